@@ -0,0 +1,286 @@
+"""
+Cold-start benchmark of the function apps.
+
+Each run starts a new Python process for an app, as the Functions host does on
+a cold start, and measures the interpreter startup, the import of
+function_app, which is when the host indexes the functions, and the first and
+second calls of a function that processes a document:
+
+    upload     classify_document and upload_to_blob_storage of a PDF
+    translate  extract_document of a PDF, downloaded from Blob Storage
+    watermark  add_pdf_watermark of a PDF
+
+The time to first invocation is the sum of the startup, the import and the
+first call; the second call shows how much of the first one was deferred
+imports and clients. Blob Storage is replaced by the stand-in of
+fake_services.py, and no database is needed. With --importtime, the modules
+whose import takes the longest, including those deferred to the first call,
+are listed from python -X importtime:
+
+    python benchmarks/cold_start.py --runs 10 --importtime 15
+
+With --warmup, the warm-up steps of the app (see warmup.py) run after the
+import, as they do from the warmup trigger, and before the first call. Steps
+needing a service that is not available here, such as the database, fail
+quickly and are counted in the report.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPT = os.path.abspath(__file__)
+
+
+def run_child(app, app_dir, document_path, server_url, warmup):
+    """
+    Imports the app and calls its document function twice. Runs in a new
+    process, started by run_cold_start, which reads the timings from stdout.
+
+    Args:
+        app (str): upload, translate or watermark.
+        app_dir (str): The directory of the app.
+        document_path (str): The path of the PDF document.
+        server_url (str): The base URL of the stand-in services.
+        warmup (str): "warmup" to run the warm-up steps before the first call.
+    """
+    started = time.time()
+    sys.path.insert(0, app_dir)
+    import function_app
+
+    imported = time.time()
+    from fake_services import install_blob_stand_ins
+
+    with open(document_path, "rb") as f:
+        content = f.read()
+    file_name = os.path.basename(document_path)
+
+    if app == "upload":
+        import utils
+
+        install_blob_stand_ins(server_url, [utils])
+
+        def call():
+            utils.classify_document(document_path)
+            utils.upload_to_blob_storage(document_path, file_name, "documents")
+
+    elif app == "translate":
+        import blob_handler
+        import document_processing
+
+        install_blob_stand_ins(server_url, [blob_handler, document_processing])
+        url = (
+            f"https://{os.environ['AZURE_STORAGE_ACCOUNT']}.blob.core.windows.net/"
+            f"{os.environ['CONTAINER_NAME']}/{os.environ['UPLOAD_PREFIX']}/{file_name}"
+            f"{os.environ['SAS_TOKEN']}"
+        )
+
+        def call():
+            document_processing.extract_document(file_name, url)
+
+    else:
+        import blob_handler
+
+        install_blob_stand_ins(server_url, [blob_handler])
+
+        def call():
+            function_app.add_pdf_watermark(content)
+
+    timings = {"started": started, "import_seconds": imported - started}
+    if warmup == "warmup":
+        warmup_started = time.time()
+        readiness = function_app.warm_up()
+        timings["warmup_seconds"] = time.time() - warmup_started
+        timings["warmup_failed_steps"] = sum(
+            step["status"] != "ok" for step in readiness["steps"].values()
+        )
+    installed = time.time()
+    call()
+    first_called = time.time()
+    call()
+    timings["first_call_seconds"] = first_called - installed
+    timings["second_call_seconds"] = time.time() - first_called
+    print(json.dumps(timings))
+
+
+def parse_importtime(stderr, top):
+    """
+    Returns the slowest imports reported by python -X importtime.
+
+    Args:
+        stderr (str): The standard error of the process.
+        top (int): The number of modules to return.
+
+    Returns:
+        list: (module, cumulative milliseconds) pairs, slowest first.
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            modules.append((fields[2].strip(), int(fields[1]) / 1000))
+        except (IndexError, ValueError):
+            continue
+    return sorted(modules, key=lambda module: -module[1])[:top]
+
+
+def run_cold_start(app, document_path, server_url, importtime=False, warmup=False):
+    """
+    Starts a new process for an app and returns its timings.
+
+    Args:
+        app (str): upload, translate or watermark.
+        document_path (str): The path of the PDF document.
+        server_url (str): The base URL of the stand-in services.
+        importtime (bool): Run the process with python -X importtime.
+        warmup (bool): Run the warm-up steps of the app before the first call.
+
+    Returns:
+        tuple: The timings in seconds, and the standard error of the process.
+
+    Raises:
+        RuntimeError: If the process fails.
+    """
+    from e2e_benchmark import APP_DIRS, get_app_environment
+
+    environment = dict(os.environ, **get_app_environment(app, server_url))
+    environment.update(
+        {
+            "CONTAINER_NAME": "documents",
+            "UPLOAD_PREFIX": "landing-zone",
+            "PYTHONPATH": os.path.dirname(SCRIPT),
+        }
+    )
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += [
+        SCRIPT, "--child", app, APP_DIRS[app], document_path, server_url,
+        "warmup" if warmup else "none",
+    ]
+
+    launched = time.time()
+    process = subprocess.run(
+        command, env=environment, cwd=APP_DIRS[app], capture_output=True, text=True, check=False
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"{app} failed: {process.stderr.strip()[-500:]}")
+    timings = json.loads(process.stdout.strip().splitlines()[-1])
+    timings["startup_seconds"] = timings.pop("started") - launched
+    timings["first_invocation_seconds"] = (
+        timings["startup_seconds"] + timings["import_seconds"] + timings["first_call_seconds"]
+    )
+    return timings, process.stderr
+
+
+def summarize(runs):
+    """
+    Summarizes the runs of an app.
+
+    Args:
+        runs (list): The timings of each run.
+
+    Returns:
+        dict: The median of each timing, and the maximum time to first invocation.
+    """
+    summary = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+    summary["max_first_invocation_seconds"] = max(run["first_invocation_seconds"] for run in runs)
+    return summary
+
+
+def main():
+    """
+    Runs the cold starts of each app and prints the median timings.
+    """
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        run_child(*sys.argv[2:7])
+        return
+
+    from corpus import make_document
+    from fake_services import FakeServices
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0])
+    parser.add_argument(
+        "--apps",
+        nargs="+",
+        choices=("upload", "translate", "watermark"),
+        default=["upload", "translate", "watermark"],
+        help="apps to start",
+    )
+    parser.add_argument("--runs", type=int, default=5, help="cold starts per app")
+    parser.add_argument("--pages", type=int, default=2, help="pages of the PDF document")
+    parser.add_argument(
+        "--importtime", type=int, default=0, help="list this many slowest imports of each app"
+    )
+    parser.add_argument(
+        "--warmup", action="store_true", help="run the warm-up steps before the first call"
+    )
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    content, _ = make_document("pdf", args.pages, random.Random(0), tables_per_page=0)
+    services = FakeServices().start()
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            document_path = os.path.join(directory, "cold-start.pdf")
+            with open(document_path, "wb") as f:
+                f.write(content)
+            services.put_blob("benchmarkstorage/documents/landing-zone/cold-start.pdf", content)
+
+            for app in args.apps:
+                # The first start compiles and caches the byte code of the app.
+                run_cold_start(app, document_path, services.url)
+                runs = [
+                    run_cold_start(app, document_path, services.url, warmup=args.warmup)[0]
+                    for _ in range(args.runs)
+                ]
+                results[app] = {"summary": summarize(runs), "runs": runs}
+                if args.importtime:
+                    _, stderr = run_cold_start(app, document_path, services.url, importtime=True)
+                    results[app]["slowest_imports"] = parse_importtime(stderr, args.importtime)
+    finally:
+        services.stop()
+
+    print(
+        f"{'app':<11}{'startup ms':>12}{'import ms':>11}{'1st call ms':>13}"
+        f"{'2nd call ms':>13}{'to 1st ms':>11}{'max ms':>9}"
+    )
+    for app, result in results.items():
+        summary = result["summary"]
+        print(
+            f"{app:<11}{summary['startup_seconds'] * 1000:>12.0f}"
+            f"{summary['import_seconds'] * 1000:>11.0f}"
+            f"{summary['first_call_seconds'] * 1000:>13.0f}"
+            f"{summary['second_call_seconds'] * 1000:>13.0f}"
+            f"{summary['first_invocation_seconds'] * 1000:>11.0f}"
+            f"{summary['max_first_invocation_seconds'] * 1000:>9.0f}"
+        )
+    for app, result in results.items():
+        summary = result["summary"]
+        if "warmup_seconds" in summary:
+            print(
+                f"{app} warm-up {summary['warmup_seconds'] * 1000:.0f} ms, "
+                f"{summary['warmup_failed_steps']:.0f} failed steps"
+            )
+    for app, result in results.items():
+        if result.get("slowest_imports"):
+            print(f"\nslowest imports of {app} (cumulative ms)")
+            for module, milliseconds in result["slowest_imports"]:
+                print(f"  {milliseconds:>8.1f}  {module}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,471 @@
+"""
+Seeded generator of synthetic DOCX and PDF documents for the benchmarks.
+
+Each document has a controlled page count, table density, share of merged
+table cells, number of text boxes per page, optional headers and footers, and
+a page size drawn from a list, so that the extraction and watermark code can
+be measured on the same inputs from run to run. The text is prose with a few
+postal addresses, which the address prompt extracts.
+
+The same seed and options always produce the same documents:
+
+    python benchmarks/corpus.py --seed 7 --count 40 --pages 1 60 --output-dir /tmp/corpus
+
+writes the documents and a manifest.jsonl file describing each of them.
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+import zipfile
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+STREETS = (
+    "Main Street", "Station Road", "Rue de la Paix", "Hauptstrasse", "Via Roma", "High Street",
+)
+CITIES = ("London", "Paris", "Berlin", "Rome", "Madrid", "Dublin", "Vienna", "Lisbon")
+WORDS = (
+    "the", "agreement", "parties", "shall", "deliver", "goods", "within", "days", "of",
+    "receipt", "invoice", "payment", "terms", "services", "contract", "notice", "period",
+)
+# Width and height in millimetres.
+PAGE_SIZES = {
+    "a4": (210, 297),
+    "letter": (215.9, 279.4),
+    "legal": (215.9, 355.6),
+    "a3": (297, 420),
+    "a4-landscape": (297, 210),
+}
+LINES_PER_PAGE = 40
+# Fixed timestamps, so that the same seed gives the same bytes.
+FIXED_TIME = datetime(2024, 1, 1)
+ZIP_TIME = (2024, 1, 1, 0, 0, 0)
+ADDRESS_RATIO = 0.15
+MM = 72 / 25.4
+
+
+def make_line(rng):
+    """
+    Returns a line of text: an address or a sentence.
+
+    Args:
+        rng (random.Random): The random generator.
+
+    Returns:
+        str: The line.
+    """
+    if rng.random() < ADDRESS_RATIO:
+        return f"{rng.randint(1, 250)} {rng.choice(STREETS)}, {rng.choice(CITIES)}"
+    return " ".join(rng.choice(WORDS) for _ in range(12)).capitalize() + "."
+
+
+def make_table(rng, merged_cell_ratio):
+    """
+    Returns the layout of a table.
+
+    Args:
+        rng (random.Random): The random generator.
+        merged_cell_ratio (float): The share of cells merged with their right neighbour.
+
+    Returns:
+        dict: The rows, columns, cell texts and (row, column) merges.
+    """
+    rows, columns = rng.randint(2, 8), rng.randint(2, 5)
+    cells = [[make_line(rng)[:40] for _ in range(columns)] for _ in range(rows)]
+    merges = [
+        (row, column)
+        for row in range(rows)
+        for column in range(0, columns - 1, 2)
+        if rng.random() < merged_cell_ratio
+    ]
+    return {"rows": rows, "columns": columns, "cells": cells, "merges": merges}
+
+
+def make_layout(rng, pages, tables_per_page, merged_cell_ratio, text_boxes_per_page, page_sizes):
+    """
+    Draws the content of each page.
+
+    Args:
+        rng (random.Random): The random generator.
+        pages (int): The number of pages.
+        tables_per_page (float): The mean number of tables per page.
+        merged_cell_ratio (float): The share of merged table cells.
+        text_boxes_per_page (float): The mean number of text boxes per page.
+        page_sizes (list): The names of the page sizes to choose from.
+
+    Returns:
+        list: One dictionary per page with its size, lines, tables and text boxes.
+    """
+    layout = []
+    for _ in range(pages):
+        tables = int(tables_per_page) + (rng.random() < tables_per_page % 1)
+        text_boxes = int(text_boxes_per_page) + (rng.random() < text_boxes_per_page % 1)
+        layout.append(
+            {
+                "size": rng.choice(page_sizes),
+                # Tables take the room of some of the lines, so each page still fits.
+                "lines": [make_line(rng) for _ in range(max(LINES_PER_PAGE - 12 * tables, 8))],
+                "tables": [make_table(rng, merged_cell_ratio) for _ in range(tables)],
+                "text_boxes": [make_line(rng) for _ in range(text_boxes)],
+            }
+        )
+    return layout
+
+
+def add_docx_text_box(paragraph, text):
+    """
+    Adds a floating VML text box to a paragraph.
+
+    python-docx has no API for text boxes, and it does not read them back:
+    their text is only reachable through the XML of the document.
+
+    Args:
+        paragraph (docx.text.paragraph.Paragraph): The paragraph.
+        text (str): The text of the box.
+    """
+    from docx.oxml import parse_xml
+
+    run = parse_xml(
+        '<w:r xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+        'xmlns:v="urn:schemas-microsoft-com:vml"><w:pict>'
+        '<v:shape type="#_x0000_t202" style="width:220pt;height:40pt">'
+        f"<v:textbox><w:txbxContent><w:p><w:r><w:t>{escape(text)}</w:t></w:r></w:p>"
+        "</w:txbxContent></v:textbox></v:shape></w:pict></w:r>"
+    )
+    paragraph._p.append(run)
+
+
+def make_docx(layout, headers_footers):
+    """
+    Builds a DOCX document, with one section per page.
+
+    Args:
+        layout (list): The pages, as returned by make_layout.
+        headers_footers (bool): Add a header and a footer to every section.
+
+    Returns:
+        bytes: The document.
+    """
+    from docx import Document
+    from docx.enum.section import WD_SECTION
+    from docx.shared import Mm
+
+    document = Document()
+    for number, page in enumerate(layout):
+        section = document.sections[0] if number == 0 else document.add_section(WD_SECTION.NEW_PAGE)
+        section.page_width, section.page_height = (Mm(size) for size in PAGE_SIZES[page["size"]])
+        if headers_footers:
+            section.header.is_linked_to_previous = False
+            section.header.paragraphs[0].text = f"Confidential - page {number + 1}"
+            section.footer.is_linked_to_previous = False
+            section.footer.paragraphs[0].text = f"Contract 2024-{number + 1:04d}"
+
+        for line in page["lines"]:
+            document.add_paragraph(line)
+        for table_layout in page["tables"]:
+            table = document.add_table(rows=table_layout["rows"], cols=table_layout["columns"])
+            table.style = "Table Grid"
+            for row, texts in enumerate(table_layout["cells"]):
+                for column, text in enumerate(texts):
+                    table.cell(row, column).text = text
+            for row, column in table_layout["merges"]:
+                table.cell(row, column).merge(table.cell(row, column + 1))
+        for text in page["text_boxes"]:
+            add_docx_text_box(document.add_paragraph(), text)
+
+    document.core_properties.created = FIXED_TIME
+    document.core_properties.modified = FIXED_TIME
+    document.core_properties.last_printed = FIXED_TIME
+    stream = io.BytesIO()
+    document.save(stream)
+    return repack_zip(stream.getvalue())
+
+
+def repack_zip(content):
+    """
+    Rewrites a ZIP archive with fixed entry timestamps.
+
+    Args:
+        content (bytes): The archive.
+
+    Returns:
+        bytes: The archive, identical for identical entries.
+    """
+    output = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(content)) as source, zipfile.ZipFile(
+        output, "w", zipfile.ZIP_DEFLATED
+    ) as target:
+        for info in source.infolist():
+            entry = zipfile.ZipInfo(info.filename, ZIP_TIME)
+            target.writestr(entry, source.read(info.filename), zipfile.ZIP_DEFLATED)
+    return output.getvalue()
+
+
+def draw_pdf_table(pdf, table_layout, x, y, width):
+    """
+    Draws a table with grid lines, merged cells spanning two columns.
+
+    Args:
+        pdf (reportlab.pdfgen.canvas.Canvas): The canvas.
+        table_layout (dict): The table, as returned by make_table.
+        x (float): The left edge.
+        y (float): The top edge.
+        width (float): The width of the table.
+
+    Returns:
+        float: The bottom edge of the table.
+    """
+    row_height = 16
+    column_width = width / table_layout["columns"]
+    merges = set(table_layout["merges"])
+    for row, texts in enumerate(table_layout["cells"]):
+        top = y - row * row_height
+        column = 0
+        while column < table_layout["columns"]:
+            span = 2 if (row, column) in merges else 1
+            pdf.rect(x + column * column_width, top - row_height, column_width * span, row_height)
+            pdf.drawString(x + column * column_width + 3, top - 12, texts[column][:30])
+            column += span
+    return y - table_layout["rows"] * row_height
+
+
+def make_pdf(layout, headers_footers):
+    """
+    Builds a PDF document.
+
+    Args:
+        layout (list): The pages, as returned by make_layout.
+        headers_footers (bool): Add a header and a footer to every page.
+
+    Returns:
+        bytes: The document.
+    """
+    from reportlab.pdfgen import canvas
+
+    stream = io.BytesIO()
+    pdf = canvas.Canvas(stream, invariant=1)
+    for number, page in enumerate(layout):
+        width, height = (size * MM for size in PAGE_SIZES[page["size"]])
+        pdf.setPageSize((width, height))
+        pdf.setFont("Helvetica", 9)
+        if headers_footers:
+            pdf.drawString(40, height - 25, f"Confidential - page {number + 1}")
+            pdf.drawString(40, 20, f"Contract 2024-{number + 1:04d}")
+
+        y = height - 50
+        line_height = min(14, (height - 100) / (len(page["lines"]) + 13 * len(page["tables"])))
+        for line in page["lines"]:
+            pdf.drawString(40, y, line)
+            y -= line_height
+        for table_layout in page["tables"]:
+            y = draw_pdf_table(pdf, table_layout, 40, y - 4, width - 80) - 8
+        for index, text in enumerate(page["text_boxes"]):
+            box_x, box_y = width - 250, height - 120 - index * 60
+            pdf.rect(box_x, box_y, 220, 40)
+            pdf.drawString(box_x + 6, box_y + 16, text[:45])
+        pdf.showPage()
+    pdf.save()
+    return stream.getvalue()
+
+
+def make_document(
+    file_format,
+    pages,
+    rng,
+    tables_per_page=0.5,
+    merged_cell_ratio=0.1,
+    text_boxes_per_page=0.2,
+    headers_footers=True,
+    page_sizes=("a4",),
+):
+    """
+    Builds a document.
+
+    Args:
+        file_format (str): docx or pdf.
+        pages (int): The number of pages.
+        rng (random.Random): The random generator.
+        tables_per_page (float): The mean number of tables per page.
+        merged_cell_ratio (float): The share of merged table cells.
+        text_boxes_per_page (float): The mean number of text boxes per page.
+        headers_footers (bool): Add headers and footers.
+        page_sizes (tuple): The names of the page sizes to choose from.
+
+    Returns:
+        tuple: The content and the layout of the document.
+    """
+    layout = make_layout(
+        rng, pages, tables_per_page, merged_cell_ratio, text_boxes_per_page, list(page_sizes)
+    )
+    build = make_docx if file_format == "docx" else make_pdf
+    return build(layout, headers_footers), layout
+
+
+def generate_corpus(
+    seed,
+    count,
+    formats=("docx", "pdf"),
+    pages=(1, 20),
+    tables_per_page=0.5,
+    merged_cell_ratio=0.1,
+    text_boxes_per_page=0.2,
+    headers_footers_ratio=0.5,
+    page_sizes=("a4", "letter"),
+):
+    """
+    Generates a corpus of documents.
+
+    The format and page count of each document are drawn uniformly; the
+    feature options apply to every document.
+
+    Args:
+        seed (int): The random seed.
+        count (int): The number of documents.
+        formats (tuple): The formats to draw from.
+        pages (tuple): The minimum and maximum page count.
+        tables_per_page (float): The mean number of tables per page.
+        merged_cell_ratio (float): The share of merged table cells.
+        text_boxes_per_page (float): The mean number of text boxes per page.
+        headers_footers_ratio (float): The share of documents with headers and footers.
+        page_sizes (tuple): The names of the page sizes to choose from.
+
+    Returns:
+        list: One dictionary per document with its name, content and features.
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for index in range(count):
+        file_format = rng.choice(formats)
+        page_count = rng.randint(pages[0], pages[1])
+        headers_footers = rng.random() < headers_footers_ratio
+        content, layout = make_document(
+            file_format,
+            page_count,
+            rng,
+            tables_per_page,
+            merged_cell_ratio,
+            text_boxes_per_page,
+            headers_footers,
+            page_sizes,
+        )
+        corpus.append(
+            {
+                "name": f"corpus-{seed}-{index:04d}-{page_count}p.{file_format}",
+                "format": file_format,
+                "pages": page_count,
+                "size_bytes": len(content),
+                "tables": sum(len(page["tables"]) for page in layout),
+                "merged_cells": sum(len(t["merges"]) for page in layout for t in page["tables"]),
+                "text_boxes": sum(len(page["text_boxes"]) for page in layout),
+                "headers_footers": headers_footers,
+                "page_sizes": sorted({page["size"] for page in layout}),
+                "content": content,
+            }
+        )
+    return corpus
+
+
+def load_corpus(directory):
+    """
+    Loads a corpus written by this script.
+
+    Args:
+        directory (str): The output directory of the corpus.
+
+    Returns:
+        list: One dictionary per document, as returned by generate_corpus.
+    """
+    corpus = []
+    with open(os.path.join(directory, "manifest.jsonl"), encoding="utf-8") as f:
+        for line in f:
+            document = json.loads(line)
+            with open(os.path.join(directory, document["name"]), "rb") as content:
+                document["content"] = content.read()
+            corpus.append(document)
+    return corpus
+
+
+def add_corpus_arguments(parser):
+    """
+    Adds the corpus options to an argument parser.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser.
+    """
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--count", type=int, default=20, help="number of documents")
+    parser.add_argument(
+        "--formats", nargs="+", choices=("docx", "pdf"), default=["docx", "pdf"], help="formats"
+    )
+    parser.add_argument(
+        "--pages", type=int, nargs=2, default=[1, 20], metavar=("MIN", "MAX"), help="page count"
+    )
+    parser.add_argument("--tables-per-page", type=float, default=0.5, help="mean tables per page")
+    parser.add_argument(
+        "--merged-cell-ratio", type=float, default=0.1, help="share of merged table cells"
+    )
+    parser.add_argument(
+        "--text-boxes-per-page", type=float, default=0.2, help="mean text boxes per page"
+    )
+    parser.add_argument(
+        "--headers-footers-ratio",
+        type=float,
+        default=0.5,
+        help="share of documents with headers and footers",
+    )
+    parser.add_argument(
+        "--page-sizes",
+        nargs="+",
+        choices=sorted(PAGE_SIZES),
+        default=["a4", "letter"],
+        help="page sizes to draw from",
+    )
+
+
+def generate_from_arguments(args):
+    """
+    Generates the corpus described by the parsed corpus options.
+
+    Args:
+        args (argparse.Namespace): The options added by add_corpus_arguments.
+
+    Returns:
+        list: One dictionary per document, as returned by generate_corpus.
+    """
+    return generate_corpus(
+        args.seed,
+        args.count,
+        tuple(args.formats),
+        tuple(args.pages),
+        args.tables_per_page,
+        args.merged_cell_ratio,
+        args.text_boxes_per_page,
+        args.headers_footers_ratio,
+        tuple(args.page_sizes),
+    )
+
+
+def main():
+    """
+    Writes a corpus and its manifest to a directory.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0])
+    add_corpus_arguments(parser)
+    parser.add_argument("--output-dir", required=True, help="directory to write the corpus to")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    corpus = generate_from_arguments(args)
+    with open(os.path.join(args.output_dir, "manifest.jsonl"), "w", encoding="utf-8") as f:
+        for document in corpus:
+            with open(os.path.join(args.output_dir, document["name"]), "wb") as content:
+                content.write(document["content"])
+            f.write(json.dumps({k: v for k, v in document.items() if k != "content"}) + "\n")
+    print(f"Wrote {len(corpus)} documents to {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,677 @@
+"""
+End-to-end benchmark of the function apps against local stand-ins of the Azure services.
+
+Documents of a configurable mix are uploaded with upload_file, translated with
+az_ai_translate_document and watermarked with add_water_mark, at each of the
+given concurrency levels. Blob Storage, Azure Translator and Azure OpenAI are
+replaced by the stand-ins of fake_services.py, with configurable latency. The
+database is a local Postgres, in which the schema of deployment-scripts/db.sql
+is created from scratch in a separate benchmark schema.
+
+Each function app runs in its own process, as it does when deployed, and its
+functions are called directly with the request objects the host would pass.
+Queued translations are run until the queue is empty, standing in for the
+sweep timers. The report gives the throughput and latency percentiles of each
+function, the per-stage latency of the translation pipeline from the
+pipeline_stage_timings table, and the calls of each stand-in endpoint.
+
+The database is configured with the DB_* environment variables used by the
+function apps, for example:
+
+    docker run -d -p 5432:5432 -e POSTGRES_PASSWORD=postgres postgres:16
+    DB_HOST=localhost DB_NAME=postgres DB_USER=postgres DB_PASSWORD=postgres \\
+        DB_SSLMODE=disable python benchmarks/e2e_benchmark.py \\
+        --mix pdf:2:8 --mix docx:3:4 --mix pdf:40:2 --concurrency 1 4 8
+
+DOCX files are converted to PDF with LibreOffice by the watermark function, so
+their watermarks fail where it is not installed.
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import time
+import urllib.parse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
+from corpus import make_document
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+APP_DIRS = {
+    "upload": os.path.join(REPO_DIR, "document-upload-function"),
+    "translate": os.path.join(REPO_DIR, "document-translate-function"),
+    "watermark": os.path.join(REPO_DIR, "document-watermark-function"),
+}
+# Modules of each app that create Blob Storage clients.
+BLOB_MODULES = {
+    "upload": ("utils",),
+    "translate": ("blob_handler", "document_processing"),
+    "watermark": ("blob_handler",),
+}
+SCHEMA_FILE = os.path.join(REPO_DIR, "deployment-scripts", "db.sql")
+SCHEMA = "benchmark"
+
+STORAGE_ACCOUNT = "benchmarkstorage"
+UPLOAD_CONTAINER = "documents"
+WATERMARK_CONTAINER = "translation-service"
+TRANSLATED_PREFIX = "translated-zone"
+PROMPT_ID = "1"
+USERS = 4
+
+
+def parse_mix(value):
+    """
+    Parses a document mix entry.
+
+    Args:
+        value (str): FORMAT:PAGES:COUNT, e.g. pdf:10:4 for four 10-page PDFs.
+
+    Returns:
+        tuple: The format, the page count and the number of documents.
+
+    Raises:
+        argparse.ArgumentTypeError: If the entry is invalid.
+    """
+    try:
+        file_format, pages, count = value.split(":")
+        pages, count = int(pages), int(count)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(f"expected FORMAT:PAGES:COUNT, got {value}") from e
+    if file_format not in ("docx", "pdf") or pages < 1 or count < 1:
+        raise argparse.ArgumentTypeError(f"expected docx or pdf and positive numbers, got {value}")
+    return file_format, pages, count
+
+
+def build_documents(mix, label, seed):
+    """
+    Builds the documents of a run.
+
+    Args:
+        mix (list): (format, pages, count) entries.
+        label (str): Prefix of the file names, unique per run.
+        seed (int): The random seed.
+
+    Returns:
+        list: (file name, content) pairs.
+    """
+    rng = random.Random(seed)
+    documents = []
+    for file_format, pages, count in mix:
+        for _ in range(count):
+            content, _ = make_document(file_format, pages, rng)
+            documents.append((f"{label}-{len(documents):04d}-{pages}p.{file_format}", content))
+    rng.shuffle(documents)
+    return documents
+
+
+def connect():
+    """
+    Connects to the benchmark schema of the local Postgres.
+
+    Returns:
+        psycopg2.connection: The connection.
+    """
+    import psycopg2
+
+    return psycopg2.connect(
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT", "5432"),
+        dbname=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        sslmode=os.getenv("DB_SSLMODE", "require"),
+        options=f"-c search_path={SCHEMA}",
+    )
+
+
+def create_schema():
+    """
+    Creates the tables of deployment-scripts/db.sql in an empty benchmark schema.
+    """
+    with open(SCHEMA_FILE, encoding="utf-8") as f:
+        statements = f.read()
+    conn = connect()
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+        cursor.execute(f"SET search_path TO {SCHEMA}")
+        cursor.execute(statements)
+    conn.commit()
+    conn.close()
+
+
+def get_app_environment(app, server_url):
+    """
+    Returns the environment variables of a function app.
+
+    Args:
+        app (str): upload, translate or watermark.
+        server_url (str): The base URL of the stand-in services.
+
+    Returns:
+        dict: The variables, set in the process of the app before it is imported.
+    """
+    environment = {
+        "AZURE_STORAGE_ACCOUNT": STORAGE_ACCOUNT,
+        "TRANSLATE_SUBSCRIPTION_KEY": "benchmark",
+        # Every connection of the apps uses the benchmark schema.
+        "PGOPTIONS": f"-c search_path={SCHEMA}",
+        "NO_PROXY": "127.0.0.1,localhost",
+    }
+    if app == "upload":
+        environment.update(
+            {
+                "SAS_TOKEN": "sv%3Dbenchmark",
+                "CONTAINER_NAME": UPLOAD_CONTAINER,
+                "AZURE_CONNECTION_STRING": (
+                    f"DefaultEndpointsProtocol=https;AccountName={STORAGE_ACCOUNT};"
+                    "AccountKey=YmVuY2htYXJr;EndpointSuffix=core.windows.net"
+                ),
+            }
+        )
+    elif app == "translate":
+        environment.update(
+            {
+                "SAS_TOKEN": "?sv=benchmark",
+                "TRANSLATE_DOCUMENT_ENDPOINT": server_url,
+                "OPEN_AI_API_KEY": "benchmark",
+                "AZURE_OPENAI_ENDPOINT": server_url,
+                "CHAT_COMPLETIONS_DEPLOYMENT_NAME": "benchmark-chat",
+            }
+        )
+    else:
+        environment.update({"SAS_TOKEN": "sv=benchmark", "WATERMARK_PREFIX": "watermarked-zone"})
+    return environment
+
+
+def load_app(app, server_url, log_level, environment=None):
+    """
+    Imports a function app in the current process, with its Blob Storage
+    calls sent to the stand-in services.
+
+    Args:
+        app (str): upload, translate or watermark.
+        server_url (str): The base URL of the stand-in services.
+        log_level (str): The level of the root logger once the app is imported.
+        environment (dict): Variables overriding those of get_app_environment.
+
+    Returns:
+        module: The function_app module of the app.
+    """
+    import importlib
+    from fake_services import install_blob_stand_ins
+
+    os.environ.update(get_app_environment(app, server_url))
+    os.environ.update(environment or {})
+    sys.path.insert(0, APP_DIRS[app])
+    function_app = importlib.import_module("function_app")
+    install_blob_stand_ins(
+        server_url, [importlib.import_module(name) for name in BLOB_MODULES[app]]
+    )
+    logging.getLogger().setLevel(log_level)
+    return function_app
+
+
+def call_concurrently(function, items, concurrency):
+    """
+    Calls a function for each item with a number of threads.
+
+    Args:
+        function (function): Called with an item, returns a dictionary.
+        items (list): The items.
+        concurrency (int): The number of threads.
+
+    Returns:
+        tuple: The results, with the seconds of each call, and the wall time.
+    """
+
+    def timed_call(item):
+        started = time.perf_counter()
+        try:
+            result = function(item)
+        except Exception as e:
+            result = {"ok": False, "error": str(e)}
+        result["seconds"] = time.perf_counter() - started
+        return result
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed_call, items))
+    return results, time.perf_counter() - started
+
+
+def run_uploads(server_url, documents, concurrency, to_langs, log_level):
+    """
+    Uploads the documents with upload_file. Runs in the process of the upload function.
+
+    Args:
+        server_url (str): The base URL of the stand-in services.
+        documents (list): (file name, content) pairs.
+        concurrency (int): The number of concurrent requests.
+        to_langs (list): The target languages.
+        log_level (str): The log level of the app.
+
+    Returns:
+        tuple: The result of each upload, with the stored file name, and the wall time.
+    """
+    import azure.functions as func
+
+    function_app = load_app("upload", server_url, log_level)
+    boundary = "benchmark-boundary"
+
+    def upload(item):
+        index, (file_name, content) = item
+        fields = [("fromLang", "en"), ("uploaded_by", f"user-{index % USERS}")]
+        fields += [("toLang", language) for language in to_langs]
+        fields.append(("prompt_id", PROMPT_ID))
+        body = b"".join(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+            .encode("utf-8")
+            for name, value in fields
+        )
+        body += (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; '
+            f'filename="{file_name}"\r\nContent-Type: application/octet-stream\r\n\r\n'
+        ).encode("utf-8")
+        body += content + f"\r\n--{boundary}--\r\n".encode("utf-8")
+        request = func.HttpRequest(
+            "POST",
+            "/api/upload_file",
+            body=body,
+            headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+        )
+        response = function_app.upload_file(request)
+        message = response.get_body().decode("utf-8")
+        stored_name = message.split(" ")[1] if response.status_code == 200 else None
+        return {
+            "ok": response.status_code == 200,
+            "file_name": stored_name,
+            "size_bytes": len(content),
+            "error": None if response.status_code == 200 else message,
+        }
+
+    return call_concurrently(upload, list(enumerate(documents)), concurrency)
+
+
+def run_translations(server_url, uploads, concurrency, log_level):
+    """
+    Fires the blob trigger of each upload, then runs the queued translations
+    until the queue is empty. Runs in the process of the translate function.
+
+    Args:
+        server_url (str): The base URL of the stand-in services.
+        uploads (list): (file name, size in bytes) pairs.
+        concurrency (int): The number of concurrent invocations.
+        log_level (str): The log level of the app.
+
+    Returns:
+        tuple: The result of each trigger invocation, and the wall time until
+            the queue was empty.
+    """
+    import azure.functions as func
+
+    function_app = load_app("translate", server_url, log_level)
+    from scheduler import LANES, database_handler, run_queued_jobs
+
+    def trigger(item):
+        file_name, size_bytes = item
+        function_app.az_ai_translate_document(
+            func.blob.InputStream(
+                data=b"", name=f"{UPLOAD_CONTAINER}/landing-zone/{file_name}", length=size_bytes
+            )
+        )
+        return {"ok": True, "file_name": file_name}
+
+    def drain(_):
+        # Stands in for the sweep timers: runs queued jobs until none is left.
+        while True:
+            processed = sum(
+                run_queued_jobs(function_app.run_translation, lane) for lane in LANES
+            )
+            if processed:
+                continue
+            counts = database_handler.count_translation_jobs()
+            if not any(count for (_, status), count in counts.items() if status == "queued"):
+                return {"ok": True}
+            time.sleep(0.5)
+
+    started = time.perf_counter()
+    results, _ = call_concurrently(trigger, uploads, concurrency)
+    call_concurrently(drain, range(concurrency), concurrency)
+    return results, time.perf_counter() - started
+
+
+def run_watermarks(server_url, file_names, concurrency, log_level):
+    """
+    Sends a BlobCreated event to add_water_mark for each translated document.
+    Runs in the process of the watermark function.
+
+    Args:
+        server_url (str): The base URL of the stand-in services.
+        file_names (list): The translated file names.
+        concurrency (int): The number of concurrent requests.
+        log_level (str): The log level of the app.
+
+    Returns:
+        tuple: The result of each request, and the wall time.
+    """
+    import azure.functions as func
+
+    function_app = load_app("watermark", server_url, log_level)
+
+    def watermark(file_name):
+        blob_url = (
+            f"https://{STORAGE_ACCOUNT}.blob.core.windows.net/{WATERMARK_CONTAINER}/"
+            f"{TRANSLATED_PREFIX}/{urllib.parse.quote(file_name)}"
+        )
+        event = {"eventType": "Microsoft.Storage.BlobCreated", "data": {"url": blob_url}}
+        request = func.HttpRequest(
+            "POST",
+            "/api/add_water_mark",
+            body=json.dumps([event]).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        response = function_app.add_water_mark(request)
+        ok = response.status_code == 200
+        return {
+            "ok": ok,
+            "file_name": file_name,
+            "error": None if ok else response.get_body().decode("utf-8"),
+        }
+
+    return call_concurrently(watermark, file_names, concurrency)
+
+
+def run_in_app_process(function, *args):
+    """
+    Runs a function in a new process, so that each app imports its own modules.
+
+    Args:
+        function (function): One of run_uploads, run_translations and run_watermarks.
+        *args: The arguments of the function.
+
+    Returns:
+        object: The result of the function.
+    """
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(function, *args).result()
+
+
+def percentile(values, fraction):
+    """
+    Returns a percentile of the values, by linear interpolation.
+
+    Args:
+        values (list): The values.
+        fraction (float): The percentile, between 0 and 1.
+
+    Returns:
+        float: The percentile, or None if there are no values.
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def summarize(results, wall_seconds):
+    """
+    Summarizes the calls of a function.
+
+    Args:
+        results (list): The result of each call, with its seconds.
+        wall_seconds (float): The wall time of the calls.
+
+    Returns:
+        dict: The number of calls and failures, the throughput and the latency percentiles.
+    """
+    seconds = [result["seconds"] for result in results]
+    return {
+        "calls": len(results),
+        "failed": sum(1 for result in results if not result["ok"]),
+        "wall_seconds": wall_seconds,
+        "per_second": len(results) / wall_seconds if wall_seconds else None,
+        "p50_seconds": percentile(seconds, 0.5),
+        "p95_seconds": percentile(seconds, 0.95),
+        "max_seconds": max(seconds) if seconds else None,
+        "errors": sorted({result["error"] for result in results if result.get("error")})[:5],
+    }
+
+
+def fetch_translation_results(file_names):
+    """
+    Fetches the translation outcome of the uploaded documents.
+
+    Args:
+        file_names (list): The stored file names.
+
+    Returns:
+        dict: The per-stage latency percentiles of the pipeline, the queue wait
+            and run time percentiles of the jobs, the number of translated
+            documents, and the translated file names.
+    """
+    conn = connect()
+    with conn.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT stage, COUNT(*),
+                percentile_cont(0.5) WITHIN GROUP (ORDER BY duration_ms),
+                percentile_cont(0.95) WITHIN GROUP (ORDER BY duration_ms)
+            FROM pipeline_stage_timings
+            WHERE file_name = ANY(%s)
+            GROUP BY stage
+            ORDER BY 4 DESC
+            """,
+            (file_names,),
+        )
+        stages = [
+            {"stage": stage, "count": count, "p50_ms": p50, "p95_ms": p95}
+            for stage, count, p50, p95 in cursor.fetchall()
+        ]
+        cursor.execute(
+            """
+            SELECT status,
+                EXTRACT(EPOCH FROM started_at - queued_at),
+                EXTRACT(EPOCH FROM finished_at - started_at)
+            FROM translation_jobs
+            WHERE file_name = ANY(%s)
+            """,
+            (file_names,),
+        )
+        jobs = cursor.fetchall()
+        cursor.execute(
+            """
+            SELECT translated_file_name
+            FROM file_translation_targets
+            WHERE file_name = ANY(%s) AND translation_status = 'done'
+            """,
+            (file_names,),
+        )
+        translated = [row[0] for row in cursor.fetchall()]
+    conn.close()
+
+    waits = [float(wait) for _, wait, _ in jobs if wait is not None]
+    runs = [float(run) for _, _, run in jobs if run is not None]
+    return {
+        "stages": stages,
+        "jobs_done": sum(1 for status, _, _ in jobs if status == "done"),
+        "queue_wait_p50_seconds": percentile(waits, 0.5),
+        "queue_wait_p95_seconds": percentile(waits, 0.95),
+        "job_p50_seconds": percentile(runs, 0.5),
+        "job_p95_seconds": percentile(runs, 0.95),
+        "translated_file_names": translated,
+    }
+
+
+def format_seconds(value):
+    """
+    Formats a duration for the report.
+
+    Args:
+        value (float): The seconds, or None.
+
+    Returns:
+        str: The formatted duration.
+    """
+    return "-" if value is None else f"{value:.2f}"
+
+
+def print_report(run):
+    """
+    Prints the results of a concurrency level.
+
+    Args:
+        run (dict): The results, as built by main.
+    """
+    print(f"\n== concurrency {run['concurrency']}, {run['documents']} documents ==")
+    print(
+        f"{'function':<12}{'calls':>7}{'failed':>8}{'wall s':>9}"
+        f"{'per s':>8}{'p50 s':>8}{'p95 s':>8}"
+    )
+    for name in ("upload", "translate", "watermark"):
+        summary = run[name]
+        print(
+            f"{name:<12}{summary['calls']:>7}{summary['failed']:>8}"
+            f"{format_seconds(summary['wall_seconds']):>9}"
+            f"{format_seconds(summary['per_second']):>8}"
+            f"{format_seconds(summary['p50_seconds']):>8}"
+            f"{format_seconds(summary['p95_seconds']):>8}"
+        )
+        for error in summary["errors"]:
+            print(f"  {name} error: {error[:160]}")
+
+    translation = run["translation"]
+    print(
+        f"translated {translation['jobs_done']} of {run['documents']}; queue wait p50/p95 "
+        f"{format_seconds(translation['queue_wait_p50_seconds'])}/"
+        f"{format_seconds(translation['queue_wait_p95_seconds'])} s, job p50/p95 "
+        f"{format_seconds(translation['job_p50_seconds'])}/"
+        f"{format_seconds(translation['job_p95_seconds'])} s"
+    )
+    print(f"{'stage':<28}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}")
+    for stage in translation["stages"]:
+        print(
+            f"{stage['stage']:<28}{stage['count']:>7}"
+            f"{stage['p50_ms']:>10.1f}{stage['p95_ms']:>10.1f}"
+        )
+    print(f"{'stand-in endpoint':<28}{'calls':>7}{'mean ms':>10}")
+    for endpoint, stats in run["stand_ins"].items():
+        print(f"{endpoint:<28}{stats['calls']:>7}{stats['mean_ms']:>10.1f}")
+
+
+def main():
+    """
+    Runs the benchmark at each concurrency level and prints the results.
+    """
+    from fake_services import FakeServices
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0])
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        action="append",
+        help="documents as FORMAT:PAGES:COUNT, repeatable (default pdf:2:8 docx:3:4 pdf:40:2)",
+    )
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4], help="levels to run")
+    parser.add_argument("--to-lang", nargs="+", default=["fr"], help="target languages")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the document contents")
+    parser.add_argument("--blob-seconds", type=float, default=0.01, help="latency of blob calls")
+    parser.add_argument(
+        "--translator-seconds", type=float, default=5, help="base time of a batch translation"
+    )
+    parser.add_argument(
+        "--translator-seconds-per-mb", type=float, default=2, help="translation time per MB"
+    )
+    parser.add_argument(
+        "--sync-translator-seconds", type=float, default=1, help="base time of a sync translation"
+    )
+    parser.add_argument(
+        "--openai-seconds", type=float, default=1, help="base latency of a completion"
+    )
+    parser.add_argument(
+        "--openai-seconds-per-token", type=float, default=0.01, help="latency per completion token"
+    )
+    parser.add_argument("--log-level", default="WARNING", help="log level of the function apps")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+    mix = args.mix or [("pdf", 2, 8), ("docx", 3, 4), ("pdf", 40, 2)]
+
+    if any(file_format == "docx" for file_format, _, _ in mix) and not shutil.which("libreoffice"):
+        print("libreoffice is not installed: the watermarks of DOCX documents will fail")
+
+    os.environ.setdefault("NO_PROXY", "127.0.0.1,localhost")
+    create_schema()
+    runs = []
+    for concurrency in args.concurrency:
+        services = FakeServices(
+            blob_seconds=args.blob_seconds,
+            translator_seconds=args.translator_seconds,
+            translator_seconds_per_mb=args.translator_seconds_per_mb,
+            sync_translator_seconds=args.sync_translator_seconds,
+            openai_seconds=args.openai_seconds,
+            openai_seconds_per_token=args.openai_seconds_per_token,
+        ).start()
+        try:
+            documents = build_documents(mix, f"bench-c{concurrency}", args.seed)
+            uploads, upload_seconds = run_in_app_process(
+                run_uploads, services.url, documents, concurrency, args.to_lang, args.log_level
+            )
+            stored = [(u["file_name"], u["size_bytes"]) for u in uploads if u["ok"]]
+            triggers, translate_seconds = run_in_app_process(
+                run_translations, services.url, stored, concurrency, args.log_level
+            )
+            translation = fetch_translation_results([file_name for file_name, _ in stored])
+
+            # Stands in for the Event Grid subscription of the watermark function,
+            # which reads the translated documents from its own container.
+            translated = translation.pop("translated_file_names")
+            for file_name in translated:
+                content = services.get_blob(
+                    f"{STORAGE_ACCOUNT}/{UPLOAD_CONTAINER}/{TRANSLATED_PREFIX}/{file_name}"
+                )
+                services.put_blob(
+                    f"{STORAGE_ACCOUNT}/{WATERMARK_CONTAINER}/{TRANSLATED_PREFIX}/{file_name}",
+                    content,
+                )
+            watermarks, watermark_seconds = run_in_app_process(
+                run_watermarks, services.url, translated, concurrency, args.log_level
+            )
+        finally:
+            services.stop()
+
+        # The trigger invocations return as soon as their job is queued or run;
+        # the translation throughput counts the documents translated until the
+        # queue was empty.
+        translate_summary = summarize(triggers, translate_seconds)
+        translate_summary["calls"] = len(stored)
+        translate_summary["failed"] = len(stored) - translation["jobs_done"]
+        translate_summary["per_second"] = translation["jobs_done"] / translate_seconds
+        translate_summary["p50_seconds"] = translation["job_p50_seconds"]
+        translate_summary["p95_seconds"] = translation["job_p95_seconds"]
+        run = {
+            "concurrency": concurrency,
+            "documents": len(documents),
+            "upload": summarize(uploads, upload_seconds),
+            "translate": translate_summary,
+            "watermark": summarize(watermarks, watermark_seconds),
+            "translation": translation,
+            "stand_ins": services.get_call_stats(),
+        }
+        print_report(run)
+        runs.append(run)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"mix": mix, "runs": runs}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+Microbenchmarks of the document extraction, glossary and watermark functions.
+
+read_docx_from_url, read_pdf_from_url and create_csv_string of the translate
+function, and add_pdf_watermark of the watermark function, are run on each
+document of a seeded corpus (see corpus.py). Each function runs once to warm
+up, then --repeat times for the wall time, then once more under tracemalloc
+for the peak of the Python heap; memory allocated by native code, such as
+PyMuPDF, is not included. The documents are read from the Blob stand-in of
+fake_services.py, without latency, so the URL readers measure the download
+through the app's HTTP session and the parsing. create_csv_string is given one
+glossary pair per line of the extracted text. add_pdf_watermark runs on the PDF
+documents only, as DOCX files are first converted by LibreOffice.
+
+One JSON object per function and document is written, with the document
+features, so that runs can be compared:
+
+    python benchmarks/extraction_microbench.py --seed 7 --count 30 --output before.jsonl
+    python benchmarks/extraction_microbench.py --seed 7 --count 30 --output after.jsonl \\
+        --compare before.jsonl
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+import urllib.parse
+import uuid
+from datetime import datetime, timezone
+from corpus import add_corpus_arguments, generate_from_arguments, load_corpus
+from e2e_benchmark import STORAGE_ACCOUNT, UPLOAD_CONTAINER, load_app, run_in_app_process
+
+CORPUS_PREFIX = "corpus"
+FEATURES = (
+    "format", "pages", "size_bytes", "tables", "merged_cells", "text_boxes", "headers_footers",
+    "page_sizes",
+)
+
+
+def measure(function, argument, repeat):
+    """
+    Measures the wall time and the peak Python heap of a function.
+
+    Args:
+        function (function): The function, called with one argument.
+        argument (object): The argument.
+        repeat (int): The number of timed calls.
+
+    Returns:
+        tuple: The seconds of each timed call, the peak heap in bytes, and the result.
+    """
+    function(argument)
+    seconds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(argument)
+        seconds.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        result = function(argument)
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return seconds, peak_bytes, result
+
+
+def make_record(function_name, document, seconds, peak_bytes, output_length):
+    """
+    Builds the result of a function on a document.
+
+    Args:
+        function_name (str): The name of the function.
+        document (dict): The document, as returned by generate_corpus.
+        seconds (list): The seconds of each timed call.
+        peak_bytes (int): The peak Python heap.
+        output_length (int): The length of the result, to check runs are comparable.
+
+    Returns:
+        dict: The result, with the document features.
+    """
+    record = {"function": function_name, "document": document["name"]}
+    record.update({feature: document.get(feature) for feature in FEATURES})
+    record.update(
+        {
+            "repeat": len(seconds),
+            "seconds_min": min(seconds),
+            "seconds_median": statistics.median(seconds),
+            "seconds_max": max(seconds),
+            "peak_bytes": peak_bytes,
+            "output_length": output_length,
+        }
+    )
+    return record
+
+
+def run_translate_benchmarks(server_url, documents, repeat, log_level):
+    """
+    Benchmarks the readers and create_csv_string. Runs in the process of the translate function.
+
+    Args:
+        server_url (str): The base URL of the stand-in services, holding the documents.
+        documents (list): The documents, as returned by generate_corpus.
+        repeat (int): The number of timed calls.
+        log_level (str): The log level of the app.
+
+    Returns:
+        list: The results.
+    """
+    load_app("translate", server_url, log_level)
+    from document_processing import create_csv_string
+    from utils import read_docx_from_url, read_pdf_from_url
+
+    records = []
+    for document in documents:
+        url = (
+            f"https://{STORAGE_ACCOUNT}.blob.core.windows.net/{UPLOAD_CONTAINER}/"
+            f"{CORPUS_PREFIX}/{urllib.parse.quote(document['name'])}?sv=benchmark"
+        )
+        reader = read_docx_from_url if document["format"] == "docx" else read_pdf_from_url
+        seconds, peak_bytes, text = measure(reader, url, repeat)
+        records.append(make_record(reader.__name__, document, seconds, peak_bytes, len(text)))
+
+        glossary = [(line, line) for line in text.splitlines() if line.strip()]
+        seconds, peak_bytes, csv_string = measure(create_csv_string, glossary, repeat)
+        records.append(
+            make_record("create_csv_string", document, seconds, peak_bytes, len(csv_string))
+        )
+    return records
+
+
+def run_watermark_benchmarks(server_url, documents, repeat, log_level):
+    """
+    Benchmarks add_pdf_watermark. Runs in the process of the watermark function.
+
+    Args:
+        server_url (str): The base URL of the stand-in services.
+        documents (list): The PDF documents, as returned by generate_corpus.
+        repeat (int): The number of timed calls.
+        log_level (str): The log level of the app.
+
+    Returns:
+        list: The results.
+    """
+    function_app = load_app("watermark", server_url, log_level)
+
+    records = []
+    for document in documents:
+        seconds, peak_bytes, pdf_content = measure(
+            function_app.add_pdf_watermark, document["content"], repeat
+        )
+        records.append(
+            make_record("add_pdf_watermark", document, seconds, peak_bytes, len(pdf_content))
+        )
+    return records
+
+
+def get_commit():
+    """
+    Returns the commit of the working tree.
+
+    Returns:
+        str: The abbreviated commit hash, or None outside a git checkout.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(records):
+    """
+    Sums the median time and takes the largest peak heap of each function.
+
+    Args:
+        records (list): The results.
+
+    Returns:
+        dict: The documents, the total median seconds and the largest peak
+            bytes, keyed by function.
+    """
+    summary = {}
+    for record in records:
+        totals = summary.setdefault(
+            record["function"], {"documents": 0, "seconds": 0.0, "peak_bytes": 0}
+        )
+        totals["documents"] += 1
+        totals["seconds"] += record["seconds_median"]
+        totals["peak_bytes"] = max(totals["peak_bytes"], record["peak_bytes"])
+    return summary
+
+
+def print_comparison(records, baseline_path):
+    """
+    Prints the change of each function against a baseline run, on the
+    documents present in both runs.
+
+    Args:
+        records (list): The results of this run.
+        baseline_path (str): The JSON lines file of the baseline run.
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {
+            (record["function"], record["document"]): record
+            for record in map(json.loads, f)
+            if record.get("function")
+        }
+    matched = [r for r in records if (r["function"], r["document"]) in baseline]
+    before = summarize([baseline[(r["function"], r["document"])] for r in matched])
+    after = summarize(matched)
+    print(f"{'function':<22}{'docs':>6}{'time before':>13}{'after':>9}{'change':>9}{'peak':>9}")
+    for function_name, totals in sorted(after.items()):
+        old = before[function_name]
+        time_change = totals["seconds"] / old["seconds"] - 1 if old["seconds"] else 0
+        peak_change = totals["peak_bytes"] / old["peak_bytes"] - 1 if old["peak_bytes"] else 0
+        print(
+            f"{function_name:<22}{totals['documents']:>6}{old['seconds']:>12.3f}s"
+            f"{totals['seconds']:>8.3f}s{time_change:>+9.1%}{peak_change:>+9.1%}"
+        )
+
+
+def main():
+    """
+    Runs the microbenchmarks on a corpus and writes one JSON line per function and document.
+    """
+    from fake_services import FakeServices
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0])
+    add_corpus_arguments(parser)
+    parser.add_argument("--corpus-dir", help="read the corpus written by corpus.py instead")
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="timed calls per function and document"
+    )
+    parser.add_argument("--output", help="JSON lines file to write, standard output by default")
+    parser.add_argument("--compare", help="JSON lines file of a previous run to compare with")
+    parser.add_argument("--log-level", default="WARNING", help="log level of the function apps")
+    args = parser.parse_args()
+
+    documents = load_corpus(args.corpus_dir) if args.corpus_dir else generate_from_arguments(args)
+    services = FakeServices().start()
+    try:
+        for document in documents:
+            services.put_blob(
+                f"{STORAGE_ACCOUNT}/{UPLOAD_CONTAINER}/{CORPUS_PREFIX}/{document['name']}",
+                document["content"],
+            )
+        records = run_in_app_process(
+            run_translate_benchmarks, services.url, documents, args.repeat, args.log_level
+        )
+        pdf_documents = [document for document in documents if document["format"] == "pdf"]
+        records += run_in_app_process(
+            run_watermark_benchmarks, services.url, pdf_documents, args.repeat, args.log_level
+        )
+    finally:
+        services.stop()
+
+    run = {
+        "run_id": uuid.uuid4().hex,
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "commit": get_commit(),
+        "python": sys.version.split()[0],
+        "seed": None if args.corpus_dir else args.seed,
+    }
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for record in records:
+            output.write(json.dumps({**run, **record}) + "\n")
+    finally:
+        if args.output:
+            output.close()
+
+    if args.compare:
+        print_comparison(records, args.compare)
+    elif args.output:
+        for function_name, totals in sorted(summarize(records).items()):
+            print(
+                f"{function_name:<22}{totals['documents']:>4} documents"
+                f"{totals['seconds']:>9.3f}s{totals['peak_bytes'] / 1024 / 1024:>9.1f} MB peak"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,786 @@
+"""
+Local stand-ins for the Azure services called by the function apps.
+
+FakeServices runs an HTTP server on localhost that serves:
+
+- a Blob store: GET, HEAD and PUT of /blob/<account>/<container>/<path>;
+- the Azure Translator batch, status, cancel and synchronous document
+  endpoints, which copy the source document to the targets after a
+  configurable latency;
+- the Azure OpenAI chat completions endpoint, which answers with the lines of
+  the text that contain a digit, and their token usage, after a configurable
+  latency.
+
+The apps build Blob Storage URLs for *.blob.core.windows.net, so
+install_blob_stand_ins, called in the process of a function app, redirects
+the requests to those URLs to the server and replaces the Blob Storage
+clients of the app modules with clients of the stand-in store. Translator
+and OpenAI are reached through their endpoint environment variables.
+"""
+
+import email
+import json
+import re
+import threading
+import time
+import urllib.parse
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+
+BLOB_HOST_PATTERN = re.compile(r"^https://([^./]+)\.blob\.core\.windows\.net/(.*)$")
+BATCHES_PATH = "/translator/document/batches"
+SYNC_TRANSLATE_PATH = "/translator/document:translate"
+CHAT_PATH_PATTERN = re.compile(r"^/openai/deployments/([^/]+)/chat/completions$")
+MAX_COMPLETION_LINES = 20
+
+server_url = None
+
+
+def to_local_url(url):
+    """
+    Returns the stand-in URL of a Blob Storage URL.
+
+    Args:
+        url (str): The URL.
+
+    Returns:
+        str: The URL on the stand-in server, or the URL itself if it is not a
+            Blob Storage URL or no server was installed.
+    """
+    match = BLOB_HOST_PATTERN.match(url)
+    if not match or server_url is None:
+        return url
+    return f"{server_url}/blob/{match.group(1)}/{match.group(2)}"
+
+
+def get_blob_key(path):
+    """
+    Returns the store key of a blob path.
+
+    Args:
+        path (str): The path after /blob/, with an optional query string.
+
+    Returns:
+        str: The unquoted account/container/path key.
+    """
+    return urllib.parse.unquote(path.split("?", 1)[0])
+
+
+def get_blob_url_key(url):
+    """
+    Returns the store key of a Blob Storage URL.
+
+    Args:
+        url (str): The Blob Storage URL, e.g. a translation source or target.
+
+    Returns:
+        str: The unquoted account/container/path key, or None for other URLs.
+    """
+    match = BLOB_HOST_PATTERN.match(url)
+    if not match:
+        return None
+    return get_blob_key(f"{match.group(1)}/{match.group(2)}")
+
+
+def read_data(data):
+    """
+    Reads the data of an upload.
+
+    Args:
+        data (object): Bytes, a string or a file-like object.
+
+    Returns:
+        bytes: The data.
+    """
+    if hasattr(data, "read"):
+        data = data.read()
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return bytes(data)
+
+
+class FakeServices:
+    """
+    The state and latency settings of the stand-in services.
+
+    Attributes:
+        blobs (dict): The blob contents, keyed by account/container/path.
+        jobs (dict): The batch translation jobs, keyed by id.
+        calls (dict): The number of calls and the total seconds of each endpoint.
+    """
+
+    def __init__(
+        self,
+        blob_seconds=0.0,
+        translator_seconds=5.0,
+        translator_seconds_per_mb=2.0,
+        sync_translator_seconds=1.0,
+        openai_seconds=1.0,
+        openai_seconds_per_token=0.01,
+    ):
+        self.blob_seconds = blob_seconds
+        self.translator_seconds = translator_seconds
+        self.translator_seconds_per_mb = translator_seconds_per_mb
+        self.sync_translator_seconds = sync_translator_seconds
+        self.openai_seconds = openai_seconds
+        self.openai_seconds_per_token = openai_seconds_per_token
+        self.blobs = {}
+        self.jobs = {}
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.server = None
+        self.thread = None
+
+    @property
+    def url(self):
+        """
+        str: The base URL of the server.
+        """
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """
+        Starts the server in a background thread.
+
+        Returns:
+            FakeServices: The started services.
+        """
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeServicesHandler)
+        self.server.daemon_threads = True
+        self.server.services = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops the server.
+        """
+        self.server.shutdown()
+        self.server.server_close()
+
+    def record_call(self, endpoint, seconds):
+        """
+        Counts a call of an endpoint.
+
+        Args:
+            endpoint (str): The endpoint name.
+            seconds (float): The time spent answering it.
+        """
+        with self.lock:
+            count, total = self.calls.get(endpoint, (0, 0.0))
+            self.calls[endpoint] = (count + 1, total + seconds)
+
+    def get_call_stats(self):
+        """
+        Returns the calls of each endpoint.
+
+        Returns:
+            dict: The number of calls and the mean milliseconds, keyed by endpoint.
+        """
+        with self.lock:
+            return {
+                endpoint: {"calls": count, "mean_ms": total / count * 1000}
+                for endpoint, (count, total) in sorted(self.calls.items())
+            }
+
+    def get_translation_seconds(self, size_bytes):
+        """
+        Returns the simulated time of a batch translation.
+
+        Args:
+            size_bytes (int): The size of the source document.
+
+        Returns:
+            float: The seconds after which the job succeeds.
+        """
+        return self.translator_seconds + size_bytes / (1024 * 1024) * self.translator_seconds_per_mb
+
+    def put_blob(self, key, content):
+        """
+        Stores a blob.
+
+        Args:
+            key (str): The account/container/path key.
+            content (bytes): The content.
+        """
+        with self.lock:
+            self.blobs[key] = content
+
+    def get_blob(self, key):
+        """
+        Returns a blob.
+
+        Args:
+            key (str): The account/container/path key.
+
+        Returns:
+            bytes: The content, or None if there is no such blob.
+        """
+        with self.lock:
+            return self.blobs.get(key)
+
+    def start_job(self, body):
+        """
+        Creates a batch translation job.
+
+        Args:
+            body (dict): The request body of the batch endpoint.
+
+        Returns:
+            str: The job id.
+        """
+        inputs = []
+        size_bytes = 0
+        for document in body.get("inputs", []):
+            source_key = get_blob_url_key(document["source"]["sourceUrl"])
+            content = self.get_blob(source_key) or b""
+            size_bytes += len(content)
+            targets = [
+                (target["language"], get_blob_url_key(target["targetUrl"]))
+                for target in document.get("targets", [])
+            ]
+            inputs.append((source_key, targets))
+
+        job_id = str(uuid.uuid4())
+        with self.lock:
+            self.jobs[job_id] = {
+                "inputs": inputs,
+                "ready_at": time.monotonic() + self.get_translation_seconds(size_bytes),
+                "status": "NotStarted",
+                "documents": [],
+            }
+        return job_id
+
+    def get_job_status(self, job_id):
+        """
+        Returns the status of a batch translation job, finishing it once its time has passed.
+
+        Args:
+            job_id (str): The job id.
+
+        Returns:
+            dict: The status response, or None if there is no such job.
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            if job["status"] in ("NotStarted", "Running"):
+                job["status"] = "Running"
+                if time.monotonic() >= job["ready_at"]:
+                    self.finish_job(job)
+            total = sum(len(targets) for _, targets in job["inputs"])
+            counts = {"Succeeded": 0, "Failed": 0, "Cancelled": 0}
+            for document in job["documents"]:
+                counts[document["status"]] += 1
+            return {
+                "id": job_id,
+                "status": job["status"],
+                "summary": {
+                    "total": total,
+                    "failed": counts["Failed"],
+                    "success": counts["Succeeded"],
+                    "inProgress": total if job["status"] == "Running" else 0,
+                    "notYetStarted": 0,
+                    "cancelled": counts["Cancelled"],
+                    "totalCharacterCharged": 0,
+                },
+            }
+
+    def finish_job(self, job):
+        """
+        Copies the sources of a job to its targets. Called with the lock held.
+
+        Args:
+            job (dict): The job.
+        """
+        for source_key, targets in job["inputs"]:
+            content = self.blobs.get(source_key)
+            for language, target_key in targets:
+                if content is None:
+                    job["documents"].append(
+                        {
+                            "path": target_key,
+                            "sourcePath": source_key,
+                            "to": language,
+                            "status": "Failed",
+                            "error": {"code": "SourceNotFound"},
+                        }
+                    )
+                    continue
+                self.blobs[target_key] = content
+                job["documents"].append(
+                    {
+                        "path": target_key,
+                        "sourcePath": source_key,
+                        "to": language,
+                        "status": "Succeeded",
+                    }
+                )
+        failed = any(document["status"] == "Failed" for document in job["documents"])
+        job["status"] = "Failed" if failed else "Succeeded"
+
+    def cancel_job(self, job_id):
+        """
+        Cancels a batch translation job that has not finished.
+
+        Args:
+            job_id (str): The job id.
+
+        Returns:
+            bool: False if there is no such job.
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return False
+            if job["status"] in ("NotStarted", "Running"):
+                job["status"] = "Cancelled"
+                job["documents"] = [
+                    {
+                        "path": target_key,
+                        "sourcePath": source_key,
+                        "to": language,
+                        "status": "Cancelled",
+                    }
+                    for source_key, targets in job["inputs"]
+                    for language, target_key in targets
+                ]
+            return True
+
+    def get_job_documents(self, job_id):
+        """
+        Returns the document statuses of a batch translation job.
+
+        Args:
+            job_id (str): The job id.
+
+        Returns:
+            dict: The documents response, or None if there is no such job.
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            return {"value": list(job["documents"])}
+
+    def complete_chat(self, body):
+        """
+        Answers a chat completion with the lines of the user text that contain a digit.
+
+        Args:
+            body (dict): The request body of the chat completions endpoint.
+
+        Returns:
+            dict: The chat completion.
+        """
+        messages = body.get("messages", [])
+        prompt = "".join(message.get("content") or "" for message in messages)
+        user_text = next(
+            (m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), ""
+        )
+        lines = [line.strip() for line in user_text.splitlines() if re.search(r"\d", line)]
+        content = "\n".join(lines[:MAX_COMPLETION_LINES])
+        prompt_tokens = len(prompt) // 4 + 1
+        completion_tokens = len(content) // 4 + 1
+        time.sleep(self.openai_seconds + completion_tokens * self.openai_seconds_per_token)
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model") or "benchmark",
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": content},
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def translate_sync(self, content_type, body):
+        """
+        Answers a synchronous document translation with the document itself.
+
+        Args:
+            content_type (str): The Content-Type of the multipart request.
+            body (bytes): The request body.
+
+        Returns:
+            bytes: The document part, or None if the request has none.
+        """
+        message = email.message_from_bytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode("utf-8") + body
+        )
+        document = None
+        for part in message.walk():
+            if part.get_param("name", header="content-disposition") == "document":
+                document = part.get_payload(decode=True)
+        if document is not None:
+            time.sleep(
+                self.sync_translator_seconds
+                + len(document) / (1024 * 1024) * self.translator_seconds_per_mb
+            )
+        return document
+
+
+class FakeServicesHandler(BaseHTTPRequestHandler):
+    """
+    Routes the requests of the function apps to the stand-in services.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        """
+        Silences the access log.
+        """
+
+    @property
+    def services(self):
+        """
+        FakeServices: The services of the server.
+        """
+        return self.server.services
+
+    def read_body(self):
+        """
+        Reads the request body.
+
+        Returns:
+            bytes: The body.
+        """
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def send(self, status, body=b"", content_type="application/json", headers=None):
+        """
+        Sends a response.
+
+        Args:
+            status (int): The status code.
+            body (object): The body, serialized to JSON unless it is bytes.
+            content_type (str): The Content-Type of the body.
+            headers (dict): Additional headers.
+        """
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def handle_request(self):
+        """
+        Dispatches the request and records its duration.
+        """
+        started = time.perf_counter()
+        path = urllib.parse.urlsplit(self.path).path
+        body = self.read_body()
+        if path.startswith("/blob/"):
+            endpoint = f"blob:{self.command.lower()}"
+            self.handle_blob(self.path[len("/blob/"):], body)
+        elif path == SYNC_TRANSLATE_PATH:
+            endpoint = "translator:document"
+            self.handle_sync_translation(body)
+        elif path.startswith(BATCHES_PATH):
+            endpoint = "translator:batches" if path == BATCHES_PATH else "translator:status"
+            self.handle_batches(path[len(BATCHES_PATH):].strip("/"), body)
+        elif CHAT_PATH_PATTERN.match(path):
+            endpoint = "openai:chat"
+            self.send(200, self.services.complete_chat(json.loads(body or b"{}")))
+        else:
+            endpoint = "unknown"
+            self.send(404, {"error": {"code": "NotFound", "message": path}})
+        self.services.record_call(endpoint, time.perf_counter() - started)
+
+    def handle_blob(self, path, body):
+        """
+        Serves the Blob store.
+
+        Args:
+            path (str): The path after /blob/, with the query string.
+            body (bytes): The request body.
+        """
+        if self.services.blob_seconds:
+            time.sleep(self.services.blob_seconds)
+        key = get_blob_key(path)
+        if self.command == "PUT":
+            if self.headers.get("If-None-Match") == "*" and self.services.get_blob(key) is not None:
+                self.send(409, {"error": {"code": "BlobAlreadyExists"}})
+                return
+            self.services.put_blob(key, body)
+            self.send(201)
+            return
+
+        content = self.services.get_blob(key)
+        if content is None:
+            self.send(404, {"error": {"code": "BlobNotFound"}})
+            return
+        self.send(200, content, "application/octet-stream")
+
+    def handle_batches(self, job_path, body):
+        """
+        Serves the batch translation endpoints.
+
+        Args:
+            job_path (str): The path after the batches path: empty, the job id,
+                or the job id followed by /documents.
+            body (bytes): The request body.
+        """
+        if self.command == "POST" and not job_path:
+            job_id = self.services.start_job(json.loads(body or b"{}"))
+            operation_location = f"{self.services.url}{BATCHES_PATH}/{job_id}"
+            self.send(202, b"", headers={"Operation-Location": operation_location})
+            return
+
+        job_id, _, resource = job_path.partition("/")
+        if self.command == "DELETE":
+            found = self.services.cancel_job(job_id)
+        elif resource == "documents":
+            found = self.services.get_job_documents(job_id)
+        else:
+            found = self.services.get_job_status(job_id)
+        if not found:
+            self.send(404, {"error": {"code": "NotFound", "message": job_id}})
+        elif self.command == "DELETE":
+            self.send(200, self.services.get_job_status(job_id))
+        else:
+            self.send(200, found)
+
+    def handle_sync_translation(self, body):
+        """
+        Serves the synchronous document translation endpoint.
+
+        Args:
+            body (bytes): The multipart request body.
+        """
+        document = self.services.translate_sync(self.headers.get("Content-Type", ""), body)
+        if document is None:
+            self.send(400, {"error": {"code": "InvalidRequest", "message": "No document"}})
+            return
+        self.send(200, document, "application/octet-stream")
+
+    do_GET = do_HEAD = do_PUT = do_POST = do_DELETE = handle_request
+
+
+class StandInDownloader:
+    """
+    The downloaded content of a stand-in blob, like StorageStreamDownloader.
+    """
+
+    def __init__(self, content):
+        self.content = content
+
+    def readall(self):
+        """
+        Returns the content.
+
+        Returns:
+            bytes: The content.
+        """
+        return self.content
+
+    def content_as_text(self, encoding="UTF-8"):
+        """
+        Returns the content as text.
+
+        Args:
+            encoding (str): The encoding.
+
+        Returns:
+            str: The content.
+        """
+        return self.content.decode(encoding)
+
+
+class StandInBlobClient:
+    """
+    A client of one blob of the stand-in store, like azure.storage.blob.BlobClient.
+    """
+
+    def __init__(self, blob_url):
+        self.url = blob_url
+
+    @classmethod
+    def from_blob_url(cls, blob_url, credential=None, **kwargs):
+        """
+        Returns a client of the blob at the URL.
+
+        Args:
+            blob_url (str): The Blob Storage URL.
+            credential (object): Unused.
+            **kwargs: Unused.
+
+        Returns:
+            StandInBlobClient: The client.
+        """
+        return cls(blob_url)
+
+    def exists(self, **kwargs):
+        """
+        Checks whether the blob exists.
+
+        Returns:
+            bool: True if it exists.
+        """
+        return requests.head(to_local_url(self.url), timeout=30).status_code == 200
+
+    def upload_blob(self, data, overwrite=False, **kwargs):
+        """
+        Uploads the blob.
+
+        Args:
+            data (object): Bytes, a string or a file-like object.
+            overwrite (bool): Replace an existing blob.
+            **kwargs: Unused.
+
+        Raises:
+            ResourceExistsError: If the blob exists and overwrite is False.
+        """
+        from azure.core.exceptions import HttpResponseError, ResourceExistsError
+
+        headers = {} if overwrite else {"If-None-Match": "*"}
+        response = requests.put(
+            to_local_url(self.url), data=read_data(data), headers=headers, timeout=60
+        )
+        if response.status_code == 409:
+            raise ResourceExistsError(f"Blob already exists: {self.url}")
+        if response.status_code != 201:
+            raise HttpResponseError(f"Upload failed with {response.status_code}: {self.url}")
+
+    def download_blob(self, **kwargs):
+        """
+        Downloads the blob.
+
+        Returns:
+            StandInDownloader: The content.
+
+        Raises:
+            ResourceNotFoundError: If the blob does not exist.
+        """
+        from azure.core.exceptions import ResourceNotFoundError
+
+        response = requests.get(to_local_url(self.url), timeout=60)
+        if response.status_code == 404:
+            raise ResourceNotFoundError(f"Blob not found: {self.url}")
+        return StandInDownloader(response.content)
+
+
+class StandInContainerClient:
+    """
+    A client of one container of the stand-in store, like ContainerClient.
+    """
+
+    def __init__(self, account_url, container):
+        self.account_url = account_url
+        self.container = container
+
+    def get_blob_client(self, blob, **kwargs):
+        """
+        Returns a client of a blob of the container.
+
+        Args:
+            blob (str): The blob path.
+
+        Returns:
+            StandInBlobClient: The client.
+        """
+        return StandInBlobClient(
+            f"{self.account_url}/{self.container}/{urllib.parse.quote(blob)}"
+        )
+
+
+class StandInBlobServiceClient:
+    """
+    A client of the stand-in store, like azure.storage.blob.BlobServiceClient.
+    """
+
+    def __init__(self, account_url, credential=None, **kwargs):
+        self.account_url = account_url.rstrip("/")
+
+    @classmethod
+    def from_connection_string(cls, conn_str, credential=None, **kwargs):
+        """
+        Returns a client of the account of a connection string.
+
+        Args:
+            conn_str (str): The connection string, with an AccountName.
+            credential (object): Unused.
+            **kwargs: Unused.
+
+        Returns:
+            StandInBlobServiceClient: The client.
+        """
+        settings = dict(
+            part.split("=", 1) for part in (conn_str or "").split(";") if "=" in part
+        )
+        account = settings.get("AccountName", "benchmark")
+        return cls(f"https://{account}.blob.core.windows.net")
+
+    def get_container_client(self, container):
+        """
+        Returns a client of a container.
+
+        Args:
+            container (str): The container name.
+
+        Returns:
+            StandInContainerClient: The client.
+        """
+        return StandInContainerClient(self.account_url, container)
+
+    def get_blob_client(self, container, blob, **kwargs):
+        """
+        Returns a client of a blob.
+
+        Args:
+            container (str): The container name.
+            blob (str): The blob path.
+
+        Returns:
+            StandInBlobClient: The client.
+        """
+        return self.get_container_client(container).get_blob_client(blob)
+
+
+def install_blob_stand_ins(url, modules):
+    """
+    Sends the Blob Storage calls of the current process to the stand-in server.
+
+    Requests to *.blob.core.windows.net URLs, made with requests, are
+    redirected to the server, and the Blob Storage clients imported by the
+    modules are replaced by the stand-in clients.
+
+    Args:
+        url (str): The base URL of the stand-in server.
+        modules (list): The app modules that use Blob Storage clients.
+    """
+    global server_url
+    server_url = url
+
+    original_send = requests.Session.send
+
+    def send(session, request, **kwargs):
+        request.url = to_local_url(request.url)
+        return original_send(session, request, **kwargs)
+
+    requests.Session.send = send
+
+    for module in modules:
+        if hasattr(module, "BlobServiceClient"):
+            module.BlobServiceClient = StandInBlobServiceClient
+        if hasattr(module, "BlobClient"):
+            module.BlobClient = StandInBlobClient
@@ -0,0 +1,456 @@
+"""
+Load generator for the upload and log routes of the upload function app.
+
+Requests to upload_file, get_logs_by_date and get_all_logs are sent to a
+running Functions host, e.g. started with func start in
+document-upload-function, at each of the given arrival rates. Arrivals are
+open loop: they follow a Poisson process whatever the response times, so a
+saturated host shows up as growing latency and errors rather than as a lower
+request rate. The route of each request is drawn from the read/write mix and
+the uploaded documents from the file mix, generated with corpus.py.
+
+Latency is measured from the scheduled arrival, so requests waiting for a free
+client slot are not under-reported. Arrivals finding --max-in-flight requests
+pending are counted as dropped. While a rate runs, the db_connections_in_use
+gauge of the /metrics route and, when the DB_* environment variables are set,
+the connections of the database in pg_stat_activity are sampled every second.
+
+Uploads are stored and translated like any other, so the host must be
+configured with a test storage account and database, for example:
+
+    cd document-upload-function && func start
+    DB_HOST=localhost DB_NAME=postgres DB_USER=postgres DB_PASSWORD=postgres \\
+        DB_SSLMODE=disable python benchmarks/http_load.py --rate 1 5 10 20 \\
+        --mix upload_file=1 get_logs_by_date=4 get_all_logs=1 --file-mix pdf:2:8 --file-mix pdf:40:1
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from corpus import make_document
+from e2e_benchmark import format_seconds, parse_mix, percentile
+
+ROUTES = ("upload_file", "get_logs_by_date", "get_all_logs")
+CONTENT_TYPES = {
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+CONNECTIONS_METRIC = re.compile(r"^db_connections_in_use(?:\{[^}]*\})? (\S+)$", re.MULTILINE)
+SAMPLE_SECONDS = 1
+
+
+def parse_route_weight(value):
+    """
+    Parses a read/write mix entry.
+
+    Args:
+        value (str): ROUTE=WEIGHT, e.g. get_all_logs=2.
+
+    Returns:
+        tuple: The route and its weight.
+
+    Raises:
+        argparse.ArgumentTypeError: If the entry is invalid.
+    """
+    route, _, weight = value.partition("=")
+    try:
+        weight = float(weight)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(f"expected ROUTE=WEIGHT, got {value}") from e
+    if route not in ROUTES or weight < 0:
+        raise argparse.ArgumentTypeError(f"expected one of {', '.join(ROUTES)}, got {value}")
+    return route, weight
+
+
+class LoadGenerator:
+    """
+    Sends requests to the routes of a Functions host at a Poisson arrival rate.
+    """
+
+    def __init__(self, base_url, route_mix, documents, args):
+        """
+        Args:
+            base_url (str): The base URL of the routes, e.g. http://localhost:7071/api.
+            route_mix (list): (route, weight) pairs.
+            documents (list): (format, content, weight) tuples to upload.
+            args (argparse.Namespace): The options of the run.
+        """
+        self.base_url = base_url.rstrip("/")
+        self.route_mix = route_mix
+        self.documents = documents
+        self.args = args
+        self.local = threading.local()
+        self.label = f"load-{uuid.uuid4().hex[:8]}"
+        self.uploads = 0
+        self.lock = threading.Lock()
+
+    def get_session(self):
+        """
+        Returns the HTTP session of the calling thread, so connections are reused.
+
+        Returns:
+            requests.Session: The session.
+        """
+        import requests
+
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = self.local.session = requests.Session()
+        return session
+
+    def send(self, route, rng):
+        """
+        Sends a request to a route.
+
+        Args:
+            route (str): The route.
+            rng (random.Random): The random generator of the document.
+
+        Returns:
+            tuple: The status code and the number of bytes sent.
+        """
+        url = f"{self.base_url}/{route}"
+        timeout = self.args.timeout
+        if route == "get_all_logs":
+            return self.get_session().get(url, timeout=timeout).status_code, 0
+        if route == "get_logs_by_date":
+            response = self.get_session().get(url, params={"date": self.args.date}, timeout=timeout)
+            return response.status_code, 0
+
+        file_format, content, _ = rng.choices(
+            self.documents, weights=[document[2] for document in self.documents]
+        )[0]
+        with self.lock:
+            self.uploads += 1
+            file_name = f"{self.label}-{self.uploads:06d}.{file_format}"
+        response = self.get_session().post(
+            url,
+            files={"file": (file_name, content, CONTENT_TYPES[file_format])},
+            data={
+                "fromLang": self.args.from_lang,
+                "toLang": self.args.to_lang,
+                "uploaded_by": f"load-user-{rng.randrange(self.args.users)}",
+                "prompt_id": self.args.prompt_id,
+            },
+            timeout=timeout,
+        )
+        return response.status_code, len(content)
+
+    def run_request(self, route, scheduled, rng, results, slots):
+        """
+        Sends a request and records its result. Runs in a worker thread.
+
+        Args:
+            route (str): The route.
+            scheduled (float): The perf_counter time of the arrival.
+            rng (random.Random): The random generator of the document.
+            results (list): Receives the result.
+            slots (threading.Semaphore): Released when the request completes.
+        """
+        result = {"route": route, "error": None, "bytes": 0}
+        try:
+            result["status"], result["bytes"] = self.send(route, rng)
+        except Exception as e:
+            result["status"] = None
+            result["error"] = f"{type(e).__name__}: {e}"
+        finally:
+            result["seconds"] = time.perf_counter() - scheduled
+            slots.release()
+        results.append(result)
+
+    def run(self, rate):
+        """
+        Sends requests at an arrival rate for the duration of the run.
+
+        Args:
+            rate (float): The mean arrivals per second.
+
+        Returns:
+            dict: The results of each request, the dropped arrivals, the
+                connection samples and the wall seconds.
+        """
+        rng = random.Random(f"{self.args.seed}:{rate}")
+        routes = [route for route, _ in self.route_mix]
+        weights = [weight for _, weight in self.route_mix]
+        results = []
+        dropped = {route: 0 for route in routes}
+        slots = threading.Semaphore(self.args.max_in_flight)
+        stop = threading.Event()
+        samples = []
+        sampler = threading.Thread(target=self.sample_connections, args=(stop, samples))
+        sampler.start()
+
+        started = time.perf_counter()
+        deadline = started + self.args.duration
+        scheduled = started
+        with ThreadPoolExecutor(max_workers=self.args.max_in_flight) as executor:
+            while True:
+                scheduled += rng.expovariate(rate)
+                if scheduled >= deadline:
+                    break
+                time.sleep(max(0, scheduled - time.perf_counter()))
+                route = rng.choices(routes, weights=weights)[0]
+                if not slots.acquire(blocking=False):
+                    dropped[route] += 1
+                    continue
+                executor.submit(
+                    self.run_request,
+                    route,
+                    scheduled,
+                    random.Random(rng.random()),
+                    results,
+                    slots,
+                )
+        wall_seconds = time.perf_counter() - started
+        stop.set()
+        sampler.join()
+        return {
+            "results": results,
+            "dropped": dropped,
+            "samples": samples,
+            "wall_seconds": wall_seconds,
+        }
+
+    def sample_connections(self, stop, samples):
+        """
+        Samples the database connections until stopped. Runs in its own thread.
+
+        Args:
+            stop (threading.Event): Set at the end of the run.
+            samples (list): Receives (host gauge, server connections) pairs;
+                either is None when it could not be read.
+        """
+        import requests
+
+        conn = connect_database()
+        try:
+            while not stop.wait(SAMPLE_SECONDS):
+                host_connections = None
+                try:
+                    response = requests.get(f"{self.base_url}/metrics", timeout=5)
+                    match = CONNECTIONS_METRIC.search(response.text)
+                    if match:
+                        host_connections = float(match.group(1))
+                except requests.RequestException:
+                    pass
+                try:
+                    server_connections = count_server_connections(conn)
+                except Exception:
+                    server_connections = None
+                samples.append((host_connections, server_connections))
+        finally:
+            if conn is not None:
+                conn.close()
+
+
+def connect_database():
+    """
+    Connects to the database of the function app, if the DB_* environment variables are set.
+
+    Returns:
+        psycopg2.connection: The connection, or None.
+    """
+    if not os.getenv("DB_HOST"):
+        return None
+    import psycopg2
+
+    conn = psycopg2.connect(
+        host=os.getenv("DB_HOST"),
+        dbname=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        port=os.getenv("DB_PORT", "5432"),
+        sslmode=os.getenv("DB_SSLMODE", "require"),
+    )
+    conn.autocommit = True
+    return conn
+
+
+def count_server_connections(conn):
+    """
+    Counts the connections to the database, other than the sampling one.
+
+    Args:
+        conn (psycopg2.connection): The sampling connection, or None.
+
+    Returns:
+        int: The number of connections, or None without a connection.
+    """
+    if conn is None:
+        return None
+    with conn.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT COUNT(*) FROM pg_stat_activity
+            WHERE datname = current_database() AND pid <> pg_backend_pid()
+            """
+        )
+        return cursor.fetchone()[0]
+
+
+def summarize_route(results, dropped, wall_seconds):
+    """
+    Summarizes the requests to a route.
+
+    Args:
+        results (list): The result of each request.
+        dropped (int): The arrivals dropped because too many requests were pending.
+        wall_seconds (float): The wall time of the run.
+
+    Returns:
+        dict: The number of requests and errors, the throughput and the latency percentiles.
+    """
+    seconds = [result["seconds"] for result in results]
+    errors = [r for r in results if r["error"] or r["status"] is None or r["status"] >= 400]
+    statuses = {}
+    for result in results:
+        key = str(result["status"]) if result["status"] is not None else "exception"
+        statuses[key] = statuses.get(key, 0) + 1
+    return {
+        "requests": len(results),
+        "dropped": dropped,
+        "errors": len(errors),
+        "error_rate": len(errors) / len(results) if results else None,
+        "statuses": statuses,
+        "per_second": len(results) / wall_seconds if wall_seconds else None,
+        "p50_seconds": percentile(seconds, 0.5),
+        "p90_seconds": percentile(seconds, 0.9),
+        "p99_seconds": percentile(seconds, 0.99),
+        "max_seconds": max(seconds) if seconds else None,
+        "megabytes_sent": sum(result["bytes"] for result in results) / 1024 / 1024,
+        "messages": sorted({r["error"] for r in errors if r["error"]})[:5],
+    }
+
+
+def summarize_samples(values):
+    """
+    Summarizes connection samples.
+
+    Args:
+        values (list): The samples, None where they could not be read.
+
+    Returns:
+        dict: The mean and maximum, or None without samples.
+    """
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    return {"mean": sum(values) / len(values), "max": max(values)}
+
+
+def print_report(run):
+    """
+    Prints the results of an arrival rate.
+
+    Args:
+        run (dict): The results, as built by main.
+    """
+    print(f"\n== {run['rate']:g} requests per second for {run['wall_seconds']:.0f} s ==")
+    print(
+        f"{'route':<18}{'sent':>7}{'dropped':>9}{'errors':>8}{'per s':>8}"
+        f"{'p50 s':>8}{'p90 s':>8}{'p99 s':>8}{'max s':>8}"
+    )
+    for route, summary in run["routes"].items():
+        print(
+            f"{route:<18}{summary['requests']:>7}{summary['dropped']:>9}{summary['errors']:>8}"
+            f"{format_seconds(summary['per_second']):>8}"
+            f"{format_seconds(summary['p50_seconds']):>8}"
+            f"{format_seconds(summary['p90_seconds']):>8}"
+            f"{format_seconds(summary['p99_seconds']):>8}"
+            f"{format_seconds(summary['max_seconds']):>8}"
+        )
+        for message in summary["messages"]:
+            print(f"  {route} error: {message[:160]}")
+    for name, key in (("host db_connections_in_use", "host"), ("pg_stat_activity", "server")):
+        connections = run["connections"][key]
+        if connections:
+            print(f"{name}: mean {connections['mean']:.1f}, max {connections['max']:.0f}")
+
+
+def main():
+    """
+    Runs the load at each arrival rate and prints the results.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0])
+    parser.add_argument(
+        "--base-url", default="http://localhost:7071/api", help="base URL of the routes"
+    )
+    parser.add_argument(
+        "--rate", type=float, nargs="+", default=[1, 5], help="arrival rates per second to run"
+    )
+    parser.add_argument("--duration", type=float, default=60, help="seconds to run each rate")
+    parser.add_argument(
+        "--mix",
+        type=parse_route_weight,
+        nargs="+",
+        help="routes as ROUTE=WEIGHT (default upload_file=1 get_logs_by_date=3 get_all_logs=1)",
+    )
+    parser.add_argument(
+        "--file-mix",
+        type=parse_mix,
+        action="append",
+        help="uploads as FORMAT:PAGES:WEIGHT, repeatable (default pdf:2:6 docx:3:3 pdf:40:1)",
+    )
+    parser.add_argument(
+        "--variants", type=int, default=3, help="documents generated per file mix entry"
+    )
+    parser.add_argument(
+        "--max-in-flight", type=int, default=64, help="pending requests before arrivals drop"
+    )
+    parser.add_argument("--timeout", type=float, default=120, help="request timeout in seconds")
+    parser.add_argument("--date", default=date.today().isoformat(), help="date of get_logs_by_date")
+    parser.add_argument("--from-lang", default="en", help="source language of the uploads")
+    parser.add_argument("--to-lang", default="fr", help="target languages of the uploads")
+    parser.add_argument("--prompt-id", default="1", help="prompt of the uploads")
+    parser.add_argument("--users", type=int, default=4, help="distinct uploaded_by values")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the arrivals and documents")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+    route_mix = args.mix or [("upload_file", 1), ("get_logs_by_date", 3), ("get_all_logs", 1)]
+    file_mix = args.file_mix or [("pdf", 2, 6), ("docx", 3, 3), ("pdf", 40, 1)]
+
+    documents = []
+    if any(route == "upload_file" and weight for route, weight in route_mix):
+        rng = random.Random(args.seed)
+        for file_format, pages, weight in file_mix:
+            for _ in range(args.variants):
+                content, _ = make_document(file_format, pages, rng)
+                documents.append((file_format, content, weight / args.variants))
+
+    generator = LoadGenerator(args.base_url, route_mix, documents, args)
+    runs = []
+    for rate in args.rate:
+        outcome = generator.run(rate)
+        run = {
+            "rate": rate,
+            "wall_seconds": outcome["wall_seconds"],
+            "routes": {
+                route: summarize_route(
+                    [r for r in outcome["results"] if r["route"] == route],
+                    outcome["dropped"][route],
+                    outcome["wall_seconds"],
+                )
+                for route, _ in route_mix
+            },
+            "connections": {
+                "host": summarize_samples([host for host, _ in outcome["samples"]]),
+                "server": summarize_samples([server for _, server in outcome["samples"]]),
+            },
+        }
+        print_report(run)
+        runs.append(run)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"routes": route_mix, "file_mix": file_mix, "runs": runs}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
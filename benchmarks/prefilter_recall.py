@@ -0,0 +1,254 @@
+"""
+Benchmark of the candidate pre-filter against the full-document GPT call.
+
+For each document, the text is reduced and pre-filtered the same way the
+translate function does it, and the prompt size is compared with the full
+text. Recall is measured against reference address lines:
+
+- With --expected, the reference lines are read from a JSON file mapping each
+  document file name to its list of lines.
+- With --gpt, the reference lines are extracted by the GPT model from the full
+  text, as the function did before the pre-filter. The candidate text is then
+  also sent to the model, and the end-to-end recall of the two calls is
+  reported. This requires the OpenAI settings used by the function app.
+- With --synthetic, generated reports with known addresses are used instead of
+  input files.
+
+Usage:
+    python benchmarks/prefilter_recall.py report.pdf letters.docx --expected expected.json
+    python benchmarks/prefilter_recall.py report.pdf --gpt
+    python benchmarks/prefilter_recall.py --synthetic 20
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "document-translate-function")
+)
+
+from prefilter import apply_prefilter
+from text_reduction import estimate_tokens, line_key, reduce_text
+
+DEFAULT_CONFIG = {"name": "address", "min_score": 2, "context_lines": 2}
+ADDRESS_PROMPT = (
+    "- Extract all location addresses from the provided text. \n"
+    "- Maintain the original address format. If the address spans multiple lines, "
+    "keep it multiline. \n"
+    "- Do not translate or modify the content. \n"
+    "- Extract each line of the address in a separate line. \n"
+    "- Provide only the extracted addresses without adding any additional text.\n"
+)
+
+SYNTHETIC_ADDRESSES = [
+    ["Acme Holdings Ltd", "10 Downing Street", "London SW1A 2AA", "United Kingdom"],
+    ["Müller GmbH", "Hauptstraße 5", "10115 Berlin", "Germany"],
+    ["Société Générale", "29 Boulevard Haussmann", "75009 Paris", "France"],
+    ["Initech Inc.", "4120 Freidrich Lane", "Austin, TX 78744", "USA"],
+    ["Van Dijk B.V.", "Keizersgracht 123", "1015 CJ Amsterdam", "Netherlands"],
+    ["Contoso Ltd", "PO Box 1234", "Manchester M1 1AE"],
+]
+SYNTHETIC_SENTENCES = [
+    "Revenue grew by {}% in the quarter, driven by higher demand across all regions.",
+    "The board reviewed {} items of the risk register and approved the treasury policy.",
+    "Operating costs of {} million remained stable despite pressure on energy prices.",
+    "Management expects {} integration milestones of the acquired business next year.",
+    "The audit committee met {} times during the year and reported no exceptions.",
+    "Capital expenditure of {} million focused on the distribution network.",
+]
+
+
+def read_document(path):
+    """
+    Reads the text and pages of a PDF, DOCX or text file.
+
+    Args:
+        path (str): The path of the file.
+
+    Returns:
+        tuple: The text and the list of pages (None if the file has no pages).
+    """
+    with open(path, "rb") as file:
+        content = file.read()
+    if path.endswith(".pdf"):
+        from utils import read_pdf_pages_from_bytes
+
+        pages = read_pdf_pages_from_bytes(content)
+        return "".join(pages), pages
+    if path.endswith(".docx"):
+        from utils import read_docx_from_bytes
+
+        return read_docx_from_bytes(content), None
+    return content.decode("utf-8"), None
+
+
+def generate_synthetic_documents(count, seed=0):
+    """
+    Generates reports with running text and a few addresses per document.
+
+    Args:
+        count (int): The number of documents.
+        seed (int): The random seed.
+
+    Returns:
+        list: (name, text, pages, expected lines) tuples.
+    """
+    rng = random.Random(seed)
+    documents = []
+    for number in range(count):
+        pages = []
+        expected = []
+        for page_number in range(rng.randint(5, 30)):
+            lines = [f"Annual Report {2020 + number % 5}"]
+            lines.extend(
+                rng.choice(SYNTHETIC_SENTENCES).format(rng.randint(2, 9999))
+                for _ in range(rng.randint(20, 40))
+            )
+            if rng.random() < 0.2:
+                address = rng.choice(SYNTHETIC_ADDRESSES)
+                position = rng.randint(1, len(lines))
+                lines[position:position] = ["Registered office:"] + address
+                expected.extend(address)
+            lines.append(f"Page {page_number + 1}")
+            pages.append("\n".join(lines) + "\n")
+        documents.append((f"synthetic_{number}.txt", "".join(pages), pages, expected))
+    return documents
+
+
+def extract_with_gpt(text):
+    """
+    Extracts the address lines from a text with the GPT model, as the function app does.
+
+    Args:
+        text (str): The text sent to the model.
+
+    Returns:
+        list: The extracted lines.
+    """
+    from environment_variables import CHAT_PARAMETERS, FEW_SHOT_EXAMPLES
+    from gpt_handler import get_gpt_response, parse_response
+
+    if not text.strip():
+        return []
+    return parse_response(get_gpt_response(text, ADDRESS_PROMPT, FEW_SHOT_EXAMPLES, CHAT_PARAMETERS))
+
+
+def measure_recall(reference_lines, text):
+    """
+    Measures the share of the reference lines found in a text.
+
+    Args:
+        reference_lines (list): The reference lines.
+        text (str): The text searched for the lines.
+
+    Returns:
+        tuple: The number of reference lines found and the number of reference lines.
+    """
+    keys = {line_key(line) for line in reference_lines if line_key(line)}
+    text_key = " \n ".join(line_key(line) for line in text.splitlines())
+    found = sum(1 for key in keys if key in text_key)
+    return found, len(keys)
+
+
+def benchmark_document(name, text, pages, expected, config, use_gpt):
+    """
+    Runs the benchmark for one document.
+
+    Args:
+        name (str): The document name.
+        text (str): The document text.
+        pages (list): The text of each page, or None.
+        expected (list): The reference lines, or None to extract them with GPT.
+        config (dict): The pre-filter configuration.
+        use_gpt (bool): Whether to extract the reference and candidate lines with GPT.
+
+    Returns:
+        dict: The measurements of the document.
+    """
+    prompt_text, _ = reduce_text(text, pages)
+    candidate_text = apply_prefilter(prompt_text, config)
+    result = {
+        "document": name,
+        "full_tokens": estimate_tokens(prompt_text),
+        "candidate_tokens": estimate_tokens(candidate_text),
+    }
+
+    reference = expected
+    if use_gpt:
+        full_lines = extract_with_gpt(prompt_text)
+        candidate_lines = extract_with_gpt(candidate_text)
+        reference = expected if expected is not None else full_lines
+        found, total = measure_recall(reference, "\n".join(candidate_lines))
+        result["end_to_end_found"], result["end_to_end_total"] = found, total
+
+    if reference is not None:
+        result["filter_found"], result["filter_total"] = measure_recall(reference, candidate_text)
+    return result
+
+
+def format_ratio(found, total):
+    """
+    Formats a recall ratio.
+
+    Args:
+        found (int): The number of lines found.
+        total (int): The number of reference lines.
+
+    Returns:
+        str: The ratio as a percentage, or "n/a" without reference lines.
+    """
+    return f"{100 * found / total:.1f}%" if total else "n/a"
+
+
+def main():
+    """
+    Runs the benchmark and prints one line per document and a summary.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0])
+    parser.add_argument("files", nargs="*", help="PDF, DOCX or text documents")
+    parser.add_argument("--expected", help="JSON file mapping file names to reference lines")
+    parser.add_argument("--gpt", action="store_true", help="compare with the full-document GPT call")
+    parser.add_argument("--synthetic", type=int, default=0, help="number of generated documents")
+    parser.add_argument("--config", default=json.dumps(DEFAULT_CONFIG), help="pre-filter config JSON")
+    args = parser.parse_args()
+
+    config = json.loads(args.config)
+    expected = {}
+    if args.expected:
+        with open(args.expected, encoding="utf-8") as file:
+            expected = json.load(file)
+
+    documents = generate_synthetic_documents(args.synthetic)
+    for path in args.files:
+        text, pages = read_document(path)
+        documents.append((os.path.basename(path), text, pages, expected.get(os.path.basename(path))))
+    if not documents:
+        parser.error("no documents, pass files or --synthetic")
+
+    totals = {}
+    for name, text, pages, reference in documents:
+        result = benchmark_document(name, text, pages, reference, config, args.gpt)
+        print(json.dumps(result))
+        for key, value in result.items():
+            if key != "document":
+                totals[key] = totals.get(key, 0) + value
+
+    print(
+        f"Documents: {len(documents)}, prompt tokens {totals['full_tokens']} -> "
+        f"{totals['candidate_tokens']} "
+        f"({totals['full_tokens'] / max(totals['candidate_tokens'], 1):.1f}x smaller)"
+    )
+    if "filter_total" in totals:
+        print(f"Pre-filter recall: {format_ratio(totals['filter_found'], totals['filter_total'])}")
+    if "end_to_end_total" in totals:
+        print(
+            "End-to-end recall vs full-document call: "
+            f"{format_ratio(totals['end_to_end_found'], totals['end_to_end_total'])}"
+        )
+
+
+if __name__ == "__main__":
+    main()
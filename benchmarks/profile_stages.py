@@ -0,0 +1,404 @@
+"""
+Profiles the document stages of the function apps on local files.
+
+Each stage function of the apps is run on the given DOCX and PDF files, without
+deploying: text extraction, text reduction and pre-filtering, the glossary
+extraction call, glossary building and the CSV glossary of the translate
+function, and the DOCX to PDF conversion and add_pdf_watermark of the
+watermark function. The input of each stage is computed once from the output
+of the previous ones, then the stage is run --repeat times under the profiler.
+
+The extraction call goes to the Azure OpenAI stand-in of fake_services.py by
+default (--gpt stub), to the Azure OpenAI deployment configured with
+OPEN_AI_API_KEY, AZURE_OPENAI_ENDPOINT and CHAT_COMPLETIONS_DEPLOYMENT_NAME
+(--gpt real), or to the local extractor of the --prefilter configuration, by
+default the address one (--gpt local). The database writes of the glossary
+stage are skipped. The conversion needs LibreOffice.
+
+With --profiler cprofile, the statistics of each stage are written to
+OUTPUT_DIR/FILE.STAGE.pstats, e.g. for snakeviz, and the top functions are
+printed. With --profiler sample, the Python stacks of the stage are sampled
+every --interval seconds and written to OUTPUT_DIR/FILE.STAGE.folded, in the
+folded format of flamegraph.pl, inferno and speedscope:
+
+    python benchmarks/profile_stages.py contract.pdf letter.docx --profiler sample
+    flamegraph.pl profiles/contract.pdf.extract.folded > extract.svg
+
+Native frames, e.g. of PyMuPDF, are not sampled; py-spy can record them, as
+each app runs in a child process:
+
+    py-spy record --subprocesses --native -o profile.svg -- \\
+        python benchmarks/profile_stages.py contract.pdf --profiler none
+"""
+
+import argparse
+import cProfile
+import io
+import json
+import os
+import pstats
+import shutil
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+from e2e_benchmark import format_seconds, load_app, run_in_app_process
+
+TRANSLATE_STAGES = ("extract", "reduce", "prefilter", "gpt", "glossary", "csv")
+# The stage whose output each translate stage takes, None for the file content.
+TRANSLATE_INPUTS = {
+    "extract": None,
+    "reduce": "extract",
+    "prefilter": "reduce",
+    "gpt": "prefilter",
+    "glossary": "prefilter",
+    "csv": "glossary",
+}
+WATERMARK_STAGES = ("convert", "watermark")
+OPENAI_VARIABLES = ("OPEN_AI_API_KEY", "AZURE_OPENAI_ENDPOINT", "CHAT_COMPLETIONS_DEPLOYMENT_NAME")
+DEFAULT_PROMPT = (
+    "Extract every postal address of the document, which must not be translated, "
+    "as glossary entries."
+)
+
+
+class StackSampler:
+    """
+    Samples the Python stack of a thread and counts the folded stacks.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        """
+        Samples the stack until stopped. Runs in its own thread.
+        """
+        while not self.stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                file_name = os.path.basename(code.co_filename)
+                frames.append(f"{code.co_name} ({file_name}:{frame.f_lineno})")
+                frame = frame.f_back
+            if frames:
+                self.stacks[";".join(reversed(frames))] += 1
+
+    def start(self):
+        """
+        Starts sampling.
+        """
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops sampling.
+        """
+        self.stop_event.set()
+        self.thread.join()
+
+    def write_folded(self, path):
+        """
+        Writes the stacks in the folded format, one stack and count per line.
+
+        Args:
+            path (str): The path of the file.
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def profile_stage(label, function, argument, args):
+    """
+    Runs a stage --repeat times under the profiler and writes its profile.
+
+    Args:
+        label (str): The file name and stage, used to name the profile.
+        function (function): The stage, called with one argument.
+        argument (object): The input of the stage.
+        args (argparse.Namespace): The options of the run.
+
+    Returns:
+        tuple: The result, a dictionary with the stage, the seconds of each run,
+            the profile path, the top functions and the error if the stage
+            failed, and the output of the stage.
+    """
+    result = failed_result(label, None)
+    profiler = cProfile.Profile() if args.profiler == "cprofile" else None
+    sampler = None
+    if args.profiler == "sample":
+        sampler = StackSampler(threading.get_ident(), args.interval)
+        sampler.start()
+    try:
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            if profiler:
+                profiler.enable()
+            try:
+                output = function(argument)
+            finally:
+                if profiler:
+                    profiler.disable()
+            result["seconds"].append(time.perf_counter() - started)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        output = None
+    finally:
+        if sampler:
+            sampler.stop()
+
+    if profiler:
+        result["profile"] = os.path.join(args.output_dir, f"{label}.pstats")
+        profiler.dump_stats(result["profile"])
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats(args.sort).print_stats(args.top)
+        result["top"] = stream.getvalue()
+    elif sampler and sampler.stacks:
+        result["profile"] = os.path.join(args.output_dir, f"{label}.folded")
+        sampler.write_folded(result["profile"])
+    return result, output
+
+
+def run_translate_stages(server_url, paths, args, environment):
+    """
+    Profiles the stages of the translate function. Runs in the process of the app.
+
+    Args:
+        server_url (str): The base URL of the stand-in services.
+        paths (list): The paths of the documents.
+        args (argparse.Namespace): The options of the run.
+        environment (dict): Variables overriding those of the benchmark.
+
+    Returns:
+        list: The result of each stage of each document.
+    """
+    function_app = load_app("translate", server_url, args.log_level, environment)
+    from document_processing import create_csv_string
+    from prefilter import apply_prefilter
+    from utils import get_docx_page_count, read_docx_from_bytes, read_pdf_pages_from_bytes
+
+    # The usage report is a database write, not part of the stage.
+    function_app.record_openai_usage = lambda *_: None
+    metadata_results = {
+        "exclusionTexts": [],
+        "prefilter_config": args.prefilter,
+        "extraction_backend": "local" if args.gpt == "local" else "openai",
+        "prompt_text": args.prompt,
+        "prompt_id": None,
+        "uploaded_by": "profile",
+        "additionalGlossaryContentUrl": None,
+    }
+
+    def extract(content):
+        if content.startswith(b"%PDF"):
+            pages = read_pdf_pages_from_bytes(content)
+            return {
+                "content": content,
+                "text": "".join(pages),
+                "pages": pages,
+                "page_count": len(pages),
+            }
+        return {
+            "content": content,
+            "text": read_docx_from_bytes(content),
+            "pages": None,
+            "page_count": get_docx_page_count(content),
+        }
+
+    stages = {
+        "extract": extract,
+        "reduce": function_app.get_prompt_text,
+        "prefilter": lambda text: apply_prefilter(text, args.prefilter),
+        "gpt": lambda text: function_app.get_extraction_response(text, metadata_results),
+        "glossary": lambda text: function_app.build_glossary_entries(
+            "profile", metadata_results, text
+        ),
+        "csv": create_csv_string,
+    }
+    results = []
+    for path in paths:
+        with open(path, "rb") as f:
+            content = f.read()
+        name = os.path.basename(path)
+        outputs = {}
+
+        def get_input(stage):
+            # The outputs of stages that are not profiled are computed once.
+            previous = TRANSLATE_INPUTS[stage]
+            if previous is None:
+                return content
+            if previous not in outputs:
+                outputs[previous] = stages[previous](get_input(previous))
+            return outputs[previous]
+
+        for stage in TRANSLATE_STAGES:
+            if stage not in args.stages:
+                continue
+            try:
+                argument = get_input(stage)
+            except Exception as e:
+                results.append(failed_result(f"{name}.{stage}", f"{type(e).__name__}: {e}"))
+                continue
+            result, output = profile_stage(f"{name}.{stage}", stages[stage], argument, args)
+            results.append(result)
+            if result["error"] is None:
+                outputs[stage] = output
+    return results
+
+
+def failed_result(label, error):
+    """
+    Returns the result of a stage that could not run.
+
+    Args:
+        label (str): The file name and stage.
+        error (str): The reason.
+
+    Returns:
+        dict: The result, in the format of profile_stage.
+    """
+    return {"stage": label, "seconds": [], "profile": None, "top": None, "error": error}
+
+
+def run_watermark_stages(server_url, paths, args):
+    """
+    Profiles the stages of the watermark function. Runs in the process of the app.
+
+    Args:
+        server_url (str): The base URL of the stand-in services.
+        paths (list): The paths of the documents.
+        args (argparse.Namespace): The options of the run.
+
+    Returns:
+        list: The result of each stage of each document.
+    """
+    function_app = load_app("watermark", server_url, args.log_level)
+
+    results = []
+    for path in paths:
+        with open(path, "rb") as f:
+            content = f.read()
+        name = os.path.basename(path)
+        pdf_content = content if path.endswith(".pdf") else None
+        if path.endswith(".docx") and "convert" in args.stages:
+            if shutil.which("libreoffice"):
+                result, pdf_content = profile_stage(
+                    f"{name}.convert", function_app.convert_docx_to_pdf, content, args
+                )
+            else:
+                result = failed_result(f"{name}.convert", "libreoffice is not installed")
+            results.append(result)
+        if "watermark" in args.stages and pdf_content:
+            result, _ = profile_stage(
+                f"{name}.watermark", function_app.add_pdf_watermark, pdf_content, args
+            )
+            results.append(result)
+    return results
+
+
+def print_result(result):
+    """
+    Prints the timings and profile of a stage.
+
+    Args:
+        result (dict): The result, as returned by profile_stage.
+    """
+    seconds = result["seconds"]
+    if seconds:
+        print(
+            f"{result['stage']:<40}{len(seconds):>4} runs  median "
+            f"{format_seconds(statistics.median(seconds))} s  min {format_seconds(min(seconds))} s"
+            + (f"  -> {result['profile']}" if result["profile"] else "")
+        )
+    if result["error"]:
+        print(f"{result['stage']:<40} failed: {result['error'][:160]}")
+    if result["top"]:
+        print(result["top"])
+
+
+def main():
+    """
+    Profiles the stages on the files and prints the results.
+    """
+    from fake_services import FakeServices
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0])
+    parser.add_argument("files", nargs="+", help="DOCX and PDF files to run the stages on")
+    parser.add_argument(
+        "--stages",
+        nargs="+",
+        default=list(TRANSLATE_STAGES + WATERMARK_STAGES),
+        choices=TRANSLATE_STAGES + WATERMARK_STAGES,
+        help="stages to profile (default all)",
+    )
+    parser.add_argument(
+        "--profiler", choices=("cprofile", "sample", "none"), default="cprofile", help="profiler"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each stage")
+    parser.add_argument(
+        "--interval", type=float, default=0.001, help="seconds between samples of the sampler"
+    )
+    parser.add_argument("--top", type=int, default=15, help="functions printed per cProfile stage")
+    parser.add_argument("--sort", default="cumulative", help="sort key of the cProfile statistics")
+    parser.add_argument(
+        "--gpt",
+        choices=("stub", "real", "local"),
+        default="stub",
+        help="backend of the glossary extraction call",
+    )
+    parser.add_argument(
+        "--openai-seconds", type=float, default=0, help="latency of the stubbed completions"
+    )
+    parser.add_argument("--prompt", default=DEFAULT_PROMPT, help="system prompt of the extraction")
+    parser.add_argument(
+        "--prefilter", type=json.loads, help="prefilter_config of the prompt, as JSON"
+    )
+    parser.add_argument("--output-dir", default="profiles", help="directory of the profiles")
+    parser.add_argument("--log-level", default="WARNING", help="log level of the function apps")
+    parser.add_argument("--json", help="also write the timings to this file")
+    args = parser.parse_args()
+    if args.gpt == "local" and args.prefilter is None:
+        # The local extractor is selected by the pre-filter of the prompt.
+        args.prefilter = {"name": "address"}
+
+    for path in args.files:
+        if not path.endswith((".docx", ".pdf")):
+            parser.error(f"{path} is not a DOCX or PDF file")
+    paths = [os.path.abspath(path) for path in args.files]
+    environment = {}
+    if args.gpt == "real":
+        missing = [name for name in OPENAI_VARIABLES if not os.getenv(name)]
+        if missing:
+            parser.error(f"--gpt real needs {', '.join(missing)}")
+        environment = {name: os.environ[name] for name in OPENAI_VARIABLES}
+    os.makedirs(args.output_dir, exist_ok=True)
+    args.output_dir = os.path.abspath(args.output_dir)
+
+    services = FakeServices(openai_seconds=args.openai_seconds, openai_seconds_per_token=0).start()
+    try:
+        results = []
+        if set(args.stages) & set(TRANSLATE_STAGES):
+            results += run_in_app_process(
+                run_translate_stages, services.url, paths, args, environment
+            )
+        if set(args.stages) & set(WATERMARK_STAGES):
+            results += run_in_app_process(run_watermark_stages, services.url, paths, args)
+    finally:
+        services.stop()
+
+    for result in results:
+        print_result(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump([{k: v for k, v in r.items() if k != "top"} for r in results], f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Load test of the shared rate limiter against a local Postgres.
+
+Several processes, standing in for function app instances, call the limiter
+of the translate function for the same bucket. The achieved rate is compared
+with the configured limit: with a bucket holding one minute of capacity, at
+most limit + duration * limit / 60 calls may succeed.
+
+The database is configured with the DB_* environment variables used by the
+function app, for example:
+
+    docker run -d -p 5432:5432 -e POSTGRES_PASSWORD=postgres postgres:16
+    DB_HOST=localhost DB_NAME=postgres DB_USER=postgres DB_PASSWORD=postgres \\
+        DB_SSLMODE=disable python benchmarks/rate_limiter_load.py --limit 120
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "document-translate-function")
+)
+
+CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+    bucket TEXT PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL
+)
+"""
+
+
+def run_worker(bucket, limit, duration, results):
+    """
+    Calls the limiter until the duration has elapsed.
+
+    Args:
+        bucket (str): The bucket name.
+        limit (int): The limit in calls per minute.
+        duration (float): The test duration in seconds.
+        results (multiprocessing.Queue): Receives the number of calls made.
+    """
+    from rate_limiter import acquire
+
+    calls = 0
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        try:
+            acquire([(bucket, 1, limit)], max_wait_seconds=deadline - time.time())
+        except TimeoutError:
+            break
+        if time.time() < deadline:
+            calls += 1
+    results.put(calls)
+
+
+def main():
+    """
+    Runs the load test and prints the achieved rate.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0])
+    parser.add_argument("--processes", type=int, default=8, help="number of concurrent callers")
+    parser.add_argument("--limit", type=int, default=120, help="calls per minute")
+    parser.add_argument("--duration", type=float, default=30, help="test duration in seconds")
+    args = parser.parse_args()
+
+    from database_helper import DatabaseHandler
+
+    bucket = f"benchmark:{os.getpid()}"
+    conn = DatabaseHandler().get_connection()
+    with conn.cursor() as cursor:
+        cursor.execute(CREATE_TABLE)
+        cursor.execute("DELETE FROM rate_limit_buckets WHERE bucket LIKE %s", ("benchmark:%",))
+    conn.commit()
+    conn.close()
+
+    results = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(
+            target=run_worker, args=(bucket, args.limit, args.duration, results)
+        )
+        for _ in range(args.processes)
+    ]
+    started = time.time()
+    for worker in workers:
+        worker.start()
+    calls = sum(results.get() for _ in workers)
+    for worker in workers:
+        worker.join()
+    elapsed = time.time() - started
+
+    allowed = args.limit + args.duration * args.limit / 60
+    print(
+        f"{calls} calls in {elapsed:.1f} s from {args.processes} processes, "
+        f"at most {allowed:.0f} allowed ({'ok' if calls <= allowed else 'limit exceeded'})"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -137,6 +137,13 @@ function Deploy-FunctionApps {
         }
     }
 
+    # Copy the modules of shared/ into each function app before packaging
+    Write-Log "Syncing shared modules..."
+    python ../sync_shared_modules.py
+    if ($LASTEXITCODE -ne 0) {
+        Handle-Error "Failed to sync the shared modules."
+    }
+
     # Zip the function app code
     Write-Log "Zipping function app code..."
     Compress-Archive -Path "../../document-upload-function/*" -DestinationPath "document-upload-function.zip" -Force
@@ -157,10 +164,13 @@ function Deploy-FunctionApps {
         "AZURE_STORAGE_ACCOUNT" = $storageDetails.Name
     }
 
-    # # Deploy Upload Function (without translation settings)
+    # # Deploy Upload Function (with the Translator key only, used to cancel translation jobs)
     Write-Log "Deploying Upload Function..."
+    $mergedUploadSettings = $configSettings.Clone()
+    $mergedUploadSettings["TRANSLATE_SUBSCRIPTION_KEY"] = $translationService.SubscriptionKey
+
     Create-Or-Update-FunctionApp -functionAppName $functionAppNameUpload -runtime "python" -resourceGroupName $resourceGroupName -appServicePlanName $appServicePlanName -storageAccountName $storageAccountName
-    Set-FunctionAppSettings -functionAppName $functionAppNameUpload -resourceGroupName $resourceGroupName -settings $configSettings
+    Set-FunctionAppSettings -functionAppName $functionAppNameUpload -resourceGroupName $resourceGroupName -settings $mergedUploadSettings
     Deploy-FunctionAppCode -functionAppName $functionAppNameUpload -sourceZip "document-upload-function.zip" -resourceGroupName $resourceGroupName
 
     # Deploy Translate Function (with translation and OpenAI settings)
@@ -0,0 +1,81 @@
+"""
+Copies the modules shared by the function apps from shared/ into each app.
+
+Each function app folder is deployed on its own, so the modules they share,
+such as metrics.py, are vendored into every app. Edit them in shared/ only,
+then update the copies:
+
+    python deployment-scripts/sync_shared_modules.py
+
+With --check, nothing is written, and the exit status is 1 if a copy is
+missing or differs from its source. The CI workflow runs the check.
+"""
+
+import argparse
+import filecmp
+import os
+import shutil
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SHARED_DIR = os.path.join(REPO_DIR, "shared")
+APP_DIRS = (
+    "document-translate-function",
+    "document-upload-function",
+    "document-watermark-function",
+)
+
+
+def get_shared_modules():
+    """
+    Returns the modules of the shared folder.
+
+    Returns:
+        list: The file names of the modules.
+    """
+    return sorted(name for name in os.listdir(SHARED_DIR) if name.endswith(".py"))
+
+
+def sync_shared_modules(check=False):
+    """
+    Copies each shared module into each function app, unless the copy is up to date.
+
+    Args:
+        check (bool): Only report the copies that are out of date.
+
+    Returns:
+        list: The paths of the copies that were out of date, relative to the repository.
+    """
+    stale = []
+    for app_dir in APP_DIRS:
+        for name in get_shared_modules():
+            source = os.path.join(SHARED_DIR, name)
+            copy = os.path.join(REPO_DIR, app_dir, name)
+            if os.path.exists(copy) and filecmp.cmp(source, copy, shallow=False):
+                continue
+            stale.append(os.path.relpath(copy, REPO_DIR))
+            if not check:
+                shutil.copyfile(source, copy)
+    return stale
+
+
+def main():
+    """
+    Updates or checks the copies of the shared modules.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0])
+    parser.add_argument(
+        "--check", action="store_true", help="fail if a copy is out of date instead of updating it"
+    )
+    args = parser.parse_args()
+
+    stale = sync_shared_modules(check=args.check)
+    for path in stale:
+        print(f"{'out of date' if args.check else 'updated'}: {path}")
+    if args.check and stale:
+        print("Run python deployment-scripts/sync_shared_modules.py and commit the copies.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,9 @@
-CREATE TABLE file_translation_logs (
+-- Schema of the translation accelerator. Every statement can run again on an
+-- existing database: tables and indexes are only created when missing, and the
+-- upgrade section adds the columns and constraints of later versions to tables
+-- created by an earlier version of this script.
+
+CREATE TABLE IF NOT EXISTS file_translation_logs (
     file_name TEXT PRIMARY KEY,
     landing_zone_path TEXT,
     file_type TEXT CHECK (file_type IN ('pdf', 'docx')),
@@ -7,13 +12,13 @@ CREATE TABLE file_translation_logs (
     upload_status TEXT CHECK (upload_status IN ('failed', 'in progress', 'done')),
     translation_date DATE,
     translation_datetime TIMESTAMP,
-    translation_status TEXT CHECK (translation_status IN ('failed', 'in progress', 'done')),
+    translation_status TEXT CHECK (translation_status IN ('failed', 'in progress', 'done', 'cancelled')),
     translated_zone_path TEXT,
     fromLanguage TEXT,
     toLanguage TEXT,
     watermark_date DATE,
     watermark_datetime TIMESTAMP,
-    watermark_status TEXT CHECK (watermark_status IN ('failed', 'in progress', 'done')),
+    watermark_status TEXT CHECK (watermark_status IN ('failed', 'in progress', 'done', 'cancelled')),
     watermark_zone_path TEXT,
     glossary_content JSON,
     glossary_processing_status TEXT CHECK (glossary_processing_status IN ('failed', 'in progress', 'done')),
@@ -22,22 +27,143 @@ CREATE TABLE file_translation_logs (
     exclusion_text TEXT,
     statue INTEGER,
     prompt_id INTEGER,
-    additional_glossary_content_url TEXT
+    additional_glossary_content_url TEXT,
+    file_size_bytes BIGINT,
+    page_count INTEGER,
+    lane TEXT CHECK (lane IN ('interactive', 'batch')),
+    translation_operation_location TEXT,
+    cancelled_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_file_name ON file_translation_logs (file_name);
+
+CREATE TABLE IF NOT EXISTS file_translation_targets (
+    file_name TEXT REFERENCES file_translation_logs (file_name) ON DELETE CASCADE,
+    toLanguage TEXT,
+    target_order INTEGER,
+    translated_file_name TEXT,
+    translation_date DATE,
+    translation_datetime TIMESTAMP,
+    translation_status TEXT CHECK (translation_status IN ('failed', 'in progress', 'done', 'cancelled')),
+    translated_zone_path TEXT,
+    watermark_date DATE,
+    watermark_datetime TIMESTAMP,
+    watermark_status TEXT CHECK (watermark_status IN ('failed', 'in progress', 'done', 'cancelled')),
+    watermark_zone_path TEXT,
+    PRIMARY KEY (file_name, toLanguage)
+);
+
+CREATE INDEX IF NOT EXISTS idx_translated_file_name ON file_translation_targets (translated_file_name);
+
+CREATE TABLE IF NOT EXISTS translation_jobs (
+    file_name TEXT PRIMARY KEY,
+    uploaded_by TEXT NOT NULL,
+    size_bytes BIGINT,
+    lane TEXT NOT NULL DEFAULT 'batch' CHECK (lane IN ('interactive', 'batch')),
+    status TEXT NOT NULL CHECK (status IN ('queued', 'running', 'done', 'failed', 'cancelled')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    queued_at TIMESTAMPTZ NOT NULL,
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS idx_translation_jobs_status ON translation_jobs (lane, status, uploaded_by);
+
+CREATE TABLE IF NOT EXISTS translation_user_shares (
+    uploaded_by TEXT PRIMARY KEY,
+    weight DOUBLE PRECISION NOT NULL DEFAULT 1,
+    virtual_time DOUBLE PRECISION NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS pipeline_stage_timings (
+    id BIGSERIAL PRIMARY KEY,
+    file_name TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    parent TEXT,
+    started_at TIMESTAMPTZ NOT NULL,
+    duration_ms DOUBLE PRECISION NOT NULL,
+    bytes BIGINT,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    attributes JSON
+);
+
+CREATE INDEX IF NOT EXISTS idx_pipeline_stage_timings_file_name ON pipeline_stage_timings (file_name);
+CREATE INDEX IF NOT EXISTS idx_pipeline_stage_timings_started_at ON pipeline_stage_timings (started_at, stage);
+
+CREATE TABLE IF NOT EXISTS openai_usage_logs (
+    id BIGSERIAL PRIMARY KEY,
+    file_name TEXT NOT NULL,
+    prompt_id INTEGER,
+    uploaded_by TEXT,
+    backend TEXT NOT NULL CHECK (backend IN ('openai', 'local')),
+    deployment TEXT,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    total_tokens INTEGER NOT NULL DEFAULT 0,
+    latency_ms DOUBLE PRECISION NOT NULL,
+    wait_ms DOUBLE PRECISION NOT NULL DEFAULT 0,
+    input_chars INTEGER,
+    page_count INTEGER,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
 );
 
-CREATE INDEX idx_file_name ON file_translation_logs (file_name);
+CREATE INDEX IF NOT EXISTS idx_openai_usage_logs_created_at ON openai_usage_logs (created_at);
+CREATE INDEX IF NOT EXISTS idx_openai_usage_logs_prompt_id ON openai_usage_logs (prompt_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_openai_usage_logs_uploaded_by ON openai_usage_logs (uploaded_by, created_at);
 
-CREATE TABLE prompt_logs (
+CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+    bucket TEXT PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS prompt_logs (
     id SERIAL PRIMARY KEY,
     prompt_name TEXT,
     prompt_text TEXT,
+    prefilter_config JSON,
+    extraction_backend TEXT DEFAULT 'openai' CHECK (extraction_backend IN ('openai', 'local')),
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
-CREATE INDEX idx_id ON prompt_logs (id);
+CREATE INDEX IF NOT EXISTS idx_id ON prompt_logs (id);
+
+-- Upgrade of a database created by an earlier version of this script
+
+ALTER TABLE file_translation_logs
+    ADD COLUMN IF NOT EXISTS file_size_bytes BIGINT,
+    ADD COLUMN IF NOT EXISTS page_count INTEGER,
+    ADD COLUMN IF NOT EXISTS lane TEXT CHECK (lane IN ('interactive', 'batch')),
+    ADD COLUMN IF NOT EXISTS translation_operation_location TEXT,
+    ADD COLUMN IF NOT EXISTS cancelled_at TIMESTAMP;
+
+ALTER TABLE file_translation_logs
+    DROP CONSTRAINT IF EXISTS file_translation_logs_translation_status_check,
+    ADD CONSTRAINT file_translation_logs_translation_status_check
+        CHECK (translation_status IN ('failed', 'in progress', 'done', 'cancelled')),
+    DROP CONSTRAINT IF EXISTS file_translation_logs_watermark_status_check,
+    ADD CONSTRAINT file_translation_logs_watermark_status_check
+        CHECK (watermark_status IN ('failed', 'in progress', 'done', 'cancelled'));
+
+ALTER TABLE prompt_logs
+    ADD COLUMN IF NOT EXISTS prefilter_config JSON,
+    ADD COLUMN IF NOT EXISTS extraction_backend TEXT DEFAULT 'openai'
+        CHECK (extraction_backend IN ('openai', 'local'));
+
+ALTER TABLE openai_usage_logs
+    ADD COLUMN IF NOT EXISTS wait_ms DOUBLE PRECISION NOT NULL DEFAULT 0;
+
+UPDATE prompt_logs
+SET prefilter_config = '{"name": "address", "min_score": 2, "context_lines": 2}'
+WHERE prompt_name = 'Address Extraction' AND prefilter_config IS NULL;
+
+-- Default prompt
 
-INSERT INTO prompt_logs (prompt_name, prompt_text) VALUES (
+INSERT INTO prompt_logs (prompt_name, prompt_text, prefilter_config)
+SELECT
     'Address Extraction',
-    '- Extract all location addresses from the provided text. \n- Maintain the original address format. If the address spans multiple lines, keep it multiline. \n- Do not translate or modify the content. \n- Extract each line of the address in a separate line. \n- Provide only the extracted addresses without adding any additional text.\n'
-);
\ No newline at end of file
+    '- Extract all location addresses from the provided text. \n- Maintain the original address format. If the address spans multiple lines, keep it multiline. \n- Do not translate or modify the content. \n- Extract each line of the address in a separate line. \n- Provide only the extracted addresses without adding any additional text.\n',
+    '{"name": "address", "min_score": 2, "context_lines": 2}'
+WHERE NOT EXISTS (SELECT 1 FROM prompt_logs WHERE prompt_name = 'Address Extraction');
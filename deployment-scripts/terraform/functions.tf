@@ -29,7 +29,10 @@ resource "azurerm_service_plan" "functions" {
 }
 
 resource "azurerm_linux_function_app" "upload_function" {
-  depends_on                 = [azurerm_postgresql_flexible_server_database.citus_db]
+  depends_on = [
+    azurerm_postgresql_flexible_server_database.citus_db,
+    azurerm_cognitive_account.translator
+  ]
   name                       = "${local.name_prefix}-${var.function_app_name_upload}-${random_string.unique.result}"
   location                   = azurerm_resource_group.rg.location
   resource_group_name        = azurerm_resource_group.rg.name
@@ -66,7 +69,8 @@ resource "azurerm_linux_function_app" "upload_function" {
     DB_USER                        = azurerm_postgresql_flexible_server.translator_db.administrator_login
     DB_PASSWORD                    = random_password.db_password.result
     DB_SSLMODE                     = "require"
-
+    # Used to cancel the batch translation jobs of Azure Translator
+    TRANSLATE_SUBSCRIPTION_KEY     = azurerm_cognitive_account.translator.primary_access_key
   }
   #   zip_deploy_file = "./document-upload-function.zip"
   tags = local.default_tags
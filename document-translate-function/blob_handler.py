@@ -6,15 +6,55 @@ upload content to Azure Blob Storage.
 """
 
 import logging
+from functools import lru_cache
 import requests
+from azure.core.exceptions import ResourceExistsError
 from azure.storage.blob import BlobServiceClient
-from environment_variables import AZURE_STORAGE_ACCOUNT, SAS_TOKEN
+from instrumentation import record
+from resilience import get_session, request
 
-# Construct the Blob service client
-blob_service_client = BlobServiceClient(
-    account_url=f"https://{AZURE_STORAGE_ACCOUNT}.blob.core.windows.net",
-    credential={SAS_TOKEN},
-)
+
+@lru_cache(maxsize=None)
+def get_blob_service_client(storage_account, token):
+    """
+    Returns a Blob service client for the storage account, reused across calls.
+
+    Args:
+        storage_account (str): The Azure storage account name.
+        token (str): The SAS token for authentication.
+
+    Returns:
+        BlobServiceClient: The Blob service client.
+    """
+    return BlobServiceClient(
+        account_url=f"https://{storage_account}.blob.core.windows.net",
+        credential=token,
+    )
+
+
+def warm_up_blob_storage(storage_account, token, container, blob_path):
+    """
+    Opens the connections of the shared HTTP session and of the Blob service
+    client to the storage account, by checking whether a blob exists.
+
+    Args:
+        storage_account (str): The Azure storage account name.
+        token (str): The SAS token for authentication, starting with "?".
+        container (str): The name of the container.
+        blob_path (str): The path of the blob in the container. It does not need to exist.
+
+    Raises:
+        requests.RequestException: If the storage account cannot be reached with the session.
+        azure.core.exceptions.AzureError: If it cannot be reached with the Blob client.
+    """
+    get_session().head(
+        f"https://{storage_account}.blob.core.windows.net/{container}/{blob_path}{token}",
+        timeout=10,
+    )
+    blob_client = get_blob_service_client(storage_account, token).get_blob_client(
+        container=container, blob=blob_path
+    )
+    blob_client.exists()
 
 
 def validate_source_url(source_url):
@@ -29,7 +69,7 @@ def validate_source_url(source_url):
     """
     logging.info("Validating source URL: %s", source_url)
     try:
-        response = requests.head(source_url, timeout=10)
+        response = request("HEAD", source_url, endpoint="blob", hedge=True, timeout=10)
         if response.status_code == 200:
             logging.info("Source file exists")
             return True
@@ -43,7 +83,7 @@ def validate_source_url(source_url):
 
 
 def upload_to_blob(
-    storage_account, token, container, blob_directory, file_name, content
+    storage_account, token, container, blob_directory, file_name, content, skip_if_exists=False
 ):
     """
     Uploads content to Azure Blob Storage.
@@ -55,24 +95,30 @@ def upload_to_blob(
         blob_directory (str): The directory in the blob storage.
         file_name (str): The name of the file to be uploaded.
         content (str): The content to be uploaded.
+        skip_if_exists (bool): Keep an existing blob instead of overwriting it. Use this
+            for content-addressed blobs, whose name already identifies their content.
 
     Returns:
         str: The full URL for the uploaded blob.
     """
-    blob_service = BlobServiceClient(
-        account_url=f"https://{storage_account}.blob.core.windows.net",
-        credential=token,
-    )
+    blob_service = get_blob_service_client(storage_account, token)
     blob_path = f"{blob_directory}/{file_name}"
     blob_client = blob_service.get_blob_client(container=container, blob=blob_path)
 
-    logging.info("Uploading CSV to Azure Blob Storage: %s", blob_path)
     try:
-        blob_client.upload_blob(content, overwrite=True)
+        if skip_if_exists and blob_client.exists():
+            logging.info("Blob already exists, skipping upload: %s", blob_path)
+        else:
+            logging.info("Uploading to Azure Blob Storage: %s", blob_path)
+            blob_client.upload_blob(content, overwrite=not skip_if_exists)
+            record(bytes=len(content))
+            logging.info("Upload successful.")
+    except ResourceExistsError:
+        # Another job uploaded the same content-addressed blob in the meantime.
+        logging.info("Blob was created concurrently, skipping upload: %s", blob_path)
     except Exception as e:
         logging.error("Failed to upload blob: %s", e)
         raise
-    logging.info("Upload successful.")
 
     # Construct and return the full URL for the uploaded blob
     glossary_url = (
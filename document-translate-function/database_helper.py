@@ -9,8 +9,13 @@ import logging
 import os
 import json
 import re
+from datetime import datetime
+import time
 import psycopg2
 from psycopg2 import sql, DatabaseError, IntegrityError
+from psycopg2.extensions import connection
+from connection_pool import ConnectionPool
+from metrics import counter, gauge, histogram
 
 # PostgreSQL connection details
 DB_HOST = os.getenv("DB_HOST")
@@ -19,6 +24,7 @@ DB_NAME = os.getenv("DB_NAME")
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_SSLMODE = os.getenv("DB_SSLMODE", "require")
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "10"))
 
 # Log environment variables to check if they exist
 logging.debug("DB_HOST: %s", DB_HOST)
@@ -27,6 +33,43 @@ logging.debug("DB_NAME: %s", DB_NAME)
 logging.debug("DB_USER: %s", DB_USER)
 logging.debug("DB_PASSWORD: %s", '****' if DB_PASSWORD else None)
 logging.debug("DB_SSLMODE: %s", DB_SSLMODE)
+logging.debug("DB_CONNECT_TIMEOUT: %s", DB_CONNECT_TIMEOUT)
+
+DB_CONNECTIONS_IN_USE = gauge("db_connections_in_use", "Open database connections.")
+DB_CONNECTIONS_OPENED = counter("db_connections_opened_total", "Database connections opened.")
+DB_CONNECT_SECONDS = histogram(
+    "db_connect_seconds",
+    "Time to open a database connection.",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+
+class TrackedConnection(connection):
+    """
+    A database connection counted in the db_connections_in_use gauge until it is closed.
+
+    Closing it returns it to the pool of the instance, if the pool has room (see
+    connection_pool.py).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        DB_CONNECTIONS_IN_USE.inc()
+
+    def close(self):
+        if not CONNECTION_POOL.release(self):
+            self.disconnect()
+
+    def disconnect(self):
+        """
+        Closes the connection instead of returning it to the pool.
+        """
+        if not self.closed:
+            DB_CONNECTIONS_IN_USE.dec()
+        super().close()
+
+
+CONNECTION_POOL = ConnectionPool()
 
 
 class DatabaseHandler:
@@ -37,6 +80,7 @@ class DatabaseHandler:
     def get_connection(self):
         """
         Establish a connection to the PostgreSQL database using the provided connection details.
+        An idle connection of the pool is reused if there is one.
 
         Returns:
             psycopg2.connection: A connection object to interact with the PostgreSQL database.
@@ -44,19 +88,44 @@ class DatabaseHandler:
         Raises:
             psycopg2.OperationalError: If there is an error connecting to the database.
         """
+        conn = CONNECTION_POOL.acquire()
+        if conn is not None:
+            return conn
+        started = time.perf_counter()
         try:
-            return psycopg2.connect(
+            conn = psycopg2.connect(
                 host=DB_HOST,
                 port=DB_PORT,
                 dbname=DB_NAME,
                 user=DB_USER,
                 password=DB_PASSWORD,
                 sslmode=DB_SSLMODE,
+                connect_timeout=DB_CONNECT_TIMEOUT,
+                connection_factory=TrackedConnection,
             )
+            DB_CONNECT_SECONDS.observe(time.perf_counter() - started)
+            DB_CONNECTIONS_OPENED.inc()
+            return conn
         except psycopg2.OperationalError as e:
             logging.error("Error connecting to the database: %s", str(e))
             raise
 
+    def ping(self):
+        """
+        Opens a connection and runs a trivial query, leaving the connection in
+        the pool for the next query. Used to warm up the instance.
+
+        Raises:
+            psycopg2.Error: If the database cannot be reached.
+        """
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.commit()
+        finally:
+            conn.close()
+
     def update_file_record(
         self,
         file_name,
@@ -71,6 +140,8 @@ class DatabaseHandler:
         """
         Update the record of the file in the PostgreSQL database.
 
+        Files whose translation was cancelled are left unchanged.
+
         Args:
             file_name (str): The name of the file.
             translation_date (datetime.date): The date of the translation.
@@ -100,7 +171,7 @@ class DatabaseHandler:
                         glossary_zone_path = %s,
                         glossary_processing_status = %s,
                         glossary_content = %s                    
-                    WHERE file_name = %s
+                    WHERE file_name = %s AND cancelled_at IS NULL
                     """
                 )
                 cursor.execute(
@@ -133,6 +204,264 @@ class DatabaseHandler:
             if conn:
                 conn.close()
 
+    def update_target_records(self, file_name, targets):
+        """
+        Record the translation result of each target language of the file.
+
+        Targets whose translation was cancelled are left unchanged.
+
+        Args:
+            file_name (str): The name of the file.
+            targets (list): One dictionary per target language with the keys language,
+                translated_file_name, translation_status and translated_zone_path.
+        """
+        conn = None
+        translation_date = datetime.now().date()
+        translation_datetime = datetime.now()
+        try:
+            conn = self.get_connection()
+            with conn.cursor() as cursor:
+                upsert_query = sql.SQL(
+                    """
+                    INSERT INTO file_translation_targets (
+                        file_name, toLanguage, target_order, translated_file_name, translation_date,
+                        translation_datetime, translation_status, translated_zone_path
+                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (file_name, toLanguage) DO UPDATE
+                    SET translated_file_name = EXCLUDED.translated_file_name,
+                        translation_date = EXCLUDED.translation_date,
+                        translation_datetime = EXCLUDED.translation_datetime,
+                        translation_status = EXCLUDED.translation_status,
+                        translated_zone_path = EXCLUDED.translated_zone_path
+                    WHERE file_translation_targets.translation_status IS DISTINCT FROM 'cancelled'
+                    """
+                )
+                for target_order, target in enumerate(targets):
+                    cursor.execute(
+                        upsert_query,
+                        (
+                            file_name,
+                            target["language"],
+                            target_order,
+                            target["translated_file_name"],
+                            translation_date,
+                            translation_datetime,
+                            target["translation_status"],
+                            target["translated_zone_path"],
+                        ),
+                    )
+                conn.commit()
+        except DatabaseError as e:
+            logging.error("Database error: %s", str(e))
+            if conn:
+                conn.rollback()
+        except Exception as e:
+            logging.error("Unexpected error: %s", str(e))
+            if conn:
+                conn.rollback()
+        finally:
+            if conn:
+                conn.close()
+
+    def update_glossary_record(self, file_name, glossary_processing_status, glossary_content):
+        """
+        Update only the glossary columns of the file record.
+
+        This records the glossary once it is built and uploaded, ahead of the
+        final update once the translation has finished. Records whose translation
+        was cancelled are left unchanged.
+
+        Args:
+            file_name (str): The name of the file.
+            glossary_processing_status (str): The status of the glossary processing
+                ('failed', 'in progress', 'done').
+            glossary_content (str): The content of the glossary.
+        """
+        conn = None
+        try:
+            conn = self.get_connection()
+            with conn.cursor() as cursor:
+                update_query = sql.SQL(
+                    """
+                    UPDATE file_translation_logs
+                    SET glossary_processing_status = %s,
+                        glossary_content = %s
+                    WHERE file_name = %s AND cancelled_at IS NULL
+                    """
+                )
+                cursor.execute(
+                    update_query,
+                    (
+                        glossary_processing_status,
+                        json.dumps(glossary_content) if glossary_content else None,
+                        file_name,
+                    ),
+                )
+                conn.commit()
+        except DatabaseError as e:
+            logging.error("Database error: %s", str(e))
+            if conn:
+                conn.rollback()
+        except Exception as e:
+            logging.error("Unexpected error: %s", str(e))
+            if conn:
+                conn.rollback()
+        finally:
+            if conn:
+                conn.close()
+
+    def update_translation_operation(self, file_name, operation_location):
+        """
+        Record the URL of the Translator batch job of the file, so that the job
+        can be cancelled while it runs.
+
+        Args:
+            file_name (str): The name of the file.
+            operation_location (str): The URL of the translation job.
+        """
+        conn = None
+        try:
+            conn = self.get_connection()
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    UPDATE file_translation_logs
+                    SET translation_operation_location = %s
+                    WHERE file_name = %s
+                    """,
+                    (operation_location, file_name),
+                )
+                conn.commit()
+        except DatabaseError as e:
+            logging.error("Database error: %s", str(e))
+            if conn:
+                conn.rollback()
+        finally:
+            if conn:
+                conn.close()
+
+    def is_translation_cancelled(self, file_name):
+        """
+        Check whether the translation of the file was cancelled.
+
+        Args:
+            file_name (str): The name of the file.
+
+        Returns:
+            bool: True if the translation was cancelled. False if the database
+                cannot be reached, so processing continues.
+        """
+        conn = None
+        try:
+            conn = self.get_connection()
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT cancelled_at IS NOT NULL FROM file_translation_logs WHERE file_name = %s",
+                    (file_name,),
+                )
+                row = cursor.fetchone()
+                return bool(row and row[0])
+        except DatabaseError as e:
+            logging.error("Database error: %s", str(e))
+            return False
+        finally:
+            if conn:
+                conn.close()
+
+    def insert_stage_timings(self, file_name, rows):
+        """
+        Store the timings of the pipeline stages of a document.
+
+        Args:
+            file_name (str): The name of the file.
+            rows (list): One dictionary per stage with the keys stage, parent,
+                started_at, duration_ms, bytes, prompt_tokens, completion_tokens
+                and attributes.
+        """
+        if not rows:
+            return
+        conn = None
+        try:
+            conn = self.get_connection()
+            with conn.cursor() as cursor:
+                cursor.executemany(
+                    """
+                    INSERT INTO pipeline_stage_timings (
+                        file_name, stage, parent, started_at, duration_ms, bytes,
+                        prompt_tokens, completion_tokens, attributes
+                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    """,
+                    [
+                        (
+                            file_name,
+                            row["stage"],
+                            row["parent"],
+                            row["started_at"],
+                            row["duration_ms"],
+                            row["bytes"],
+                            row["prompt_tokens"],
+                            row["completion_tokens"],
+                            json.dumps(row["attributes"]) if row["attributes"] else None,
+                        )
+                        for row in rows
+                    ],
+                )
+                conn.commit()
+        except DatabaseError as e:
+            logging.error("Database error: %s", str(e))
+            if conn:
+                conn.rollback()
+        finally:
+            if conn:
+                conn.close()
+
+    def insert_openai_usage(self, usage):
+        """
+        Record the token usage and latency of a glossary extraction call.
+
+        Args:
+            usage (dict): The keys file_name, prompt_id, uploaded_by, backend,
+                deployment, prompt_tokens, completion_tokens, total_tokens,
+                latency_ms, wait_ms, input_chars and page_count. latency_ms is the
+                time spent in the calls, wait_ms the time spent waiting for rate
+                limit capacity and between retries.
+        """
+        conn = None
+        try:
+            conn = self.get_connection()
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    INSERT INTO openai_usage_logs (
+                        file_name, prompt_id, uploaded_by, backend, deployment, prompt_tokens,
+                        completion_tokens, total_tokens, latency_ms, wait_ms, input_chars,
+                        page_count
+                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    """,
+                    (
+                        usage["file_name"],
+                        usage["prompt_id"],
+                        usage["uploaded_by"],
+                        usage["backend"],
+                        usage["deployment"],
+                        usage["prompt_tokens"],
+                        usage["completion_tokens"],
+                        usage["total_tokens"],
+                        usage["latency_ms"],
+                        usage["wait_ms"],
+                        usage["input_chars"],
+                        usage["page_count"],
+                    ),
+                )
+                conn.commit()
+        except DatabaseError as e:
+            logging.error("Database error: %s", str(e))
+            if conn:
+                conn.rollback()
+        finally:
+            if conn:
+                conn.close()
+
     def fetch_metadata_text(self, file_name):
         """
         Fetch metadata and exclusion texts from the file_translation_logs table.
@@ -141,8 +470,11 @@ class DatabaseHandler:
             file_name (str): The name of the file to fetch exclusion texts and metadata for.
 
         Returns:
-            dict: A dictionary containing metadata (fromLang, toLang, exclusionTexts, additionalGlossaryContentUrl)
-                and exclusion texts for the given file name.
+            dict: A dictionary containing metadata (fromLang, toLang, toLangs, exclusionTexts,
+                additionalGlossaryContentUrl, lane, uploaded_by), the prompt id, prompt text,
+                pre-filter configuration and extraction backend, and exclusion texts for the
+                given file name. toLangs lists every target language of the upload; toLang
+                is the first of them.
 
         Raises:
             DatabaseError: If there is a general database error.
@@ -152,9 +484,15 @@ class DatabaseHandler:
         result = {
             "fromLang": None,
             "toLang": None,
+            "toLangs": [],
             "exclusionTexts": [],
             "additionalGlossaryContentUrl": None,
-            "prompt_text": None
+            "prompt_text": None,
+            "prefilter_config": None,
+            "extraction_backend": "openai",
+            "lane": None,
+            "prompt_id": None,
+            "uploaded_by": None
         }
 
         try:
@@ -162,7 +500,9 @@ class DatabaseHandler:
             with conn.cursor() as cursor:
                 query = sql.SQL(
                     """
-                    SELECT fromLanguage, toLanguage, exclusion_text, additional_glossary_content_url, prompt_text
+                    SELECT fromLanguage, toLanguage, exclusion_text, additional_glossary_content_url,
+                        prompt_text, prefilter_config, extraction_backend, lane, prompt_id,
+                        uploaded_by
                     FROM file_translation_logs a
                     join prompt_logs b
                     on a.prompt_id = b.id
@@ -177,12 +517,29 @@ class DatabaseHandler:
                     result["toLang"] = row[1]
                     result["additionalGlossaryContentUrl"] = row[3]
                     result["prompt_text"] = row[4] if row[4] is not None else ""
+                    result["prefilter_config"] = row[5]
+                    result["extraction_backend"] = row[6] or "openai"
+                    result["lane"] = row[7]
+                    result["prompt_id"] = row[8]
+                    result["uploaded_by"] = row[9]
 
                     exclusion_texts = row[2]
                     exclusion_texts = row[2] if row[2] is not None else ""
                     result["exclusionTexts"] = [
                         text.strip() for text in re.split(r"\r\n|\n", exclusion_texts)
                     ]
+
+                    cursor.execute(
+                        """
+                        SELECT toLanguage
+                        FROM file_translation_targets
+                        WHERE file_name = %s
+                        ORDER BY target_order
+                        """,
+                        (file_name,),
+                    )
+                    target_languages = [target[0] for target in cursor.fetchall()]
+                    result["toLangs"] = target_languages or [result["toLang"]]
         except DatabaseError as e:
             logging.error("Database error: %s", str(e))
             raise
@@ -194,3 +551,347 @@ class DatabaseHandler:
                 conn.close()
 
         return result
+
+    def take_rate_limit_tokens(self, requests):
+        """
+        Take tokens from shared token buckets, all of them or none.
+
+        The buckets live in the rate_limit_buckets table, so every instance of the
+        function app draws from the same capacity. The bucket rows are locked in
+        name order, refilled from the database clock, and the tokens are only
+        taken if every bucket has enough of them.
+
+        Args:
+            requests (list): (bucket, amount, capacity, refill_per_second) tuples.
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise the number of seconds until
+                every bucket is expected to hold enough tokens.
+
+        Raises:
+            DatabaseError: If there is a general database error.
+        """
+        conn = None
+        try:
+            conn = self.get_connection()
+            with conn.cursor() as cursor:
+                buckets = []
+                for bucket, amount, capacity, refill_per_second in sorted(requests):
+                    cursor.execute(
+                        """
+                        INSERT INTO rate_limit_buckets (bucket, tokens, updated_at)
+                        VALUES (%s, %s, clock_timestamp())
+                        ON CONFLICT (bucket) DO NOTHING
+                        """,
+                        (bucket, capacity),
+                    )
+                    cursor.execute(
+                        """
+                        SELECT tokens, clock_timestamp(),
+                               EXTRACT(EPOCH FROM clock_timestamp() - updated_at)::float8
+                        FROM rate_limit_buckets
+                        WHERE bucket = %s
+                        FOR UPDATE
+                        """,
+                        (bucket,),
+                    )
+                    tokens, now, elapsed = cursor.fetchone()
+                    tokens = min(capacity, tokens + max(elapsed, 0) * refill_per_second)
+                    # A request larger than the bucket could never be served.
+                    amount = min(amount, capacity)
+                    buckets.append((bucket, tokens, amount, refill_per_second, now))
+
+                wait_seconds = max(
+                    (amount - tokens) / refill_per_second if tokens < amount else 0
+                    for _, tokens, amount, refill_per_second, _ in buckets
+                )
+                for bucket, tokens, amount, _, now in buckets:
+                    cursor.execute(
+                        """
+                        UPDATE rate_limit_buckets
+                        SET tokens = %s, updated_at = %s
+                        WHERE bucket = %s
+                        """,
+                        (tokens - amount if wait_seconds == 0 else tokens, now, bucket),
+                    )
+                conn.commit()
+                return wait_seconds
+        except DatabaseError as e:
+            logging.error("Database error: %s", str(e))
+            if conn:
+                conn.rollback()
+            raise
+        finally:
+            if conn:
+                conn.close()
+
+    def enqueue_translation_job(self, file_name, size_bytes, default_lane):
+        """
+        Queue a document for translation under the user who uploaded it, in the
+        lane it was classified into at upload.
+
+        A user without queued or running jobs starts at the lowest virtual time of
+        the active users, so that idle time is not saved up as credit. Documents
+        that are already queued or running are left as they are; jobs that are
+        done, failed or cancelled are queued again.
+
+        Args:
+            file_name (str): The name of the file.
+            size_bytes (int): The size of the document in bytes.
+            default_lane (str): The lane used if the upload was not classified.
+
+        Returns:
+            str: The lane of the job, or None if the job was already queued or running.
+
+        Raises:
+            DatabaseError: If there is a general database error.
+        """
+        conn = None
+        try:
+            conn = self.get_connection()
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(hashtext('translation_jobs'))")
+                cursor.execute(
+                    """
+                    INSERT INTO translation_jobs (file_name, uploaded_by, size_bytes, lane, status, queued_at)
+                    SELECT %s, COALESCE(MAX(uploaded_by), 'unknown'), %s, COALESCE(MAX(lane), %s),
+                        'queued', clock_timestamp()
+                    FROM file_translation_logs
+                    WHERE file_name = %s
+                    ON CONFLICT (file_name) DO UPDATE
+                    SET size_bytes = EXCLUDED.size_bytes,
+                        lane = EXCLUDED.lane,
+                        status = 'queued',
+                        queued_at = EXCLUDED.queued_at,
+                        started_at = NULL,
+                        finished_at = NULL,
+                        attempts = 0
+                    WHERE translation_jobs.status IN ('done', 'failed', 'cancelled')
+                    RETURNING uploaded_by, lane
+                    """,
+                    (file_name, size_bytes, default_lane, file_name),
+                )
+                row = cursor.fetchone()
+                if row is None:
+                    # Blob triggers can fire more than once for the same upload.
+                    conn.commit()
+                    logging.info("%s is already queued or running", file_name)
+                    return None
+                uploaded_by, lane = row
+                cursor.execute(
+                    """
+                    INSERT INTO translation_user_shares (uploaded_by, virtual_time)
+                    SELECT %s, COALESCE(MIN(s.virtual_time), 0)
+                    FROM translation_user_shares s
+                    WHERE EXISTS (
+                        SELECT 1 FROM translation_jobs j
+                        WHERE j.uploaded_by = s.uploaded_by
+                          AND j.status IN ('queued', 'running')
+                          AND j.file_name <> %s
+                    )
+                    ON CONFLICT (uploaded_by) DO UPDATE
+                    SET virtual_time = GREATEST(
+                        translation_user_shares.virtual_time, EXCLUDED.virtual_time
+                    )
+                    """,
+                    (uploaded_by, file_name),
+                )
+                conn.commit()
+                logging.info("Queued %s for %s in the %s lane", file_name, uploaded_by, lane)
+                return lane
+        except DatabaseError as e:
+            logging.error("Database error: %s", str(e))
+            if conn:
+                conn.rollback()
+            raise
+        finally:
+            if conn:
+                conn.close()
+
+    def claim_translation_job(self, lane, max_running, max_jobs_per_user, max_attempts):
+        """
+        Claim the next queued document of a lane, choosing fairly between users.
+
+        Among the candidates, the user with the lowest virtual time wins; their
+        virtual time then advances by 1 / weight, which gives weighted round-robin
+        between users. Nothing is claimed while the lane runs max_running
+        documents, and users already running max_jobs_per_user documents in the
+        lane are skipped. Claims are serialized with an advisory lock, so
+        concurrent instances never claim the same document.
+
+        Args:
+            lane (str): The lane ('interactive', 'batch').
+            max_running (int): The maximum number of running documents in the lane.
+            max_jobs_per_user (int): The maximum number of running documents per user in the lane.
+            max_attempts (int): Documents claimed this many times are not claimed again.
+
+        Returns:
+            str: The name of the claimed file, or None if no document can be started.
+
+        Raises:
+            DatabaseError: If there is a general database error.
+        """
+        conn = None
+        try:
+            conn = self.get_connection()
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(hashtext('translation_jobs'))")
+                cursor.execute(
+                    """
+                    SELECT j.file_name, j.uploaded_by
+                    FROM translation_jobs j
+                    LEFT JOIN translation_user_shares s ON s.uploaded_by = j.uploaded_by
+                    WHERE j.status = 'queued'
+                      AND j.lane = %s
+                      AND j.attempts < %s
+                      AND (
+                          SELECT COUNT(*) FROM translation_jobs r
+                          WHERE r.lane = j.lane AND r.status = 'running'
+                      ) < %s
+                      AND (
+                          SELECT COUNT(*) FROM translation_jobs r
+                          WHERE r.lane = j.lane AND r.uploaded_by = j.uploaded_by
+                            AND r.status = 'running'
+                      ) < %s
+                    ORDER BY COALESCE(s.virtual_time, 0), j.queued_at
+                    LIMIT 1
+                    """,
+                    (lane, max_attempts, max_running, max_jobs_per_user),
+                )
+                row = cursor.fetchone()
+                if row is None:
+                    conn.commit()
+                    return None
+
+                file_name, uploaded_by = row
+                cursor.execute(
+                    """
+                    UPDATE translation_jobs
+                    SET status = 'running', started_at = clock_timestamp(), attempts = attempts + 1
+                    WHERE file_name = %s
+                    """,
+                    (file_name,),
+                )
+                cursor.execute(
+                    """
+                    UPDATE translation_user_shares
+                    SET virtual_time = virtual_time + 1.0 / GREATEST(weight, 0.01)
+                    WHERE uploaded_by = %s
+                    """,
+                    (uploaded_by,),
+                )
+                conn.commit()
+                logging.info("Claimed %s for %s", file_name, uploaded_by)
+                return file_name
+        except DatabaseError as e:
+            logging.error("Database error: %s", str(e))
+            if conn:
+                conn.rollback()
+            raise
+        finally:
+            if conn:
+                conn.close()
+
+    def count_translation_jobs(self):
+        """
+        Count the queued and running documents of each lane.
+
+        Returns:
+            dict: The number of documents, keyed by (lane, status).
+        """
+        conn = None
+        try:
+            conn = self.get_connection()
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    SELECT lane, status, COUNT(*)
+                    FROM translation_jobs
+                    WHERE status IN ('queued', 'running')
+                    GROUP BY lane, status
+                    """
+                )
+                counts = {
+                    (lane, status): 0
+                    for lane in ("interactive", "batch")
+                    for status in ("queued", "running")
+                }
+                for lane, status, count in cursor.fetchall():
+                    counts[(lane, status)] = count
+                return counts
+        finally:
+            if conn:
+                conn.close()
+
+    def finish_translation_job(self, file_name, status):
+        """
+        Record the end of the processing of a queued document.
+
+        Args:
+            file_name (str): The name of the file.
+            status (str): The final status ('done', 'failed', 'cancelled').
+        """
+        conn = None
+        try:
+            conn = self.get_connection()
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    UPDATE translation_jobs
+                    SET status = %s, finished_at = clock_timestamp()
+                    WHERE file_name = %s
+                    """,
+                    (status, file_name),
+                )
+                conn.commit()
+        except DatabaseError as e:
+            logging.error("Database error: %s", str(e))
+            if conn:
+                conn.rollback()
+        finally:
+            if conn:
+                conn.close()
+
+    def requeue_stale_translation_jobs(self, lane, stale_seconds, max_attempts):
+        """
+        Requeue documents whose processing was interrupted, e.g. by an instance
+        being recycled, and fail those that were already retried.
+
+        Args:
+            lane (str): The lane ('interactive', 'batch').
+            stale_seconds (int): Running documents started longer ago are stale.
+            max_attempts (int): Stale documents claimed this many times are failed.
+
+        Returns:
+            int: The number of stale documents.
+        """
+        conn = None
+        try:
+            conn = self.get_connection()
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    UPDATE translation_jobs
+                    SET status = CASE WHEN attempts < %s THEN 'queued' ELSE 'failed' END,
+                        finished_at = CASE WHEN attempts < %s THEN NULL ELSE clock_timestamp() END
+                    WHERE status = 'running'
+                      AND lane = %s
+                      AND started_at < clock_timestamp() - make_interval(secs => %s)
+                    """,
+                    (max_attempts, max_attempts, lane, stale_seconds),
+                )
+                stale = cursor.rowcount
+                conn.commit()
+                if stale:
+                    logging.warning(
+                        "Requeued or failed %d stale translation jobs in the %s lane", stale, lane
+                    )
+                return stale
+        except DatabaseError as e:
+            logging.error("Database error: %s", str(e))
+            if conn:
+                conn.rollback()
+            return 0
+        finally:
+            if conn:
+                conn.close()
@@ -4,28 +4,47 @@ Module for processing documents and interacting with Azure Blob Storage and GPT
 This module provides functions to:
 1. Create a CSV string from data.
 2. Process and upload data to Azure Blob Storage.
-3. Process input files and extract text using a GPT model.
-4. Parse CSV files from Azure Blob Storage.
+3. Extract text from input files, timed by the "document" stage of the pipeline.
+4. Load additional glossaries, cached per blob ETag.
 """
 
 import logging
 import io
-import os
 import csv
-from io import BytesIO
-import pandas as pd
-from azure.storage.blob import BlobServiceClient
+import hashlib
+import threading
+from collections import OrderedDict
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceModifiedError
+from azure.storage.blob import BlobClient
 from blob_handler import upload_to_blob
-from gpt_handler import get_gpt_response
-from utils import read_docx_from_url, read_pdf_from_url
+from instrumentation import timed
+from memory_tracking import set_document_size
+from environment_variables import ADDITIONAL_GLOSSARY_CACHE_SIZE
+from utils import (
+    download_document,
+    get_docx_page_count,
+    read_docx_from_bytes,
+    read_pdf_pages_from_bytes,
+)
+
+
+# Parsed additional glossaries, keyed by blob URL without the SAS token.
+# Each value is an (etag, pairs) tuple; the least recently used entry is evicted.
+additional_glossary_cache = OrderedDict()
+additional_glossary_cache_lock = threading.Lock()
 
 
 def create_csv_string(data):
     """
     Creates a CSV string from the given data.
 
+    Every field is quoted, so terms containing commas, quotes or line breaks
+    are escaped rather than altered.
+
     Args:
-        data (list): A list of data to be written to CSV.
+        data (list): The glossary as (source, target) pairs. A plain string is
+            written as a term that is kept untranslated.
 
     Returns:
         str: The CSV string.
@@ -34,21 +53,61 @@ def create_csv_string(data):
     writer = csv.writer(output, quoting=csv.QUOTE_ALL)
 
     for item in data:
-        cleaned_item = item.replace(",", "")  # Remove commas
-        writer.writerow([cleaned_item, cleaned_item])
+        source, target = item if isinstance(item, tuple) else (item, item)
+        writer.writerow([source, target])
 
     return output.getvalue()
 
 
+def normalize_csv_content(csv_content):
+    """
+    Normalizes a glossary CSV so that equivalent glossaries have identical content.
+
+    The content is parsed as CSV, so line breaks inside quoted terms are kept.
+    Empty rows are dropped, the rows are deduplicated and sorted, since the
+    order of glossary entries has no meaning, and written back with every field
+    quoted and \r\n line endings.
+
+    Args:
+        csv_content (str): The glossary CSV string.
+
+    Returns:
+        str: The normalized CSV string.
+    """
+    reader = csv.reader(io.StringIO(csv_content, newline=""))
+    rows = {tuple(row) for row in reader if any(field.strip() for field in row)}
+    output = io.StringIO()
+    csv.writer(output, quoting=csv.QUOTE_ALL).writerows(sorted(rows))
+    return output.getvalue()
+
+
+def get_glossary_blob_name(csv_content):
+    """
+    Returns the content-addressed blob name of a normalized glossary CSV.
+
+    Args:
+        csv_content (str): The normalized glossary CSV string.
+
+    Returns:
+        str: The blob name, derived from the SHA-256 hash of the content.
+    """
+    digest = hashlib.sha256(csv_content.encode("utf-8")).hexdigest()
+    return f"glossary_{digest}.csv"
+
+
+@timed()
 def process_and_upload_data(
     file_name, entries, storage_account, SAS_TOKEN, CONTAINER_NAME, GLOSSARY_PREFIX
 ):
     """
     Processes the extracted text and uploads it as a CSV file to Azure Blob Storage.
 
+    The glossary blob is named after the hash of its normalized content, so
+    identical glossaries share a blob and are only uploaded once.
+
     Args:
         file_name (str): The name of the source file.
-        entries (list): The extracted text entries.
+        entries (list): The glossary as (source, target) pairs.
         storage_account (str): The Azure storage account name.
         SAS_TOKEN (str): The SAS token for authentication.
         CONTAINER_NAME (str): The name of the container in Azure Blob Storage.
@@ -57,14 +116,11 @@ def process_and_upload_data(
     Returns:
         str: The URL of the uploaded glossary file.
     """
-    # Extract the base name without extension and prepare the new file name
-    base_name = os.path.splitext(file_name)[0]
-    new_file_name = f"glossaries_{base_name}.csv"
-
-    logging.info("Processing entries for new file name: %s", new_file_name)
-
     # Create CSV content from the list
-    csv_content = create_csv_string(entries)
+    csv_content = normalize_csv_content(create_csv_string(entries))
+    new_file_name = get_glossary_blob_name(csv_content)
+
+    logging.info("Glossary blob for %s: %s", file_name, new_file_name)
 
     # Upload CSV to Azure Blob Storage and get the URL
     glossary_url = upload_to_blob(
@@ -74,70 +130,124 @@ def process_and_upload_data(
         GLOSSARY_PREFIX,
         new_file_name,
         csv_content,
+        skip_if_exists=True,
     )
 
     logging.info("Glossary URL: %s", glossary_url)
     return glossary_url
 
 
-def process_file(
-    file_name, source_url, system_prompt, FEW_SHOT_EXAMPLES, CHAT_PARAMETERS
-):
+def parse_glossary_csv(content, delimiter=","):
     """
-    Processes the input file, sends its content to the GPT model, and extracts relevant text.
+    Parses a glossary file into (source, target) pairs.
 
     Args:
-        file_name (str): The name of the file to process.
-        source_url (str): The URL of the source file.
-        system_prompt (str): The system prompt to guide the GPT model.
-        FEW_SHOT_EXAMPLES (list): Examples to help guide the GPT model.
-        CHAT_PARAMETERS (dict): Parameters for the GPT model.
+        content (bytes): The content of the glossary file.
+        delimiter (str): The field delimiter, "," for CSV and "\\t" for TSV.
 
     Returns:
-        list: A list of extracted text lines.
+        list: The glossary as (source, target) pairs. A row with a single column
+            is a term that is kept untranslated.
     """
-    logging.info("Starting to process file: %s", file_name)
-    if file_name.endswith(".docx"):
-        text = read_docx_from_url(source_url)
-    elif file_name.endswith(".pdf"):
-        text = read_pdf_from_url(source_url)
-    else:
-        logging.error("Unsupported file type: %s", file_name)
-        raise ValueError("Unsupported file type. URL must end with .docx or .pdf")
+    pairs = []
+    reader = csv.reader(io.StringIO(content.decode("utf-8-sig")), delimiter=delimiter)
+    for row in reader:
+        if not row or not row[0].strip():
+            continue
+        source = row[0]
+        target = row[1] if len(row) > 1 and row[1].strip() else source
+        pairs.append((source, target))
+    return pairs
+
+
+def load_additional_glossary(glossary_url):
+    """
+    Loads an additional glossary from Azure Blob Storage.
+
+    Parsed glossaries are kept in an in-process cache keyed by URL and validated
+    against the blob ETag, so a shared glossary is only downloaded and parsed
+    again when it changes. If the blob changes between reading its ETag and
+    downloading it, the ETag is read again and the download retried once.
+
+    Args:
+        glossary_url (str): The URL of the glossary blob, including its SAS token.
+
+    Returns:
+        list: The glossary as (source, target) pairs.
 
-    response = get_gpt_response(text, system_prompt, FEW_SHOT_EXAMPLES, CHAT_PARAMETERS)
-    logging.info("get_gpt_response: %s", response)
+    Raises:
+        azure.core.exceptions.AzureError: If the blob cannot be read, e.g. when it
+            does not exist or changed again during the retry.
+        ValueError: If the URL is not a blob URL.
+    """
+    cache_key = glossary_url.split("?")[0]
+    blob_client = BlobClient.from_blob_url(glossary_url)
+    for attempt in range(2):
+        etag = blob_client.get_blob_properties().etag
+
+        with additional_glossary_cache_lock:
+            cached = additional_glossary_cache.get(cache_key)
+            if cached and cached[0] == etag:
+                additional_glossary_cache.move_to_end(cache_key)
+                logging.info("Additional glossary cache hit: %s", cache_key)
+                return cached[1]
+
+        logging.info("Downloading additional glossary: %s", cache_key)
+        try:
+            content = blob_client.download_blob(
+                etag=etag, match_condition=MatchConditions.IfNotModified
+            ).readall()
+            break
+        except ResourceModifiedError:
+            if attempt:
+                raise
+            logging.warning("Additional glossary changed during download, retrying: %s", cache_key)
+    pairs = parse_glossary_csv(
+        content, delimiter="\t" if cache_key.lower().endswith(".tsv") else ","
+    )
+    logging.info("Parsed %d entries from additional glossary: %s", len(pairs), cache_key)
 
-    return response
+    with additional_glossary_cache_lock:
+        additional_glossary_cache[cache_key] = (etag, pairs)
+        additional_glossary_cache.move_to_end(cache_key)
+        while len(additional_glossary_cache) > ADDITIONAL_GLOSSARY_CACHE_SIZE:
+            evicted_key, _ = additional_glossary_cache.popitem(last=False)
+            logging.info("Evicted additional glossary from cache: %s", evicted_key)
+    return pairs
 
 
-def parse_csv_from_azure_blob(CONTAINER_NAME, blob_name, connection_string):
+def extract_document(file_name, source_url):
     """
-    Parse a CSV file from an Azure Blob Storage.
+    Downloads the input file and extracts its text content.
 
     Args:
-        CONTAINER_NAME (str): The name of the container.
-        blob_name (str): The name of the blob file.
-        connection_string (str): The connection string for the Azure Blob Storage account.
+        file_name (str): The name of the file to process.
+        source_url (str): The URL of the source file.
 
     Returns:
-        pd.DataFrame: The parsed CSV file as a pandas DataFrame.
+        dict: The document content ("content"), its extracted text ("text"), the
+            text of each page ("pages", None for DOCX) and its page count
+            ("page_count", None when unknown).
 
     Raises:
-        Exception: If there is an error in downloading or parsing the CSV file.
+        ValueError: If the file type is not supported.
     """
-    try:
-        blob_service_client = BlobServiceClient.from_connection_string(connection_string)
-        blob_client = blob_service_client.get_blob_client(container=CONTAINER_NAME, blob=blob_name)
-
-        # Download the blob's content as a stream
-        stream = BytesIO()
-        blob_client.download_blob().readinto(stream)
-        stream.seek(0)
-
-        # Parse the CSV file using pandas
-        df = pd.read_csv(stream)
-        return df
-    except Exception as e:
-        logging.error("Error parsing CSV from Azure Blob: %s", e)
-        raise
+    if file_name.endswith(".docx"):
+        content = download_document(source_url)
+        text = read_docx_from_bytes(content)
+        pages = None
+        page_count = get_docx_page_count(content)
+    elif file_name.endswith(".pdf"):
+        content = download_document(source_url)
+        pages = read_pdf_pages_from_bytes(content)
+        text = "".join(pages)
+        page_count = len(pages)
+    else:
+        logging.error("Unsupported file type: %s", file_name)
+        raise ValueError("Unsupported file type. URL must end with .docx or .pdf")
+
+    logging.info(
+        "Extracted %s: %d bytes, %s pages", file_name, len(content), page_count
+    )
+    set_document_size(len(content))
+    return {"content": content, "text": text, "pages": pages, "page_count": page_count}
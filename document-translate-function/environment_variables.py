@@ -53,3 +53,106 @@ CONTAINER_NAME = "documents"
 UPLOAD_PREFIX = "landing-zone"
 GLOSSARY_PREFIX = "glossaries"
 TRANSLATION_OUTPUT_PREFIX = "translated-zone"
+
+# Small documents are sent to the synchronous single-document endpoint instead of
+# the batch API, which avoids the polling loop. Set SYNC_TRANSLATION_ENABLED=false to disable.
+SYNC_TRANSLATION_ENABLED = os.getenv("SYNC_TRANSLATION_ENABLED", "true").lower() == "true"
+SYNC_TRANSLATION_MAX_BYTES = int(os.getenv("SYNC_TRANSLATION_MAX_BYTES", str(2 * 1024 * 1024)))
+SYNC_TRANSLATION_MAX_PAGES = int(os.getenv("SYNC_TRANSLATION_MAX_PAGES", "10"))
+
+logging.info("SYNC_TRANSLATION_ENABLED: %s", SYNC_TRANSLATION_ENABLED)
+logging.info("SYNC_TRANSLATION_MAX_BYTES: %s", SYNC_TRANSLATION_MAX_BYTES)
+logging.info("SYNC_TRANSLATION_MAX_PAGES: %s", SYNC_TRANSLATION_MAX_PAGES)
+
+# Bounds of the delay between two status polls of a batch translation job.
+POLL_MIN_DELAY_SECONDS = float(os.getenv("POLL_MIN_DELAY_SECONDS", "2"))
+POLL_MAX_DELAY_SECONDS = float(os.getenv("POLL_MAX_DELAY_SECONDS", "30"))
+
+logging.info("POLL_MIN_DELAY_SECONDS: %s", POLL_MIN_DELAY_SECONDS)
+logging.info("POLL_MAX_DELAY_SECONDS: %s", POLL_MAX_DELAY_SECONDS)
+
+# Number of parsed additional glossaries kept in memory per instance
+ADDITIONAL_GLOSSARY_CACHE_SIZE = int(os.getenv("ADDITIONAL_GLOSSARY_CACHE_SIZE", "16"))
+logging.info("ADDITIONAL_GLOSSARY_CACHE_SIZE: %s", ADDITIONAL_GLOSSARY_CACHE_SIZE)
+
+# Repeated headers, footers and paragraphs are removed from the document text
+# before it is sent to the GPT model. Set TEXT_REDUCTION_ENABLED=false to send the full text.
+TEXT_REDUCTION_ENABLED = os.getenv("TEXT_REDUCTION_ENABLED", "true").lower() == "true"
+logging.info("TEXT_REDUCTION_ENABLED: %s", TEXT_REDUCTION_ENABLED)
+
+# Prompts with a local extractor fall back to it when Azure OpenAI is throttled.
+# Set LOCAL_EXTRACTION_FALLBACK_ENABLED=false to fail the glossary extraction instead.
+LOCAL_EXTRACTION_FALLBACK_ENABLED = (
+    os.getenv("LOCAL_EXTRACTION_FALLBACK_ENABLED", "true").lower() == "true"
+)
+logging.info("LOCAL_EXTRACTION_FALLBACK_ENABLED: %s", LOCAL_EXTRACTION_FALLBACK_ENABLED)
+
+# Limits shared by every instance of the function app, enforced with token
+# buckets in the database. A limit of 0 disables it. Callers wait for capacity
+# for at most RATE_LIMIT_MAX_WAIT_SECONDS.
+OPENAI_REQUESTS_PER_MINUTE = int(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "0"))
+OPENAI_TOKENS_PER_MINUTE = int(os.getenv("OPENAI_TOKENS_PER_MINUTE", "0"))
+TRANSLATOR_REQUESTS_PER_MINUTE = int(os.getenv("TRANSLATOR_REQUESTS_PER_MINUTE", "0"))
+RATE_LIMIT_MAX_WAIT_SECONDS = int(os.getenv("RATE_LIMIT_MAX_WAIT_SECONDS", "300"))
+
+logging.info("OPENAI_REQUESTS_PER_MINUTE: %s", OPENAI_REQUESTS_PER_MINUTE)
+logging.info("OPENAI_TOKENS_PER_MINUTE: %s", OPENAI_TOKENS_PER_MINUTE)
+logging.info("TRANSLATOR_REQUESTS_PER_MINUTE: %s", TRANSLATOR_REQUESTS_PER_MINUTE)
+logging.info("RATE_LIMIT_MAX_WAIT_SECONDS: %s", RATE_LIMIT_MAX_WAIT_SECONDS)
+
+# Retries, circuit breakers and hedged requests for outbound calls (see resilience.py).
+# Set HEDGE_DELAY_SECONDS=0 to disable hedged requests.
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "4"))
+RETRY_BASE_DELAY_SECONDS = float(os.getenv("RETRY_BASE_DELAY_SECONDS", "1"))
+RETRY_MAX_DELAY_SECONDS = float(os.getenv("RETRY_MAX_DELAY_SECONDS", "30"))
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_BREAKER_FAILURE_THRESHOLD", "5"))
+CIRCUIT_BREAKER_RESET_SECONDS = float(os.getenv("CIRCUIT_BREAKER_RESET_SECONDS", "30"))
+HEDGE_DELAY_SECONDS = float(os.getenv("HEDGE_DELAY_SECONDS", "2"))
+
+logging.info("RETRY_MAX_ATTEMPTS: %s", RETRY_MAX_ATTEMPTS)
+logging.info("RETRY_BASE_DELAY_SECONDS: %s", RETRY_BASE_DELAY_SECONDS)
+logging.info("RETRY_MAX_DELAY_SECONDS: %s", RETRY_MAX_DELAY_SECONDS)
+logging.info("CIRCUIT_BREAKER_FAILURE_THRESHOLD: %s", CIRCUIT_BREAKER_FAILURE_THRESHOLD)
+logging.info("CIRCUIT_BREAKER_RESET_SECONDS: %s", CIRCUIT_BREAKER_RESET_SECONDS)
+logging.info("HEDGE_DELAY_SECONDS: %s", HEDGE_DELAY_SECONDS)
+
+# Fair scheduling of translation jobs between users (see scheduler.py).
+# Set SCHEDULER_ENABLED=false to process every upload as soon as it arrives.
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+SCHEDULER_MAX_JOBS_PER_USER = int(os.getenv("SCHEDULER_MAX_JOBS_PER_USER", "2"))
+SCHEDULER_MAX_ATTEMPTS = int(os.getenv("SCHEDULER_MAX_ATTEMPTS", "2"))
+SCHEDULER_SWEEP_SECONDS = int(os.getenv("SCHEDULER_SWEEP_SECONDS", "240"))
+
+logging.info("SCHEDULER_ENABLED: %s", SCHEDULER_ENABLED)
+logging.info("SCHEDULER_MAX_JOBS_PER_USER: %s", SCHEDULER_MAX_JOBS_PER_USER)
+logging.info("SCHEDULER_MAX_ATTEMPTS: %s", SCHEDULER_MAX_ATTEMPTS)
+logging.info("SCHEDULER_SWEEP_SECONDS: %s", SCHEDULER_SWEEP_SECONDS)
+
+# Documents are classified at upload into the interactive or the batch lane,
+# with the LANE_INTERACTIVE_MAX_BYTES and LANE_INTERACTIVE_MAX_PAGES settings
+# read by lanes.py. Each lane has its own limit of running jobs across all
+# instances, translation timeout (0 derives it from the document size), stale
+# job timeout and interval between the sweeps of its queue. A sweep runs for at
+# most its interval and SCHEDULER_SWEEP_SECONDS, so sweeps do not pile up.
+LANE_INTERACTIVE_MAX_RUNNING = int(os.getenv("LANE_INTERACTIVE_MAX_RUNNING", "16"))
+LANE_INTERACTIVE_TIMEOUT_SECONDS = int(os.getenv("LANE_INTERACTIVE_TIMEOUT_SECONDS", "300"))
+LANE_INTERACTIVE_STALE_SECONDS = int(os.getenv("LANE_INTERACTIVE_STALE_SECONDS", "900"))
+LANE_INTERACTIVE_SWEEP_SECONDS = int(os.getenv("LANE_INTERACTIVE_SWEEP_SECONDS", "30"))
+LANE_BATCH_MAX_RUNNING = int(os.getenv("LANE_BATCH_MAX_RUNNING", "4"))
+LANE_BATCH_TIMEOUT_SECONDS = int(os.getenv("LANE_BATCH_TIMEOUT_SECONDS", "0"))
+LANE_BATCH_STALE_SECONDS = int(os.getenv("LANE_BATCH_STALE_SECONDS", "7200"))
+LANE_BATCH_SWEEP_SECONDS = int(os.getenv("LANE_BATCH_SWEEP_SECONDS", "60"))
+
+logging.info("LANE_INTERACTIVE_MAX_RUNNING: %s", LANE_INTERACTIVE_MAX_RUNNING)
+logging.info("LANE_INTERACTIVE_TIMEOUT_SECONDS: %s", LANE_INTERACTIVE_TIMEOUT_SECONDS)
+logging.info("LANE_INTERACTIVE_STALE_SECONDS: %s", LANE_INTERACTIVE_STALE_SECONDS)
+logging.info("LANE_INTERACTIVE_SWEEP_SECONDS: %s", LANE_INTERACTIVE_SWEEP_SECONDS)
+logging.info("LANE_BATCH_MAX_RUNNING: %s", LANE_BATCH_MAX_RUNNING)
+logging.info("LANE_BATCH_TIMEOUT_SECONDS: %s", LANE_BATCH_TIMEOUT_SECONDS)
+logging.info("LANE_BATCH_STALE_SECONDS: %s", LANE_BATCH_STALE_SECONDS)
+logging.info("LANE_BATCH_SWEEP_SECONDS: %s", LANE_BATCH_SWEEP_SECONDS)
+
+# The wall time, bytes and tokens of each stage of every document are stored in
+# the pipeline_stage_timings table. Set STAGE_TIMINGS_ENABLED=false to disable.
+STAGE_TIMINGS_ENABLED = os.getenv("STAGE_TIMINGS_ENABLED", "true").lower() == "true"
+logging.info("STAGE_TIMINGS_ENABLED: %s", STAGE_TIMINGS_ENABLED)
@@ -7,26 +7,118 @@ It handles the following steps:
 2. Extracts text content from the document.
 3. Processes the extracted content to merge with metadata.
 4. Uploads the processed data to a storage location.
-5. Initiates a translation job using the processed data.
+5. Initiates one translation job covering every target language of the upload.
 6. Checks the status of the translation job and retrieves the translated document.
 7. Updates the database with the results of the translation job.
+
+Small documents skip steps 5 and 6: they are translated with the synchronous
+single-document endpoint and written directly to the translated zone.
+
+Independent stages, such as the metadata query and the document download, are
+run concurrently as a small dependency graph (see pipeline.py). The wall time,
+bytes and tokens of each stage are stored per document in the
+pipeline_stage_timings table (see instrumentation.py). Counters, gauges and
+histograms of the app are served by the metrics route (see metrics.py), and
+the memory used by each document can be logged with MEMORY_TRACKING_ENABLED
+(see memory_tracking.py).
+
+Uploads are queued in an interactive or a batch lane by size, and translated in
+a fair order between users (see scheduler.py); a timer trigger per lane sweeps
+the queue for jobs that could not be started right away.
+
+Uploads can be cancelled through the upload function. Processing checks for the
+cancellation between stages and while waiting for the batch translation job,
+which is then cancelled too.
+
+A new instance opens its database, Blob Storage, Translator and OpenAI
+connections and loads the document readers before its first document, from
+the warmup trigger, or in the background when the health route finds it not
+ready (see warmup.py).
 """
 
 import json
 import logging
+import time
 import urllib.parse
+import uuid
 from datetime import datetime
 import azure.functions as func
-from environment_variables import *
-from blob_handler import validate_source_url
-from document_processing import process_file, process_and_upload_data
-from translation_service import start_translation, check_translation_status
+import requests
+from azure.core.exceptions import AzureError
+from psycopg2 import Error as PostgresError
+from environment_variables import (
+    AZURE_STORAGE_ACCOUNT,
+    CHAT_PARAMETERS,
+    CONTAINER_NAME,
+    FEW_SHOT_EXAMPLES,
+    GLOSSARY_PREFIX,
+    LOCAL_EXTRACTION_FALLBACK_ENABLED,
+    SAS_TOKEN,
+    SCHEDULER_ENABLED,
+    STAGE_TIMINGS_ENABLED,
+    TEXT_REDUCTION_ENABLED,
+    TRANSLATION_OUTPUT_PREFIX,
+    UPLOAD_PREFIX,
+)
+from blob_handler import validate_source_url, upload_to_blob, warm_up_blob_storage
+from document_processing import (
+    create_csv_string,
+    extract_document,
+    load_additional_glossary,
+    process_and_upload_data,
+)
+from translation_service import (
+    TranslationResult,
+    start_translation,
+    check_translation_status,
+    is_sync_translation_eligible,
+    translate_document_sync,
+    warm_up_translator,
+)
 from database_helper import DatabaseHandler
-from gpt_handler import parse_response
+from rate_limiter import RateLimitTimeoutError
+from resilience import CircuitOpenError
+from gpt_handler import get_gpt_response, get_openai_error, parse_response, warm_up_openai
+from pipeline import Stage, run_pipeline
+from instrumentation import record, span, timed, trace
+from memory_tracking import track_memory
+from metrics import CONTENT_TYPE, counter, gauge, histogram, render
+from scheduler import (
+    BATCH_LANE,
+    INTERACTIVE_LANE,
+    enqueue_job,
+    get_lane_timeout,
+    get_sweep_schedule,
+    get_sweep_time_budget,
+    requeue_stale_jobs,
+    run_queued_jobs,
+)
+from glossary_builder import build_glossary
+from text_reduction import reduce_text
+from prefilter import apply_prefilter
+from local_extractor import get_local_extractor, get_local_response
+from utils import warm_up_readers
+from warmup import register_warmup_step, request_warm_up, warm_up
 
 app = func.FunctionApp()
 database_handler = DatabaseHandler()
 
+DOCUMENTS = counter(
+    "translation_documents_total", "Documents processed, by outcome.", ("status",)
+)
+DOCUMENT_SECONDS = histogram(
+    "translation_document_seconds", "Wall time of the processing of a document.", ("status",)
+)
+QUEUE_JOBS = gauge(
+    "translation_queue_jobs", "Queued and running documents of each lane.", ("lane", "status")
+)
+QUEUE_JOBS.set_function(database_handler.count_translation_jobs)
+PROMPT_REDUCTION_TOKENS = counter(
+    "translation_prompt_reduction_tokens_total",
+    "Estimated tokens of the GPT prompt text before and after the text reduction.",
+    ("text",),
+)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -35,6 +127,12 @@ logging.basicConfig(
 )
 
 
+class TranslationCancelledError(Exception):
+    """
+    Raised when the translation of a document is cancelled while it is processed.
+    """
+
+
 @app.blob_trigger(
     arg_name="myblob",
     path="documents/landing-zone/{name}",
@@ -67,11 +165,194 @@ def az_ai_translate_document(myblob: func.InputStream):
         logging.info("File type not supported for translation: %s", file_name)
         return
 
+    if not SCHEDULER_ENABLED:
+        run_translation(file_name)
+        return
+
     try:
-        process_document(file_name)
+        lane = enqueue_job(file_name, myblob.length)
+    except PostgresError as e:
+        logging.error("Could not queue %s, translating it directly: %s", file_name, e)
+        run_translation(file_name)
+        return
+
+    if lane:
+        # Run the next job of the lane in fair order, which is not necessarily this
+        # upload, then the following ones while the sweep budget of the lane lasts.
+        run_queued_jobs(
+            run_translation, lane, time_budget_seconds=get_sweep_time_budget(lane), workers=1
+        )
+
+
+@app.timer_trigger(arg_name="timer", schedule=get_sweep_schedule(INTERACTIVE_LANE))
+def sweep_interactive_queue(timer: func.TimerRequest):
+    """
+    Function to run queued small documents that could not be started when
+    they were uploaded, e.g. because their user was at the concurrency cap.
+
+    Args:
+        timer (func.TimerRequest): The timer that triggered the function.
+    """
+    sweep_translation_queue(INTERACTIVE_LANE, timer)
+
+
+@app.timer_trigger(arg_name="timer", schedule=get_sweep_schedule(BATCH_LANE))
+def sweep_batch_queue(timer: func.TimerRequest):
+    """
+    Function to run queued large documents that could not be started when
+    they were uploaded, e.g. because the batch lane was at its limit.
+
+    Args:
+        timer (func.TimerRequest): The timer that triggered the function.
+    """
+    sweep_translation_queue(BATCH_LANE, timer)
+
+
+def sweep_translation_queue(lane, timer):
+    """
+    Requeue the stale jobs of a lane and run its queued jobs.
+
+    Args:
+        lane (str): The lane.
+        timer (func.TimerRequest): The timer that triggered the function.
+    """
+    if not SCHEDULER_ENABLED:
+        return
+    if timer.past_due:
+        logging.info("Translation queue sweep of the %s lane is past due", lane)
+
+    requeue_stale_jobs(lane)
+    run_queued_jobs(run_translation, lane, time_budget_seconds=get_sweep_time_budget(lane))
+
+
+@app.route(route="metrics", methods=["GET"])
+def get_metrics(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Function to serve the metrics of the instance in the Prometheus text format.
+
+    Args:
+        req (func.HttpRequest): The HTTP request object.
+
+    Returns:
+        func.HttpResponse: The metrics.
+    """
+    return func.HttpResponse(render(), status_code=200, headers={"Content-Type": CONTENT_TYPE})
+
+
+@register_warmup_step("database")
+def warm_up_database():
+    """
+    Opens a database connection, kept in the pool for the first document.
+    """
+    database_handler.ping()
+
+
+@register_warmup_step("blob_storage")
+def warm_up_storage():
+    """
+    Opens the connections to the storage account.
+    """
+    warm_up_blob_storage(
+        AZURE_STORAGE_ACCOUNT, SAS_TOKEN, CONTAINER_NAME, f"{UPLOAD_PREFIX}/.warmup"
+    )
+
 
-    except (ValueError, KeyError, RuntimeError) as e:
-        handle_exception(file_name, str(e))
+register_warmup_step("translator")(warm_up_translator)
+register_warmup_step("openai")(warm_up_openai)
+register_warmup_step("document_readers")(warm_up_readers)
+
+
+@app.warm_up_trigger(arg_name="context")
+def warmup(context) -> None:
+    """
+    Function to warm up a new instance before the platform sends it requests.
+
+    Args:
+        context (azure.functions.WarmUpContext): The warm-up context.
+    """
+    readiness = warm_up()
+    logging.info("Instance warmed up, ready: %s", readiness["ready"])
+
+
+@app.route(route="health", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
+def get_health(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Function to report whether the instance is ready, starting a warm-up in the
+    background when it is not (see warmup.request_warm_up).
+
+    Args:
+        req (func.HttpRequest): The HTTP request object.
+
+    Returns:
+        func.HttpResponse: The readiness report, with status 200 if the instance
+            is ready and 503 otherwise.
+    """
+    readiness = request_warm_up()
+    return func.HttpResponse(
+        json.dumps(readiness),
+        status_code=200 if readiness["ready"] else 503,
+        mimetype="application/json",
+    )
+
+
+def run_translation(file_name):
+    """
+    Translate a document, recording the failure if processing raises an error.
+
+    Args:
+        file_name (str): The name of the file.
+
+    Returns:
+        str: The outcome of the processing ('done', 'failed', 'cancelled').
+    """
+    status = "failed"
+    with trace(file_name) as document_trace, track_memory("translate_document", file_name):
+        try:
+            with span("process_document") as document_span:
+                process_document(file_name)
+            status = "done"
+
+        except TranslationCancelledError:
+            logging.info("Translation of %s was cancelled, stopping.", file_name)
+            status = "cancelled"
+
+        # Failed calls to Azure Translator, Blob Storage and Azure OpenAI, e.g. an
+        # open circuit breaker or throttling that outlasted the retries. The
+        # except clause is only evaluated on an error, so openai is still
+        # imported on first use.
+        except (
+            ValueError,
+            KeyError,
+            RuntimeError,
+            requests.RequestException,
+            get_openai_error(),
+        ) as e:
+            handle_exception(file_name, str(e))
+
+        except Exception as e:
+            handle_exception(file_name, str(e))
+            raise
+
+        finally:
+            DOCUMENTS.inc(labels=(status,))
+            DOCUMENT_SECONDS.observe(document_span.duration, labels=(status,))
+            if STAGE_TIMINGS_ENABLED:
+                database_handler.insert_stage_timings(file_name, document_trace.rows())
+    return status
+
+
+def check_cancelled(file_name):
+    """
+    Stop the processing of a document if its translation was cancelled.
+
+    Args:
+        file_name (str): The name of the file.
+
+    Raises:
+        TranslationCancelledError: If the translation was cancelled.
+    """
+    if database_handler.is_translation_cancelled(file_name):
+        raise TranslationCancelledError(f"Translation of {file_name} was cancelled")
 
 
 def process_document(file_name):
@@ -94,172 +375,545 @@ def process_document(file_name):
         logging.error("Source file does not exist: %s", source_url)
         return
 
-    target_urls = get_target_urls(file_name)
-    target_url = (
-        target_urls["docx"] if file_name.endswith(".docx") else target_urls["pdf"]
-    )
-    logging.info("Target URL: %s", target_url)
+    check_cancelled(file_name)
+
+    # The metadata query and the download/extraction are independent, so they run
+    # concurrently. The glossary CSV is uploaded by translate_document, and only
+    # for the batch translation job.
+    stages = [
+        Stage("metadata", lambda: fetch_metadata(file_name)),
+        Stage("document", lambda: extract_document(file_name, source_url)),
+        Stage(
+            "additional_glossary",
+            lambda metadata: load_additional_glossaries(metadata),
+            depends_on=("metadata",),
+        ),
+        Stage(
+            "prompt_text",
+            lambda document: get_prompt_text(document),
+            depends_on=("document",),
+        ),
+        Stage(
+            "candidate_text",
+            lambda metadata, prompt_text: apply_prefilter(
+                prompt_text, metadata["prefilter_config"]
+            ),
+            depends_on=("metadata", "prompt_text"),
+        ),
+        Stage(
+            "glossary_entries",
+            lambda metadata, document, candidate_text, additional_glossary: build_glossary_entries(
+                file_name, metadata, candidate_text, additional_glossary, document["page_count"]
+            ),
+            depends_on=("metadata", "document", "candidate_text", "additional_glossary"),
+        ),
+        Stage(
+            "translation",
+            lambda metadata, document, glossary_entries: translate_document(
+                file_name, source_url, document, glossary_entries, metadata
+            ),
+            depends_on=("metadata", "document", "glossary_entries"),
+        ),
+    ]
+    run_pipeline(stages, label=file_name, check=lambda: check_cancelled(file_name))
+
+
+def fetch_metadata(file_name):
+    """
+    Fetch the metadata of the document from the database.
+
+    Args:
+        file_name (str): The name of the file.
 
+    Returns:
+        dict: The metadata results.
+    """
     metadata_results = database_handler.fetch_metadata_text(file_name)
     logging.info("Metadata results: %s", metadata_results)
+    return metadata_results
+
+
+def load_additional_glossaries(metadata_results):
+    """
+    Load the additional glossaries referenced by the upload.
+
+    The additional_glossary_content_url column may hold several URLs separated
+    by whitespace. URLs without a query string get the storage SAS token appended.
+    A glossary that cannot be read, e.g. a missing blob or an invalid URL, is
+    logged and skipped, so the document is translated with the other glossaries.
+
+    Args:
+        metadata_results (dict): The metadata results.
+
+    Returns:
+        list: The entries of all additional glossaries as (source, target) pairs.
+    """
+    glossary_urls = (metadata_results["additionalGlossaryContentUrl"] or "").split()
+    pairs = []
+    for glossary_url in glossary_urls:
+        if "?" not in glossary_url:
+            glossary_url = f"{glossary_url}{SAS_TOKEN}"
+        try:
+            pairs.extend(load_additional_glossary(glossary_url))
+        except (AzureError, ValueError) as e:
+            logging.error(
+                "Skipping additional glossary %s: %s", glossary_url.split("?")[0], str(e)
+            )
+    logging.info("Loaded %d additional glossary entries", len(pairs))
+    return pairs
+
+
+def get_prompt_text(document):
+    """
+    Get the document text sent to the GPT model, without repeated headers,
+    footers and paragraphs unless text reduction is disabled.
+
+    The estimated tokens before and after the reduction, and the tokens saved,
+    are recorded in the span of the stage, stored in pipeline_stage_timings,
+    and added to the translation_prompt_reduction_tokens_total counter.
+
+    Args:
+        document (dict): The extracted document.
+
+    Returns:
+        str: The text to extract the glossary entries from.
+    """
+    if not TEXT_REDUCTION_ENABLED:
+        return document["text"]
+    prompt_text, stats = reduce_text(document["text"], document["pages"])
+    record(**stats)
+    PROMPT_REDUCTION_TOKENS.inc(stats["tokens_before"], labels=("original",))
+    PROMPT_REDUCTION_TOKENS.inc(stats["tokens_after"], labels=("reduced",))
+    return prompt_text
 
-    exclusion_text = metadata_results["exclusionTexts"]
-    logging.info("Exclusion text: %s", exclusion_text)
 
-    system_prompt = metadata_results["prompt_text"]
+def get_extraction_response(text, metadata_results, timings=None):
+    """
+    Extract the glossary terms with the extraction backend of the prompt.
+
+    Prompts with the local backend never send text to Azure OpenAI. Prompts
+    with the OpenAI backend fall back to their local extractor, if they have
+    one, when Azure OpenAI is throttled: when it still answers 429 after the
+    retries, when its circuit breaker is open, or when the shared rate limit
+    has no capacity.
+
+    Args:
+        text (str): The text to extract the terms from.
+        metadata_results (dict): The metadata results.
+        timings (dict, optional): Receives the latency of the calls to Azure
+            OpenAI and the time spent waiting, see get_gpt_response.
+
+    Returns:
+        str: The JSON response, in the chat completion format.
+    """
+    prefilter_config = metadata_results["prefilter_config"]
+    if metadata_results["extraction_backend"] == "local":
+        return get_local_response(text, prefilter_config)
 
-    response = process_file(
-        file_name, source_url, system_prompt, FEW_SHOT_EXAMPLES, CHAT_PARAMETERS
+    from openai import RateLimitError
+
+    try:
+        return get_gpt_response(
+            text, metadata_results["prompt_text"], FEW_SHOT_EXAMPLES, CHAT_PARAMETERS, timings
+        )
+    except (RateLimitError, CircuitOpenError, RateLimitTimeoutError) as e:
+        if not LOCAL_EXTRACTION_FALLBACK_ENABLED or not get_local_extractor(prefilter_config):
+            raise
+        logging.warning("GPT model throttled, using the local extractor: %s", str(e))
+        if timings is not None:
+            # The latency recorded is then that of the local extractor, after the waits.
+            timings.pop("latency", None)
+        return get_local_response(text, prefilter_config)
+
+
+def record_openai_usage(
+    file_name, metadata_results, text, response, latency, page_count, wait=0.0
+):
+    """
+    Record the token usage and latency of a glossary extraction call, for the
+    prompt efficiency report of the upload function.
+
+    Args:
+        file_name (str): The name of the file.
+        metadata_results (dict): The metadata results.
+        text (str): The text sent to the extraction backend.
+        response (str): The JSON response, in the chat completion format.
+        latency (float): The duration of the call in seconds, without the waits.
+        page_count (int): The page count of the document, None if unknown.
+        wait (float): The seconds spent waiting for rate limit capacity and
+            between retries.
+    """
+    try:
+        completion = json.loads(response)
+    except ValueError:
+        completion = {}
+    model = completion.get("model") or ""
+    # The local extractor answers with a model named after it and without usage.
+    if model.startswith("local-"):
+        backend, deployment = "local", model
+    else:
+        backend, deployment = "openai", CHAT_PARAMETERS["deploymentName"]
+    usage = completion.get("usage") or {}
+
+    database_handler.insert_openai_usage(
+        {
+            "file_name": file_name,
+            "prompt_id": metadata_results["prompt_id"],
+            "uploaded_by": metadata_results["uploaded_by"],
+            "backend": backend,
+            "deployment": deployment,
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "total_tokens": usage.get("total_tokens", 0),
+            "latency_ms": latency * 1000,
+            "wait_ms": wait * 1000,
+            "input_chars": len(text),
+            "page_count": page_count,
+        }
     )
 
-    parsed_response = parse_response(response)
-    logging.info("Text extracted from file: %s", parsed_response)
+
+def build_glossary_entries(
+    file_name, metadata_results, text, additional_glossary=(), page_count=None
+):
+    """
+    Extract glossary entries from the document text with the GPT model,
+    merge them with the exclusion texts and additional glossaries, and build
+    the glossary.
+
+    Args:
+        file_name (str): The name of the file.
+        metadata_results (dict): The metadata results.
+        text (str): The text sent to the GPT model, empty if the pre-filter of
+            the prompt selected nothing.
+        additional_glossary (list): Entries of the additional glossaries as
+            (source, target) pairs.
+        page_count (int): The page count of the document, None if unknown.
+
+    Returns:
+        list: The glossary as (source, target) pairs.
+    """
+    exclusion_text = metadata_results["exclusionTexts"]
+    logging.info("Exclusion text: %s", exclusion_text)
+
+    if text.strip():
+        timings = {}
+        started = time.perf_counter()
+        response = get_extraction_response(text, metadata_results, timings)
+        wait = timings.get("wait", 0.0)
+        latency = timings.get("latency", time.perf_counter() - started - wait)
+        logging.info("get_gpt_response: %s", response)
+        record_openai_usage(
+            file_name, metadata_results, text, response, latency, page_count, wait
+        )
+
+        parsed_response = parse_response(response)
+        logging.info("Text extracted from file: %s", parsed_response)
+    else:
+        logging.info("No candidate passages in %s, skipping the GPT model.", file_name)
+        parsed_response = []
 
     logging.info("File processing completed for: %s", file_name)
 
-    merged_response = parsed_response + exclusion_text
-    logging.info("Merged response: %s", merged_response)
+    # The first occurrence of a term wins: the user's exclusion texts take
+    # precedence over the shared glossaries, which take precedence over GPT.
+    merged_response = exclusion_text + list(additional_glossary) + parsed_response
+    logging.info("Merged response: %d entries", len(merged_response))
+    return build_glossary(merged_response)
 
-    glossary_url = process_and_upload_data(
-        file_name,
-        merged_response,
-        AZURE_STORAGE_ACCOUNT,
-        SAS_TOKEN,
-        CONTAINER_NAME,
-        GLOSSARY_PREFIX,
-    )
 
-    logging.info("Glossary URL: %s", glossary_url)
+def record_glossary(file_name, glossary_entries):
+    """
+    Build the glossary content and record it in the database, with the glossary
+    processing status set to done. Called once the glossary CSV is uploaded, if
+    it is needed.
 
-    json_list = [{"items": item} for item in merged_response]
+    Args:
+        file_name (str): The name of the file.
+        glossary_entries (list): The glossary as (source, target) pairs.
+
+    Returns:
+        str: The glossary content as a JSON string.
+    """
+    json_list = [
+        {"items": source} if source == target else {"items": source, "target": target}
+        for source, target in glossary_entries
+    ]
 
     # Convert the list of objects to a JSON string
     glossary_content = json.dumps(json_list, ensure_ascii=False, indent=2)
     logging.info("Glossary content: %s", glossary_content)
 
-    start_translation_job(
-        file_name,
-        source_url,
-        target_url,
-        glossary_url,
-        metadata_results,
-        glossary_content,
-    )
+    database_handler.update_glossary_record(file_name, "done", glossary_content)
+    return glossary_content
 
 
-def get_target_urls(file_name):
+def get_translation_targets(file_name, target_languages):
     """
-    Get the target URLs for the document.
+    Get the translated file name and target URL of each target language.
+
+    A single target language keeps the source file name. With several target
+    languages, the language code and an identifier of this translation run are
+    appended to each translated file name, so that it cannot be the name of
+    another upload.
 
     Args:
         file_name (str): The name of the file.
+        target_languages (list): The target languages of the upload.
 
     Returns:
-        dict: A dictionary containing the target URLs for DOCX and PDF formats.
+        list: One dictionary per target language with the keys language,
+            translated_file_name, target_url and translation_status.
     """
-    target_file_name_base = file_name.split(".")[0]
-    logging.info("Target file name base: %s", target_file_name_base)
+    targets = []
+    run_id = uuid.uuid4().hex[:8]
+    for target_language in target_languages:
+        target_file_name = get_target_file_name(
+            file_name,
+            target_language if len(target_languages) > 1 else None,
+            run_id,
+        )
+        logging.info("Target file name (%s): %s", target_language, target_file_name)
 
-    target_file_name_docx = f"{target_file_name_base}.docx"
-    logging.info("Target file name (docx): %s", target_file_name_docx)
+        encoded_target_file_name = urllib.parse.quote(target_file_name)
+        target_url = (
+            f"https://{AZURE_STORAGE_ACCOUNT}.blob.core.windows.net/"
+            f"{CONTAINER_NAME}/{TRANSLATION_OUTPUT_PREFIX}/{encoded_target_file_name}{SAS_TOKEN}"
+        )
+        targets.append(
+            {
+                "language": target_language,
+                "translated_file_name": target_file_name,
+                "target_url": target_url,
+                "translation_status": "in progress",
+            }
+        )
+    return targets
 
-    target_file_name_pdf = f"{target_file_name_base}.pdf"
-    logging.info("Target file name (pdf): %s", target_file_name_pdf)
 
-    encoded_target_file_name_docx = urllib.parse.quote(target_file_name_docx)
-    encoded_target_file_name_pdf = urllib.parse.quote(target_file_name_pdf)
+def translate_document(file_name, source_url, document, glossary_entries, metadata_results):
+    """
+    Translate the document into every target language, using the synchronous
+    endpoint for small documents and a single batch translation job otherwise.
 
-    target_url_docx = (
-        f"https://{AZURE_STORAGE_ACCOUNT}.blob.core.windows.net/"
-        f"{CONTAINER_NAME}/{TRANSLATION_OUTPUT_PREFIX}/{encoded_target_file_name_docx}{SAS_TOKEN}"
-    )
-    target_url_pdf = (
-        f"https://{AZURE_STORAGE_ACCOUNT}.blob.core.windows.net/"
-        f"{CONTAINER_NAME}/{TRANSLATION_OUTPUT_PREFIX}/{encoded_target_file_name_pdf}{SAS_TOKEN}"
-    )
+    The synchronous endpoint takes the glossary inline, so the glossary CSV is
+    only uploaded when a batch translation job is needed.
+
+    Args:
+        file_name (str): The name of the file.
+        source_url (str): The source URL of the file.
+        document (dict): The downloaded document, as returned by extract_document.
+        glossary_entries (list): The glossary as (source, target) pairs.
+        metadata_results (dict): The metadata results.
+    """
+    targets = get_translation_targets(file_name, metadata_results["toLangs"])
+
+    pending_targets = targets
+    if is_sync_translation_eligible(
+        file_name, len(document["content"]), document["page_count"]
+    ):
+        pending_targets = translate_small_document(
+            file_name, document, glossary_entries, targets, metadata_results
+        )
+
+    glossary_url = None
+    if pending_targets:
+        with span("glossary_url"):
+            glossary_url = process_and_upload_data(
+                file_name,
+                glossary_entries,
+                AZURE_STORAGE_ACCOUNT,
+                SAS_TOKEN,
+                CONTAINER_NAME,
+                GLOSSARY_PREFIX,
+            )
+    with span("glossary_content"):
+        glossary_content = record_glossary(file_name, glossary_entries)
+
+    if pending_targets:
+        start_translation_job(
+            file_name,
+            source_url,
+            pending_targets,
+            glossary_url,
+            metadata_results,
+            document,
+        )
 
-    return {"docx": target_url_docx, "pdf": target_url_pdf}
+    record_translation(file_name, targets, glossary_url, glossary_content)
+
+
+def translate_small_document(
+    file_name, document, glossary_entries, targets, metadata_results
+):
+    """
+    Translate a small document with the synchronous endpoint and write the
+    translated bytes directly to the translated zone.
+
+    Args:
+        file_name (str): The name of the file.
+        document (dict): The downloaded document, as returned by extract_document.
+        glossary_entries (list): The glossary as (source, target) pairs.
+        targets (list): The translation targets, as returned by get_translation_targets.
+        metadata_results (dict): The metadata results.
+
+    Returns:
+        list: The targets that could not be translated and fall back to the batch job.
+    """
+    glossary_csv = create_csv_string(glossary_entries)
+    pending_targets = []
+    for target in targets:
+        check_cancelled(file_name)
+        translated_content = translate_document_sync(
+            file_name,
+            document["content"],
+            glossary_csv,
+            metadata_results["fromLang"],
+            target["language"],
+        )
+        if translated_content is None:
+            logging.warning(
+                "Synchronous translation to %s failed, falling back to batch: %s",
+                target["language"],
+                file_name,
+            )
+            pending_targets.append(target)
+            continue
+
+        upload_to_blob(
+            AZURE_STORAGE_ACCOUNT,
+            SAS_TOKEN,
+            CONTAINER_NAME,
+            TRANSLATION_OUTPUT_PREFIX,
+            target["translated_file_name"],
+            translated_content,
+        )
+        logging.info("Translated document URL: %s", target["target_url"])
+        target["translation_status"] = "done"
+    return pending_targets
 
 
 def start_translation_job(
-    file_name, source_url, target_url, glossary_url, metadata_results, glossary_content
+    file_name, source_url, targets, glossary_url, metadata_results, document=None
 ):
     """
-    Start the translation job for the document.
+    Start a single translation job for all the targets and wait for its result.
+
+    The translation status of each target is updated in place.
 
     Args:
         file_name (str): The name of the file.
         source_url (str): The source URL of the file.
-        target_url (str): The target URL for the translated file.
+        targets (list): The translation targets, as returned by get_translation_targets.
         glossary_url (str): The URL of the glossary.
         metadata_results (dict): The metadata results.
-        glossary_content (str): The content of the glossary.
+        document (dict): The downloaded document, used to estimate the translation time.
     """
     operation_location = start_translation(
         source_url,
-        target_url,
+        [(target["language"], target["target_url"]) for target in targets],
         glossary_url,
         metadata_results["fromLang"],
-        metadata_results["toLang"],
     )
 
-    translation_status = "in progress"
-    glossary_processing_status = "done"
-    translation_date = datetime.now().date()
-    translation_datetime = datetime.now()
-    translated_zone_path = target_url
-
     if not operation_location:
         logging.error("Failed to start translation job")
-        translation_status = "failed"
-        update_file_record(
-            file_name,
-            translation_date,
-            translation_datetime,
-            translation_status,
-            translated_zone_path,
-            glossary_url,
-            glossary_processing_status,
-            glossary_content,
-        )
+        for target in targets:
+            target["translation_status"] = "failed"
         return
 
     logging.info("Translation job started successfully")
+    database_handler.update_translation_operation(file_name, operation_location)
 
-    translated_document = check_translation_status(
-        operation_location, get_target_file_name(file_name)
+    translation_result = check_translation_status(
+        operation_location,
+        file_name,
+        size_bytes=len(document["content"]) if document else None,
+        page_count=document["page_count"] if document else None,
+        timeout=get_lane_timeout(metadata_results["lane"]),
+        is_cancelled=lambda: database_handler.is_translation_cancelled(file_name),
     )
 
-    if not translated_document:
-        logging.error("Translation job failed")
-        translation_status = "failed"
-    else:
-        logging.info("Translated document URL: %s", target_url)
-        translation_status = "done"
+    if translation_result.status == TranslationResult.CANCELLED:
+        raise TranslationCancelledError(f"Translation of {file_name} was cancelled")
+
+    if translation_result.succeeded:
+        for target in targets:
+            logging.info("Translated document URL: %s", target["target_url"])
+            target["translation_status"] = "done"
+        return
+
+    logging.error("Translation job %s: %s", translation_result.status, translation_result)
+    failed_languages = {
+        error.get("language") for error in translation_result.errors if error.get("language")
+    }
+    for target in targets:
+        # Without per-document errors, e.g. on a timeout, no target is known to be done.
+        if failed_languages and target["language"] not in failed_languages:
+            target["translation_status"] = "done"
+        else:
+            target["translation_status"] = "failed"
+
 
+def record_translation(file_name, targets, glossary_url, glossary_content):
+    """
+    Record the translation result of each target and of the file as a whole.
+
+    Args:
+        file_name (str): The name of the file.
+        targets (list): The translation targets, as returned by get_translation_targets.
+        glossary_url (str): The URL of the glossary, or None if every target was
+            translated synchronously.
+        glossary_content (str): The content of the glossary.
+    """
+    database_handler.update_target_records(
+        file_name,
+        [
+            {
+                "language": target["language"],
+                "translated_file_name": target["translated_file_name"],
+                "translation_status": target["translation_status"],
+                "translated_zone_path": target["target_url"],
+            }
+            for target in targets
+        ],
+    )
+
+    translation_status = (
+        "done"
+        if all(target["translation_status"] == "done" for target in targets)
+        else "failed"
+    )
     update_file_record(
         file_name,
-        translation_date,
-        translation_datetime,
+        datetime.now().date(),
+        datetime.now(),
         translation_status,
-        translated_zone_path,
+        targets[0]["target_url"],
         glossary_url,
-        glossary_processing_status,
+        "done",
         glossary_content,
     )
 
 
-def get_target_file_name(file_name):
+def get_target_file_name(file_name, target_language=None, run_id=None):
     """
     Get the target file name based on the file extension.
 
     Args:
         file_name (str): The name of the file.
+        target_language (str): The target language to append to the file name, if any.
+        run_id (str): The identifier of the translation run, appended with the
+            target language.
 
     Returns:
         str: The target file name.
     """
     target_file_name_base = file_name.split(".")[0]
+    if target_language:
+        target_file_name_base = f"{target_file_name_base}_{target_language}"
+        if run_id:
+            target_file_name_base = f"{target_file_name_base}_{run_id}"
     return (
         f"{target_file_name_base}.docx"
         if file_name.endswith(".docx")
@@ -267,6 +921,7 @@ def get_target_file_name(file_name):
     )
 
 
+@timed()
 def update_file_record(
     file_name,
     translation_date,
@@ -0,0 +1,166 @@
+"""
+Module for building translation glossaries from extracted terms.
+
+The GPT output and the exclusion texts often contain the same term many times,
+with varying whitespace or case, and multi-line blocks whose lines also appear
+inside longer entries. This module normalizes and deduplicates the entries,
+drops entries that are contained in longer ones, and keeps the glossary within
+the size limit of the Translator service.
+"""
+
+import logging
+import re
+import unicodedata
+
+# Translator rejects glossary files larger than 10 MB.
+MAX_GLOSSARY_BYTES = 10 * 1024 * 1024
+
+# Longest word sequence indexed for containment checks. Longer entries are
+# still kept, but are only checked against spans up to this length.
+MAX_INDEXED_WORDS = 24
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize_term(term):
+    """
+    Normalizes the Unicode form and whitespace of a glossary term.
+
+    Args:
+        term (str): The raw term.
+
+    Returns:
+        str: The normalized term, empty if nothing remains.
+    """
+    term = unicodedata.normalize("NFC", term)
+    return WHITESPACE_PATTERN.sub(" ", term).strip()
+
+
+def term_key(term):
+    """
+    Returns the key under which duplicate terms are detected.
+
+    Args:
+        term (str): The normalized term.
+
+    Returns:
+        str: The case-folded term.
+    """
+    return term.casefold()
+
+
+def term_words(term):
+    """
+    Splits a term into case-folded words, ignoring punctuation.
+
+    Args:
+        term (str): The normalized term.
+
+    Returns:
+        tuple: The words of the term.
+    """
+    return tuple(WORD_PATTERN.findall(term.casefold()))
+
+
+def build_glossary(entries, drop_contained=True, max_bytes=MAX_GLOSSARY_BYTES):
+    """
+    Builds a glossary from the extracted entries.
+
+    Entries are either terms, which are kept untranslated (source and target are
+    the same), or (source, target) pairs. The first occurrence of a term wins.
+
+    Args:
+        entries (list): The extracted terms and (source, target) pairs.
+        drop_contained (bool): Drop untranslated terms whose words appear, in order,
+            inside a longer untranslated term.
+        max_bytes (int): The maximum size of the glossary CSV in bytes.
+
+    Returns:
+        list: The glossary as a list of (source, target) pairs.
+    """
+    pairs = []
+    seen = set()
+    for entry in entries:
+        if isinstance(entry, tuple):
+            source, target = normalize_term(entry[0]), normalize_term(entry[1])
+        else:
+            source = target = normalize_term(entry)
+        if not source or not target:
+            continue
+        key = term_key(source)
+        if key in seen:
+            continue
+        seen.add(key)
+        pairs.append((source, target))
+
+    if drop_contained:
+        pairs = drop_contained_terms(pairs)
+
+    pairs = limit_glossary_size(pairs, max_bytes)
+    logging.info("Built glossary with %d of %d entries.", len(pairs), len(entries))
+    return pairs
+
+
+def drop_contained_terms(pairs):
+    """
+    Drops untranslated terms that are contained in a longer untranslated term.
+
+    Containment is checked on word boundaries: every contiguous word span of the
+    longer terms is indexed in a set, so the check runs in time linear in the
+    number of entries for terms of bounded length.
+
+    Args:
+        pairs (list): The deduplicated (source, target) pairs.
+
+    Returns:
+        list: The pairs, in their original order, without contained terms.
+    """
+    words = [term_words(source) for source, _ in pairs]
+    order = sorted(range(len(pairs)), key=lambda index: len(words[index]), reverse=True)
+
+    indexed_spans = set()
+    dropped = set()
+    for index in order:
+        source, target = pairs[index]
+        term = words[index]
+        if source != target or not term:
+            # Translated pairs are explicit choices and are always kept.
+            continue
+        if term in indexed_spans:
+            dropped.add(index)
+            continue
+        for start in range(len(term)):
+            for end in range(start + 1, min(len(term), start + MAX_INDEXED_WORDS) + 1):
+                indexed_spans.add(term[start:end])
+
+    if dropped:
+        logging.info("Dropped %d glossary entries contained in longer ones.", len(dropped))
+    return [pair for index, pair in enumerate(pairs) if index not in dropped]
+
+
+def limit_glossary_size(pairs, max_bytes):
+    """
+    Truncates the glossary so that its CSV stays within the size limit.
+
+    Args:
+        pairs (list): The (source, target) pairs.
+        max_bytes (int): The maximum size of the glossary CSV in bytes.
+
+    Returns:
+        list: The pairs that fit within the limit.
+    """
+    total = 0
+    for index, (source, target) in enumerate(pairs):
+        # Two quoted fields, a separator and a line break, with quotes doubled.
+        total += len(source.encode("utf-8")) + len(target.encode("utf-8")) + 7
+        total += source.count('"') + target.count('"')
+        if total > max_bytes:
+            logging.warning(
+                "Glossary exceeds %d bytes, keeping the first %d of %d entries.",
+                max_bytes,
+                index,
+                len(pairs),
+            )
+            return pairs[:index]
+    return pairs
@@ -1,16 +1,102 @@
 """
 Module for handling interactions with the GPT model using Azure OpenAI.
 This module provides functions to send text to the GPT model and parse the responses.
+
+The openai package is imported on first use, so that it is not loaded when the
+function app starts. The client is created once and reused, so that its
+connections to Azure OpenAI stay open between calls.
 """
 
 import logging
 import json
-from openai import AzureOpenAI
+import time
+from functools import lru_cache
 from environment_variables import (
     OPENAI_API_KEY, OPENAI_API_ENDPOINT
 )
+from instrumentation import record, timed
+from metrics import counter
+from rate_limiter import acquire_openai
+from text_reduction import estimate_tokens
+from resilience import call_with_retry, parse_retry_after
+
+OPENAI_TOKENS = counter(
+    "openai_tokens_total", "Tokens used by Azure OpenAI chat completions.", ("deployment", "type")
+)
+
+
+def classify_openai_error(_, error):
+    """
+    Classifies the outcome of a chat completion call for call_with_retry.
+
+    Args:
+        _ (object): The completion, unused.
+        error (Exception): The raised exception, or None.
+
+    Returns:
+        tuple: Whether the call failed transiently, whether it may be retried,
+            and the delay requested by the service.
+    """
+    from openai import APIConnectionError, InternalServerError, RateLimitError
+
+    if isinstance(error, (RateLimitError, InternalServerError)):
+        return True, True, parse_retry_after(error.response)
+    if isinstance(error, APIConnectionError):
+        return True, True, None
+    return False, False, None
 
-def get_gpt_response(prompt_text, system_prompt, FEW_SHOT_EXAMPLES, CHAT_PARAMETERS):
+
+def get_openai_error():
+    """
+    Returns the base class of the errors raised by the openai package, imported on first use.
+
+    Returns:
+        type: openai.OpenAIError.
+    """
+    from openai import OpenAIError
+
+    return OpenAIError
+
+
+@lru_cache(maxsize=None)
+def get_openai_client():
+    """
+    Returns the Azure OpenAI client, created on first use and reused across calls.
+
+    Returns:
+        AzureOpenAI: The client.
+    """
+    from openai import AzureOpenAI
+
+    return AzureOpenAI(
+        api_key=OPENAI_API_KEY,
+        azure_endpoint=OPENAI_API_ENDPOINT,
+        api_version="2024-02-01",
+        # Retries are handled by call_with_retry, which also tracks the circuit breaker.
+        max_retries=0,
+    )
+
+
+def warm_up_openai():
+    """
+    Opens a connection to Azure OpenAI by listing the models, without using tokens.
+
+    Raises:
+        openai.APIConnectionError: If Azure OpenAI cannot be reached. An error
+            response still opens the connection, so it is not raised.
+    """
+    from openai import APIStatusError
+
+    try:
+        get_openai_client().models.list()
+    except APIStatusError as e:
+        logging.info("Azure OpenAI answered the warm-up with status %s", e.status_code)
+
+
+@timed()
+def get_gpt_response(
+    prompt_text, system_prompt, FEW_SHOT_EXAMPLES, CHAT_PARAMETERS, timings=None
+):
     """
     Sends the extracted text to the GPT model and retrieves the response.
 
@@ -19,16 +105,15 @@ def get_gpt_response(prompt_text, system_prompt, FEW_SHOT_EXAMPLES, CHAT_PARAMET
         system_prompt (str): The system prompt to guide the GPT model.
         FEW_SHOT_EXAMPLES (list): Examples to help guide the GPT model.
         CHAT_PARAMETERS (dict): Parameters for the GPT model.
+        timings (dict, optional): Receives the seconds spent in the calls to
+            Azure OpenAI ("latency") and waiting for rate limit capacity and
+            between retries ("wait").
 
     Returns:
         str: The JSON response from the GPT model.
     """
     logging.info("Sending extracted text to the GPT model.")
-    client = AzureOpenAI(
-        api_key=OPENAI_API_KEY,
-        azure_endpoint=OPENAI_API_ENDPOINT,
-        api_version="2024-02-01",
-    )
+    client = get_openai_client()
 
     messages = [
         {"role": "system", "content": system_prompt},
@@ -38,18 +123,53 @@ def get_gpt_response(prompt_text, system_prompt, FEW_SHOT_EXAMPLES, CHAT_PARAMET
         messages.append({"role": "assistant", "content": example["chatbotResponse"]})
         messages.append({"role": "user", "content": example["userInput"]})
 
-    completion = client.chat.completions.create(
-        model=CHAT_PARAMETERS["deploymentName"],
-        messages=messages,
-        max_tokens=CHAT_PARAMETERS.get("maxResponseLength", 800),
-        temperature=CHAT_PARAMETERS.get("temperature", 0.7),
-        top_p=CHAT_PARAMETERS.get("topProbabilities", 0.95),
-        stop=CHAT_PARAMETERS.get("stopSequences"),
-        frequency_penalty=CHAT_PARAMETERS.get("frequencyPenalty", 0),
-        presence_penalty=CHAT_PARAMETERS.get("presencePenalty", 0),
-    )
+    max_tokens = CHAT_PARAMETERS.get("maxResponseLength", 800)
+    prompt_tokens = sum(estimate_tokens(message["content"] or "") for message in messages)
+    deployment_name = CHAT_PARAMETERS["deploymentName"]
+
+    call_seconds = []
+
+    def create_completion():
+        call_started = time.perf_counter()
+        try:
+            return client.chat.completions.create(
+                model=deployment_name,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=CHAT_PARAMETERS.get("temperature", 0.7),
+                top_p=CHAT_PARAMETERS.get("topProbabilities", 0.95),
+                stop=CHAT_PARAMETERS.get("stopSequences"),
+                frequency_penalty=CHAT_PARAMETERS.get("frequencyPenalty", 0),
+                presence_penalty=CHAT_PARAMETERS.get("presencePenalty", 0),
+            )
+        finally:
+            call_seconds.append(time.perf_counter() - call_started)
+
+    started = time.perf_counter()
+    try:
+        completion = call_with_retry(
+            f"openai:{deployment_name}",
+            create_completion,
+            classify_openai_error,
+            on_attempt=lambda: acquire_openai(deployment_name, prompt_tokens + max_tokens),
+        )
+    finally:
+        # Everything but the calls themselves is spent waiting: for rate limit
+        # capacity before each attempt and for the backoff between attempts.
+        if timings is not None:
+            timings["latency"] = sum(call_seconds)
+            timings["wait"] = time.perf_counter() - started - timings["latency"]
 
     logging.info("Response received from GPT model.")
+    if completion.usage:
+        record(
+            prompt_tokens=completion.usage.prompt_tokens,
+            completion_tokens=completion.usage.completion_tokens,
+        )
+        OPENAI_TOKENS.inc(completion.usage.prompt_tokens, labels=(deployment_name, "prompt"))
+        OPENAI_TOKENS.inc(
+            completion.usage.completion_tokens, labels=(deployment_name, "completion")
+        )
     return completion.to_json()
 
 
@@ -0,0 +1,198 @@
+"""
+Module for timing the stages of the translation of a document.
+
+A trace collects the spans of one document. A span measures the wall time of
+a block of code and the counts recorded while it runs: bytes moved, prompt and
+completion tokens, or anything else, such as the number of status polls.
+
+    with trace(file_name) as document_trace:
+        with span("download"):
+            content = download()
+            record(bytes=len(content))
+
+The current trace and span are held in context variables, so code called from
+a span does not need them passed in, and spans opened in pipeline threads are
+added to the trace of the document (see pipeline.py). Spans opened outside a
+trace are measured but not kept. The function app stores the spans of each
+document in the pipeline_stage_timings table, and every span is also observed
+in the translation_stage_seconds histogram (see metrics.py).
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from functools import wraps
+from metrics import histogram
+
+# Counts stored in their own pipeline_stage_timings columns; other counts are
+# stored in the attributes column.
+COLUMN_COUNTS = ("bytes", "prompt_tokens", "completion_tokens")
+
+STAGE_SECONDS = histogram(
+    "translation_stage_seconds", "Wall time of the translation pipeline stages.", ("stage",)
+)
+
+current_trace = ContextVar("current_trace", default=None)
+current_span = ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    The wall time and counts of a block of code.
+    """
+
+    def __init__(self, name, parent=None):
+        self.name = name
+        self.parent = parent
+        self.started_at = datetime.now(timezone.utc)
+        self.start = time.perf_counter()
+        self.duration = None
+        self.counts = {}
+
+    def add(self, **counts):
+        """
+        Adds counts to the span.
+
+        Args:
+            **counts: The counts to add, e.g. bytes=1024.
+        """
+        for key, value in counts.items():
+            if value is not None:
+                self.counts[key] = self.counts.get(key, 0) + value
+
+    def to_row(self):
+        """
+        Returns the span as a pipeline_stage_timings row.
+
+        Returns:
+            dict: The stage, parent, start time, duration in milliseconds, the
+                column counts and the other counts as attributes.
+        """
+        return {
+            "stage": self.name,
+            "parent": self.parent,
+            "started_at": self.started_at,
+            "duration_ms": (self.duration or 0) * 1000,
+            "bytes": self.counts.get("bytes"),
+            "prompt_tokens": self.counts.get("prompt_tokens"),
+            "completion_tokens": self.counts.get("completion_tokens"),
+            "attributes": {
+                key: value for key, value in self.counts.items() if key not in COLUMN_COUNTS
+            },
+        }
+
+
+class Trace:
+    """
+    The spans of one document.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.spans = []
+        self.lock = threading.Lock()
+
+    def add(self, finished_span):
+        """
+        Adds a finished span to the trace.
+
+        Args:
+            finished_span (Span): The span.
+        """
+        with self.lock:
+            self.spans.append(finished_span)
+
+    def rows(self):
+        """
+        Returns the spans as pipeline_stage_timings rows, in start order.
+
+        Returns:
+            list: One dictionary per span, as returned by Span.to_row.
+        """
+        with self.lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+        return [s.to_row() for s in spans]
+
+
+@contextmanager
+def trace(file_name):
+    """
+    Collects the spans opened in the block for a document.
+
+    Args:
+        file_name (str): The name of the file.
+
+    Yields:
+        Trace: The trace.
+    """
+    document_trace = Trace(file_name)
+    token = current_trace.set(document_trace)
+    try:
+        yield document_trace
+    finally:
+        current_trace.reset(token)
+
+
+@contextmanager
+def span(name, **counts):
+    """
+    Measures the wall time of the block.
+
+    Args:
+        name (str): The name of the stage.
+        **counts: Counts known when the span starts, e.g. bytes=1024.
+
+    Yields:
+        Span: The span, to which counts can be added.
+    """
+    parent = current_span.get()
+    new_span = Span(name, parent.name if parent else None)
+    new_span.add(**counts)
+    token = current_span.set(new_span)
+    try:
+        yield new_span
+    finally:
+        new_span.duration = time.perf_counter() - new_span.start
+        current_span.reset(token)
+        STAGE_SECONDS.observe(new_span.duration, labels=(name,))
+        document_trace = current_trace.get()
+        if document_trace is not None:
+            document_trace.add(new_span)
+        logging.debug("Span %s finished in %.3f s: %s", name, new_span.duration, new_span.counts)
+
+
+def record(**counts):
+    """
+    Adds counts to the current span. Does nothing outside a span.
+
+    Args:
+        **counts: The counts to add, e.g. prompt_tokens=1200.
+    """
+    current = current_span.get()
+    if current is not None:
+        current.add(**counts)
+
+
+def timed(name=None):
+    """
+    Decorates a function so that each call is measured in a span.
+
+    Args:
+        name (str): The name of the stage. Defaults to the function name.
+
+    Returns:
+        function: The decorator.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name or func.__name__):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
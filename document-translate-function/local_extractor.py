@@ -0,0 +1,166 @@
+"""
+Module for extracting glossary terms locally, without the GPT model.
+
+Some prompts, such as address extraction, can be served by deterministic
+pattern and rule extraction, and some tenants may not send document text to
+Azure OpenAI at all. A prompt selects this backend with extraction_backend =
+'local' in prompt_logs; the extractor is chosen by the name of its pre-filter
+configuration (see prefilter.py).
+
+The response has the same format as the one returned by get_gpt_response, so
+it is parsed with parse_response like any other model response.
+"""
+
+import json
+import logging
+from prefilter import MAX_ADDRESS_LINE_WORDS, WORD_PATTERN, score_address_line
+
+# Lines scoring at least this much start an address block: a postcode, or a
+# street keyword with a house number.
+ADDRESS_ANCHOR_SCORE = 3
+# Neighbouring lines scoring at least this much, such as the town, the country
+# or the company name, are added to the block.
+ADDRESS_LINE_SCORE = 1
+MAX_ADDRESS_LINES = 6
+
+LOCAL_EXTRACTORS = {}
+
+
+def register_extractor(name):
+    """
+    Registers a local extraction function.
+
+    The function is called with the document text and returns the extracted lines.
+
+    Args:
+        name (str): The pre-filter name the extractor serves.
+
+    Returns:
+        function: The decorator registering the function.
+    """
+
+    def decorator(func):
+        LOCAL_EXTRACTORS[name] = func
+        return func
+
+    return decorator
+
+
+def is_address_line(line, scores, index):
+    """
+    Checks whether a line neighbouring an address block belongs to it.
+
+    Args:
+        line (str): The line.
+        scores (list): The address score of every line.
+        index (int): The index of the line.
+
+    Returns:
+        bool: True if the line can be part of the address.
+    """
+    words = WORD_PATTERN.findall(line)
+    if len(words) == 1:
+        # A single capitalized word, such as the country.
+        return words[0][0].isupper() and words[0].isalpha()
+    return (
+        bool(words)
+        and scores[index] >= ADDRESS_LINE_SCORE
+        and len(words) <= MAX_ADDRESS_LINE_WORDS
+    )
+
+
+@register_extractor("address")
+def extract_addresses(text):
+    """
+    Extracts the lines of the postal addresses in a text.
+
+    Each line scoring as a postcode or a numbered street starts a block, which
+    is extended over the neighbouring lines that also look like address lines.
+
+    Args:
+        text (str): The document text.
+
+    Returns:
+        list: The address lines, in document order and without duplicates.
+    """
+    lines = text.splitlines()
+    scores = [score_address_line(line) for line in lines]
+
+    selected = set()
+    for index, score in enumerate(scores):
+        if score < ADDRESS_ANCHOR_SCORE or index in selected:
+            continue
+        start = end = index
+        while (
+            end - start + 1 < MAX_ADDRESS_LINES
+            and start > 0
+            and is_address_line(lines[start - 1], scores, start - 1)
+        ):
+            start -= 1
+        while (
+            end - start + 1 < MAX_ADDRESS_LINES
+            and end + 1 < len(lines)
+            and is_address_line(lines[end + 1], scores, end + 1)
+        ):
+            end += 1
+        selected.update(range(start, end + 1))
+
+    results = []
+    seen = set()
+    for index in sorted(selected):
+        line = lines[index].strip()
+        if line not in seen:
+            seen.add(line)
+            results.append(line)
+    return results
+
+
+def get_local_extractor(prefilter_config):
+    """
+    Returns the local extractor for the pre-filter configuration of a prompt.
+
+    Args:
+        prefilter_config (dict): The prefilter_config of the prompt, or None.
+
+    Returns:
+        function: The extraction function, or None if there is none for the prompt.
+    """
+    name = (prefilter_config or {}).get("name")
+    return LOCAL_EXTRACTORS.get(name)
+
+
+def get_local_response(prompt_text, prefilter_config):
+    """
+    Extracts the glossary terms from the text locally.
+
+    Args:
+        prompt_text (str): The text to extract the terms from.
+        prefilter_config (dict): The prefilter_config of the prompt, which selects
+            the extractor.
+
+    Returns:
+        str: The JSON response, in the chat completion format of get_gpt_response.
+
+    Raises:
+        ValueError: If there is no local extractor for the prompt.
+    """
+    extractor = get_local_extractor(prefilter_config)
+    if extractor is None:
+        raise ValueError(f"No local extractor for pre-filter configuration {prefilter_config}")
+
+    lines = extractor(prompt_text)
+    logging.info("Local extractor %s found %d lines.", prefilter_config["name"], len(lines))
+    return json.dumps(
+        {
+            "object": "chat.completion",
+            "model": f"local-{prefilter_config['name']}",
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": "\n".join(lines)},
+                }
+            ],
+        },
+        ensure_ascii=False,
+    )
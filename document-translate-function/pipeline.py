@@ -0,0 +1,164 @@
+"""
+Module for running the translation pipeline as a small dependency graph.
+
+Each stage declares the stages it depends on. Stages whose dependencies have
+completed are submitted to a thread pool, so independent I/O (for example the
+metadata query and the document download) runs at the same time. Per-stage
+timings and the critical path are logged once the pipeline finishes, and each
+stage runs in a span of the current trace (see instrumentation.py).
+
+An optional check runs before new stages are started, e.g. to stop the
+pipeline when its document is cancelled.
+"""
+
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from instrumentation import span
+
+DEFAULT_MAX_WORKERS = 4
+
+
+class Stage:
+    """
+    A single unit of work in the pipeline.
+
+    The stage function is called with the results of its dependencies as
+    keyword arguments, named after the dependency stages.
+    """
+
+    def __init__(self, name, func, depends_on=()):
+        self.name = name
+        self.func = func
+        self.depends_on = tuple(depends_on)
+
+
+def validate_stages(stages):
+    """
+    Validates that stage names are unique, dependencies exist and there are no cycles.
+
+    Args:
+        stages (list): The stages of the pipeline.
+
+    Raises:
+        ValueError: If the stages do not form a valid dependency graph.
+    """
+    names = [stage.name for stage in stages]
+    if len(names) != len(set(names)):
+        raise ValueError(f"Duplicate stage names in pipeline: {names}")
+
+    by_name = {stage.name: stage for stage in stages}
+    for stage in stages:
+        for dependency in stage.depends_on:
+            if dependency not in by_name:
+                raise ValueError(f"Stage {stage.name} depends on unknown stage {dependency}")
+
+    resolved = set()
+    remaining = list(stages)
+    while remaining:
+        ready = [stage for stage in remaining if set(stage.depends_on) <= resolved]
+        if not ready:
+            raise ValueError(
+                f"Pipeline has a dependency cycle between: {[s.name for s in remaining]}"
+            )
+        resolved.update(stage.name for stage in ready)
+        remaining = [stage for stage in remaining if stage.name not in resolved]
+
+
+def run_pipeline(stages, max_workers=DEFAULT_MAX_WORKERS, label="pipeline", check=None):
+    """
+    Runs the stages, starting each one as soon as its dependencies have completed.
+
+    Args:
+        stages (list): The stages of the pipeline.
+        max_workers (int): Maximum number of stages running at the same time.
+        label (str): Name used in the timing log lines, e.g. the file name.
+        check (function): Called without arguments before stages are started.
+            An exception it raises stops the pipeline like a failed stage.
+
+    Returns:
+        dict: The result of each stage, keyed by stage name.
+
+    Raises:
+        Exception: The first exception raised by a stage or by the check. Stages
+            that have not started yet are cancelled.
+    """
+    validate_stages(stages)
+
+    results = {}
+    timings = {}
+    pending = {stage.name: stage for stage in stages}
+    running = {}
+    pipeline_start = time.perf_counter()
+
+    def run_stage(stage, kwargs):
+        started = time.perf_counter()
+        try:
+            with span(stage.name):
+                return stage.func(**kwargs)
+        finally:
+            finished = time.perf_counter()
+            timings[stage.name] = (started - pipeline_start, finished - pipeline_start)
+            logging.info(
+                "[%s] Stage %s finished in %.3f s", label, stage.name, finished - started
+            )
+
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pipeline")
+    try:
+        while pending or running:
+            if check and pending:
+                check()
+            for name, stage in list(pending.items()):
+                if all(dependency in results for dependency in stage.depends_on):
+                    kwargs = {dependency: results[dependency] for dependency in stage.depends_on}
+                    # Each stage runs in a copy of the caller's context, so its span
+                    # is added to the trace of the document.
+                    running[executor.submit(copy_context().run, run_stage, stage, kwargs)] = name
+                    del pending[name]
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name] = future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    log_critical_path(stages, timings, label)
+    return results
+
+
+def log_critical_path(stages, timings, label):
+    """
+    Logs the chain of stages that determined the total pipeline duration.
+
+    Args:
+        stages (list): The stages of the pipeline.
+        timings (dict): (start, end) offsets in seconds, keyed by stage name.
+        label (str): Name used in the log line.
+    """
+    if not timings:
+        return
+
+    by_name = {stage.name: stage for stage in stages}
+    current = max(timings, key=lambda name: timings[name][1])
+    path = []
+    while current:
+        start, end = timings[current]
+        path.append(f"{current} ({end - start:.3f} s)")
+        finished_dependencies = [
+            dependency for dependency in by_name[current].depends_on if dependency in timings
+        ]
+        current = (
+            max(finished_dependencies, key=lambda name: timings[name][1])
+            if finished_dependencies
+            else None
+        )
+
+    total = max(end for _, end in timings.values())
+    logging.info(
+        "[%s] Pipeline finished in %.3f s. Critical path: %s",
+        label,
+        total,
+        " -> ".join(reversed(path)),
+    )
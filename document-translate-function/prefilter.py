@@ -0,0 +1,215 @@
+"""
+Module for selecting the passages of a document that are sent to the GPT model.
+
+Most prompts only need a small part of the document. The address extraction
+prompt, for example, only needs the lines that could hold an address. A
+pre-filter scores every line of the text with local heuristics and keeps the
+candidate lines together with a few lines of context around them, so GPT sees
+only the relevant passages.
+
+Pre-filters are registered by name and configured per prompt through the
+prefilter_config column of prompt_logs, for example:
+
+    {"name": "address", "min_score": 2, "context_lines": 2}
+
+Prompts without a configuration are sent the full text.
+"""
+
+import logging
+import re
+
+DEFAULT_MIN_SCORE = 2
+DEFAULT_CONTEXT_LINES = 2
+
+# Lines longer than this are running text rather than address lines.
+MAX_ADDRESS_LINE_WORDS = 12
+
+PREFILTERS = {}
+
+
+def register_prefilter(name):
+    """
+    Registers a line scoring function as a pre-filter.
+
+    The function is called with a single line and returns its score; lines
+    scoring at least the configured min_score are candidates.
+
+    Args:
+        name (str): The name used in the prefilter_config of a prompt.
+
+    Returns:
+        function: The decorator registering the function.
+    """
+
+    def decorator(func):
+        PREFILTERS[name] = func
+        return func
+
+    return decorator
+
+
+UK_POSTCODE_PATTERN = re.compile(r"\b[A-Z]{1,2}\d[A-Z\d]? ?\d[A-Z]{2}\b")
+US_STATE_ZIP_PATTERN = re.compile(r"\b[A-Z]{2},? \d{5}(?:-\d{4})?\b")
+# Four to five digit postal code followed by a capitalized town, as in "10115 Berlin".
+POSTAL_CODE_TOWN_PATTERN = re.compile(r"\b(?:[A-Z]{1,2}-)?\d{2}-?\d{3}\s+[^\W\d_][^\W\d_]+")
+PO_BOX_PATTERN = re.compile(r"\b(?:p\.?\s?o\.?\s?box|postfach|boîte postale|apartado)\b", re.I)
+STREET_KEYWORDS = (
+    "street", "st", "road", "rd", "avenue", "ave", "lane", "ln", "drive", "dr",
+    "boulevard", "blvd", "way", "place", "pl", "square", "sq", "court", "ct",
+    "crescent", "close", "terrace", "highway", "hwy", "parkway", "suite", "floor",
+    "straße", "strasse", "str", "weg", "platz", "gasse", "allee", "ring", "damm",
+    "rue", "chemin", "quai", "impasse", "via", "viale", "piazza", "corso",
+    "calle", "avenida", "plaza", "paseo", "carrer", "rua", "travessa",
+    "ulica", "ul", "aleja", "al", "plac", "straat", "laan", "plein", "gracht",
+)
+# German and Dutch street names are compounds, as in "Hauptstraße" or "Keizersgracht".
+STREET_SUFFIXES = (
+    "straße", "strasse", "weg", "platz", "gasse", "allee", "damm",
+    "straat", "laan", "plein", "gracht", "kade",
+)
+STREET_KEYWORD_PATTERN = re.compile(
+    r"\b(?:" + "|".join(STREET_KEYWORDS) + r")\b"
+    r"|\w(?:" + "|".join(STREET_SUFFIXES) + r")\b",
+    re.I,
+)
+HOUSE_NUMBER_PATTERN = re.compile(r"\b\d{1,5}[a-zA-Z]?\b")
+CAPITALIZED_WORD_PATTERN = re.compile(r"^[^\W\d_]")
+WORD_PATTERN = re.compile(r"\S+")
+
+
+def is_capitalized_line(words):
+    """
+    Checks whether a short line consists mostly of capitalized words, as names
+    of buildings, towns and countries do.
+
+    Args:
+        words (list): The words of the line.
+
+    Returns:
+        bool: True if the line has at least two words and most of them are capitalized.
+    """
+    alphabetic = [word for word in words if CAPITALIZED_WORD_PATTERN.match(word)]
+    if len(alphabetic) < 2:
+        return False
+    capitalized = [word for word in alphabetic if word[0].isupper()]
+    return len(capitalized) * 3 >= len(alphabetic) * 2
+
+
+@register_prefilter("address")
+def score_address_line(line):
+    """
+    Scores how likely a line is to be part of a postal address.
+
+    Args:
+        line (str): The line.
+
+    Returns:
+        int: The score of the line, 0 when it does not look like an address.
+    """
+    words = WORD_PATTERN.findall(line)
+    if not words or len(words) > MAX_ADDRESS_LINE_WORDS:
+        return 0
+
+    score = 0
+    if UK_POSTCODE_PATTERN.search(line) or US_STATE_ZIP_PATTERN.search(line):
+        score += 3
+    elif POSTAL_CODE_TOWN_PATTERN.search(line):
+        score += 2
+    if PO_BOX_PATTERN.search(line):
+        score += 2
+
+    if STREET_KEYWORD_PATTERN.search(line):
+        score += 1
+        if HOUSE_NUMBER_PATTERN.search(line):
+            score += 2
+    if is_capitalized_line(words):
+        score += 1
+    return score
+
+
+def get_prefilter(config):
+    """
+    Returns the scoring function of a pre-filter configuration.
+
+    Args:
+        config (dict): The prefilter_config of the prompt, or None.
+
+    Returns:
+        function: The scoring function, or None when the full text should be sent.
+    """
+    if not config:
+        return None
+    scorer = PREFILTERS.get(config.get("name"))
+    if scorer is None:
+        logging.warning("Unknown pre-filter %s, sending the full text.", config.get("name"))
+    return scorer
+
+
+def select_candidate_lines(lines, scorer, min_score, context_lines):
+    """
+    Selects the indexes of the candidate lines and their context.
+
+    Args:
+        lines (list): The lines of the text.
+        scorer (function): The line scoring function.
+        min_score (int): The minimum score of a candidate line.
+        context_lines (int): The number of lines kept before and after each candidate.
+
+    Returns:
+        list: The sorted indexes of the selected lines.
+    """
+    selected = set()
+    for index, line in enumerate(lines):
+        if scorer(line) >= min_score:
+            start = max(index - context_lines, 0)
+            end = min(index + context_lines + 1, len(lines))
+            selected.update(range(start, end))
+    return sorted(selected)
+
+
+def apply_prefilter(text, config):
+    """
+    Keeps only the passages of the text selected by the pre-filter of the prompt.
+
+    Adjacent selected lines are kept together as one passage; passages are
+    separated by a blank line.
+
+    Args:
+        text (str): The document text.
+        config (dict): The prefilter_config of the prompt, or None.
+
+    Returns:
+        str: The selected passages, the full text if the prompt has no
+            pre-filter, or an empty string if no line was selected.
+    """
+    scorer = get_prefilter(config)
+    if scorer is None:
+        return text
+
+    lines = text.splitlines()
+    indexes = select_candidate_lines(
+        lines,
+        scorer,
+        config.get("min_score", DEFAULT_MIN_SCORE),
+        config.get("context_lines", DEFAULT_CONTEXT_LINES),
+    )
+
+    passages = []
+    previous = None
+    for index in indexes:
+        if previous is None or index != previous + 1:
+            passages.append([])
+        if lines[index].strip():
+            passages[-1].append(lines[index])
+        previous = index
+    candidate_text = "\n\n".join("\n".join(passage) for passage in passages if passage)
+
+    logging.info(
+        "Pre-filter %s kept %d of %d lines (%d of %d characters).",
+        config.get("name"),
+        len(indexes),
+        len(lines),
+        len(candidate_text),
+        len(text),
+    )
+    return candidate_text
@@ -0,0 +1,132 @@
+"""
+Module for limiting the rate of calls to Azure OpenAI and Azure Translator.
+
+When a bulk upload scales the function app out, every instance calls the
+services independently and the shared quota is exceeded. The limits are
+enforced with token buckets stored in the rate_limit_buckets table, so they
+are shared by all instances: callers wait until the buckets hold enough
+capacity instead of receiving 429 responses.
+
+Each limit is a bucket holding up to one minute of capacity, refilled
+continuously. A limit of 0 disables its bucket. If the database cannot be
+reached, calls proceed without limiting. A caller that finds no capacity within
+RATE_LIMIT_MAX_WAIT_SECONDS gets a RateLimitTimeoutError, a RuntimeError, so a
+document whose calls cannot be made is recorded as failed.
+"""
+
+import logging
+import random
+import time
+from psycopg2 import Error
+from database_helper import DatabaseHandler
+from metrics import histogram
+from environment_variables import (
+    OPENAI_REQUESTS_PER_MINUTE,
+    OPENAI_TOKENS_PER_MINUTE,
+    RATE_LIMIT_MAX_WAIT_SECONDS,
+    TRANSLATOR_REQUESTS_PER_MINUTE,
+)
+
+MIN_WAIT_SECONDS = 0.05
+MAX_WAIT_SECONDS = 10
+# Random extra wait, as a share of the wait, so instances do not retry in lockstep.
+WAIT_JITTER = 0.2
+
+RATE_LIMIT_WAIT_SECONDS = histogram(
+    "rate_limit_wait_seconds", "Time waited for shared rate limit capacity."
+)
+
+database_handler = DatabaseHandler()
+
+
+class RateLimitTimeoutError(RuntimeError):
+    """
+    Raised when the shared rate limit has no capacity for a call within the maximum wait.
+    """
+
+
+def acquire(limits, max_wait_seconds=RATE_LIMIT_MAX_WAIT_SECONDS):
+    """
+    Waits until every bucket has capacity for the call, then takes it.
+
+    Args:
+        limits (list): (bucket, amount, per_minute) tuples. Buckets with a
+            per_minute limit of 0 are ignored.
+        max_wait_seconds (float): The maximum time to wait for capacity.
+
+    Returns:
+        float: The time waited in seconds.
+
+    Raises:
+        RateLimitTimeoutError: If the capacity is not available within max_wait_seconds.
+    """
+    requests = [
+        (bucket, amount, per_minute, per_minute / 60)
+        for bucket, amount, per_minute in limits
+        if per_minute > 0
+    ]
+    if not requests:
+        return 0
+
+    started = time.monotonic()
+    while True:
+        try:
+            wait_seconds = database_handler.take_rate_limit_tokens(requests)
+        except Error as e:
+            logging.warning("Rate limiter unavailable, continuing without it: %s", str(e))
+            return time.monotonic() - started
+
+        waited = time.monotonic() - started
+        if wait_seconds == 0:
+            RATE_LIMIT_WAIT_SECONDS.observe(waited)
+            if waited > 0:
+                logging.info(
+                    "Waited %.2f s for rate limit capacity of %s",
+                    waited,
+                    [bucket for bucket, _, _, _ in requests],
+                )
+            return waited
+
+        remaining = max_wait_seconds - waited
+        if remaining <= 0:
+            raise RateLimitTimeoutError(
+                f"No rate limit capacity for {[bucket for bucket, _, _, _ in requests]} "
+                f"after {waited:.0f} s"
+            )
+        delay = min(wait_seconds, MAX_WAIT_SECONDS) * (1 + random.uniform(0, WAIT_JITTER))
+        time.sleep(min(max(delay, MIN_WAIT_SECONDS), remaining))
+
+
+def acquire_openai(deployment_name, estimated_tokens):
+    """
+    Waits for the request and token capacity of an Azure OpenAI deployment.
+
+    Args:
+        deployment_name (str): The name of the model deployment.
+        estimated_tokens (int): The prompt tokens plus the maximum response tokens,
+            which is what Azure OpenAI counts against the tokens per minute.
+
+    Returns:
+        float: The time waited in seconds.
+    """
+    return acquire(
+        [
+            (f"openai:{deployment_name}:requests", 1, OPENAI_REQUESTS_PER_MINUTE),
+            (f"openai:{deployment_name}:tokens", estimated_tokens, OPENAI_TOKENS_PER_MINUTE),
+        ]
+    )
+
+
+def acquire_translator():
+    """
+    Waits for the request capacity of Azure Translator.
+
+    Every call to the Translator API takes capacity: translations, batch job
+    submissions and cancellations, status polls and the document status
+    requests. A hedged request takes capacity once, as its second copy is only
+    sent when the first is slow. Only the warm-up request of an instance is exempt.
+
+    Returns:
+        float: The time waited in seconds.
+    """
+    return acquire([("translator:requests", 1, TRANSLATOR_REQUESTS_PER_MINUTE)])
@@ -0,0 +1,403 @@
+"""
+Module for making outbound service calls resilient to transient failures.
+
+Calls to Azure OpenAI, Azure Translator and Blob Storage go through this
+module, which provides:
+
+- retries with exponential backoff and full jitter, honoring Retry-After;
+- a circuit breaker per endpoint, which fails calls fast while an endpoint
+  keeps failing and lets a single trial call through after a cool-down;
+- hedged requests for idempotent GETs: if the first request has not answered
+  within HEDGE_DELAY_SECONDS, a second one is sent and the first good answer wins;
+- counters of retries, hedges and breaker transitions, and the breaker states,
+  in the metrics registry (see metrics.py).
+
+Requests share one HTTP session, so connections are reused across calls.
+"""
+
+import logging
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import counter, gauge
+from environment_variables import (
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+    CIRCUIT_BREAKER_RESET_SECONDS,
+    HEDGE_DELAY_SECONDS,
+    RETRY_BASE_DELAY_SECONDS,
+    RETRY_MAX_ATTEMPTS,
+    RETRY_MAX_DELAY_SECONDS,
+)
+
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+# Status codes returned before the service processed the request, so that even
+# non-idempotent requests can be retried.
+NOT_PROCESSED_STATUS_CODES = (429, 503)
+IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT", "DELETE", "OPTIONS")
+HTTP_POOL_SIZE = 20
+HEDGE_POOL_SIZE = 8
+
+OUTBOUND_EVENTS = counter(
+    "outbound_events_total",
+    "Retries, hedges, failures and circuit breaker events of outbound calls.",
+    ("event", "endpoint"),
+)
+BREAKER_STATE = gauge(
+    "circuit_breaker_state",
+    "State of the circuit breaker of each endpoint: 0 closed, 1 half-open, 2 open.",
+    ("endpoint",),
+)
+breakers = {}
+breakers_lock = threading.Lock()
+hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_POOL_SIZE, thread_name_prefix="hedge")
+
+
+class CircuitOpenError(requests.RequestException):
+    """
+    Raised when a call is rejected because the circuit breaker of its endpoint is open.
+    """
+
+
+def increment_metric(name, endpoint):
+    """
+    Increments a counter of an endpoint.
+
+    Args:
+        name (str): The counter name, e.g. "retries".
+        endpoint (str): The endpoint name.
+    """
+    OUTBOUND_EVENTS.inc(labels=(name, endpoint))
+
+
+def get_breaker_states():
+    """
+    Returns the state of every circuit breaker, for the circuit_breaker_state gauge.
+
+    Returns:
+        dict: 0 for closed, 1 for half-open and 2 for open, keyed by (endpoint,).
+    """
+    values = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+    with breakers_lock:
+        return {(name,): values[breaker.state] for name, breaker in breakers.items()}
+
+
+class CircuitBreaker:
+    """
+    Tracks consecutive transient failures of an endpoint.
+
+    After failure_threshold consecutive failures the breaker opens and rejects
+    calls. Once reset_seconds have passed, it lets one trial call through: a
+    success closes the breaker, a failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(
+        self,
+        name,
+        failure_threshold=CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+        reset_seconds=CIRCUIT_BREAKER_RESET_SECONDS,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """
+        Checks whether a call may be made.
+
+        Returns:
+            bool: True if the call may be made.
+        """
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+                logging.info("Circuit breaker %s is half-open", self.name)
+                return True
+            return False
+
+    def record_success(self):
+        """
+        Records a successful call, closing the breaker.
+        """
+        with self.lock:
+            if self.state != self.CLOSED:
+                logging.info("Circuit breaker %s closed", self.name)
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        """
+        Records a transient failure, opening the breaker at the threshold.
+        """
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and self.failures >= self.failure_threshold
+            ):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                logging.warning(
+                    "Circuit breaker %s opened after %d failures", self.name, self.failures
+                )
+                increment_metric("breaker_opened", self.name)
+
+
+BREAKER_STATE.set_function(get_breaker_states)
+
+
+def get_breaker(endpoint):
+    """
+    Returns the circuit breaker of an endpoint, creating it on first use.
+
+    Args:
+        endpoint (str): The endpoint name.
+
+    Returns:
+        CircuitBreaker: The circuit breaker.
+    """
+    with breakers_lock:
+        if endpoint not in breakers:
+            breakers[endpoint] = CircuitBreaker(endpoint)
+        return breakers[endpoint]
+
+
+@lru_cache(maxsize=None)
+def get_session():
+    """
+    Returns the HTTP session shared by all outbound requests.
+
+    Returns:
+        requests.Session: The session.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def parse_retry_after(response):
+    """
+    Reads the Retry-After header of a response.
+
+    Args:
+        response (requests.Response): The HTTP response.
+
+    Returns:
+        float: The number of seconds to wait, or None if the header is missing.
+    """
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def get_backoff_delay(attempt, retry_after=None):
+    """
+    Returns the delay before the next attempt.
+
+    Args:
+        attempt (int): The number of the failed attempt, starting at 0.
+        retry_after (float): The delay requested by the service, if any.
+
+    Returns:
+        float: The delay in seconds.
+    """
+    if retry_after is not None:
+        return min(retry_after, RETRY_MAX_DELAY_SECONDS)
+    return random.uniform(0, min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * 2**attempt))
+
+
+def call_with_retry(endpoint, func, classify, max_attempts=RETRY_MAX_ATTEMPTS, on_attempt=None):
+    """
+    Calls a function, retrying transient failures behind the endpoint's circuit breaker.
+
+    Args:
+        endpoint (str): The endpoint name, which selects the circuit breaker.
+        func (function): The call, without arguments.
+        classify (function): Called with the result and the raised exception (one
+            of them is None). Returns a (transient, retry_allowed, retry_after)
+            tuple: whether the outcome is a transient failure of the endpoint,
+            whether the call may be repeated, and the delay requested by the service.
+        max_attempts (int): The maximum number of attempts.
+        on_attempt (function): Called before each attempt and before the circuit
+            breaker is checked, e.g. to wait for rate limit capacity. Its
+            exceptions are raised as they are and do not count for the breaker,
+            as the endpoint was not called.
+
+    Returns:
+        object: The result of the last attempt.
+
+    Raises:
+        CircuitOpenError: If the circuit breaker of the endpoint is open before
+            the first attempt.
+        Exception: The exception raised by the last attempt or by on_attempt.
+    """
+    breaker = get_breaker(endpoint)
+    attempt = 0
+    while True:
+        if on_attempt:
+            on_attempt()
+        if not breaker.allow():
+            increment_metric("breaker_rejected", endpoint)
+            raise CircuitOpenError(f"Circuit breaker {endpoint} is open")
+
+        result = error = None
+        try:
+            result = func()
+        except Exception as e:
+            error = e
+        transient, retry_allowed, retry_after = classify(result, error)
+        if transient:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+        attempt += 1
+        # Stop retrying once the breaker has opened, so the endpoint can recover.
+        if (
+            not transient
+            or not retry_allowed
+            or attempt >= max_attempts
+            or breaker.state == CircuitBreaker.OPEN
+        ):
+            if transient:
+                increment_metric("failures", endpoint)
+            if error is not None:
+                raise error
+            return result
+
+        delay = get_backoff_delay(attempt - 1, retry_after)
+        increment_metric("retries", endpoint)
+        logging.warning(
+            "Transient failure calling %s (attempt %d of %d), retrying in %.1f s: %s",
+            endpoint,
+            attempt,
+            max_attempts,
+            delay,
+            error if error is not None else getattr(result, "status_code", result),
+        )
+        time.sleep(delay)
+
+
+def is_good_response(future):
+    """
+    Checks whether a completed request returned a response that is not a transient failure.
+
+    Args:
+        future (concurrent.futures.Future): The completed request.
+
+    Returns:
+        bool: True if the response can be used.
+    """
+    return future.exception() is None and future.result().status_code not in RETRYABLE_STATUS_CODES
+
+
+def send_hedged(endpoint, send):
+    """
+    Sends a request, and a second identical one if the first is slow.
+
+    Args:
+        endpoint (str): The endpoint name, used for the metrics.
+        send (function): Sends the request and returns the response.
+
+    Returns:
+        requests.Response: The first good response, or the first response if
+            both requests failed.
+    """
+    first = hedge_executor.submit(send)
+    done, _ = wait([first], timeout=HEDGE_DELAY_SECONDS)
+    if done:
+        return first.result()
+
+    increment_metric("hedges", endpoint)
+    second = hedge_executor.submit(send)
+    pending = {first, second}
+    completed = []
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if is_good_response(future):
+                if future is second:
+                    increment_metric("hedges_won", endpoint)
+                return future.result()
+            completed.append(future)
+    return completed[0].result()
+
+
+def request(method, url, endpoint, idempotent=None, hedge=False, max_attempts=None,
+            on_attempt=None, **kwargs):
+    """
+    Sends an HTTP request with retries, a circuit breaker and optional hedging.
+
+    Idempotent requests are retried on connection errors, timeouts and
+    retryable status codes. Other requests are only retried when the service
+    did not process them: on connection errors and on 429 and 503 responses.
+
+    Args:
+        method (str): The HTTP method.
+        url (str): The URL.
+        endpoint (str): The endpoint name, which selects the circuit breaker.
+        idempotent (bool): Whether the request may be repeated. Defaults to
+            True for GET, HEAD, PUT, DELETE and OPTIONS.
+        hedge (bool): Send a second request if the first one is slow. Only
+            used for idempotent requests.
+        max_attempts (int): The maximum number of attempts. Defaults to RETRY_MAX_ATTEMPTS.
+        on_attempt (function): Called before each attempt, e.g. to wait for rate
+            limit capacity (see call_with_retry).
+        **kwargs: Passed to requests.Session.request.
+
+    Returns:
+        requests.Response: The response of the last attempt.
+
+    Raises:
+        CircuitOpenError: If the circuit breaker of the endpoint is open.
+        requests.RequestException: If the last attempt failed without a response.
+    """
+    if idempotent is None:
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+    session = get_session()
+
+    def send():
+        return session.request(method, url, **kwargs)
+
+    def attempt():
+        if hedge and idempotent and HEDGE_DELAY_SECONDS > 0:
+            return send_hedged(endpoint, send)
+        return send()
+
+    def classify(response, error):
+        if error is not None:
+            transient = isinstance(error, requests.RequestException)
+            return transient, idempotent or isinstance(error, requests.ConnectionError), None
+        if response.status_code not in RETRYABLE_STATUS_CODES:
+            return False, False, None
+        retry_allowed = idempotent or response.status_code in NOT_PROCESSED_STATUS_CODES
+        return True, retry_allowed, parse_retry_after(response)
+
+    return call_with_retry(
+        endpoint, attempt, classify, max_attempts or RETRY_MAX_ATTEMPTS, on_attempt=on_attempt
+    )
@@ -0,0 +1,217 @@
+"""
+Module for scheduling translation jobs fairly between users.
+
+Uploads used to be translated in arrival order, so one user's large batch
+starved everybody else. Each upload is now queued in the translation_jobs table
+under the uploaded_by value of its file_translation_logs record, and the next
+job to run is chosen across users:
+
+- documents are split into lanes at upload: small documents go to the
+  interactive lane and large ones to the batch lane. Each lane has its own
+  limit of running jobs across all instances, translation timeout and stale
+  job timeout, so large documents cannot take the capacity small ones need;
+- within a lane, weighted round-robin between users: every started job
+  advances the user's virtual time by 1 / weight, and the user with the lowest
+  virtual time goes next (weights are set in translation_user_shares);
+- a user never runs more than SCHEDULER_MAX_JOBS_PER_USER jobs at once in a lane.
+
+Every blob trigger invocation queues its upload and then runs jobs of the same
+lane, starting with the next one in fair order, which is not necessarily its
+own, and claiming the next job whenever one finishes. A timer per lane sweeps
+the queue for jobs that could not be started at the time, runs them on as many
+concurrent workers as the lane may run jobs, and requeues jobs interrupted by a
+recycled instance. The timer schedules are derived from the sweep
+interval of each lane.
+
+The lane of a document is decided by classify_lane of lanes.py, shared with
+the upload function.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from database_helper import DatabaseHandler
+from lanes import BATCH_LANE, INTERACTIVE_LANE, classify_lane
+from environment_variables import (
+    LANE_BATCH_MAX_RUNNING,
+    LANE_BATCH_STALE_SECONDS,
+    LANE_BATCH_SWEEP_SECONDS,
+    LANE_BATCH_TIMEOUT_SECONDS,
+    LANE_INTERACTIVE_MAX_RUNNING,
+    LANE_INTERACTIVE_STALE_SECONDS,
+    LANE_INTERACTIVE_SWEEP_SECONDS,
+    LANE_INTERACTIVE_TIMEOUT_SECONDS,
+    SCHEDULER_MAX_ATTEMPTS,
+    SCHEDULER_MAX_JOBS_PER_USER,
+    SCHEDULER_SWEEP_SECONDS,
+)
+
+LANES = {
+    INTERACTIVE_LANE: {
+        "max_running": LANE_INTERACTIVE_MAX_RUNNING,
+        "timeout_seconds": LANE_INTERACTIVE_TIMEOUT_SECONDS,
+        "stale_seconds": LANE_INTERACTIVE_STALE_SECONDS,
+        "sweep_seconds": LANE_INTERACTIVE_SWEEP_SECONDS,
+    },
+    BATCH_LANE: {
+        "max_running": LANE_BATCH_MAX_RUNNING,
+        "timeout_seconds": LANE_BATCH_TIMEOUT_SECONDS,
+        "stale_seconds": LANE_BATCH_STALE_SECONDS,
+        "sweep_seconds": LANE_BATCH_SWEEP_SECONDS,
+    },
+}
+
+database_handler = DatabaseHandler()
+
+
+def get_lane_timeout(lane):
+    """
+    Returns the translation timeout of a lane.
+
+    Args:
+        lane (str): The lane, None for documents that were not classified.
+
+    Returns:
+        int: The timeout in seconds, or None to derive it from the document size.
+    """
+    return LANES.get(lane, LANES[BATCH_LANE])["timeout_seconds"] or None
+
+
+def get_sweep_schedule(lane):
+    """
+    Returns the NCRONTAB schedule of the timer that sweeps the queue of a lane.
+
+    Intervals under a minute are in seconds and should divide 60, as the timer
+    also fires at the start of each minute; longer ones are rounded down to
+    whole minutes, up to an hour.
+
+    Args:
+        lane (str): The lane.
+
+    Returns:
+        str: The schedule, e.g. "*/30 * * * * *" for a 30 second interval.
+    """
+    seconds = max(LANES[lane]["sweep_seconds"], 1)
+    if seconds < 60:
+        return f"*/{seconds} * * * * *"
+    return f"0 */{min(seconds // 60, 60)} * * * *"
+
+
+def get_sweep_time_budget(lane):
+    """
+    Returns the time a sweep of a lane may spend running queued jobs.
+
+    A sweep ends before the next one of the lane is due, and after at most
+    SCHEDULER_SWEEP_SECONDS.
+
+    Args:
+        lane (str): The lane.
+
+    Returns:
+        int: The time budget in seconds.
+    """
+    return min(LANES[lane]["sweep_seconds"], SCHEDULER_SWEEP_SECONDS)
+
+
+def enqueue_job(file_name, size_bytes):
+    """
+    Queues an uploaded document for translation.
+
+    Args:
+        file_name (str): The name of the file.
+        size_bytes (int): The size of the document in bytes, None if unknown.
+
+    Returns:
+        str: The lane of the job, or None if the job was already queued or running.
+    """
+    return database_handler.enqueue_translation_job(
+        file_name, size_bytes, classify_lane(size_bytes)
+    )
+
+
+def run_queued_jobs(process, lane, max_jobs=None, time_budget_seconds=None, workers=None):
+    """
+    Claims and processes the queued jobs of a lane in fair order, on concurrent workers.
+
+    Each worker claims a job, processes it and claims the next one, until no job
+    can be started, max_jobs have been claimed or the time budget is spent. The
+    claims enforce the running limit of the lane and the per-user cap across all
+    instances, so workers beyond them find nothing to claim and stop.
+
+    Args:
+        process (function): Processes a file, called with the file name. Returns
+            the final status of the job ('done', 'failed', 'cancelled').
+        lane (str): The lane.
+        max_jobs (int): The maximum number of jobs to process, None for no limit.
+        time_budget_seconds (float): No job is started after this many seconds,
+            None for no limit.
+        workers (int): The number of jobs processed at once, by default the
+            running limit of the lane.
+
+    Returns:
+        int: The number of jobs processed.
+    """
+    started = time.monotonic()
+    if workers is None:
+        workers = LANES[lane]["max_running"]
+    if max_jobs is not None:
+        workers = min(workers, max_jobs)
+    claimed = []
+    claim_lock = threading.Lock()
+
+    def claim():
+        with claim_lock:
+            if max_jobs is not None and len(claimed) >= max_jobs:
+                return None
+            if (
+                time_budget_seconds is not None
+                and time.monotonic() - started >= time_budget_seconds
+            ):
+                return None
+            file_name = database_handler.claim_translation_job(
+                lane,
+                LANES[lane]["max_running"],
+                SCHEDULER_MAX_JOBS_PER_USER,
+                SCHEDULER_MAX_ATTEMPTS,
+            )
+            if file_name is not None:
+                claimed.append(file_name)
+            return file_name
+
+    def work():
+        file_name = claim()
+        while file_name is not None:
+            status = "failed"
+            try:
+                status = process(file_name)
+            except Exception as e:
+                logging.error("Translation job %s failed: %s", file_name, str(e), exc_info=True)
+            finally:
+                database_handler.finish_translation_job(file_name, status)
+            file_name = claim()
+
+    if workers <= 1:
+        work()
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{lane}-job") as pool:
+            for future in [pool.submit(work) for _ in range(workers)]:
+                future.result()
+
+    logging.info("Processed %d queued translation jobs in the %s lane", len(claimed), lane)
+    return len(claimed)
+
+
+def requeue_stale_jobs(lane):
+    """
+    Requeues the jobs of a lane whose instance stopped before finishing them.
+
+    Args:
+        lane (str): The lane.
+
+    Returns:
+        int: The number of stale jobs.
+    """
+    return database_handler.requeue_stale_translation_jobs(
+        lane, LANES[lane]["stale_seconds"], SCHEDULER_MAX_ATTEMPTS
+    )
@@ -0,0 +1,120 @@
+"""
+Tests for the loading of additional glossaries.
+"""
+
+import pytest
+from azure.core.exceptions import ResourceModifiedError, ResourceNotFoundError
+import document_processing
+import function_app
+
+GLOSSARY_URL = "https://account.blob.core.windows.net/container/glossary.csv?sig=secret"
+
+
+class FakeDownload:
+    def __init__(self, content):
+        self.content = content
+
+    def readall(self):
+        return self.content
+
+
+class FakeBlobClient:
+    """
+    A glossary blob, whose ETag moves to the next of the given (etag, content)
+    versions each time its properties are read.
+    """
+
+    def __init__(self, versions, modified_downloads=0, missing=False):
+        self.versions = versions
+        self.modified_downloads = modified_downloads
+        self.missing = missing
+        self.reads = 0
+        self.downloads = 0
+
+    def get_blob_properties(self):
+        if self.missing:
+            raise ResourceNotFoundError("The specified blob does not exist.")
+        etag, _ = self.versions[min(self.reads, len(self.versions) - 1)]
+        self.reads += 1
+        return type("Properties", (), {"etag": etag})()
+
+    def download_blob(self, etag, match_condition):
+        self.downloads += 1
+        if self.downloads <= self.modified_downloads:
+            raise ResourceModifiedError("The condition specified is not met.")
+        versions = dict(self.versions)
+        return FakeDownload(versions[etag])
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    document_processing.additional_glossary_cache.clear()
+    yield
+    document_processing.additional_glossary_cache.clear()
+
+
+def use_blob(monkeypatch, blob_client):
+    monkeypatch.setattr(
+        document_processing.BlobClient, "from_blob_url", lambda url: blob_client
+    )
+
+
+def test_load_additional_glossary_parses_and_caches(monkeypatch):
+    blob_client = FakeBlobClient([("etag-1", b"Contoso,Contoso\nhello,bonjour\n")])
+    use_blob(monkeypatch, blob_client)
+    expected = [("Contoso", "Contoso"), ("hello", "bonjour")]
+    assert document_processing.load_additional_glossary(GLOSSARY_URL) == expected
+    assert document_processing.load_additional_glossary(GLOSSARY_URL) == expected
+    assert blob_client.downloads == 1
+
+
+def test_load_additional_glossary_retries_once_when_modified(monkeypatch):
+    blob_client = FakeBlobClient(
+        [("etag-1", b"old,ancien\n"), ("etag-2", b"new,nouveau\n")], modified_downloads=1
+    )
+    use_blob(monkeypatch, blob_client)
+    assert document_processing.load_additional_glossary(GLOSSARY_URL) == [("new", "nouveau")]
+    assert blob_client.downloads == 2
+    assert document_processing.additional_glossary_cache[GLOSSARY_URL.split("?")[0]][0] == "etag-2"
+
+
+def test_load_additional_glossary_raises_when_modified_twice(monkeypatch):
+    blob_client = FakeBlobClient(
+        [("etag-1", b"a,b\n"), ("etag-2", b"c,d\n")], modified_downloads=2
+    )
+    use_blob(monkeypatch, blob_client)
+    with pytest.raises(ResourceModifiedError):
+        document_processing.load_additional_glossary(GLOSSARY_URL)
+
+
+def test_load_additional_glossaries_skips_missing_blob(monkeypatch):
+    blobs = {
+        "missing.csv": FakeBlobClient([], missing=True),
+        "present.csv": FakeBlobClient([("etag-1", b"hello,bonjour\n")]),
+    }
+    monkeypatch.setattr(
+        document_processing.BlobClient,
+        "from_blob_url",
+        lambda url: blobs[url.split("?")[0].rsplit("/", 1)[1]],
+    )
+    metadata = {
+        "additionalGlossaryContentUrl": (
+            "https://account.blob.core.windows.net/container/missing.csv?sig=a "
+            "https://account.blob.core.windows.net/container/present.csv?sig=b"
+        )
+    }
+    assert function_app.load_additional_glossaries(metadata) == [("hello", "bonjour")]
+
+
+def test_load_additional_glossaries_skips_modified_blob(monkeypatch):
+    use_blob(
+        monkeypatch,
+        FakeBlobClient([("etag-1", b"a,b\n"), ("etag-2", b"c,d\n")], modified_downloads=2),
+    )
+    metadata = {"additionalGlossaryContentUrl": GLOSSARY_URL}
+    assert function_app.load_additional_glossaries(metadata) == []
+
+
+def test_load_additional_glossaries_skips_invalid_url():
+    metadata = {"additionalGlossaryContentUrl": "not-a-blob-url?sig=a"}
+    assert function_app.load_additional_glossaries(metadata) == []
@@ -0,0 +1,33 @@
+"""
+Tests for the glossary helpers of document_processing.py.
+"""
+
+import csv
+import io
+from document_processing import create_csv_string, normalize_csv_content
+
+
+def parse(csv_content):
+    return list(csv.reader(io.StringIO(csv_content, newline="")))
+
+
+def test_normalize_csv_content_keeps_line_breaks_inside_terms():
+    entries = [
+        ("line one\nline two", "ligne un\nligne deux"),
+        ("vertical\x0btab", "vertical\x0btab"),
+        ("line\u2028separator", "line\u2028separator"),
+        ("group\x1dseparator", "group\x1dseparator"),
+    ]
+    rows = parse(normalize_csv_content(create_csv_string(entries)))
+    assert sorted(rows) == sorted([list(entry) for entry in entries])
+
+
+def test_normalize_csv_content_deduplicates_and_sorts():
+    first = create_csv_string([("b", "b"), ("a", "x"), ("b", "b")])
+    second = create_csv_string([("a", "x"), ("b", "b")]).replace("\r\n", "\n") + "\n"
+    assert normalize_csv_content(first) == normalize_csv_content(second)
+    assert parse(normalize_csv_content(first)) == [["a", "x"], ["b", "b"]]
+
+
+def test_normalize_csv_content_uses_crlf_and_quotes_every_field():
+    assert normalize_csv_content('a,b\n\n"c","d"\n') == '"a","b"\r\n"c","d"\r\n'
@@ -0,0 +1,86 @@
+"""
+Tests for the timings of get_gpt_response in gpt_handler.py.
+"""
+
+import itertools
+import time
+import httpx
+import pytest
+from openai import APIConnectionError
+import gpt_handler
+
+deployment_names = itertools.count()
+
+
+class Clock:
+    """
+    A perf_counter that only advances when told to.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeCompletion:
+    usage = None
+
+    def to_json(self):
+        return '{"choices": []}'
+
+
+class FakeClient:
+    """
+    Answers chat completions after call_seconds, failing the first attempts.
+    """
+
+    def __init__(self, clock, call_seconds, failures=0):
+        self.clock = clock
+        self.call_seconds = call_seconds
+        self.failures = failures
+        self.chat = self
+        self.completions = self
+
+    def create(self, **_):
+        self.clock.sleep(self.call_seconds)
+        if self.failures:
+            self.failures -= 1
+            raise APIConnectionError(request=httpx.Request("POST", "https://openai.test"))
+        return FakeCompletion()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(time, "perf_counter", clock)
+    monkeypatch.setattr(time, "sleep", clock.sleep)
+    return clock
+
+
+def get_response(monkeypatch, client, rate_limit_wait):
+    monkeypatch.setattr(gpt_handler, "get_openai_client", lambda: client)
+    monkeypatch.setattr(
+        gpt_handler, "acquire_openai", lambda *_: client.clock.sleep(rate_limit_wait)
+    )
+    parameters = {"deploymentName": f"test-{next(deployment_names)}"}
+    timings = {}
+    gpt_handler.get_gpt_response("text", "prompt", [], parameters, timings)
+    return timings
+
+
+def test_latency_excludes_rate_limit_waits(monkeypatch, clock):
+    timings = get_response(monkeypatch, FakeClient(clock, 1.5), rate_limit_wait=4)
+    assert timings == {"latency": pytest.approx(1.5), "wait": pytest.approx(4)}
+
+
+def test_retry_backoff_counts_as_wait(monkeypatch, clock):
+    timings = get_response(monkeypatch, FakeClient(clock, 0.5, failures=1), rate_limit_wait=1)
+    # Two attempts of 0.5 s, each after a rate limit wait of 1 s, and the backoff between them.
+    backoff = clock.now - 3
+    assert backoff > 0
+    assert timings == {"latency": pytest.approx(1), "wait": pytest.approx(2 + backoff)}
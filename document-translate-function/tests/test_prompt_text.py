@@ -0,0 +1,26 @@
+"""
+Tests for the recording of the text reduction savings.
+"""
+
+import function_app
+from instrumentation import span
+
+
+def test_get_prompt_text_records_the_tokens_saved(monkeypatch):
+    monkeypatch.setattr(function_app, "TEXT_REDUCTION_ENABLED", True)
+    footer = "Contoso Ltd - Confidential - All rights reserved"
+    pages = [f"Page {index} with an address at 1 Main Street.\n{footer}\n" for index in range(6)]
+    document = {"text": "".join(pages), "pages": pages}
+    series = function_app.PROMPT_REDUCTION_TOKENS.series
+    original_before = series.get(("original",), 0)
+    reduced_before = series.get(("reduced",), 0)
+
+    with span("prompt_text") as prompt_span:
+        prompt_text = function_app.get_prompt_text(document)
+
+    assert prompt_text.count(footer) < len(pages)
+    counts = prompt_span.counts
+    assert counts["tokens_saved"] == counts["tokens_before"] - counts["tokens_after"] > 0
+    assert series[("original",)] - original_before == counts["tokens_before"]
+    assert series[("reduced",)] - reduced_before == counts["tokens_after"]
+    assert prompt_span.to_row()["attributes"]["tokens_saved"] == counts["tokens_saved"]
@@ -0,0 +1,75 @@
+"""
+Tests for rate_limiter.py.
+"""
+
+import pytest
+from psycopg2 import OperationalError
+import rate_limiter
+
+
+class FakeBuckets:
+    """
+    Answers take_rate_limit_tokens with the given waits, one per call.
+    """
+
+    def __init__(self, waits):
+        self.waits = list(waits)
+        self.calls = []
+
+    def take_rate_limit_tokens(self, requests):
+        self.calls.append(requests)
+        wait = self.waits.pop(0)
+        if isinstance(wait, Exception):
+            raise wait
+        return wait
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(rate_limiter.time, "sleep", slept.append)
+    return slept
+
+
+def use_buckets(monkeypatch, waits):
+    buckets = FakeBuckets(waits)
+    monkeypatch.setattr(rate_limiter, "database_handler", buckets)
+    return buckets
+
+
+def test_acquire_ignores_disabled_limits(monkeypatch):
+    buckets = use_buckets(monkeypatch, [])
+    assert rate_limiter.acquire([("translator:requests", 1, 0)]) == 0
+    assert buckets.calls == []
+
+
+def test_acquire_takes_capacity_from_every_enabled_bucket(monkeypatch, sleeps):
+    buckets = use_buckets(monkeypatch, [0])
+    rate_limiter.acquire(
+        [("openai:requests", 1, 60), ("openai:tokens", 500, 0), ("translator:requests", 2, 120)]
+    )
+    assert buckets.calls == [
+        [("openai:requests", 1, 60, 1.0), ("translator:requests", 2, 120, 2.0)]
+    ]
+    assert sleeps == []
+
+
+def test_acquire_waits_until_capacity_is_available(monkeypatch, sleeps):
+    buckets = use_buckets(monkeypatch, [1.5, 0.5, 0])
+    rate_limiter.acquire([("translator:requests", 1, 60)], max_wait_seconds=60)
+    assert len(buckets.calls) == 3
+    assert len(sleeps) == 2
+    assert 1.5 <= sleeps[0] <= 1.5 * (1 + rate_limiter.WAIT_JITTER)
+
+
+def test_acquire_raises_a_runtime_error_after_the_maximum_wait(monkeypatch, sleeps):
+    use_buckets(monkeypatch, [5])
+    with pytest.raises(rate_limiter.RateLimitTimeoutError) as raised:
+        rate_limiter.acquire([("translator:requests", 1, 60)], max_wait_seconds=0)
+    assert isinstance(raised.value, RuntimeError)
+
+
+def test_acquire_proceeds_when_the_database_is_unavailable(monkeypatch, sleeps):
+    use_buckets(monkeypatch, [OperationalError("connection refused")])
+    rate_limiter.acquire([("translator:requests", 1, 60)])
+    assert sleeps == []
@@ -0,0 +1,131 @@
+"""
+Tests for call_with_retry and the circuit breakers of resilience.py.
+"""
+
+import itertools
+import pytest
+import resilience
+from rate_limiter import RateLimitTimeoutError
+from resilience import CircuitBreaker, CircuitOpenError, call_with_retry
+
+endpoint_names = itertools.count()
+
+
+class TransientError(Exception):
+    pass
+
+
+class PermanentError(Exception):
+    pass
+
+
+def classify(result, error):
+    if isinstance(error, TransientError):
+        return True, True, 0
+    if error is not None:
+        return False, False, None
+    return result == "retry", True, 0
+
+
+def calls(*outcomes):
+    """
+    Returns a function raising or returning the outcomes in turn, and its call log.
+    """
+    log = []
+    remaining = list(outcomes)
+
+    def func():
+        log.append(1)
+        outcome = remaining.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    return func, log
+
+
+@pytest.fixture
+def endpoint(monkeypatch):
+    monkeypatch.setattr(resilience.time, "sleep", lambda seconds: None)
+    return f"test:{next(endpoint_names)}"
+
+
+def test_retries_transient_failures_until_success(endpoint):
+    func, log = calls(TransientError(), "retry", "ok")
+    assert call_with_retry(endpoint, func, classify, max_attempts=4) == "ok"
+    assert len(log) == 3
+    assert resilience.get_breaker(endpoint).failures == 0
+
+
+def test_raises_the_last_error_after_max_attempts(endpoint):
+    func, log = calls(TransientError(), TransientError(), TransientError())
+    with pytest.raises(TransientError):
+        call_with_retry(endpoint, func, classify, max_attempts=3)
+    assert len(log) == 3
+
+
+def test_does_not_retry_permanent_errors(endpoint):
+    func, log = calls(PermanentError(), "ok")
+    with pytest.raises(PermanentError):
+        call_with_retry(endpoint, func, classify, max_attempts=3)
+    assert len(log) == 1
+
+
+def test_open_breaker_rejects_calls(endpoint):
+    breaker = resilience.get_breaker(endpoint)
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    func, log = calls("ok")
+    with pytest.raises(CircuitOpenError):
+        call_with_retry(endpoint, func, classify)
+    assert log == []
+
+
+def test_stops_retrying_once_the_breaker_opens(endpoint):
+    breaker = resilience.get_breaker(endpoint)
+    for _ in range(breaker.failure_threshold - 1):
+        breaker.record_failure()
+    func, log = calls(TransientError(), "ok")
+    with pytest.raises(TransientError):
+        call_with_retry(endpoint, func, classify, max_attempts=4)
+    assert len(log) == 1
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_rate_limit_timeout_does_not_touch_the_breaker(endpoint):
+    breaker = resilience.get_breaker(endpoint)
+    breaker.record_failure()
+
+    def on_attempt():
+        raise RateLimitTimeoutError("No rate limit capacity")
+
+    func, log = calls("ok")
+    with pytest.raises(RateLimitTimeoutError):
+        call_with_retry(endpoint, func, classify, on_attempt=on_attempt)
+    assert log == []
+    assert breaker.failures == 1
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_trial_is_kept_for_a_call_that_was_made(endpoint):
+    breaker = resilience.get_breaker(endpoint)
+    breaker.reset_seconds = 0
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+    def on_attempt():
+        raise RateLimitTimeoutError("No rate limit capacity")
+
+    with pytest.raises(RateLimitTimeoutError):
+        call_with_retry(endpoint, calls("ok")[0], classify, on_attempt=on_attempt)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert call_with_retry(endpoint, calls("ok")[0], classify) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_on_attempt_runs_before_each_attempt(endpoint):
+    attempts = []
+    func, log = calls(TransientError(), "ok")
+    call_with_retry(endpoint, func, classify, max_attempts=3, on_attempt=lambda: attempts.append(1))
+    assert len(attempts) == len(log) == 2
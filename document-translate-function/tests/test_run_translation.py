@@ -0,0 +1,51 @@
+"""
+Tests for the failure handling of run_translation in function_app.py.
+"""
+
+import httpx
+import pytest
+from openai import APIConnectionError
+import function_app
+from resilience import CircuitOpenError
+
+
+@pytest.fixture
+def statuses(monkeypatch):
+    """
+    Returns the translation statuses written to the file record, by file name.
+    """
+    written = {}
+
+    def update_file_record(file_name, *args):
+        written[file_name] = args[2]
+
+    monkeypatch.setattr(function_app.database_handler, "update_file_record", update_file_record)
+    monkeypatch.setattr(function_app, "STAGE_TIMINGS_ENABLED", False)
+    return written
+
+
+def fail_with(monkeypatch, error):
+    def process_document(_):
+        raise error
+
+    monkeypatch.setattr(function_app, "process_document", process_document)
+
+
+def test_open_circuit_breaker_fails_the_file(monkeypatch, statuses):
+    fail_with(monkeypatch, CircuitOpenError("Circuit breaker translator is open"))
+    assert function_app.run_translation("a.pdf") == "failed"
+    assert statuses == {"a.pdf": "failed"}
+
+
+def test_exhausted_openai_retries_fail_the_file(monkeypatch, statuses):
+    request = httpx.Request("POST", "https://openai.test")
+    fail_with(monkeypatch, APIConnectionError(request=request))
+    assert function_app.run_translation("b.pdf") == "failed"
+    assert statuses == {"b.pdf": "failed"}
+
+
+def test_unexpected_error_fails_the_file_and_is_raised(monkeypatch, statuses):
+    fail_with(monkeypatch, ZeroDivisionError("division by zero"))
+    with pytest.raises(ZeroDivisionError):
+        function_app.run_translation("c.pdf")
+    assert statuses == {"c.pdf": "failed"}
@@ -0,0 +1,125 @@
+"""
+Tests for the lanes of scheduler.py.
+"""
+
+import threading
+import pytest
+import scheduler
+from scheduler import (
+    BATCH_LANE,
+    INTERACTIVE_LANE,
+    get_lane_timeout,
+    get_sweep_schedule,
+    get_sweep_time_budget,
+    run_queued_jobs,
+)
+
+
+class FakeJobs:
+    """
+    The translation_jobs queue, claimed in order with the limits of claim_translation_job.
+    """
+
+    def __init__(self, jobs):
+        self.queued = list(jobs)
+        self.running = {}
+        self.finished = {}
+        self.lock = threading.Lock()
+
+    def claim_translation_job(self, lane, max_running, max_jobs_per_user, max_attempts):
+        with self.lock:
+            if len(self.running) >= max_running:
+                return None
+            for file_name, user in self.queued:
+                if list(self.running.values()).count(user) < max_jobs_per_user:
+                    self.queued.remove((file_name, user))
+                    self.running[file_name] = user
+                    return file_name
+            return None
+
+    def finish_translation_job(self, file_name, status):
+        with self.lock:
+            self.running.pop(file_name)
+            self.finished[file_name] = status
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    def queue(jobs, max_running=4, max_jobs_per_user=2):
+        fake = FakeJobs(jobs)
+        monkeypatch.setattr(scheduler, "database_handler", fake)
+        monkeypatch.setitem(scheduler.LANES[BATCH_LANE], "max_running", max_running)
+        monkeypatch.setattr(scheduler, "SCHEDULER_MAX_JOBS_PER_USER", max_jobs_per_user)
+        return fake
+
+    return queue
+
+
+def test_get_lane_timeout_falls_back_to_the_batch_lane(monkeypatch):
+    monkeypatch.setitem(scheduler.LANES[INTERACTIVE_LANE], "timeout_seconds", 300)
+    monkeypatch.setitem(scheduler.LANES[BATCH_LANE], "timeout_seconds", 0)
+    assert get_lane_timeout(INTERACTIVE_LANE) == 300
+    # A timeout of 0 derives the timeout from the document size.
+    assert get_lane_timeout(BATCH_LANE) is None
+    assert get_lane_timeout(None) is None
+
+
+@pytest.mark.parametrize(
+    "sweep_seconds, schedule",
+    [
+        (30, "*/30 * * * * *"),
+        (0, "*/1 * * * * *"),
+        (60, "0 */1 * * * *"),
+        (150, "0 */2 * * * *"),
+        (7200, "0 */60 * * * *"),
+    ],
+)
+def test_get_sweep_schedule(monkeypatch, sweep_seconds, schedule):
+    monkeypatch.setitem(scheduler.LANES[BATCH_LANE], "sweep_seconds", sweep_seconds)
+    assert get_sweep_schedule(BATCH_LANE) == schedule
+
+
+def test_get_sweep_time_budget_ends_before_the_next_sweep(monkeypatch):
+    monkeypatch.setattr(scheduler, "SCHEDULER_SWEEP_SECONDS", 240)
+    monkeypatch.setitem(scheduler.LANES[INTERACTIVE_LANE], "sweep_seconds", 30)
+    monkeypatch.setitem(scheduler.LANES[BATCH_LANE], "sweep_seconds", 600)
+    assert get_sweep_time_budget(INTERACTIVE_LANE) == 30
+    assert get_sweep_time_budget(BATCH_LANE) == 240
+
+
+def test_queued_jobs_of_two_users_run_concurrently(jobs):
+    queue = jobs([("a1", "alice"), ("b1", "bob"), ("a2", "alice"), ("b2", "bob")])
+    # Every job waits until all four run, so they fail unless they run at once.
+    all_running = threading.Barrier(4, timeout=5)
+
+    def process(_):
+        all_running.wait()
+        return "done"
+
+    assert run_queued_jobs(process, BATCH_LANE) == 4
+    assert queue.finished == {"a1": "done", "b1": "done", "a2": "done", "b2": "done"}
+
+
+def test_workers_claim_the_next_job_within_the_per_user_cap(jobs):
+    queue = jobs([(f"a{index}", "alice") for index in range(5)] + [("b1", "bob")])
+    peak = {"alice": 0}
+    lock = threading.Lock()
+
+    def process(file_name):
+        with lock:
+            running = list(queue.running.values()).count("alice")
+            peak["alice"] = max(peak["alice"], running)
+        if file_name == "a3":
+            raise RuntimeError("translation failed")
+        return "done"
+
+    assert run_queued_jobs(process, BATCH_LANE) == 6
+    assert peak["alice"] <= 2
+    assert queue.finished["a3"] == "failed"
+    assert not queue.queued
+
+
+def test_max_jobs_limits_the_claims(jobs):
+    queue = jobs([("a1", "alice"), ("b1", "bob"), ("a2", "alice")])
+    assert run_queued_jobs(lambda _: "done", BATCH_LANE, max_jobs=2) == 2
+    assert queue.queued == [("a2", "alice")]
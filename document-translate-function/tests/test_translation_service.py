@@ -0,0 +1,105 @@
+"""
+Tests for the batch status polling of translation_service.py.
+"""
+
+import time
+import pytest
+import translation_service
+from translation_service import TranslationResult, poll_translation_status
+
+
+class Clock:
+    """
+    A monotonic clock that only advances when slept on, recording the sleeps.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeResponse:
+    def __init__(self, status_code, job_status=None, retry_after=None):
+        self.status_code = status_code
+        self.headers = {} if retry_after is None else {"Retry-After": retry_after}
+        self.job_status = job_status
+        self.text = "" if job_status else "Not found"
+
+    def json(self):
+        return {"status": self.job_status, "summary": {"total": 1}}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(time, "monotonic", clock)
+    monkeypatch.setattr(time, "sleep", clock.sleep)
+    monkeypatch.setattr(translation_service, "POLL_MIN_DELAY_SECONDS", 2)
+    monkeypatch.setattr(translation_service, "POLL_MAX_DELAY_SECONDS", 30)
+    return clock
+
+
+@pytest.fixture
+def responses(monkeypatch):
+    """
+    Answers the status polls with the given responses, the last one repeatedly.
+    """
+    queue = []
+
+    def request(*_, **__):
+        return queue.pop(0) if len(queue) > 1 else queue[0]
+
+    monkeypatch.setattr(translation_service, "request", request)
+    return queue
+
+
+def test_retry_after_is_clamped_to_the_poll_delays(clock, responses):
+    responses.extend(
+        [
+            FakeResponse(200, "Running", retry_after="0"),
+            FakeResponse(200, "Running", retry_after="3600"),
+            FakeResponse(200, "Succeeded"),
+        ]
+    )
+    result = poll_translation_status("https://translator.test/jobs/1", "a.pdf", page_count=1)
+    assert result.status == TranslationResult.SUCCEEDED
+    assert result.polls == 3
+    assert clock.sleeps[1:] == [2, 30]
+
+
+def test_backoff_stays_within_the_poll_delays_until_the_timeout(clock, responses):
+    responses.append(FakeResponse(200, "Running"))
+    result = poll_translation_status("https://translator.test/jobs/2", "b.pdf", timeout=300)
+    assert result.status == TranslationResult.TIMED_OUT
+    assert result.job_status == "Running"
+    assert clock.now == pytest.approx(300)
+    # The last sleep is cut short by the timeout.
+    assert all(2 <= seconds <= 30 for seconds in clock.sleeps[:-1])
+    assert result.polls == len(clock.sleeps)
+
+
+def test_error_status_fails_the_job(clock, responses):
+    responses.append(FakeResponse(404))
+    result = poll_translation_status("https://translator.test/jobs/3", "c.pdf")
+    assert result.status == TranslationResult.FAILED
+    assert result.errors == [{"status_code": 404, "error": "Not found"}]
+
+
+def test_cancelled_job_is_cancelled_at_the_service(monkeypatch, clock, responses):
+    cancelled = []
+    monkeypatch.setattr(translation_service, "cancel_translation", cancelled.append)
+    responses.append(FakeResponse(200, "Running"))
+    polls = iter([False, True])
+    result = poll_translation_status(
+        "https://translator.test/jobs/4", "d.pdf", is_cancelled=lambda: next(polls)
+    )
+    assert result.status == TranslationResult.CANCELLED
+    assert result.polls == 1
+    assert cancelled == ["https://translator.test/jobs/4"]
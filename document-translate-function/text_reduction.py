@@ -0,0 +1,248 @@
+"""
+Module for reducing document text before it is sent to the GPT model.
+
+Extracted PDFs repeat running headers, footers, page numbers and legal
+disclaimers on every page. Since the glossary is built from individual lines,
+keeping the first occurrence of such text is enough for the extraction. This
+module removes running headers and footers repeated across pages and page
+numbers, collapses whitespace, and removes exact and near-duplicate
+paragraphs, reporting the estimated tokens saved. Short paragraphs, such as
+the lines of an address, are never removed as duplicates.
+"""
+
+import hashlib
+import logging
+import re
+
+# Number of lines at the top and bottom of a page searched for running headers and footers.
+HEADER_FOOTER_LINES = 3
+# Minimum share of the pages a line must appear on to count as a running header or footer.
+REPEATED_LINE_PAGE_FRACTION = 0.3
+# Paragraphs with fewer words are never removed as duplicates.
+DUPLICATE_MIN_WORDS = 5
+# Paragraphs with fewer words are only removed when they are exact duplicates,
+# so that addresses differing only in a house number are all kept.
+NEAR_DUPLICATE_MIN_WORDS = 20
+# Maximum number of differing simhash bits for two paragraphs to be near-duplicates.
+NEAR_DUPLICATE_MAX_DISTANCE = 3
+SIMHASH_BITS = 64
+SIMHASH_BANDS = 4
+
+DIGITS_PATTERN = re.compile(r"\d+")
+NON_WORD_PATTERN = re.compile(r"[^\w#]+", re.UNICODE)
+PAGE_NUMBER_PATTERN = re.compile(
+    r"^(page|pg|p|seite|strona|pagina|página)? ?# ?((of|von|z|de|sur|/) ?#)?$"
+)
+INLINE_WHITESPACE_PATTERN = re.compile(r"[ \t\u00a0]+")
+BLANK_LINES_PATTERN = re.compile(r"\n\s*\n")
+
+
+def estimate_tokens(text):
+    """
+    Estimates the number of GPT tokens in a text (about four characters per token).
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        int: The estimated token count.
+    """
+    return (len(text) + 3) // 4
+
+
+def line_key(line):
+    """
+    Returns the key under which repeated lines are detected.
+
+    Case, punctuation and whitespace are ignored.
+
+    Args:
+        line (str): The line.
+
+    Returns:
+        str: The key, empty for lines without any word characters.
+    """
+    return NON_WORD_PATTERN.sub(" ", line.casefold()).strip()
+
+
+def is_page_number(key):
+    """
+    Checks whether a line only holds a page number, such as "Page 3 of 10".
+
+    Args:
+        key (str): The key of the line, as returned by line_key.
+
+    Returns:
+        bool: True if the line is a page number.
+    """
+    return bool(PAGE_NUMBER_PATTERN.match(DIGITS_PATTERN.sub("#", key)))
+
+
+def get_edge_lines(lines):
+    """
+    Returns the indexes of the non-empty lines at the top and bottom of a page.
+
+    Args:
+        lines (list): The lines of the page.
+
+    Returns:
+        set: The indexes of the header and footer candidate lines.
+    """
+    non_empty = [index for index, line in enumerate(lines) if line.strip()]
+    return set(non_empty[:HEADER_FOOTER_LINES] + non_empty[-HEADER_FOOTER_LINES:])
+
+
+def remove_running_headers(pages):
+    """
+    Removes page numbers, and keeps only the first occurrence of header and
+    footer lines repeated across pages.
+
+    Args:
+        pages (list): The text of each page.
+
+    Returns:
+        list: The text of each page without page numbers and repeated headers and footers.
+    """
+    split_pages = [page.splitlines() for page in pages]
+    counts = {}
+    for lines in split_pages:
+        for key in {line_key(lines[index]) for index in get_edge_lines(lines)}:
+            if key:
+                counts[key] = counts.get(key, 0) + 1
+
+    threshold = max(2, REPEATED_LINE_PAGE_FRACTION * len(pages))
+    repeated = {key for key, count in counts.items() if count >= threshold}
+
+    seen = set()
+    reduced_pages = []
+    for lines in split_pages:
+        edge_lines = get_edge_lines(lines)
+        kept = []
+        for index, line in enumerate(lines):
+            key = line_key(line)
+            if key and is_page_number(key):
+                continue
+            if index in edge_lines and key in repeated:
+                if key in seen:
+                    continue
+                seen.add(key)
+            kept.append(line)
+        reduced_pages.append("\n".join(kept))
+    return reduced_pages
+
+
+def collapse_whitespace(text):
+    """
+    Collapses runs of spaces and tabs, trims lines and limits blank lines to one.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        str: The text with collapsed whitespace.
+    """
+    lines = [INLINE_WHITESPACE_PATTERN.sub(" ", line).strip() for line in text.splitlines()]
+    return BLANK_LINES_PATTERN.sub("\n\n", "\n".join(lines)).strip()
+
+
+def simhash(words):
+    """
+    Computes the simhash of a paragraph from its word 3-shingles.
+
+    Args:
+        words (list): The normalized words of the paragraph.
+
+    Returns:
+        int: The 64-bit simhash.
+    """
+    weights = [0] * SIMHASH_BITS
+    shingles = [" ".join(words[i:i + 3]) for i in range(max(len(words) - 2, 1))]
+    for shingle in shingles:
+        digest = hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit in range(SIMHASH_BITS) if weights[bit] > 0)
+
+
+def remove_duplicate_paragraphs(text):
+    """
+    Removes exact and near-duplicate paragraphs, keeping the first occurrence.
+
+    Each line is a paragraph: DOCX paragraphs are extracted as single lines, and
+    wrapped PDF paragraphs repeat line by line. Exact duplicates are detected on
+    the normalized line. Near-duplicates of long lines, such as a disclaimer
+    repeated with a different date, are detected with simhash over the words
+    with numbers masked; lines are bucketed by each band of their hash, so only
+    lines sharing a band are compared.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        str: The text without duplicate paragraphs.
+    """
+    band_bits = SIMHASH_BITS // SIMHASH_BANDS
+    band_mask = (1 << band_bits) - 1
+    seen_keys = set()
+    buckets = {}
+    kept = []
+    for paragraph in text.split("\n"):
+        key = line_key(paragraph)
+        words = DIGITS_PATTERN.sub("#", key).split()
+        if len(words) < DUPLICATE_MIN_WORDS:
+            kept.append(paragraph)
+            continue
+        if key in seen_keys:
+            continue
+        seen_keys.add(key)
+
+        if len(words) >= NEAR_DUPLICATE_MIN_WORDS:
+            fingerprint = simhash(words)
+            bands = [
+                (band, fingerprint >> (band * band_bits) & band_mask)
+                for band in range(SIMHASH_BANDS)
+            ]
+            if any(
+                bin(fingerprint ^ other).count("1") <= NEAR_DUPLICATE_MAX_DISTANCE
+                for band in bands
+                for other in buckets.get(band, ())
+            ):
+                continue
+            for band in bands:
+                buckets.setdefault(band, []).append(fingerprint)
+        kept.append(paragraph)
+    return "\n".join(kept)
+
+
+def reduce_text(text, pages=None):
+    """
+    Removes boilerplate from document text before it is sent to the GPT model.
+
+    Args:
+        text (str): The extracted text of the document.
+        pages (list): The text of each page, if the document has pages.
+
+    Returns:
+        tuple: The reduced text and a dictionary with the estimated tokens
+            before and after the reduction.
+    """
+    if pages:
+        text_without_headers = "\n\n".join(remove_running_headers(pages))
+    else:
+        text_without_headers = text
+    reduced = collapse_whitespace(remove_duplicate_paragraphs(text_without_headers))
+
+    stats = {
+        "tokens_before": estimate_tokens(text),
+        "tokens_after": estimate_tokens(reduced),
+    }
+    stats["tokens_saved"] = stats["tokens_before"] - stats["tokens_after"]
+    logging.info(
+        "Reduced prompt text from about %d to %d tokens (%d saved, %.0f%%).",
+        stats["tokens_before"],
+        stats["tokens_after"],
+        stats["tokens_saved"],
+        100 * stats["tokens_saved"] / max(stats["tokens_before"], 1),
+    )
+    return reduced, stats
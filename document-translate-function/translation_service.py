@@ -1,38 +1,165 @@
 """
 Module for handling translation services.
 
-This module provides functions to start a translation job and check the status
-of the translation job using the Azure Translator service.
+This module provides functions to start, check the status of and cancel a
+translation job using the Azure Translator service. Small documents can
+instead be translated with the synchronous single-document endpoint.
 """
 
 import logging
 import json
+import random
 import time
 import requests
-from environment_variables import ENDPOINT, SUBSCRIPTION_KEY
+from environment_variables import (
+    ENDPOINT,
+    POLL_MAX_DELAY_SECONDS,
+    POLL_MIN_DELAY_SECONDS,
+    SUBSCRIPTION_KEY,
+    SYNC_TRANSLATION_ENABLED,
+    SYNC_TRANSLATION_MAX_BYTES,
+    SYNC_TRANSLATION_MAX_PAGES,
+)
+from instrumentation import record, span, timed
+from metrics import counter
+from rate_limiter import RateLimitTimeoutError, acquire_translator
+from resilience import RETRYABLE_STATUS_CODES, get_session, parse_retry_after, request
 
-def start_translation(
-    source_url, target_url, glossary_url, source_language, target_language
+# Batch status polling
+FINAL_JOB_STATUSES = ("Succeeded", "Failed", "Cancelled", "ValidationFailed")
+POLL_BASE_SECONDS = 10
+POLL_SECONDS_PER_PAGE = 2
+POLL_SECONDS_PER_MB = 20
+POLL_TIMEOUT_FACTOR = 6
+POLL_MIN_TIMEOUT_SECONDS = 600
+
+TRANSLATOR_POLLS = counter("translator_polls_total", "Status polls of batch translation jobs.")
+TRANSLATOR_JOBS = counter(
+    "translator_jobs_total", "Batch translation jobs by outcome.", ("status",)
+)
+
+DOCUMENT_CONTENT_TYPES = {
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    ".pdf": "application/pdf",
+}
+
+
+def warm_up_translator():
+    """
+    Opens a connection of the shared HTTP session to the Azure Translator endpoint.
+    Any response opens the connection, so the status code is not checked.
+
+    Raises:
+        requests.RequestException: If the endpoint cannot be reached.
+    """
+    response = get_session().head(ENDPOINT, timeout=10)
+    logging.info("Azure Translator answered the warm-up with status %s", response.status_code)
+
+
+def is_sync_translation_eligible(file_name, size_bytes, page_count):
+    """
+    Checks whether a document is small enough for the synchronous endpoint.
+
+    Args:
+        file_name (str): The name of the file.
+        size_bytes (int): The size of the document in bytes.
+        page_count (int): The page count of the document, None if unknown.
+
+    Returns:
+        bool: True if the document should be translated synchronously.
+    """
+    if not SYNC_TRANSLATION_ENABLED:
+        return False
+    if not any(file_name.endswith(extension) for extension in DOCUMENT_CONTENT_TYPES):
+        return False
+    if size_bytes > SYNC_TRANSLATION_MAX_BYTES:
+        return False
+    return page_count is None or page_count <= SYNC_TRANSLATION_MAX_PAGES
+
+
+@timed()
+def translate_document_sync(
+    file_name, content, glossary_csv, source_language, target_language
 ):
+    """
+    Translates a single document with the synchronous document translation endpoint.
+
+    Args:
+        file_name (str): The name of the file.
+        content (bytes): The content of the document.
+        glossary_csv (str): The glossary as a CSV string.
+        source_language (str): The source language of the document.
+        target_language (str): The target language for the translation.
+
+    Returns:
+        bytes: The translated document if successful, None otherwise, including
+            when the rate limit had no capacity for the call.
+    """
+    logging.info("Starting synchronous translation of %s", file_name)
+    extension = file_name[file_name.rfind("."):]
+    url = f"{ENDPOINT}/translator/document:translate"
+    params = {"targetLanguage": target_language, "api-version": "2024-05-01"}
+    if source_language:
+        params["sourceLanguage"] = source_language
+
+    files = {"document": (file_name, content, DOCUMENT_CONTENT_TYPES[extension])}
+    if glossary_csv:
+        files["glossary"] = ("glossary.csv", glossary_csv.encode("utf-8"), "text/csv")
+
+    try:
+        # Translating the same document again has no side effects, so the call is retried
+        # like an idempotent request.
+        response = request(
+            "POST",
+            url,
+            endpoint="translator:document",
+            idempotent=True,
+            on_attempt=acquire_translator,
+            headers={"Ocp-Apim-Subscription-Key": SUBSCRIPTION_KEY},
+            params=params,
+            files=files,
+            timeout=120,
+        )
+    except (requests.RequestException, RateLimitTimeoutError) as e:
+        # The batch job is started instead, which waits for capacity again.
+        logging.error("Error calling synchronous translation: %s", e)
+        return None
+
+    logging.info("Response status code: %s", response.status_code)
+    if response.status_code == 200:
+        logging.info(
+            "Synchronous translation succeeded: %d bytes", len(response.content)
+        )
+        record(bytes=len(content) + len(response.content))
+        return response.content
+    logging.error(
+        "Error in synchronous translation: %s, %s", response.status_code, response.text
+    )
+    return None
+
+
+@timed()
+def start_translation(source_url, targets, glossary_url, source_language):
     """
     Starts the translation job.
 
+    All target languages are submitted in a single request, so the document and
+    glossary are shared by every target.
+
     Args:
         source_url (str): URL of the source document.
-        target_url (str): URL where the translated document will be stored.
+        targets (list): (target_language, target_url) pairs, one per target language.
         glossary_url (str): URL of the glossary file.
         source_language (str): The source language of the document.
-        target_language (str): The target language for the translation.
 
     Returns:
         str: Operation location URL if successful, None otherwise.
     """
     logging.info("Starting translation job")
     logging.info("Source URL: %s", source_url)
-    logging.info("Target URL: %s", target_url)
+    logging.info("Targets: %s", targets)
     logging.info("Glossary URL: %s", glossary_url)
     logging.info("Source language: %s", source_language)
-    logging.info("Target language: %s", target_language)
 
     url = f"{ENDPOINT}/translator/document/batches?api-version=2024-05-01"
     body = {
@@ -51,6 +178,7 @@ def start_translation(
                         "storageSource": "AzureBlob",
                         "glossaries": [{"glossaryUrl": glossary_url, "format": "csv"}],
                     }
+                    for target_language, target_url in targets
                 ],
                 "storageType": "File",
             }
@@ -59,8 +187,11 @@ def start_translation(
     }
 
     logging.info("Request body: %s", json.dumps(body, indent=2))
-    response = requests.post(
+    response = request(
+        "POST",
         url,
+        endpoint="translator:batches",
+        on_attempt=acquire_translator,
         headers={
             "Ocp-Apim-Subscription-Key": SUBSCRIPTION_KEY,
             "Content-Type": "application/json",
@@ -84,45 +215,315 @@ def start_translation(
     return None
 
 
+class TranslationResult:
+    """
+    The outcome of a batch translation job.
+
+    Attributes:
+        status (str): One of SUCCEEDED, FAILED, TIMED_OUT or CANCELLED.
+        job_status (str): The last batch status reported by the service.
+        summary (dict): The per-document summary of the batch.
+        errors (list): Errors of the batch and of the failed documents.
+        polls (int): The number of status requests made.
+    """
+
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    TIMED_OUT = "timed out"
+    CANCELLED = "cancelled"
+
+    def __init__(self, status, job_status=None, summary=None, errors=None, polls=0):
+        self.status = status
+        self.job_status = job_status
+        self.summary = summary or {}
+        self.errors = errors or []
+        self.polls = polls
+
+    @property
+    def succeeded(self):
+        """bool: True if every document of the batch was translated."""
+        return self.status == self.SUCCEEDED
+
+    def __repr__(self):
+        return (
+            f"TranslationResult(status={self.status!r}, job_status={self.job_status!r}, "
+            f"summary={self.summary!r}, errors={self.errors!r}, polls={self.polls})"
+        )
+
+
+def estimate_translation_seconds(size_bytes=None, page_count=None):
+    """
+    Estimates how long the service needs to translate a document.
+
+    Args:
+        size_bytes (int): The size of the document in bytes, None if unknown.
+        page_count (int): The page count of the document, None if unknown.
+
+    Returns:
+        float: The expected translation time in seconds.
+    """
+    expected = POLL_BASE_SECONDS
+    if page_count:
+        expected += page_count * POLL_SECONDS_PER_PAGE
+    elif size_bytes:
+        expected += size_bytes / (1024 * 1024) * POLL_SECONDS_PER_MB
+    return expected
+
+
+def fetch_document_errors(operation_location):
+    """
+    Fetches the errors of the failed documents of a batch translation job.
+
+    Args:
+        operation_location (str): URL of the translation job.
+
+    Returns:
+        list: One dictionary per failed document with its path, target language and error.
+    """
+    base_url, _, query = operation_location.partition("?")
+    documents_url = f"{base_url}/documents" + (f"?{query}" if query else "")
+    try:
+        response = request(
+            "GET",
+            documents_url,
+            endpoint="translator:status",
+            hedge=True,
+            on_attempt=acquire_translator,
+            headers={"Ocp-Apim-Subscription-Key": SUBSCRIPTION_KEY},
+            timeout=30,
+        )
+    except (requests.RequestException, RateLimitTimeoutError) as e:
+        logging.error("Error fetching document statuses: %s", e)
+        return []
+    if response.status_code != 200:
+        logging.error(
+            "Error fetching document statuses: %s, %s", response.status_code, response.text
+        )
+        return []
+
+    return [
+        {
+            "path": document.get("path") or document.get("sourcePath"),
+            "language": document.get("to"),
+            "status": document.get("status"),
+            "error": document.get("error"),
+        }
+        for document in response.json().get("value", [])
+        if document.get("status") != "Succeeded"
+    ]
+
+
+def cancel_translation(operation_location):
+    """
+    Cancels a translation job.
+
+    Documents that the service has not started translating are cancelled and
+    not charged; documents already being translated still complete.
+
+    Args:
+        operation_location (str): URL of the translation job.
+
+    Returns:
+        bool: True if the service accepted the cancellation.
+    """
+    logging.info("Cancelling translation job: %s", operation_location)
+    try:
+        response = request(
+            "DELETE",
+            operation_location,
+            endpoint="translator:batches",
+            on_attempt=acquire_translator,
+            headers={"Ocp-Apim-Subscription-Key": SUBSCRIPTION_KEY},
+            timeout=30,
+        )
+    except (requests.RequestException, RateLimitTimeoutError) as e:
+        logging.error("Error cancelling translation job: %s", e)
+        return False
+    if response.status_code == 200:
+        return True
+    logging.error(
+        "Error cancelling translation job: %s, %s", response.status_code, response.text
+    )
+    return False
+
+
 def check_translation_status(
-    operation_location, target_file_name, max_retries=20, delay=10
+    operation_location,
+    target_file_name,
+    size_bytes=None,
+    page_count=None,
+    timeout=None,
+    is_cancelled=None,
 ):
     """
-    Checks the status of the translation job and retrieves the translated document if successful.
+    Polls the translation job until it reaches a final status or the timeout expires.
+
+    The first poll is scheduled at half of the expected completion time, which is
+    estimated from the document size. Later polls use exponential backoff with
+    jitter, starting from that first delay, and a Retry-After header from the
+    service takes precedence. Delays are bounded by POLL_MIN_DELAY_SECONDS and
+    POLL_MAX_DELAY_SECONDS.
 
     Args:
         operation_location (str): URL to check the status of the translation job.
         target_file_name (str): Name of the target file.
-        max_retries (int): Maximum number of retries for checking status.
-        delay (int): Delay between retries in seconds.
+        size_bytes (int): The size of the document in bytes, None if unknown.
+        page_count (int): The page count of the document, None if unknown.
+        timeout (float): Maximum time to wait in seconds. Defaults to a multiple
+            of the expected completion time.
+        is_cancelled (function): Called without arguments before each poll. If
+            it returns True, the job is cancelled and polling stops.
 
     Returns:
-        str: Translated document content if successful, None otherwise.
+        TranslationResult: The outcome of the translation job.
+    """
+    with span("check_translation_status") as status_span:
+        translation_result = poll_translation_status(
+            operation_location,
+            target_file_name,
+            size_bytes=size_bytes,
+            page_count=page_count,
+            timeout=timeout,
+            is_cancelled=is_cancelled,
+        )
+        status_span.add(polls=translation_result.polls)
+    TRANSLATOR_JOBS.inc(labels=(translation_result.status,))
+    return translation_result
+
+
+def poll_translation_status(
+    operation_location,
+    target_file_name,
+    size_bytes=None,
+    page_count=None,
+    timeout=None,
+    is_cancelled=None,
+):
+    """
+    Polls the translation job until it reaches a final status or the timeout expires.
+
+    Args:
+        operation_location (str): URL to check the status of the translation job.
+        target_file_name (str): Name of the target file.
+        size_bytes (int): The size of the document in bytes, None if unknown.
+        page_count (int): The page count of the document, None if unknown.
+        timeout (float): Maximum time to wait in seconds.
+        is_cancelled (function): Called without arguments before each poll.
+
+    Returns:
+        TranslationResult: The outcome of the translation job.
     """
     logging.info("Checking translation status")
     logging.info("Operation location: %s", operation_location)
     logging.info("Target file name: %s", target_file_name)
 
-    retries = 0
-    while retries < max_retries:
-        time.sleep(delay)
-        retries += 1
-        logging.info("Polling translation status... Attempt %d/%d", retries, max_retries)
-        response = requests.get(
-            operation_location, headers={"Ocp-Apim-Subscription-Key": SUBSCRIPTION_KEY},
-            timeout=30
-        )
-        logging.info("Response status code: %s", response.status_code)
-        logging.info("Response text: %s", response.text)
+    expected = estimate_translation_seconds(size_bytes, page_count)
+    if timeout is None:
+        timeout = max(POLL_MIN_TIMEOUT_SECONDS, expected * POLL_TIMEOUT_FACTOR)
+    deadline = time.monotonic() + timeout
+    delay = min(max(expected / 2, POLL_MIN_DELAY_SECONDS), POLL_MAX_DELAY_SECONDS)
+    logging.info(
+        "Expected translation time %.1f s, first poll in %.1f s, timeout %.0f s",
+        expected,
+        delay,
+        timeout,
+    )
+
+    polls = 0
+    job_status = None
+    summary = {}
+    # The backoff continues from the estimate instead of restarting at the minimum.
+    backoff = delay
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            logging.error("Translation status check timed out after %d polls.", polls)
+            return TranslationResult(
+                TranslationResult.TIMED_OUT, job_status, summary, polls=polls
+            )
+        time.sleep(min(delay, remaining))
+
+        if is_cancelled and is_cancelled():
+            logging.info("Translation of %s was cancelled after %d polls.", target_file_name, polls)
+            cancel_translation(operation_location)
+            return TranslationResult(
+                TranslationResult.CANCELLED, job_status, summary, polls=polls
+            )
+
+        polls += 1
+        TRANSLATOR_POLLS.inc()
+        logging.info("Polling translation status... Attempt %d", polls)
+        try:
+            # The polling loop already retries, so each poll is a single hedged attempt.
+            response = request(
+                "GET",
+                operation_location,
+                endpoint="translator:status",
+                hedge=True,
+                max_attempts=1,
+                on_attempt=acquire_translator,
+                headers={"Ocp-Apim-Subscription-Key": SUBSCRIPTION_KEY},
+                timeout=30,
+            )
+        except (requests.RequestException, RateLimitTimeoutError) as e:
+            logging.warning("Error polling translation status: %s", e)
+            response = None
 
-        if response.status_code == 200:
+        if response is not None and response.status_code == 200:
             status = response.json()
-            logging.info("Translation status response: %s", json.dumps(status, indent=2))
-            return json.dumps(status, indent=2)
-        logging.error(
-            "Error checking translation status: %s, %s", response.status_code, response.text
-        )
-        return None
+            job_status = status.get("status")
+            summary = status.get("summary") or {}
+            logging.info("Translation status: %s, summary: %s", job_status, summary)
 
-    logging.error("Max retries reached. Translation status check failed.")
-    return None
+            if job_status in FINAL_JOB_STATUSES:
+                return build_translation_result(
+                    operation_location, status, job_status, summary, polls
+                )
+        elif response is not None and response.status_code not in RETRYABLE_STATUS_CODES:
+            logging.error(
+                "Error checking translation status: %s, %s", response.status_code, response.text
+            )
+            return TranslationResult(
+                TranslationResult.FAILED,
+                job_status,
+                summary,
+                errors=[{"status_code": response.status_code, "error": response.text}],
+                polls=polls,
+            )
+
+        retry_after = parse_retry_after(response) if response is not None else None
+        if retry_after is not None:
+            delay = retry_after
+        else:
+            delay = random.uniform(backoff / 2, backoff)
+            backoff = min(backoff * 2, POLL_MAX_DELAY_SECONDS)
+        # A Retry-After of 0 would poll in a tight loop, and a large one would
+        # sleep past the next useful poll.
+        delay = min(max(delay, POLL_MIN_DELAY_SECONDS), POLL_MAX_DELAY_SECONDS)
+
+
+def build_translation_result(operation_location, status, job_status, summary, polls):
+    """
+    Builds the result of a translation job that reached a final status.
+
+    Args:
+        operation_location (str): URL of the translation job.
+        status (dict): The status response of the translation job.
+        job_status (str): The final batch status.
+        summary (dict): The per-document summary of the batch.
+        polls (int): The number of status requests made.
+
+    Returns:
+        TranslationResult: The outcome of the translation job.
+    """
+    failed_documents = summary.get("failed", 0) + summary.get("cancelled", 0)
+    if job_status == "Succeeded" and not failed_documents:
+        logging.info("Translation job succeeded: %s", summary)
+        return TranslationResult(TranslationResult.SUCCEEDED, job_status, summary, polls=polls)
+
+    errors = []
+    if status.get("error"):
+        errors.append(status["error"])
+    errors.extend(fetch_document_errors(operation_location))
+    logging.error("Translation job %s: %s", job_status, json.dumps(errors, indent=2))
+    return TranslationResult(TranslationResult.FAILED, job_status, summary, errors, polls)
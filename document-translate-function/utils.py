@@ -2,32 +2,51 @@
 Module for reading documents from URLs.
 
 This module provides functions to read DOCX and PDF files from given URLs and extract their text content.
+
+python-docx and PyMuPDF are imported on first use, so that they are not loaded
+when the function app starts.
 """
 
 import logging
 import io
+import re
+import zipfile
 from io import BytesIO
-import requests
-from docx import Document
-import fitz  # PyMuPDF
+from instrumentation import record
+from resilience import request
 
 
-def read_docx_from_url(docx_url):
+def download_document(url):
     """
-    Reads a DOCX file from the provided URL and extracts its text content.
+    Downloads a document from the provided URL.
 
     Args:
-        docx_url (str): The URL of the DOCX file to read.
+        url (str): The URL of the document to download.
 
     Returns:
-        str: The extracted text content from the DOCX file.
+        bytes: The content of the document.
     """
-    logging.info("Attempting to fetch DOCX from URL: %s", docx_url)
-    response = requests.get(docx_url, timeout=30)
+    logging.info("Attempting to fetch document from URL: %s", url)
+    response = request("GET", url, endpoint="blob", timeout=30)
     response.raise_for_status()  # Ensure the request succeeded
-    logging.info("DOCX file fetched successfully.")
+    logging.info("Document fetched successfully.")
+    record(bytes=len(response.content))
+    return response.content
+
+
+def read_docx_from_bytes(content):
+    """
+    Extracts the text content of a DOCX file.
+
+    Args:
+        content (bytes): The content of the DOCX file.
+
+    Returns:
+        str: The extracted text content from the DOCX file.
+    """
+    from docx import Document
 
-    doc = Document(BytesIO(response.content))
+    doc = Document(BytesIO(content))
     full_text = []
 
     try:
@@ -47,6 +66,73 @@ def read_docx_from_url(docx_url):
         raise
 
 
+def read_pdf_pages_from_bytes(content):
+    """
+    Extracts the text content of each page of a PDF file.
+
+    Args:
+        content (bytes): The content of the PDF file.
+
+    Returns:
+        list: The extracted text of each page.
+    """
+    import fitz  # PyMuPDF
+
+    with fitz.open(stream=io.BytesIO(content), filetype="pdf") as doc:
+        pages = [page.get_text() for page in doc]
+    logging.info("Text extracted from %d PDF pages successfully.", len(pages))
+    return pages
+
+
+def warm_up_readers():
+    """
+    Loads python-docx and PyMuPDF and reads an empty document of each format.
+    """
+    import fitz  # PyMuPDF
+    from docx import Document
+
+    with fitz.open() as doc:
+        doc.new_page()
+        pdf_content = doc.tobytes()
+    read_pdf_pages_from_bytes(pdf_content)
+
+    docx_stream = BytesIO()
+    Document().save(docx_stream)
+    read_docx_from_bytes(docx_stream.getvalue())
+
+
+def get_docx_page_count(content):
+    """
+    Reads the page count that Word stores in the DOCX extended properties.
+
+    Args:
+        content (bytes): The content of the DOCX file.
+
+    Returns:
+        int: The page count, or None if the document does not record it.
+    """
+    try:
+        with zipfile.ZipFile(BytesIO(content)) as archive:
+            app_properties = archive.read("docProps/app.xml").decode("utf-8")
+    except (KeyError, zipfile.BadZipFile):
+        return None
+    match = re.search(r"<(?:\w+:)?Pages>(\d+)</(?:\w+:)?Pages>", app_properties)
+    return int(match.group(1)) if match else None
+
+
+def read_docx_from_url(docx_url):
+    """
+    Reads a DOCX file from the provided URL and extracts its text content.
+
+    Args:
+        docx_url (str): The URL of the DOCX file to read.
+
+    Returns:
+        str: The extracted text content from the DOCX file.
+    """
+    return read_docx_from_bytes(download_document(docx_url))
+
+
 def read_pdf_from_url(pdf_url):
     """
     Reads a PDF file from the provided URL and extracts its text content.
@@ -57,12 +143,4 @@ def read_pdf_from_url(pdf_url):
     Returns:
         str: The extracted text content from the PDF file.
     """
-    logging.info("Attempting to fetch PDF from URL: %s", pdf_url)
-    response = requests.get(pdf_url, timeout=30)
-    response.raise_for_status()  # Ensure the request succeeded
-    logging.info("PDF file fetched successfully.")
-
-    doc = fitz.open(stream=io.BytesIO(response.content), filetype="pdf")
-    text = "".join(page.get_text() for page in doc)
-    logging.info("Text extracted from PDF file successfully.")
-    return text
+    return "".join(read_pdf_pages_from_bytes(download_document(pdf_url)))
@@ -2,15 +2,19 @@
 Database handler module for interacting with PostgreSQL for file translation logs.
 
 This module provides functionality to connect to a PostgreSQL database,
-insert file upload records, check for existing file names, and fetch logs
-based on date or fetch all logs.
+insert file upload records, check for existing file names, cancel translations,
+and fetch logs based on date or fetch all logs.
 """
 
 import logging
 import os
+import time
 from datetime import datetime
 import psycopg2
 from psycopg2 import sql, DatabaseError, IntegrityError
+from psycopg2.extensions import connection
+from connection_pool import ConnectionPool
+from metrics import counter, gauge, histogram
 
 
 # PostgreSQL connection details
@@ -20,6 +24,7 @@ DB_NAME = os.getenv("DB_NAME")
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_SSLMODE = os.getenv("DB_SSLMODE", "require")
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "10"))
 
 # Log environment variables to check if they exist
 logging.debug("DB_HOST: %s", DB_HOST)
@@ -28,6 +33,61 @@ logging.debug("DB_NAME: %s", DB_NAME)
 logging.debug("DB_USER: %s", DB_USER)
 logging.debug("DB_PASSWORD: %s", '****' if DB_PASSWORD else None)
 logging.debug("DB_SSLMODE: %s", DB_SSLMODE)
+logging.debug("DB_CONNECT_TIMEOUT: %s", DB_CONNECT_TIMEOUT)
+
+DB_CONNECTIONS_IN_USE = gauge("db_connections_in_use", "Open database connections.")
+DB_CONNECTIONS_OPENED = counter("db_connections_opened_total", "Database connections opened.")
+DB_CONNECT_SECONDS = histogram(
+    "db_connect_seconds",
+    "Time to open a database connection.",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+
+class TrackedConnection(connection):
+    """
+    A database connection counted in the db_connections_in_use gauge until it is closed.
+
+    Closing it returns it to the pool of the instance, if the pool has room (see
+    connection_pool.py).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        DB_CONNECTIONS_IN_USE.inc()
+
+    def close(self):
+        if not CONNECTION_POOL.release(self):
+            self.disconnect()
+
+    def disconnect(self):
+        """
+        Closes the connection instead of returning it to the pool.
+        """
+        if not self.closed:
+            DB_CONNECTIONS_IN_USE.dec()
+        super().close()
+
+
+CONNECTION_POOL = ConnectionPool()
+
+
+def is_processing_finished(translation_status, watermark_status):
+    """
+    Check whether the processing of an upload or of one of its target languages has finished.
+
+    Args:
+        translation_status (str): The translation status.
+        watermark_status (str): The watermark status.
+
+    Returns:
+        bool: True if the translation failed or was cancelled, or the watermark is final.
+    """
+    return translation_status in ("failed", "cancelled") or watermark_status in (
+        "done",
+        "failed",
+        "cancelled",
+    )
 
 
 class DatabaseHandler:
@@ -38,6 +98,7 @@ class DatabaseHandler:
     def get_connection(self):
         """
         Establish a connection to the PostgreSQL database using the provided connection details.
+        An idle connection of the pool is reused if there is one.
 
         Returns:
             psycopg2.connection: A connection object to interact with the PostgreSQL database.
@@ -46,19 +107,44 @@ class DatabaseHandler:
             psycopg2.OperationalError: If there is an error connecting to the database.
         """
         logging.info("Database password retrieved: %s", DB_PASSWORD is not None)
+        conn = CONNECTION_POOL.acquire()
+        if conn is not None:
+            return conn
+        started = time.perf_counter()
         try:
-            return psycopg2.connect(
+            conn = psycopg2.connect(
                 host=DB_HOST,
                 port=DB_PORT,
                 dbname=DB_NAME,
                 user=DB_USER,
                 password=DB_PASSWORD,
                 sslmode=DB_SSLMODE,
+                connect_timeout=DB_CONNECT_TIMEOUT,
+                connection_factory=TrackedConnection,
             )
+            DB_CONNECT_SECONDS.observe(time.perf_counter() - started)
+            DB_CONNECTIONS_OPENED.inc()
+            return conn
         except psycopg2.OperationalError as e:
             logging.error("Error connecting to the database: %s", str(e))
             raise
 
+    def ping(self):
+        """
+        Opens a connection and runs a trivial query, leaving the connection in
+        the pool for the next query. Used to warm up the instance.
+
+        Raises:
+            psycopg2.Error: If the database cannot be reached.
+        """
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.commit()
+        finally:
+            conn.close()
+
     def insert_file_record(
         self,
         file_name,
@@ -69,9 +155,12 @@ class DatabaseHandler:
         upload_status,
         uploaded_by,
         from_lang,
-        to_lang,
+        to_langs,
         exclusion_text,
-        prompt_id
+        prompt_id,
+        file_size_bytes=None,
+        page_count=None,
+        lane=None,
     ):
         """
         Insert a record of the uploaded file into the PostgreSQL database.
@@ -85,8 +174,13 @@ class DatabaseHandler:
             upload_status (str): The status of the upload ('failed', 'in progress', 'done').
             uploaded_by (str): The identifier of the person who uploaded the file.
             from_lang (str): The source language of the file.
-            to_lang (str): The target language of the file.
+            to_langs (list): The target languages of the file. One file_translation_targets
+                row is stored per language; toLanguage holds the first one.
             exclusion_text (str): The text to exclude from translation.
+            prompt_id (int): The identifier of the prompt used for glossary extraction.
+            file_size_bytes (int, optional): The size of the file in bytes.
+            page_count (int, optional): The page count of the file.
+            lane (str, optional): The translation lane ('interactive' or 'batch').
 
         Raises:
             IntegrityError: If there is an integrity constraint violation.
@@ -101,8 +195,9 @@ class DatabaseHandler:
                     """
                     INSERT INTO file_translation_logs (
                         file_name, landing_zone_path, file_type, upload_date, upload_datetime, 
-                        upload_status, uploaded_by, fromLanguage, toLanguage, exclusion_text, prompt_id
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                        upload_status, uploaded_by, fromLanguage, toLanguage, exclusion_text, prompt_id,
+                        file_size_bytes, page_count, lane
+                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                 """
                 )
                 cursor.execute(
@@ -116,11 +211,25 @@ class DatabaseHandler:
                         upload_status,
                         uploaded_by,
                         from_lang,
-                        to_lang,
+                        to_langs[0],
                         exclusion_text,
-                        prompt_id
+                        prompt_id,
+                        file_size_bytes,
+                        page_count,
+                        lane,
                     ),
                 )
+                target_query = sql.SQL(
+                    """
+                    INSERT INTO file_translation_targets (
+                        file_name, toLanguage, target_order, translation_status
+                    ) VALUES (%s, %s, %s, %s)
+                """
+                )
+                for target_order, to_lang in enumerate(to_langs):
+                    cursor.execute(
+                        target_query, (file_name, to_lang, target_order, "in progress")
+                    )
                 conn.commit()
         except IntegrityError as e:
             logging.error("Integrity error: %s", str(e))
@@ -138,6 +247,151 @@ class DatabaseHandler:
             if conn:
                 conn.close()
 
+    def update_upload_status(self, file_name, upload_status):
+        """
+        Update the upload status of a file.
+
+        Args:
+            file_name (str): The name of the file.
+            upload_status (str): The status of the upload ('failed', 'in progress', 'done').
+
+        Raises:
+            DatabaseError: If there is a general database error.
+        """
+        conn = None
+        try:
+            conn = self.get_connection()
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "UPDATE file_translation_logs SET upload_status = %s WHERE file_name = %s",
+                    (upload_status, file_name),
+                )
+                conn.commit()
+        except DatabaseError as e:
+            logging.error("Database error: %s", str(e))
+            if conn:
+                conn.rollback()
+            raise
+        finally:
+            if conn:
+                conn.close()
+
+    def cancel_translation(self, file_name):
+        """
+        Mark the translation of a file as cancelled.
+
+        The translation and watermark statuses that are not final yet are set to
+        'cancelled', and a queued translation job is taken off the queue. A running
+        job is left to the translate function, which checks for the cancellation
+        between its steps and stops.
+
+        The processing has finished when the translation failed or was cancelled
+        or the watermark is final, for the upload or for each of its target languages.
+
+        Args:
+            file_name (str): The name of the file.
+
+        Returns:
+            dict: The keys cancelled (False if the processing had already finished),
+                translation_status, watermark_status and operation_location (the
+                URL of the Translator batch job, None if none was started), or None
+                if there is no such file.
+
+        Raises:
+            DatabaseError: If there is a general database error.
+        """
+        conn = None
+        try:
+            conn = self.get_connection()
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    SELECT translation_status, watermark_status, translation_operation_location,
+                        cancelled_at IS NOT NULL
+                    FROM file_translation_logs
+                    WHERE file_name = %s
+                    FOR UPDATE
+                    """,
+                    (file_name,),
+                )
+                row = cursor.fetchone()
+                if row is None:
+                    conn.commit()
+                    return None
+
+                translation_status, watermark_status, operation_location, cancelled = row
+                # With several target languages, the watermark statuses are only
+                # recorded per target, so the upload has finished once each target has.
+                cursor.execute(
+                    """
+                    SELECT translation_status, watermark_status
+                    FROM file_translation_targets
+                    WHERE file_name = %s
+                    """,
+                    (file_name,),
+                )
+                targets = cursor.fetchall()
+                finished = is_processing_finished(translation_status, watermark_status) or (
+                    bool(targets) and all(is_processing_finished(*target) for target in targets)
+                )
+                if cancelled or finished:
+                    conn.commit()
+                    return {
+                        "cancelled": cancelled,
+                        "translation_status": translation_status,
+                        "watermark_status": watermark_status,
+                        "operation_location": operation_location,
+                    }
+
+                cursor.execute(
+                    """
+                    UPDATE file_translation_logs
+                    SET translation_status = CASE WHEN translation_status = 'done'
+                            THEN translation_status ELSE 'cancelled' END,
+                        watermark_status = 'cancelled',
+                        cancelled_at = %s
+                    WHERE file_name = %s
+                    RETURNING translation_status, watermark_status
+                    """,
+                    (datetime.now(), file_name),
+                )
+                translation_status, watermark_status = cursor.fetchone()
+                cursor.execute(
+                    """
+                    UPDATE file_translation_targets
+                    SET translation_status = CASE WHEN translation_status = 'done'
+                            THEN translation_status ELSE 'cancelled' END,
+                        watermark_status = CASE WHEN watermark_status IN ('done', 'failed')
+                            THEN watermark_status ELSE 'cancelled' END
+                    WHERE file_name = %s
+                    """,
+                    (file_name,),
+                )
+                cursor.execute(
+                    """
+                    UPDATE translation_jobs
+                    SET status = 'cancelled', finished_at = clock_timestamp()
+                    WHERE file_name = %s AND status = 'queued'
+                    """,
+                    (file_name,),
+                )
+                conn.commit()
+                logging.info("Cancelled the translation of %s", file_name)
+                return {
+                    "cancelled": True,
+                    "translation_status": translation_status,
+                    "watermark_status": watermark_status,
+                    "operation_location": operation_location,
+                }
+        except DatabaseError as e:
+            logging.error("Database error: %s", str(e))
+            if conn:
+                conn.rollback()
+            raise
+        finally:
+            if conn:
+                conn.close()
+
     def check_file_name(self, file_name):
         """
         Check if a file with the same name already exists in the database.
@@ -239,6 +493,7 @@ class DatabaseHandler:
                             "exclusion_text": row[21],
                         }
                     )
+                self.attach_translation_targets(cursor, logs)
         except DatabaseError as e:
             logging.error("Database error: %s", str(e))
             raise
@@ -306,6 +561,7 @@ class DatabaseHandler:
                             "exclusion_text": row[21],
                         }
                     )
+                self.attach_translation_targets(cursor, logs)
         except DatabaseError as e:
             logging.error("Database error: %s", str(e))
             raise
@@ -318,6 +574,42 @@ class DatabaseHandler:
         return logs
 
 
+    def attach_translation_targets(self, cursor, logs):
+        """
+        Add the per-language translation targets to each log entry.
+
+        Args:
+            cursor (psycopg2.cursor): The cursor used to fetch the logs.
+            logs (list): The log entries; each one gets a "targets" list.
+        """
+        logs_by_file_name = {log["file_name"]: log for log in logs}
+        for log in logs:
+            log["targets"] = []
+        if not logs_by_file_name:
+            return
+
+        cursor.execute(
+            """
+            SELECT file_name, toLanguage, translated_file_name, translation_status,
+                translated_zone_path, watermark_status, watermark_zone_path
+            FROM file_translation_targets
+            WHERE file_name = ANY(%s)
+            ORDER BY file_name, target_order
+            """,
+            (list(logs_by_file_name),),
+        )
+        for row in cursor.fetchall():
+            logs_by_file_name[row[0]]["targets"].append(
+                {
+                    "toLanguage": row[1],
+                    "translated_file_name": row[2],
+                    "translation_status": row[3],
+                    "translated_zone_path": row[4],
+                    "watermark_status": row[5],
+                    "watermark_zone_path": row[6],
+                }
+            )
+
     def fetch_all_prompts(self):
         """
         Fetch all prompts from the prompt_logs table.
@@ -361,3 +653,226 @@ class DatabaseHandler:
             if conn:
                 conn.close()
         return logs
+
+    def fetch_queue_stats(self):
+        """
+        Fetch the translation queue depth and wait times of each user and lane.
+
+        Returns:
+            list: One dictionary per user and lane with the number of queued and running
+                jobs, the wait of the oldest queued job, the average wait of the
+                jobs started in the last hour (in seconds), and the scheduling weight.
+
+        Raises:
+            DatabaseError: If there is a general database error.
+            Exception: If there is an unexpected error.
+        """
+        conn = None
+        stats = []
+        try:
+            conn = self.get_connection()
+            with conn.cursor() as cursor:
+                query = sql.SQL(
+                    """
+                    SELECT j.uploaded_by, j.lane,
+                        COUNT(*) FILTER (WHERE j.status = 'queued'),
+                        COUNT(*) FILTER (WHERE j.status = 'running'),
+                        EXTRACT(EPOCH FROM clock_timestamp() - MIN(j.queued_at)
+                            FILTER (WHERE j.status = 'queued'))::float8,
+                        EXTRACT(EPOCH FROM AVG(j.started_at - j.queued_at)
+                            FILTER (WHERE j.started_at > clock_timestamp() - INTERVAL '1 hour'))::float8,
+                        COALESCE(MAX(s.weight), 1)
+                    FROM translation_jobs j
+                    LEFT JOIN translation_user_shares s ON s.uploaded_by = j.uploaded_by
+                    WHERE j.status IN ('queued', 'running')
+                        OR j.started_at > clock_timestamp() - INTERVAL '1 hour'
+                    GROUP BY j.uploaded_by, j.lane
+                    ORDER BY 3 DESC, j.uploaded_by, j.lane
+                    """
+                )
+                cursor.execute(query)
+                for row in cursor.fetchall():
+                    stats.append(
+                        {
+                            "uploaded_by": row[0],
+                            "lane": row[1],
+                            "queued": row[2],
+                            "running": row[3],
+                            "oldest_wait_seconds": row[4],
+                            "average_wait_seconds_last_hour": row[5],
+                            "weight": row[6],
+                        }
+                    )
+        except DatabaseError as e:
+            logging.error("Database error: %s", str(e))
+            raise
+        except Exception as e:
+            logging.error("Unexpected error: %s", str(e))
+            raise
+        finally:
+            if conn:
+                conn.close()
+        return stats
+
+    def fetch_stage_latency(self, hours):
+        """
+        Fetch the latency percentiles of each translation pipeline stage.
+
+        Args:
+            hours (float): The time window, in hours up to now.
+
+        Returns:
+            list: One dictionary per stage with the number of runs, the p50, p95
+                and p99 wall time in milliseconds, and the total bytes, prompt
+                tokens and completion tokens.
+
+        Raises:
+            DatabaseError: If there is a general database error.
+            Exception: If there is an unexpected error.
+        """
+        conn = None
+        stats = []
+        try:
+            conn = self.get_connection()
+            with conn.cursor() as cursor:
+                query = sql.SQL(
+                    """
+                    SELECT stage,
+                        COUNT(*),
+                        percentile_cont(ARRAY[0.5, 0.95, 0.99]) WITHIN GROUP (ORDER BY duration_ms),
+                        SUM(bytes)::BIGINT,
+                        SUM(prompt_tokens),
+                        SUM(completion_tokens)
+                    FROM pipeline_stage_timings
+                    WHERE started_at > clock_timestamp() - make_interval(secs => %s)
+                    GROUP BY stage
+                    ORDER BY 3 DESC
+                    """
+                )
+                cursor.execute(query, (hours * 3600,))
+                for row in cursor.fetchall():
+                    stats.append(
+                        {
+                            "stage": row[0],
+                            "count": row[1],
+                            "p50_ms": row[2][0],
+                            "p95_ms": row[2][1],
+                            "p99_ms": row[2][2],
+                            "bytes": row[3],
+                            "prompt_tokens": row[4],
+                            "completion_tokens": row[5],
+                        }
+                    )
+        except DatabaseError as e:
+            logging.error("Database error: %s", str(e))
+            raise
+        except Exception as e:
+            logging.error("Unexpected error: %s", str(e))
+            raise
+        finally:
+            if conn:
+                conn.close()
+        return stats
+
+    def fetch_openai_usage_report(self, hours, group_by="prompt"):
+        """
+        Fetch the token usage and latency of the glossary extraction calls,
+        aggregated per prompt or per user.
+
+        Args:
+            hours (float): The time window, in hours up to now.
+            group_by (str): 'prompt' to aggregate per prompt_logs id, 'user' to
+                aggregate per uploaded_by.
+
+        Returns:
+            list: One dictionary per prompt or user with the number of calls and
+                documents, the prompt, completion and total tokens, the pages, the
+                tokens per page, the average and p95 latency in milliseconds, the
+                milliseconds per completion token, and the average milliseconds
+                spent waiting for rate limit capacity and between retries, which
+                the latency does not include.
+
+        Raises:
+            ValueError: If group_by is not 'prompt' or 'user'.
+            DatabaseError: If there is a general database error.
+            Exception: If there is an unexpected error.
+        """
+        if group_by == "prompt":
+            key = sql.SQL("u.prompt_id AS group_key, p.prompt_name AS group_name")
+        elif group_by == "user":
+            key = sql.SQL("u.uploaded_by AS group_key, NULL AS group_name")
+        else:
+            raise ValueError(f"Invalid group_by: {group_by}")
+
+        conn = None
+        report = []
+        try:
+            conn = self.get_connection()
+            with conn.cursor() as cursor:
+                # Pages are counted once per document, even if it was sent in several calls.
+                query = sql.SQL(
+                    """
+                    WITH calls AS (
+                        SELECT {key}, u.file_name, u.page_count, u.prompt_tokens,
+                            u.completion_tokens, u.total_tokens, u.latency_ms, u.wait_ms
+                        FROM openai_usage_logs u
+                        LEFT JOIN prompt_logs p ON p.id = u.prompt_id
+                        WHERE u.created_at > clock_timestamp() - make_interval(secs => %s)
+                    ),
+                    pages AS (
+                        SELECT group_key, SUM(page_count) AS page_count
+                        FROM (
+                            SELECT group_key, file_name, MAX(page_count) AS page_count
+                            FROM calls
+                            GROUP BY group_key, file_name
+                        ) documents
+                        GROUP BY group_key
+                    )
+                    SELECT c.group_key,
+                        c.group_name,
+                        COUNT(*),
+                        COUNT(DISTINCT c.file_name),
+                        SUM(c.prompt_tokens),
+                        SUM(c.completion_tokens),
+                        SUM(c.total_tokens),
+                        MAX(pages.page_count),
+                        AVG(c.latency_ms),
+                        percentile_cont(0.95) WITHIN GROUP (ORDER BY c.latency_ms),
+                        SUM(c.latency_ms) / NULLIF(SUM(c.completion_tokens), 0),
+                        AVG(c.wait_ms)
+                    FROM calls c
+                    LEFT JOIN pages ON pages.group_key IS NOT DISTINCT FROM c.group_key
+                    GROUP BY c.group_key, c.group_name
+                    ORDER BY 7 DESC
+                    """
+                ).format(key=key)
+                cursor.execute(query, (hours * 3600,))
+                for row in cursor.fetchall():
+                    total_tokens, pages = row[6], row[7]
+                    report.append(
+                        {
+                            group_by: row[0],
+                            "prompt_name": row[1],
+                            "calls": row[2],
+                            "documents": row[3],
+                            "prompt_tokens": row[4],
+                            "completion_tokens": row[5],
+                            "total_tokens": total_tokens,
+                            "pages": pages,
+                            "tokens_per_page": total_tokens / pages if pages else None,
+                            "avg_latency_ms": row[8],
+                            "p95_latency_ms": row[9],
+                            "ms_per_completion_token": row[10],
+                            "avg_wait_ms": row[11],
+                        }
+                    )
+        except DatabaseError as e:
+            logging.error("Database error: %s", str(e))
+            raise
+        except Exception as e:
+            logging.error("Unexpected error: %s", str(e))
+            raise
+        finally:
+            if conn:
+                conn.close()
+        return report
@@ -5,24 +5,39 @@ Functions:
 - upload_file: 
     -> Handles file upload requests.
     -> Saves files temporarily.
-    -> Uploads them to Azure Blob Storage
+    -> Classifies them into the interactive or the batch translation lane.
     -> Logs upload details in a PostgreSQL database.
+    -> Uploads them to Azure Blob Storage
 - get_logs_by_date: Fetches logs from the PostgreSQL database based on a provided date.
 - get_all_logs: Retrieves all logs from the PostgreSQL database.
+- cancel_translation: Cancels the translation of an upload, including its Translator job.
+- get_stage_latency: Returns the latency percentiles of each translation pipeline stage.
+- get_openai_usage_report: Returns the OpenAI token usage and latency of each prompt or user.
+- get_queue_stats: Returns the translation queue depth and wait times of each user and lane.
+- get_metrics: Returns the metrics of the instance in the Prometheus text format.
+- warmup, get_health: Warm up a new instance and report whether it is ready (see warmup.py).
+
+The memory used by each upload can be logged with MEMORY_TRACKING_ENABLED (see memory_tracking.py).
 """
 
 import logging
 import json
 import azure.functions as func
 from database_handler import DatabaseHandler, DatabaseError, IntegrityError
+from memory_tracking import MemoryTracker
+from metrics import CONTENT_TYPE, counter, histogram, render
+from warmup import register_warmup_step, request_warm_up, warm_up
 from utils import (
     extract_request_data, 
     get_azure_storage_info, 
     save_file_temporarily, 
+    classify_document,
     upload_to_blob_storage, 
     generate_blob_url, 
     log_file_upload,
-    clean_up_temporary_file
+    clean_up_temporary_file,
+    cancel_translator_operation,
+    warm_up_blob_storage
     )
 
 
@@ -35,6 +50,15 @@ logging.basicConfig(
 
 app = func.FunctionApp(http_auth_level=func.AuthLevel.ANONYMOUS)
 
+UPLOADS = counter("uploads_total", "Upload requests, by outcome.", ("status",))
+UPLOAD_BYTES = histogram(
+    "upload_bytes",
+    "Size of the uploaded documents, by translation lane.",
+    ("lane",),
+    buckets=tuple(mb * 1024 * 1024 for mb in (0.0625, 0.25, 1, 2, 10, 40)),
+)
+CANCELLATIONS = counter("cancellations_total", "Cancel requests, by outcome.", ("result",))
+
 
 @app.route(route="upload_file", methods=["POST"])
 def upload_file(req: func.HttpRequest) -> func.HttpResponse:
@@ -50,15 +74,16 @@ def upload_file(req: func.HttpRequest) -> func.HttpResponse:
     """
     logging.info("Python HTTP trigger function to upload a file processed a request.")
     new_file_path = None
+    memory = MemoryTracker("upload_file").start()
     try:
 
-        file, from_lang, to_lang, exclusion_text, uploaded_by, prompt_id = extract_request_data(req)
+        file, from_lang, to_langs, exclusion_text, uploaded_by, prompt_id = extract_request_data(req)
 
         if not file:
             logging.error("No file provided in the request")
             return func.HttpResponse("No file provided in the request", status_code=400)
 
-        if not from_lang or not to_lang:
+        if not from_lang or not to_langs:
             logging.error("Language information not provided in the request")
             return func.HttpResponse(
                 "Language information not provided in the request", status_code=400
@@ -69,34 +94,113 @@ def upload_file(req: func.HttpRequest) -> func.HttpResponse:
         azure_storage_account, sas_token, container_name = get_azure_storage_info()
 
         new_file_name, new_file_path = save_file_temporarily(file, database_handler)
-        
-        upload_to_blob_storage(new_file_path, new_file_name, container_name)
 
-        landing_zone_path = generate_blob_url(azure_storage_account, container_name, new_file_name, sas_token)
+        size_bytes, page_count, lane = classify_document(new_file_path)
+        memory.file_name, memory.size_bytes = new_file_name, size_bytes
 
-        logging.info("File %s uploaded successfully", new_file_name)
+        landing_zone_path = generate_blob_url(azure_storage_account, container_name, new_file_name, sas_token)
 
+        # The record is written before the upload, so the translate function
+        # finds the lane and the user of the document when the blob trigger fires.
         log_file_upload(
             new_file_name,
             landing_zone_path,
             file,
             uploaded_by,
             from_lang,
-            to_lang,
+            to_langs,
             exclusion_text,
-            prompt_id
+            prompt_id,
+            size_bytes,
+            page_count,
+            lane,
+            status="in progress",
         )
 
+        try:
+            upload_to_blob_storage(new_file_path, new_file_name, container_name)
+        except Exception:
+            database_handler.update_upload_status(new_file_name, "failed")
+            raise
+        database_handler.update_upload_status(new_file_name, "done")
+
+        logging.info("File %s uploaded successfully", new_file_name)
+        UPLOADS.inc(labels=("done",))
+        UPLOAD_BYTES.observe(size_bytes, labels=(lane,))
+
         return func.HttpResponse(f"File {new_file_name} uploaded successfully", status_code=200)
 
     except (FileNotFoundError, PermissionError, DatabaseError, IntegrityError) as e:
         logging.error("Specific error: %s", str(e))
+        UPLOADS.inc(labels=("failed",))
         return func.HttpResponse(f"Specific error: {str(e)}", status_code=500)
     except Exception as e:
         logging.error("Exception occurred during upload: %s", str(e))
+        UPLOADS.inc(labels=("failed",))
         return func.HttpResponse(f"Exception occurred during upload: {str(e)}", status_code=500)
     finally:        
         clean_up_temporary_file(new_file_path)
+        memory.stop()
+
+
+@app.route(route="cancel_translation", methods=["POST"])
+def cancel_translation(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Handle the request to cancel the translation of an uploaded file.
+
+    The file is marked as cancelled, so the translate and watermark functions
+    stop at their next step, and a running Translator batch job is cancelled.
+
+    Args:
+        req (func.HttpRequest): The HTTP request object, with file_name on the
+            query string or in the request body.
+
+    Returns:
+        func.HttpResponse: The HTTP response object with the cancellation result.
+    """
+    logging.info("Python HTTP trigger function to cancel a translation processed a request.")
+
+    file_name = req.params.get("file_name")
+    if not file_name:
+        try:
+            req_body = req.get_json()
+        except ValueError:
+            req_body = {}
+        file_name = req_body.get("file_name")
+
+    if not file_name:
+        return func.HttpResponse(
+            "Please pass a file_name on the query string or in the request body", status_code=400
+        )
+
+    database_handler = DatabaseHandler()
+    try:
+        result = database_handler.cancel_translation(file_name)
+    except Exception as e:
+        logging.error("Exception occurred: %s", str(e))
+        return func.HttpResponse(f"Error cancelling translation: {str(e)}", status_code=500)
+
+    if result is None:
+        CANCELLATIONS.inc(labels=("not_found",))
+        return func.HttpResponse(f"File {file_name} not found", status_code=404)
+    if not result["cancelled"]:
+        CANCELLATIONS.inc(labels=("finished",))
+        return func.HttpResponse(
+            f"Translation of {file_name} has already finished", status_code=409
+        )
+
+    CANCELLATIONS.inc(labels=("cancelled",))
+    translator_cancelled = False
+    if result["operation_location"] and result["translation_status"] == "cancelled":
+        translator_cancelled = cancel_translator_operation(result["operation_location"])
+
+    body = {
+        "file_name": file_name,
+        "translation_status": result["translation_status"],
+        "watermark_status": result["watermark_status"],
+        "translator_job_cancelled": translator_cancelled,
+    }
+    return func.HttpResponse(json.dumps(body), status_code=200, mimetype="application/json")
 
 
 @app.route(route="get_logs_by_date", methods=["GET"])
@@ -175,3 +279,149 @@ def get_all_prompts(req: func.HttpRequest) -> func.HttpResponse:
         logging.error("Exception occurred: %s", str(e))
         return func.HttpResponse(f"Error fetching logs: {str(e)}", status_code=500)    
     
+
+
+@app.route(route="get_queue_stats", methods=["GET"])
+def get_queue_stats(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Handle the GET request to fetch the translation queue depth and wait times per user.
+
+    Args:
+        req (func.HttpRequest): The HTTP request object.
+
+    Returns:
+        func.HttpResponse: The HTTP response object with the queue statistics.
+    """
+    logging.info("Python HTTP trigger function processed a request.")
+
+    database_handler = DatabaseHandler()
+    try:
+        stats = database_handler.fetch_queue_stats()
+        return func.HttpResponse(json.dumps(stats), status_code=200, mimetype="application/json")
+    except Exception as e:
+        logging.error("Exception occurred: %s", str(e))
+        return func.HttpResponse(f"Error fetching queue statistics: {str(e)}", status_code=500)
+
+
+@app.route(route="get_stage_latency", methods=["GET"])
+def get_stage_latency(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Handle the GET request to fetch the p50, p95 and p99 latency of each
+    translation pipeline stage over a time window.
+
+    Args:
+        req (func.HttpRequest): The HTTP request object, with the window in
+            hours on the query string (hours, defaults to 24).
+
+    Returns:
+        func.HttpResponse: The HTTP response object with the latency statistics.
+    """
+    logging.info("Python HTTP trigger function processed a request.")
+
+    try:
+        hours = float(req.params.get("hours", "24"))
+    except ValueError:
+        return func.HttpResponse("hours must be a number", status_code=400)
+    if hours <= 0:
+        return func.HttpResponse("hours must be positive", status_code=400)
+
+    database_handler = DatabaseHandler()
+    try:
+        stats = database_handler.fetch_stage_latency(hours)
+        return func.HttpResponse(json.dumps(stats), status_code=200, mimetype="application/json")
+    except Exception as e:
+        logging.error("Exception occurred: %s", str(e))
+        return func.HttpResponse(f"Error fetching stage latency: {str(e)}", status_code=500)
+
+
+@app.route(route="get_openai_usage_report", methods=["GET"])
+def get_openai_usage_report(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Handle the GET request to fetch the OpenAI token usage, tokens per page and
+    latency per token of each prompt or user over a time window.
+
+    Args:
+        req (func.HttpRequest): The HTTP request object, with the window in
+            hours (hours, defaults to 168) and the grouping (group_by, 'prompt'
+            or 'user', defaults to 'prompt') on the query string.
+
+    Returns:
+        func.HttpResponse: The HTTP response object with the usage report.
+    """
+    logging.info("Python HTTP trigger function processed a request.")
+
+    try:
+        hours = float(req.params.get("hours", "168"))
+    except ValueError:
+        return func.HttpResponse("hours must be a number", status_code=400)
+    if hours <= 0:
+        return func.HttpResponse("hours must be positive", status_code=400)
+    group_by = req.params.get("group_by", "prompt")
+    if group_by not in ("prompt", "user"):
+        return func.HttpResponse("group_by must be 'prompt' or 'user'", status_code=400)
+
+    database_handler = DatabaseHandler()
+    try:
+        report = database_handler.fetch_openai_usage_report(hours, group_by)
+        return func.HttpResponse(json.dumps(report), status_code=200, mimetype="application/json")
+    except Exception as e:
+        logging.error("Exception occurred: %s", str(e))
+        return func.HttpResponse(f"Error fetching OpenAI usage: {str(e)}", status_code=500)
+
+
+@app.route(route="metrics", methods=["GET"])
+def get_metrics(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Handle the GET request to fetch the metrics of the instance in the Prometheus text format.
+
+    Args:
+        req (func.HttpRequest): The HTTP request object.
+
+    Returns:
+        func.HttpResponse: The HTTP response object with the metrics.
+    """
+    return func.HttpResponse(render(), status_code=200, headers={"Content-Type": CONTENT_TYPE})
+
+
+@register_warmup_step("database")
+def warm_up_database():
+    """
+    Opens a database connection, kept in the pool for the first request.
+    """
+    DatabaseHandler().ping()
+
+
+register_warmup_step("blob_storage")(warm_up_blob_storage)
+
+
+@app.warm_up_trigger(arg_name="context")
+def warmup(context) -> None:
+    """
+    Warm up a new instance before the platform sends it requests.
+
+    Args:
+        context (azure.functions.WarmUpContext): The warm-up context.
+    """
+    readiness = warm_up()
+    logging.info("Instance warmed up, ready: %s", readiness["ready"])
+
+
+@app.route(route="health", methods=["GET"])
+def get_health(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Report whether the instance is ready, starting a warm-up in the background
+    when it is not (see warmup.request_warm_up).
+
+    Args:
+        req (func.HttpRequest): The HTTP request object.
+
+    Returns:
+        func.HttpResponse: The readiness report, with status 200 if the instance
+            is ready and 503 otherwise.
+    """
+    readiness = request_warm_up()
+    return func.HttpResponse(
+        json.dumps(readiness),
+        status_code=200 if readiness["ready"] else 503,
+        mimetype="application/json",
+    )
@@ -0,0 +1,48 @@
+"""
+Module for routing documents to the interactive or the batch translation lane.
+
+Small documents are translated in the interactive lane, which keeps their
+latency low; large ones run in the batch lane, with its own concurrency limit
+and timeout (see scheduler.py in the translate function). A document is small
+if it has at most LANE_INTERACTIVE_MAX_BYTES bytes and, when its page count is
+known, at most LANE_INTERACTIVE_MAX_PAGES pages:
+
+    lane = classify_lane(size_bytes, page_count)
+
+The upload function classifies documents when they are uploaded, and the
+translate function classifies the documents that were not, so both apps read
+the thresholds from the same settings with this module.
+
+The source of this module is shared/lanes.py. The function apps each have a
+copy, updated with deployment-scripts/sync_shared_modules.py.
+"""
+
+import logging
+import os
+
+INTERACTIVE_LANE = "interactive"
+BATCH_LANE = "batch"
+
+LANE_INTERACTIVE_MAX_BYTES = int(os.getenv("LANE_INTERACTIVE_MAX_BYTES", str(2 * 1024 * 1024)))
+LANE_INTERACTIVE_MAX_PAGES = int(os.getenv("LANE_INTERACTIVE_MAX_PAGES", "10"))
+
+logging.info("LANE_INTERACTIVE_MAX_BYTES: %s", LANE_INTERACTIVE_MAX_BYTES)
+logging.info("LANE_INTERACTIVE_MAX_PAGES: %s", LANE_INTERACTIVE_MAX_PAGES)
+
+
+def classify_lane(size_bytes, page_count=None):
+    """
+    Returns the lane of a document from its size and page count.
+
+    Args:
+        size_bytes (int): The size of the document in bytes, None if unknown.
+        page_count (int): The page count of the document, None if unknown.
+
+    Returns:
+        str: The lane of the document. Documents of unknown size go to the batch lane.
+    """
+    if size_bytes is None or size_bytes > LANE_INTERACTIVE_MAX_BYTES:
+        return BATCH_LANE
+    if page_count is not None and page_count > LANE_INTERACTIVE_MAX_PAGES:
+        return BATCH_LANE
+    return INTERACTIVE_LANE
@@ -0,0 +1,22 @@
+"""
+Tests for is_processing_finished of database_handler.py.
+"""
+
+import pytest
+from database_handler import is_processing_finished
+
+
+@pytest.mark.parametrize(
+    "translation_status, watermark_status, finished",
+    [
+        ("in progress", None, False),
+        ("done", None, False),
+        ("done", "in progress", False),
+        ("done", "done", True),
+        ("done", "failed", True),
+        ("failed", None, True),
+        ("cancelled", None, True),
+    ],
+)
+def test_is_processing_finished(translation_status, watermark_status, finished):
+    assert is_processing_finished(translation_status, watermark_status) is finished
@@ -0,0 +1,146 @@
+"""
+Tests for database_handler.py against a Postgres database.
+
+The database is configured with the DB_* environment variables of the function
+app, e.g. a local Postgres started with
+
+    docker run -d -p 5432:5432 -e POSTGRES_PASSWORD=postgres postgres:16
+    DB_HOST=localhost DB_NAME=postgres DB_USER=postgres DB_PASSWORD=postgres \\
+        DB_SSLMODE=disable python -m pytest tests
+
+The tables of deployment-scripts/db.sql are created in a schema of their own,
+which is dropped afterwards. The tests are skipped when no database is reachable.
+"""
+
+import json
+import os
+from datetime import datetime, timezone
+import psycopg2
+import pytest
+import database_handler
+from database_handler import CONNECTION_POOL, DatabaseHandler
+
+SCHEMA = "database_handler_tests"
+SCHEMA_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "deployment-scripts", "db.sql"
+)
+
+
+def drain_pool():
+    conn = CONNECTION_POOL.acquire()
+    while conn is not None:
+        conn.disconnect()
+        conn = CONNECTION_POOL.acquire()
+
+
+@pytest.fixture(scope="module")
+def schema():
+    if not database_handler.DB_HOST:
+        pytest.skip("DB_HOST is not set")
+    try:
+        conn = psycopg2.connect(
+            host=database_handler.DB_HOST,
+            port=database_handler.DB_PORT,
+            dbname=database_handler.DB_NAME,
+            user=database_handler.DB_USER,
+            password=database_handler.DB_PASSWORD,
+            sslmode=database_handler.DB_SSLMODE,
+            connect_timeout=5,
+        )
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"No database reachable: {e}")
+    with open(SCHEMA_FILE, encoding="utf-8") as f:
+        statements = f.read()
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+        cursor.execute(f"SET search_path TO {SCHEMA}")
+        cursor.execute(statements)
+    conn.commit()
+    yield conn
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def handler(schema, monkeypatch):
+    # The connections of the handler use the schema of the tests.
+    monkeypatch.setenv("PGOPTIONS", f"-c search_path={SCHEMA}")
+    drain_pool()
+    yield DatabaseHandler()
+    drain_pool()
+
+
+def test_fetch_stage_latency_rows_serialize_to_json(schema, handler):
+    now = datetime.now(timezone.utc)
+    with schema.cursor() as cursor:
+        cursor.executemany(
+            """
+            INSERT INTO pipeline_stage_timings
+                (file_name, stage, started_at, duration_ms, bytes, prompt_tokens,
+                 completion_tokens)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """,
+            [
+                ("a.pdf", "translation", now, 1200.5, 3_000_000_000, None, None),
+                ("b.pdf", "translation", now, 800.0, 3_000_000_000, None, None),
+                ("a.pdf", "glossary_entries", now, 950.0, None, 1500, 300),
+            ],
+        )
+    schema.commit()
+
+    stats = handler.fetch_stage_latency(1)
+
+    # SUM(bytes) is numeric in Postgres, which json.dumps cannot serialize as a Decimal.
+    rows = {row["stage"]: row for row in json.loads(json.dumps(stats))}
+    assert rows["translation"]["count"] == 2
+    assert rows["translation"]["bytes"] == 6_000_000_000
+    assert rows["translation"]["p50_ms"] == pytest.approx(1000.25)
+    assert rows["glossary_entries"]["prompt_tokens"] == 1500
+    assert rows["glossary_entries"]["completion_tokens"] == 300
+    assert rows["glossary_entries"]["bytes"] is None
+
+
+def insert_upload(connection, file_name, targets):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO file_translation_logs (file_name, translation_status, toLanguage)
+            VALUES (%s, 'done', %s)
+            """,
+            (file_name, targets[0][0]),
+        )
+        for target_order, (language, watermark_status) in enumerate(targets):
+            cursor.execute(
+                """
+                INSERT INTO file_translation_targets
+                    (file_name, toLanguage, target_order, translation_status, watermark_status)
+                VALUES (%s, %s, %s, 'done', %s)
+                """,
+                (file_name, language, target_order, watermark_status),
+            )
+    connection.commit()
+
+
+def test_cancel_translation_of_finished_targets_is_not_cancelled(schema, handler):
+    insert_upload(schema, "finished.pdf", [("fr", "done"), ("de", "failed")])
+    result = handler.cancel_translation("finished.pdf")
+    assert result["cancelled"] is False
+
+
+def test_cancel_translation_with_an_unfinished_target(schema, handler):
+    insert_upload(schema, "running.pdf", [("fr", "done"), ("de", "in progress")])
+    result = handler.cancel_translation("running.pdf")
+    assert result["cancelled"] is True
+    with schema.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT toLanguage, watermark_status FROM file_translation_targets
+            WHERE file_name = %s ORDER BY target_order
+            """,
+            ("running.pdf",),
+        )
+        assert cursor.fetchall() == [("fr", "done"), ("de", "cancelled")]
+    schema.commit()
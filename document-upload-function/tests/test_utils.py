@@ -0,0 +1,43 @@
+"""
+Tests for the document classification of utils.py.
+"""
+
+import pytest
+import lanes
+from utils import classify_document, get_pdf_page_count
+
+
+def write_pdf(path, pages, count=None):
+    objects = b"".join(
+        b"%d 0 obj << /Type /Page /Parent 1 0 R >> endobj\n" % (index + 2)
+        for index in range(pages)
+    )
+    tree = b"1 0 obj << /Type /Pages /Count %d >> endobj\n" % (pages if count is None else count)
+    path.write_bytes(b"%PDF-1.7\n" + tree + objects + b"%%EOF\n")
+    return str(path)
+
+
+@pytest.fixture(autouse=True)
+def thresholds(monkeypatch):
+    monkeypatch.setattr(lanes, "LANE_INTERACTIVE_MAX_BYTES", 1000)
+    monkeypatch.setattr(lanes, "LANE_INTERACTIVE_MAX_PAGES", 3)
+
+
+def test_get_pdf_page_count_reads_page_objects_and_page_tree(tmp_path):
+    assert get_pdf_page_count(write_pdf(tmp_path / "a.pdf", 2)) == 2
+    # Pages inside compressed object streams are only visible in /Count.
+    assert get_pdf_page_count(write_pdf(tmp_path / "b.pdf", 1, count=7)) == 7
+    (tmp_path / "c.pdf").write_bytes(b"%PDF-1.7\n%%EOF\n")
+    assert get_pdf_page_count(str(tmp_path / "c.pdf")) is None
+
+
+def test_classify_document_by_pages_and_size(tmp_path):
+    small = write_pdf(tmp_path / "small.pdf", 3)
+    assert classify_document(small)[1:] == (3, "interactive")
+    assert classify_document(write_pdf(tmp_path / "long.pdf", 4))[1:] == (4, "batch")
+
+    docx = tmp_path / "large.DOCX"
+    docx.write_bytes(b"x" * 1001)
+    assert classify_document(str(docx)) == (1001, None, "batch")
+    docx.write_bytes(b"x" * 1000)
+    assert classify_document(str(docx)) == (1000, None, "interactive")
@@ -3,30 +3,64 @@ Utility functions for handling file uploads and logging in an Azure Functions ap
 
 Functions:
 - extract_request_data: Extracts data from the HTTP request.
+- parse_target_languages: Parses the list of target languages of an upload.
+- get_blob_service_client: Returns the Blob service client, created on first use.
+- warm_up_blob_storage: Opens the connection of the Blob service client.
 - get_azure_storage_info: Retrieves Azure storage account information.
+- get_pdf_page_count: Counts the pages of a PDF file.
+- classify_document: Routes a document to the interactive or the batch lane.
 - log_file_upload: Logs file upload details to the database.
 - save_file_temporarily: Saves the uploaded file to a temporary location.
 - upload_to_blob_storage: Uploads the file to Azure Blob Storage.
 - generate_blob_url: Generates a URL for the uploaded blob.
 - clean_up_temporary_file: Removes the temporary file.
+- cancel_translator_operation: Cancels a batch translation job of Azure Translator.
 """
 
 import logging
 import os
+import re
 from datetime import datetime
+from functools import lru_cache
+import requests
 from azure.storage.blob import BlobServiceClient
 from database_handler import DatabaseHandler
+from lanes import classify_lane
 import urllib.parse
 
 # Azure Blob Storage connection string
 AZURE_CONNECTION_STRING = os.getenv("AZURE_CONNECTION_STRING")
 UPLOAD_DIRECTORY = "landing-zone"
+# Azure Translator key, used to cancel batch translation jobs
+TRANSLATE_SUBSCRIPTION_KEY = os.getenv("TRANSLATE_SUBSCRIPTION_KEY")
+
+PDF_PAGE_PATTERN = re.compile(rb"/Type\s*/Page(?![a-zA-Z])")
+PDF_PAGE_COUNT_PATTERN = re.compile(rb"/Type\s*/Pages\b[^>]*?/Count\s+(\d+)", re.DOTALL)
 
 # Log environment variables to check if they exist
 logging.debug("AZURE_CONNECTION_STRING: %s", '****' if AZURE_CONNECTION_STRING else None)
+logging.debug("TRANSLATE_SUBSCRIPTION_KEY: %s", '****' if TRANSLATE_SUBSCRIPTION_KEY else None)
+
+
+@lru_cache(maxsize=None)
+def get_blob_service_client():
+    """
+    Returns the Blob service client of the storage account, created on first
+    use rather than when the function app starts, and reused across calls.
+
+    Returns:
+        BlobServiceClient: The Blob service client.
+    """
+    return BlobServiceClient.from_connection_string(AZURE_CONNECTION_STRING)
+
 
-# Initialize the BlobServiceClient
-blob_service_client = BlobServiceClient.from_connection_string(AZURE_CONNECTION_STRING)
+def warm_up_blob_storage():
+    """
+    Opens the connection of the Blob service client to the storage account, by
+    checking whether a blob of the upload directory exists.
+    """
+    container_client = get_blob_service_client().get_container_client(os.getenv("CONTAINER_NAME"))
+    container_client.get_blob_client(blob=f"{UPLOAD_DIRECTORY}/.warmup").exists()
 
 
 def extract_request_data(req):
@@ -37,7 +71,7 @@ def extract_request_data(req):
         req (func.HttpRequest): The HTTP request object.
 
     Returns:
-        tuple: Extracted file, from_lang, to_lang, exclusion_text, and uploaded_by.
+        tuple: Extracted file, from_lang, to_langs, exclusion_text, uploaded_by and prompt_id.
     """
     file = req.files.get("file")
     logging.info("File: %s", file.filename if file else "None")
@@ -45,8 +79,8 @@ def extract_request_data(req):
     from_lang = req.form.get("fromLang")
     logging.info("From Language: %s", from_lang)
 
-    to_lang = req.form.get("toLang")
-    logging.info("To Language: %s", to_lang)
+    to_langs = parse_target_languages(req.form.getlist("toLang"))
+    logging.info("To Languages: %s", to_langs)
     exclusion_text = req.form.get("exclusion_text")
     logging.info("Exclusion Text: %s", exclusion_text)
 
@@ -56,7 +90,29 @@ def extract_request_data(req):
     prompt_id = req.form.get("prompt_id")
     logging.info("Prompt ID: %s", prompt_id)
 
-    return file, from_lang, to_lang, exclusion_text, uploaded_by, prompt_id
+    return file, from_lang, to_langs, exclusion_text, uploaded_by, prompt_id
+
+
+def parse_target_languages(values):
+    """
+    Parse the target languages of an upload.
+
+    The languages can be sent as repeated toLang fields, as a comma-separated
+    list, or both.
+
+    Args:
+        values (list): The raw toLang form values.
+
+    Returns:
+        list: The unique target languages, in the order they were given.
+    """
+    to_langs = []
+    for value in values:
+        for language in value.split(","):
+            language = language.strip()
+            if language and language not in to_langs:
+                to_langs.append(language)
+    return to_langs
 
 
 def get_azure_storage_info():
@@ -76,15 +132,66 @@ def get_azure_storage_info():
     return azure_storage_account, sas_token, container_name
 
 
+def get_pdf_page_count(file_path):
+    """
+    Count the pages of a PDF file without parsing it.
+
+    The page objects are counted, and the /Count entries of the page trees are
+    read; the larger number is used, since objects inside compressed object
+    streams are not visible to either.
+
+    Args:
+        file_path (str): The path to the PDF file.
+
+    Returns:
+        int: The page count, or None if it cannot be determined.
+    """
+    with open(file_path, "rb") as f:
+        content = f.read()
+    page_objects = len(PDF_PAGE_PATTERN.findall(content))
+    page_tree_counts = [int(count) for count in PDF_PAGE_COUNT_PATTERN.findall(content)]
+    page_count = max([page_objects] + page_tree_counts)
+    return page_count or None
+
+
+def classify_document(file_path):
+    """
+    Route a document to the interactive or the batch lane.
+
+    Small documents are translated in the interactive lane, which keeps their
+    latency low; large ones run in the batch lane, with its own concurrency
+    limit and timeout. PDFs are classified by byte size and page count, DOCX
+    files by byte size, with the thresholds of lanes.py.
+
+    Args:
+        file_path (str): The path to the document.
+
+    Returns:
+        tuple: The size in bytes, the page count (None for DOCX files or if it
+            cannot be determined) and the lane.
+    """
+    size_bytes = os.path.getsize(file_path)
+    page_count = get_pdf_page_count(file_path) if file_path.lower().endswith(".pdf") else None
+
+    lane = classify_lane(size_bytes, page_count)
+    logging.info(
+        "Document %s: %d bytes, %s pages, %s lane", file_path, size_bytes, page_count, lane
+    )
+    return size_bytes, page_count, lane
+
+
 def log_file_upload(
     new_file_name,
     landing_zone_path,
     file,
     uploaded_by,
     from_lang,
-    to_lang,
+    to_langs,
     exclusion_text,
     prompt_id,
+    size_bytes=None,
+    page_count=None,
+    lane=None,
     status="done",
 ):
     """
@@ -96,8 +203,11 @@ def log_file_upload(
         file (werkzeug.datastructures.FileStorage): The uploaded file.
         uploaded_by (str): The user who uploaded the file.
         from_lang (str): The source language.
-        to_lang (str): The target language.
+        to_langs (list): The target languages.
         exclusion_text (str): The exclusion text.
+        size_bytes (int, optional): The size of the file in bytes.
+        page_count (int, optional): The page count of the file.
+        lane (str, optional): The translation lane ('interactive' or 'batch').
         status (str, optional): The upload status. Defaults to "done".
     """
     logging.info("Inserting file = %s record into the database", new_file_name)
@@ -114,9 +224,12 @@ def log_file_upload(
         status,
         uploaded_by,
         from_lang,
-        to_lang,
+        to_langs,
         exclusion_text,
-        prompt_id
+        prompt_id,
+        size_bytes,
+        page_count,
+        lane,
     )
     logging.info("File %s record inserted successfully", new_file_name)
 
@@ -156,7 +269,7 @@ def upload_to_blob_storage(new_file_path, new_file_name, container_name):
         new_file_name (str): The new file name.
     """
     logging.debug("Getting container client")
-    container_client = blob_service_client.get_container_client(container_name)
+    container_client = get_blob_service_client().get_container_client(container_name)
     blob_client = container_client.get_blob_client(blob=f"{UPLOAD_DIRECTORY}/{new_file_name}")
     logging.debug("Uploading file to blob")
 
@@ -194,3 +307,29 @@ def clean_up_temporary_file(file_path):
     """
     if os.path.exists(file_path):
         os.remove(file_path)
+
+
+def cancel_translator_operation(operation_location):
+    """
+    Cancel a batch translation job of Azure Translator.
+
+    Documents that the service has not started translating are cancelled and
+    not charged; documents already being translated still complete.
+
+    Args:
+        operation_location (str): The URL of the translation job.
+
+    Returns:
+        bool: True if the service accepted the cancellation.
+    """
+    try:
+        response = requests.delete(
+            operation_location,
+            headers={"Ocp-Apim-Subscription-Key": TRANSLATE_SUBSCRIPTION_KEY},
+            timeout=30,
+        )
+    except requests.RequestException as e:
+        logging.error("Error cancelling translation job %s: %s", operation_location, str(e))
+        return False
+    logging.info("Cancel translation job response status code: %s", response.status_code)
+    return response.status_code == 200
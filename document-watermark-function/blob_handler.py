@@ -1,14 +1,59 @@
 """
 Module for handling blob operations including validating the existence of a blob URL
 and uploading content to Azure Blob Storage.
+
+The HTTP session and the Blob service client are created once and reused, so
+that their connections to the storage account stay open between requests.
 """
 
 import logging
+from functools import lru_cache
 import requests
 from azure.storage.blob import BlobServiceClient
 from environment_variables import AZURE_STORAGE_ACCOUNT, CONTAINER_NAME, SAS_TOKEN
 
 
+@lru_cache(maxsize=None)
+def get_session():
+    """
+    Returns the HTTP session used to check the blobs, created on first use.
+
+    Returns:
+        requests.Session: The session.
+    """
+    return requests.Session()
+
+
+@lru_cache(maxsize=None)
+def get_blob_service_client():
+    """
+    Returns the Blob service client of the storage account, created on first use.
+
+    Returns:
+        BlobServiceClient: The Blob service client.
+    """
+    return BlobServiceClient(
+        account_url=f"https://{AZURE_STORAGE_ACCOUNT}.blob.core.windows.net",
+        credential=SAS_TOKEN,
+    )
+
+
+def warm_up_blob_storage(blob_path):
+    """
+    Opens the connections of the HTTP session and of the Blob service client to
+    the storage account, by checking whether a blob exists.
+
+    Input:
+    - blob_path: Path of the blob in the container. It does not need to exist.
+    """
+    get_session().head(
+        f"https://{AZURE_STORAGE_ACCOUNT}.blob.core.windows.net/"
+        f"{CONTAINER_NAME}/{blob_path}?{SAS_TOKEN}",
+        timeout=10,
+    )
+    get_blob_service_client().get_blob_client(container=CONTAINER_NAME, blob=blob_path).exists()
+
+
 def validate_blob_url(blob_url):
     """
     Validates the existence of the source URL.
@@ -20,7 +65,7 @@ def validate_blob_url(blob_url):
     - True if the file exists, False otherwise.
     """
     logging.info("Validating source URL: %s", blob_url)
-    response = requests.head(blob_url, timeout=10)
+    response = get_session().head(blob_url, timeout=10)
     if response.status_code == 200:
         logging.info("Source file exists")
         return True
@@ -40,12 +85,8 @@ def upload_to_blob(blob_directory, file_name, content):
     Output:
     - URL of the uploaded file.
     """
-    blob_service_client = BlobServiceClient(
-        account_url=f"https://{AZURE_STORAGE_ACCOUNT}.blob.core.windows.net",
-        credential=SAS_TOKEN,
-    )
     blob_path = f"{blob_directory}/{file_name}"
-    blob_client = blob_service_client.get_blob_client(
+    blob_client = get_blob_service_client().get_blob_client(
         container=CONTAINER_NAME, blob=blob_path
     )
 
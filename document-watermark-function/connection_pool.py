@@ -0,0 +1,161 @@
+"""
+Module for reusing database connections within an instance.
+
+Each query opens a connection and closes it when done. Opening one costs a TCP
+and TLS handshake and the authentication, which is often longer than the query
+itself. The connections of the app are therefore kept open when they are
+closed, up to DB_POOL_SIZE per instance, and handed out again by the next
+get_connection:
+
+    conn = CONNECTION_POOL.acquire()
+    if conn is None:
+        conn = psycopg2.connect(...)
+    ...
+    conn.close()  # TrackedConnection.close returns it to the pool
+
+A transaction left open is rolled back when the connection is returned.
+Connections idle for longer than DB_POOL_MAX_IDLE_SECONDS are closed instead
+of reused, as the server or a load balancer may have dropped them, and the
+others are checked with a SELECT 1 before they are handed out, so that a
+restart or failover of the server closes them rather than failing the
+query; get_connection then opens a new one. Idle
+connections are not shared with a forked process. Set DB_POOL_SIZE=0 to open
+a new connection for each query.
+
+The source of this module is shared/connection_pool.py. The function apps
+each have a copy, updated with deployment-scripts/sync_shared_modules.py.
+"""
+
+import logging
+import os
+import threading
+import time
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from metrics import counter, gauge
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+DB_POOL_MAX_IDLE_SECONDS = float(os.getenv("DB_POOL_MAX_IDLE_SECONDS", "240"))
+
+logging.info("DB_POOL_SIZE: %s", DB_POOL_SIZE)
+logging.info("DB_POOL_MAX_IDLE_SECONDS: %s", DB_POOL_MAX_IDLE_SECONDS)
+
+DB_CONNECTIONS_REUSED = counter(
+    "db_connections_reused_total", "Database connections taken from the pool."
+)
+DB_CONNECTIONS_IDLE = gauge("db_connections_idle", "Open database connections kept in the pool.")
+
+
+class ConnectionPool:
+    """
+    The idle database connections of the instance, most recently used last.
+
+    The connections must have a disconnect method, which closes them without
+    returning them to the pool.
+    """
+
+    def __init__(self, size=DB_POOL_SIZE, max_idle_seconds=DB_POOL_MAX_IDLE_SECONDS):
+        self.size = size
+        self.max_idle_seconds = max_idle_seconds
+        self.idle = []
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        DB_CONNECTIONS_IDLE.set_function(self.collect_idle)
+
+    def acquire(self):
+        """
+        Takes an idle connection from the pool, checking that it is still alive.
+
+        Returns:
+            psycopg2.extensions.connection: The connection, or None if the pool has
+                no live connection.
+        """
+        while True:
+            expired = []
+            conn = None
+            with self.lock:
+                self.check_process()
+                now = time.monotonic()
+                while self.idle and now - self.idle[0][1] > self.max_idle_seconds:
+                    expired.append(self.idle.pop(0)[0])
+                while self.idle and conn is None:
+                    candidate = self.idle.pop()[0]
+                    if candidate.closed:
+                        expired.append(candidate)
+                    else:
+                        conn = candidate
+            for stale in expired:
+                stale.disconnect()
+            if conn is None:
+                return None
+            if is_alive(conn):
+                DB_CONNECTIONS_REUSED.inc()
+                return conn
+            conn.disconnect()
+
+    def release(self, conn):
+        """
+        Returns a connection to the pool, rolling back its open transaction.
+
+        Args:
+            conn (psycopg2.extensions.connection): The connection.
+
+        Returns:
+            bool: True if the pool kept the connection, False if it must be closed.
+        """
+        if self.size <= 0 or conn.closed:
+            return False
+        try:
+            if conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except psycopg2.Error as e:
+            logging.warning("Not reusing a database connection: %s", str(e))
+            return False
+        with self.lock:
+            self.check_process()
+            if len(self.idle) >= self.size:
+                return False
+            self.idle.append((conn, time.monotonic()))
+            return True
+
+    def check_process(self):
+        """
+        Forgets the idle connections inherited from the parent process, which
+        still uses them. Called with the lock held.
+        """
+        if self.pid != os.getpid():
+            self.idle = []
+            self.pid = os.getpid()
+
+    def collect_idle(self):
+        """
+        Returns the number of idle connections, for the db_connections_idle gauge.
+
+        Returns:
+            dict: The number of connections, keyed by the empty label values.
+        """
+        with self.lock:
+            return {(): len(self.idle) if self.pid == os.getpid() else 0}
+
+
+def is_alive(conn):
+    """
+    Checks that the server still answers on a connection, with a single round trip.
+
+    The query runs in autocommit mode so that it leaves no transaction to close.
+
+    Args:
+        conn (psycopg2.extensions.connection): The idle connection.
+
+    Returns:
+        bool: True if the query succeeded, False if the connection must be closed.
+    """
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        conn.autocommit = False
+        return True
+    except psycopg2.Error as e:
+        logging.warning("Dropping a dead pooled database connection: %s", str(e))
+        return False
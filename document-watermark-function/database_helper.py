@@ -4,9 +4,13 @@ Module for handling database operations related to watermark file records.
 
 import logging
 import os
+import time
 from datetime import datetime
 import psycopg2
 from psycopg2 import sql, DatabaseError, IntegrityError, OperationalError
+from psycopg2.extensions import connection
+from connection_pool import ConnectionPool
+from metrics import counter, gauge, histogram
 
 # PostgreSQL connection details
 DB_HOST = os.getenv("DB_HOST")
@@ -15,6 +19,7 @@ DB_NAME = os.getenv("DB_NAME")
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_SSLMODE = os.getenv("DB_SSLMODE", "require")
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "10"))
 
 # Log environment variables to check if they exist
 logging.debug("DB_HOST: %s", DB_HOST)
@@ -23,35 +28,140 @@ logging.debug("DB_NAME: %s", DB_NAME)
 logging.debug("DB_USER: %s", DB_USER)
 logging.debug("DB_PASSWORD: %s", "****" if DB_PASSWORD else None)
 logging.debug("DB_SSLMODE: %s", DB_SSLMODE)
+logging.debug("DB_CONNECT_TIMEOUT: %s", DB_CONNECT_TIMEOUT)
+
+DB_CONNECTIONS_IN_USE = gauge("db_connections_in_use", "Open database connections.")
+DB_CONNECTIONS_OPENED = counter("db_connections_opened_total", "Database connections opened.")
+DB_CONNECT_SECONDS = histogram(
+    "db_connect_seconds",
+    "Time to open a database connection.",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+
+class TrackedConnection(connection):
+    """
+    A database connection counted in the db_connections_in_use gauge until it is closed.
+
+    Closing it returns it to the pool of the instance, if the pool has room (see
+    connection_pool.py).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        DB_CONNECTIONS_IN_USE.inc()
+
+    def close(self):
+        if not CONNECTION_POOL.release(self):
+            self.disconnect()
+
+    def disconnect(self):
+        """
+        Closes the connection instead of returning it to the pool.
+        """
+        if not self.closed:
+            DB_CONNECTIONS_IN_USE.dec()
+        super().close()
+
+
+CONNECTION_POOL = ConnectionPool()
 
 
 def get_connection():
     """
     Establish a connection to the PostgreSQL database using the provided connection details.
+    An idle connection of the pool is reused if there is one.
     Returns:
         psycopg2.connection: A connection object to interact with the PostgreSQL database.
     Raises:
         psycopg2.OperationalError: If there is an error connecting to the database.
     """
+    conn = CONNECTION_POOL.acquire()
+    if conn is not None:
+        return conn
+    started = time.perf_counter()
     try:
-        return psycopg2.connect(
+        conn = psycopg2.connect(
             host=DB_HOST,
             port=DB_PORT,
             dbname=DB_NAME,
             user=DB_USER,
             password=DB_PASSWORD,
             sslmode=DB_SSLMODE,
+            connect_timeout=DB_CONNECT_TIMEOUT,
+            connection_factory=TrackedConnection,
         )
+        DB_CONNECT_SECONDS.observe(time.perf_counter() - started)
+        DB_CONNECTIONS_OPENED.inc()
+        return conn
     except OperationalError as e:
         logging.error("Error connecting to the database: %s", str(e))
         raise    
 
 
+def ping():
+    """
+    Opens a connection and runs a trivial query, leaving the connection in the
+    pool for the next query. Used to warm up the instance.
+    Raises:
+        psycopg2.Error: If the database cannot be reached.
+    """
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def is_watermark_cancelled(file_name):
+    """
+    Check whether the translation of a translated file was cancelled.
+    Args:
+        file_name (str): The name of the translated file.
+    Returns:
+        bool: True if the translation was cancelled. False if the database cannot
+            be reached, so the watermark is still added.
+    """
+    conn = None
+    try:
+        conn = get_connection()
+        with conn.cursor() as cursor:
+            # With several target languages, the translated file name identifies
+            # a file_translation_targets row instead of the upload itself.
+            cursor.execute(
+                """
+                SELECT 1
+                FROM file_translation_logs
+                WHERE cancelled_at IS NOT NULL
+                  AND (
+                      file_name = %s
+                      OR file_name IN (
+                          SELECT file_name FROM file_translation_targets
+                          WHERE translated_file_name = %s
+                      )
+                  )
+                """,
+                (file_name, file_name),
+            )
+            return cursor.fetchone() is not None
+    except psycopg2.Error as e:
+        logging.error("Psycopg2 error: %s", str(e))
+        return False
+    finally:
+        if conn:
+            conn.close()
+
+
 def update_watermark_file_record(file_name, watermark_status="failed", watermark_zone_path=""):
     """
     Update the record of the file in the PostgreSQL database.
+    Records whose watermark was cancelled are left unchanged.
+    With several target languages, the watermark status of the upload is set
+    once every target has finished: 'failed' if any target failed, else 'done'.
     Args:
-        file_name (str): The name of the file.
+        file_name (str): The name of the translated file.
         watermark_status (str): The status of the watermark ('failed', 'in progress', 'done').
         watermark_zone_path (str): The path to the translated file in the translated zone.
     Raises:
@@ -65,6 +175,20 @@ def update_watermark_file_record(file_name, watermark_status="failed", watermark
     try:
         conn = get_connection()
         with conn.cursor() as cursor:
+            # The upload is locked first, so that the targets finishing at the
+            # same time see each other's status when they are rolled up.
+            cursor.execute(
+                """
+                SELECT 1 FROM file_translation_logs
+                WHERE file_name = %s
+                   OR file_name IN (
+                       SELECT file_name FROM file_translation_targets
+                       WHERE translated_file_name = %s
+                   )
+                FOR UPDATE
+                """,
+                (file_name, file_name),
+            )
             update_query = sql.SQL(
                 """
                 UPDATE file_translation_logs
@@ -73,6 +197,7 @@ def update_watermark_file_record(file_name, watermark_status="failed", watermark
                     watermark_status = %s,
                     watermark_zone_path = %s               
                 WHERE file_name = %s
+                  AND watermark_status IS DISTINCT FROM 'cancelled'
                 """
             )
             cursor.execute(
@@ -85,6 +210,67 @@ def update_watermark_file_record(file_name, watermark_status="failed", watermark
                     file_name,
                 ),
             )
+            # With several target languages, the translated file name identifies
+            # a file_translation_targets row instead of the upload itself.
+            cursor.execute(
+                """
+                UPDATE file_translation_targets
+                SET watermark_date = %s,
+                    watermark_datetime = %s,
+                    watermark_status = %s,
+                    watermark_zone_path = %s
+                WHERE translated_file_name = %s
+                  AND watermark_status IS DISTINCT FROM 'cancelled'
+                """,
+                (
+                    watermark_date,
+                    watermark_datetime,
+                    watermark_status,
+                    watermark_zone_path,
+                    file_name,
+                ),
+            )
+            # The web app reads the status of the upload, so it is rolled up from
+            # the targets once none of them is in progress. A target whose
+            # translation failed or was cancelled gets no watermark.
+            cursor.execute(
+                """
+                UPDATE file_translation_logs l
+                SET watermark_date = %s,
+                    watermark_datetime = %s,
+                    watermark_status = CASE WHEN t.failed THEN 'failed' ELSE 'done' END,
+                    watermark_zone_path = COALESCE(l.watermark_zone_path, t.watermark_zone_path)
+                FROM (
+                    SELECT file_name,
+                        bool_or(
+                            COALESCE(
+                                watermark_status = 'failed' OR translation_status = 'failed',
+                                FALSE
+                            )
+                        ) AS failed,
+                        bool_and(
+                            COALESCE(
+                                watermark_status IN ('done', 'failed', 'cancelled')
+                                OR translation_status IN ('failed', 'cancelled'),
+                                FALSE
+                            )
+                        ) AS finished,
+                        (array_agg(watermark_zone_path ORDER BY target_order))[1]
+                            AS watermark_zone_path
+                    FROM file_translation_targets
+                    WHERE file_name IN (
+                        SELECT file_name FROM file_translation_targets
+                        WHERE translated_file_name = %s
+                    )
+                    GROUP BY file_name
+                ) t
+                WHERE l.file_name = t.file_name
+                  AND t.finished
+                  AND l.cancelled_at IS NULL
+                  AND l.watermark_status IS DISTINCT FROM 'cancelled'
+                """,
+                (watermark_date, watermark_datetime, file_name),
+            )
             conn.commit()
     except IntegrityError as e:
         logging.error("Integrity error: %s", str(e))
@@ -2,6 +2,18 @@
 Azure Function App to handle the retrieval of a file from Azure Blob Storage,
 convert it to PDF if necessary, add a watermark, upload it back to Azure Blob Storage,
 and log the upload details in the database.
+
+Files whose translation was cancelled are skipped; the cancellation is checked
+before the download and again before the upload.
+
+The metrics of the instance are served in the Prometheus text format by the
+metrics route (see metrics.py). The memory used by each watermark can be
+logged with MEMORY_TRACKING_ENABLED (see memory_tracking.py).
+
+A new instance opens its database and Blob Storage connections, starts
+LibreOffice once and renders the watermark before its first request, from the
+warmup trigger, or in the background when the health route finds it not ready
+(see warmup.py). The rendered watermark is reused by every request.
 """
 
 import logging
@@ -10,13 +22,19 @@ import tempfile
 import subprocess
 import urllib.parse
 import io
+import time
+from functools import lru_cache
 import azure.functions as func
-from azure.storage.blob import BlobClient
-from PyPDF2 import PdfReader, PdfWriter
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from database_helper import update_watermark_file_record
-from blob_handler import validate_blob_url, upload_to_blob
+from database_helper import is_watermark_cancelled, ping, update_watermark_file_record
+from blob_handler import (
+    get_blob_service_client,
+    upload_to_blob,
+    validate_blob_url,
+    warm_up_blob_storage,
+)
+from memory_tracking import MemoryTracker
+from metrics import CONTENT_TYPE, counter, histogram, render
+from warmup import register_warmup_step, request_warm_up, warm_up
 from azure.functions import HttpRequest, HttpResponse
 import json
 from environment_variables import (
@@ -29,6 +47,13 @@ from environment_variables import (
 
 app = func.FunctionApp(http_auth_level=func.AuthLevel.ANONYMOUS)
 
+WATERMARKS = counter("watermarks_total", "Watermark requests, by outcome.", ("status",))
+WATERMARK_SECONDS = histogram(
+    "watermark_seconds", "Time to download, watermark and upload a translated document."
+)
+WATERMARK_TEXT = "AI Translated"
+LIBREOFFICE_WARMUP_TIMEOUT_SECONDS = 120
+
 @app.route(route="add_water_mark", methods=["POST"])
 def add_water_mark(req: func.HttpRequest) -> func.HttpResponse:
     """
@@ -43,6 +68,8 @@ def add_water_mark(req: func.HttpRequest) -> func.HttpResponse:
     """
     logging.info("Python HTTP trigger function to upload a file processed a request.")
     input_file_path = None
+    started = time.perf_counter()
+    memory = MemoryTracker("add_water_mark").start()
     try:
         req_body = req.get_json()        
         logging.info("Request body: %s", req_body)
@@ -68,6 +95,12 @@ def add_water_mark(req: func.HttpRequest) -> func.HttpResponse:
                 logging.info("File name extracted: %s", file_name)
                 
                 input_file_path = file_name
+                memory.file_name = file_name
+
+                if is_watermark_cancelled(file_name):
+                    logging.info("Translation of %s was cancelled, skipping the watermark.", file_name)
+                    WATERMARKS.inc(labels=("cancelled",))
+                    return func.HttpResponse(f"Watermark of {file_name} cancelled", status_code=200)
 
                 # Define the source URL
                 encoded_file_name = urllib.parse.quote(file_name)
@@ -83,9 +116,12 @@ def add_water_mark(req: func.HttpRequest) -> func.HttpResponse:
                     return func.HttpResponse("Source file does not exist.", status_code=404)
 
                 # Read the file content from the source URL
-                blob_client = BlobClient.from_blob_url(source_url)
+                blob_client = get_blob_service_client().get_blob_client(
+                    container=CONTAINER_NAME, blob=f"{UPLOAD_PREFIX}/{file_name}"
+                )
                 downloader = blob_client.download_blob()
                 file_content = downloader.readall()
+                memory.size_bytes = len(file_content)
 
                 logging.info("File content read successfully.")
                 new_file_name = file_content
@@ -100,6 +136,11 @@ def add_water_mark(req: func.HttpRequest) -> func.HttpResponse:
                 else:
                     return func.HttpResponse("Unsupported file type.", status_code=400)
 
+                if is_watermark_cancelled(file_name):
+                    logging.info("Translation of %s was cancelled, skipping the upload.", file_name)
+                    WATERMARKS.inc(labels=("cancelled",))
+                    return func.HttpResponse(f"Watermark of {file_name} cancelled", status_code=200)
+
                 file_url = upload_to_blob(
                     WATERMARK_PREFIX,
                     new_file_name,
@@ -116,6 +157,8 @@ def add_water_mark(req: func.HttpRequest) -> func.HttpResponse:
                     watermark_zone_path,
                 )
                 logging.info("Watermark record updated successfully.")
+                WATERMARKS.inc(labels=("done",))
+                WATERMARK_SECONDS.observe(time.perf_counter() - started)
 
                 return func.HttpResponse(f"File {new_file_name} uploaded successfully", status_code=200)
 
@@ -129,12 +172,122 @@ def add_water_mark(req: func.HttpRequest) -> func.HttpResponse:
         )
     except Exception as e:
         logging.error("Error processing the request: %s", str(e), exc_info=True)
+        WATERMARKS.inc(labels=("failed",))
         if input_file_path:
             update_watermark_file_record(input_file_path)
         return func.HttpResponse("Internal Server Error", status_code=500)
+    finally:
+        memory.stop()
 
 
 
+@app.route(route="metrics", methods=["GET"])
+def get_metrics(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Serve the metrics of the instance in the Prometheus text format.
+
+    Args:
+        req (func.HttpRequest): The HTTP request object.
+
+    Returns:
+        func.HttpResponse: The HTTP response object with the metrics.
+    """
+    return func.HttpResponse(render(), status_code=200, headers={"Content-Type": CONTENT_TYPE})
+
+
+@register_warmup_step("database")
+def warm_up_database():
+    """
+    Opens a database connection, kept in the pool for the first request.
+    """
+    ping()
+
+
+@register_warmup_step("blob_storage")
+def warm_up_storage():
+    """
+    Opens the connections to the storage account.
+    """
+    warm_up_blob_storage(f"{UPLOAD_PREFIX}/.warmup")
+
+
+@register_warmup_step("libreoffice")
+def warm_up_libreoffice():
+    """
+    Converts a text file with LibreOffice, which creates its user profile on the first run.
+    """
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        text_path = os.path.join(tmpdirname, "warmup.txt")
+        with open(text_path, "w", encoding="utf-8") as f:
+            f.write(WATERMARK_TEXT)
+        run_libreoffice(text_path, tmpdirname, timeout=LIBREOFFICE_WARMUP_TIMEOUT_SECONDS)
+
+
+@register_warmup_step("watermark")
+def warm_up_watermark():
+    """
+    Renders the watermark and adds it to a page, which loads reportlab and PyPDF2.
+    """
+    add_pdf_watermark(render_watermark(WATERMARK_TEXT))
+
+
+@app.warm_up_trigger(arg_name="context")
+def warmup(context) -> None:
+    """
+    Warm up a new instance before the platform sends it requests.
+
+    Args:
+        context (azure.functions.WarmUpContext): The warm-up context.
+    """
+    readiness = warm_up()
+    logging.info("Instance warmed up, ready: %s", readiness["ready"])
+
+
+@app.route(route="health", methods=["GET"])
+def get_health(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Report whether the instance is ready, starting a warm-up in the background
+    when it is not (see warmup.request_warm_up).
+
+    Args:
+        req (func.HttpRequest): The HTTP request object.
+
+    Returns:
+        func.HttpResponse: The readiness report, with status 200 if the instance
+            is ready and 503 otherwise.
+    """
+    readiness = request_warm_up()
+    return func.HttpResponse(
+        body=json.dumps(readiness),
+        status_code=200 if readiness["ready"] else 503,
+        mimetype="application/json",
+    )
+
+
+def run_libreoffice(input_path, output_dir, timeout=None):
+    """
+    Converts a document to .pdf with LibreOffice.
+
+    Input:
+    - input_path: The path of the document.
+    - output_dir: The directory where the .pdf file is written, with the same base name.
+    - timeout: The seconds after which LibreOffice is killed, or None to wait for it.
+    """
+    subprocess.run(
+        [
+            "libreoffice",
+            "--headless",
+            "--convert-to",
+            "pdf",
+            input_path,
+            "--outdir",
+            output_dir,
+        ],
+        check=True,
+        timeout=timeout,
+    )
+
+
 def convert_docx_to_pdf(docx_content):
     """
     Converts a .docx file content to .pdf using LibreOffice.
@@ -155,18 +308,7 @@ def convert_docx_to_pdf(docx_content):
             logging.debug("Wrote .docx content to %s", docx_path)
 
             # Convert .docx to .pdf using LibreOffice
-            subprocess.run(
-                [
-                    "libreoffice",
-                    "--headless",
-                    "--convert-to",
-                    "pdf",
-                    docx_path,
-                    "--outdir",
-                    tmpdirname,
-                ],
-                check=True,
-            )
+            run_libreoffice(docx_path, tmpdirname)
             logging.debug("Converted .docx to .pdf using LibreOffice, output path: %s", pdf_path)
 
             # Read the .pdf file content
@@ -180,7 +322,7 @@ def convert_docx_to_pdf(docx_content):
         raise
 
 
-def add_pdf_watermark(pdf_content, watermark_text="AI Translated"):
+def add_pdf_watermark(pdf_content, watermark_text=WATERMARK_TEXT):
     """
     Adds a watermark to a PDF document.
 
@@ -191,30 +333,17 @@ def add_pdf_watermark(pdf_content, watermark_text="AI Translated"):
     Output:
     - Watermarked PDF content.
     """
+    # PyPDF2 is imported on first use, so that it is not loaded when the
+    # function app starts.
+    from PyPDF2 import PdfReader, PdfWriter
+
     try:
         with io.BytesIO(pdf_content) as input_pdf_stream, io.BytesIO() as output_pdf_stream:
             input_pdf = PdfReader(input_pdf_stream)
             output_pdf = PdfWriter()
 
-            # Create a watermark
-            watermark_stream = io.BytesIO()
-            c = canvas.Canvas(watermark_stream, pagesize=letter)
-            c.setFont("Helvetica", 100)
-            c.setFillColorRGB(0.5, 0.5, 0.5, alpha=0.3)
-
-            # Get the dimensions of the page to center the watermark
-            page_width, page_height = letter
-            x = page_width / 2
-            y = page_height / 2
-
-            c.saveState()
-            c.translate(x, y)
-            c.rotate(45)
-            c.drawCentredString(0, 0, watermark_text)
-            c.restoreState()
-            c.save()
-            watermark_stream.seek(0)
-            watermark = PdfReader(watermark_stream).pages[0]
+            # The watermark is rendered once per text and reused
+            watermark = PdfReader(io.BytesIO(render_watermark(watermark_text))).pages[0]
 
             # Add watermark to each page
             for page in input_pdf.pages:
@@ -228,3 +357,38 @@ def add_pdf_watermark(pdf_content, watermark_text="AI Translated"):
     except Exception as e:
         logging.error("Error adding watermark: %s", str(e), exc_info=True)
         raise
+
+
+@lru_cache(maxsize=16)
+def render_watermark(watermark_text=WATERMARK_TEXT):
+    """
+    Renders a watermark as a one-page PDF, once per watermark text.
+
+    Input:
+    - watermark_text: The text to be used as the watermark.
+
+    Output:
+    - The content of the watermark PDF.
+    """
+    # reportlab is imported on first use, so that it is not loaded when the
+    # function app starts.
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+
+    watermark_stream = io.BytesIO()
+    c = canvas.Canvas(watermark_stream, pagesize=letter)
+    c.setFont("Helvetica", 100)
+    c.setFillColorRGB(0.5, 0.5, 0.5, alpha=0.3)
+
+    # Get the dimensions of the page to center the watermark
+    page_width, page_height = letter
+    x = page_width / 2
+    y = page_height / 2
+
+    c.saveState()
+    c.translate(x, y)
+    c.rotate(45)
+    c.drawCentredString(0, 0, watermark_text)
+    c.restoreState()
+    c.save()
+    return watermark_stream.getvalue()
@@ -0,0 +1,354 @@
+"""
+Module for in-process metrics exposed in the Prometheus text format.
+
+Counters, gauges and histograms with fixed buckets are registered once, at
+import time, and updated on the hot paths: an update takes one lock and a
+dictionary lookup. Each label combination is a separate series.
+
+    DOCUMENTS = counter("documents_total", "Processed documents.", ("status",))
+    DOCUMENTS.inc(labels=("done",))
+
+Gauges can also be computed when the metrics are scraped, e.g. from the
+database, with set_function. render returns every metric in the text
+exposition format, served by the /metrics route of the function app.
+
+The source of this module is shared/metrics.py. The function apps each have a
+copy, updated with deployment-scripts/sync_shared_modules.py.
+"""
+
+import logging
+import math
+import threading
+from bisect import bisect_left
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+registry = {}
+registry_lock = threading.Lock()
+
+
+class Metric:
+    """
+    A named metric with one series per label combination.
+    """
+
+    type_name = None
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def format_labels(self, labels, extra=()):
+        """
+        Formats label values as a Prometheus label set.
+
+        Args:
+            labels (tuple): The label values, in the order of label_names.
+            extra (tuple): Additional (name, value) pairs, e.g. the bucket bound.
+
+        Returns:
+            str: The label set, empty if there are no labels.
+        """
+        pairs = list(zip(self.label_names, labels)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in pairs) + "}"
+
+    def collect(self):
+        """
+        Returns a snapshot of the series.
+
+        Returns:
+            dict: The value of each series, keyed by label values.
+        """
+        with self.lock:
+            return dict(self.series)
+
+    def render(self):
+        """
+        Renders the metric in the text exposition format.
+
+        Returns:
+            list: The lines of the metric.
+        """
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        for labels, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{self.format_labels(labels)} {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """
+    A value that only increases, such as the number of processed documents.
+    """
+
+    type_name = "counter"
+
+    def inc(self, amount=1, labels=()):
+        """
+        Increments the counter.
+
+        Args:
+            amount (float): The increment, not negative.
+            labels (tuple): The label values, in the order of label_names.
+        """
+        with self.lock:
+            self.series[labels] = self.series.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    A value that goes up and down, such as the number of open connections.
+    """
+
+    type_name = "gauge"
+
+    def __init__(self, name, documentation, label_names=()):
+        super().__init__(name, documentation, label_names)
+        self.function = None
+
+    def set(self, value, labels=()):
+        """
+        Sets the gauge.
+
+        Args:
+            value (float): The value.
+            labels (tuple): The label values, in the order of label_names.
+        """
+        with self.lock:
+            self.series[labels] = value
+
+    def inc(self, amount=1, labels=()):
+        """
+        Increments the gauge.
+
+        Args:
+            amount (float): The increment, negative to decrement.
+            labels (tuple): The label values, in the order of label_names.
+        """
+        with self.lock:
+            self.series[labels] = self.series.get(labels, 0) + amount
+
+    def dec(self, amount=1, labels=()):
+        """
+        Decrements the gauge.
+
+        Args:
+            amount (float): The decrement.
+            labels (tuple): The label values, in the order of label_names.
+        """
+        self.inc(-amount, labels)
+
+    def set_function(self, function):
+        """
+        Computes the gauge when the metrics are scraped.
+
+        Args:
+            function (function): Called without arguments. Returns the value of
+                each series, keyed by label values.
+        """
+        self.function = function
+
+    def collect(self):
+        """
+        Returns a snapshot of the series, computing them if the gauge has a function.
+
+        Returns:
+            dict: The value of each series, keyed by label values.
+        """
+        if self.function is None:
+            return super().collect()
+        try:
+            return dict(self.function())
+        except Exception as e:
+            logging.warning("Could not compute gauge %s: %s", self.name, str(e))
+            return {}
+
+
+class Histogram(Metric):
+    """
+    The distribution of observed values, such as durations, in fixed buckets.
+    """
+
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, labels=()):
+        """
+        Records a value.
+
+        Args:
+            value (float): The observed value.
+            labels (tuple): The label values, in the order of label_names.
+        """
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                # The bucket counts, with a last bucket for +Inf, and the sum.
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def collect(self):
+        """
+        Returns a snapshot of the series.
+
+        Returns:
+            dict: The bucket counts and the sum of each series, keyed by label values.
+        """
+        with self.lock:
+            return {
+                labels: (list(counts), total) for labels, (counts, total) in self.series.items()
+            }
+
+    def render(self):
+        """
+        Renders the histogram in the text exposition format, with cumulative buckets.
+
+        Returns:
+            list: The lines of the metric.
+        """
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        bounds = [format_value(bound) for bound in self.buckets] + ["+Inf"]
+        for labels, (counts, total) in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{self.format_labels(labels, (('le', bound),))} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{self.format_labels(labels)} {format_value(total)}")
+            lines.append(f"{self.name}_count{self.format_labels(labels)} {cumulative}")
+        return lines
+
+
+def escape_label(value):
+    """
+    Escapes a label value for the text exposition format.
+
+    Args:
+        value (object): The label value.
+
+    Returns:
+        str: The escaped value.
+    """
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_value(value):
+    """
+    Formats a sample value for the text exposition format.
+
+    Args:
+        value (float): The value.
+
+    Returns:
+        str: The formatted value.
+    """
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        if value.is_integer():
+            return str(int(value))
+    return str(value)
+
+
+def register(metric_class, name, documentation, label_names=(), **kwargs):
+    """
+    Returns the metric with the name, creating it on first use.
+
+    Args:
+        metric_class (type): Counter, Gauge or Histogram.
+        name (str): The metric name.
+        documentation (str): The help text.
+        label_names (tuple): The label names.
+        **kwargs: Passed to the metric, e.g. the histogram buckets.
+
+    Returns:
+        Metric: The metric.
+
+    Raises:
+        ValueError: If a metric of another type or with other labels has the name.
+    """
+    with registry_lock:
+        metric = registry.get(name)
+        if metric is None:
+            metric = registry[name] = metric_class(name, documentation, label_names, **kwargs)
+        elif type(metric) is not metric_class or metric.label_names != tuple(label_names):
+            raise ValueError(f"Metric {name} is already registered with another type or labels")
+        return metric
+
+
+def counter(name, documentation, label_names=()):
+    """
+    Returns the counter with the name, creating it on first use.
+
+    Args:
+        name (str): The metric name, ending in _total.
+        documentation (str): The help text.
+        label_names (tuple): The label names.
+
+    Returns:
+        Counter: The counter.
+    """
+    return register(Counter, name, documentation, label_names)
+
+
+def gauge(name, documentation, label_names=()):
+    """
+    Returns the gauge with the name, creating it on first use.
+
+    Args:
+        name (str): The metric name.
+        documentation (str): The help text.
+        label_names (tuple): The label names.
+
+    Returns:
+        Gauge: The gauge.
+    """
+    return register(Gauge, name, documentation, label_names)
+
+
+def histogram(name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+    """
+    Returns the histogram with the name, creating it on first use.
+
+    Args:
+        name (str): The metric name.
+        documentation (str): The help text.
+        label_names (tuple): The label names.
+        buckets (tuple): The upper bounds of the buckets.
+
+    Returns:
+        Histogram: The histogram.
+    """
+    return register(Histogram, name, documentation, label_names, buckets=buckets)
+
+
+def render():
+    """
+    Renders every registered metric in the text exposition format.
+
+    Returns:
+        str: The metrics.
+    """
+    with registry_lock:
+        metrics = sorted(registry.values(), key=lambda metric: metric.name)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,118 @@
+"""
+Tests for database_helper.py against a Postgres database.
+
+The database is configured with the DB_* environment variables of the function
+app, e.g. a local Postgres started with
+
+    docker run -d -p 5432:5432 -e POSTGRES_PASSWORD=postgres postgres:16
+    DB_HOST=localhost DB_NAME=postgres DB_USER=postgres DB_PASSWORD=postgres \\
+        DB_SSLMODE=disable python -m pytest tests
+
+The tables of deployment-scripts/db.sql are created in a schema of their own,
+which is dropped afterwards. The tests are skipped when no database is reachable.
+"""
+
+import os
+import psycopg2
+import pytest
+import database_helper
+from database_helper import CONNECTION_POOL, update_watermark_file_record
+
+SCHEMA = "watermark_database_helper_tests"
+SCHEMA_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "deployment-scripts", "db.sql"
+)
+
+
+def drain_pool():
+    conn = CONNECTION_POOL.acquire()
+    while conn is not None:
+        conn.disconnect()
+        conn = CONNECTION_POOL.acquire()
+
+
+@pytest.fixture(scope="module")
+def schema():
+    if not database_helper.DB_HOST:
+        pytest.skip("DB_HOST is not set")
+    try:
+        conn = psycopg2.connect(
+            host=database_helper.DB_HOST,
+            port=database_helper.DB_PORT,
+            dbname=database_helper.DB_NAME,
+            user=database_helper.DB_USER,
+            password=database_helper.DB_PASSWORD,
+            sslmode=database_helper.DB_SSLMODE,
+            connect_timeout=5,
+        )
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"No database reachable: {e}")
+    with open(SCHEMA_FILE, encoding="utf-8") as f:
+        statements = f.read()
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+        cursor.execute(f"SET search_path TO {SCHEMA}")
+        cursor.execute(statements)
+    conn.commit()
+    yield conn
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def database(schema, monkeypatch):
+    # The connections of the module use the schema of the tests.
+    monkeypatch.setenv("PGOPTIONS", f"-c search_path={SCHEMA}")
+    drain_pool()
+    yield schema
+    drain_pool()
+
+
+def insert_upload(connection, file_name, languages):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO file_translation_logs (file_name, translation_status, toLanguage)
+            VALUES (%s, 'done', %s)
+            """,
+            (file_name, languages[0]),
+        )
+        for target_order, language in enumerate(languages):
+            cursor.execute(
+                """
+                INSERT INTO file_translation_targets (
+                    file_name, toLanguage, target_order, translated_file_name,
+                    translation_status
+                ) VALUES (%s, %s, %s, %s, 'done')
+                """,
+                (file_name, language, target_order, f"{file_name}_{language}"),
+            )
+    connection.commit()
+
+
+def get_watermark_status(connection, file_name):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT watermark_status FROM file_translation_logs WHERE file_name = %s",
+            (file_name,),
+        )
+        status = cursor.fetchone()[0]
+    connection.commit()
+    return status
+
+
+@pytest.mark.parametrize("second_status, upload_status", [("done", "done"), ("failed", "failed")])
+def test_upload_status_is_rolled_up_once_every_target_finished(
+    database, second_status, upload_status
+):
+    file_name = f"upload-{second_status}.pdf"
+    insert_upload(database, file_name, ["fr", "de"])
+
+    update_watermark_file_record(f"{file_name}_fr", "done", "watermark-zone/fr.pdf")
+    assert get_watermark_status(database, file_name) is None
+
+    update_watermark_file_record(f"{file_name}_de", second_status, "watermark-zone/de.pdf")
+    assert get_watermark_status(database, file_name) == upload_status
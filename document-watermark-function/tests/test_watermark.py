@@ -0,0 +1,29 @@
+"""
+Tests for the PDF watermark of function_app.py.
+"""
+
+import io
+from PyPDF2 import PdfReader, PdfWriter
+from function_app import add_pdf_watermark, render_watermark
+
+
+def blank_pdf(pages):
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=612, height=792)
+    stream = io.BytesIO()
+    writer.write(stream)
+    return stream.getvalue()
+
+
+def test_render_watermark_is_cached_per_text():
+    assert render_watermark("DRAFT") is render_watermark("DRAFT")
+    assert render_watermark("DRAFT") != render_watermark("COPY")
+    assert len(PdfReader(io.BytesIO(render_watermark("DRAFT"))).pages) == 1
+
+
+def test_add_pdf_watermark_marks_every_page():
+    reader = PdfReader(io.BytesIO(add_pdf_watermark(blank_pdf(3), "DRAFT")))
+    assert len(reader.pages) == 3
+    for page in reader.pages:
+        assert "DRAFT" in page.extract_text()
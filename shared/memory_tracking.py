@@ -0,0 +1,354 @@
+"""
+Module for measuring the memory used by each invocation of a function.
+
+Tracking is opt-in, with MEMORY_TRACKING_ENABLED=true. A tracker samples the
+resident set size (RSS) of the process in a background thread while the
+invocation runs, and logs the RSS at the start, the peak and the increase,
+with the file name and size. The RSS includes memory allocated by native code,
+such as PyMuPDF and LibreOffice buffers.
+
+A share of the tracked invocations, MEMORY_TRACKING_TRACEMALLOC_RATE, also
+traces Python allocations with tracemalloc, which slows them down. A snapshot
+is taken whenever the traced memory grows past the previous snapshot, so the
+top allocation sites logged are those holding memory close to the peak: the
+copies of the document worth removing.
+
+    with track_memory("translate_document", file_name):
+        content = download()
+        set_document_size(len(content))
+
+Invocations running at the same time in a process share its RSS and
+tracemalloc, so the report gives the number of concurrent trackers. The peaks
+and increases are also observed in histograms of the metrics route (see
+metrics.py).
+
+The source of this module is shared/memory_tracking.py. The function apps each
+have a copy, updated with deployment-scripts/sync_shared_modules.py.
+"""
+
+import logging
+import os
+import random
+import resource
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from metrics import gauge, histogram
+
+MEMORY_TRACKING_ENABLED = os.getenv("MEMORY_TRACKING_ENABLED", "false").lower() == "true"
+MEMORY_TRACKING_TRACEMALLOC_RATE = float(os.getenv("MEMORY_TRACKING_TRACEMALLOC_RATE", "0.1"))
+MEMORY_TRACKING_TOP_SITES = int(os.getenv("MEMORY_TRACKING_TOP_SITES", "10"))
+MEMORY_TRACKING_FRAMES = int(os.getenv("MEMORY_TRACKING_FRAMES", "4"))
+MEMORY_TRACKING_INTERVAL_SECONDS = float(os.getenv("MEMORY_TRACKING_INTERVAL_SECONDS", "0.05"))
+
+logging.info("MEMORY_TRACKING_ENABLED: %s", MEMORY_TRACKING_ENABLED)
+logging.info("MEMORY_TRACKING_TRACEMALLOC_RATE: %s", MEMORY_TRACKING_TRACEMALLOC_RATE)
+logging.info("MEMORY_TRACKING_TOP_SITES: %s", MEMORY_TRACKING_TOP_SITES)
+logging.info("MEMORY_TRACKING_FRAMES: %s", MEMORY_TRACKING_FRAMES)
+logging.info("MEMORY_TRACKING_INTERVAL_SECONDS: %s", MEMORY_TRACKING_INTERVAL_SECONDS)
+
+# A new snapshot is taken when the traced memory exceeds the last one by this factor.
+SNAPSHOT_GROWTH = 1.1
+MEMORY_BUCKETS = tuple(mb * 1024 * 1024 for mb in (16, 32, 64, 128, 256, 512, 1024, 2048, 4096))
+
+PEAK_RSS_BYTES = histogram(
+    "invocation_peak_rss_bytes",
+    "Peak resident memory of the process during tracked invocations.",
+    ("function",),
+    buckets=MEMORY_BUCKETS,
+)
+RSS_INCREASE_BYTES = histogram(
+    "invocation_rss_increase_bytes",
+    "Increase of the resident memory of the process during tracked invocations.",
+    ("function",),
+    buckets=MEMORY_BUCKETS,
+)
+TRACED_PEAK_BYTES = histogram(
+    "invocation_traced_peak_bytes",
+    "Peak of the Python allocations traced during sampled invocations.",
+    ("function",),
+    buckets=MEMORY_BUCKETS,
+)
+RESIDENT_MEMORY_BYTES = gauge("process_resident_memory_bytes", "Resident memory of the process.")
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+current_tracker = ContextVar("current_tracker", default=None)
+active_trackers = set()
+tracing_trackers = set()
+trackers_lock = threading.Lock()
+
+
+def read_rss():
+    """
+    Returns the resident set size of the process.
+
+    Returns:
+        int: The RSS in bytes, or None where /proc is not available.
+    """
+    try:
+        with open("/proc/self/statm", encoding="ascii") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def read_max_rss():
+    """
+    Returns the peak resident set size of the process since it started.
+
+    Returns:
+        int: The peak RSS in bytes.
+    """
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def collect_resident_memory():
+    """
+    Returns the resident memory of the process, for the process_resident_memory_bytes gauge.
+
+    Returns:
+        dict: The RSS in bytes, keyed by the empty label values, or no series without /proc.
+    """
+    rss = read_rss()
+    return {} if rss is None else {(): rss}
+
+
+RESIDENT_MEMORY_BYTES.set_function(collect_resident_memory)
+
+
+class MemoryTracker:
+    """
+    The memory used by one invocation of a function.
+    """
+
+    def __init__(self, function_name, file_name=None, size_bytes=None):
+        self.function_name = function_name
+        self.file_name = file_name
+        self.size_bytes = size_bytes
+        self.enabled = MEMORY_TRACKING_ENABLED
+        self.traced = False
+        self.start_rss = None
+        self.peak_rss = None
+        self.start_max_rss = None
+        self.started = None
+        self.snapshot = None
+        self.snapshot_traced_bytes = 0
+        self.stop_event = threading.Event()
+        self.sampler = None
+        self.token = None
+
+    def start(self):
+        """
+        Starts tracking. Does nothing unless MEMORY_TRACKING_ENABLED is set.
+
+        Returns:
+            MemoryTracker: The tracker.
+        """
+        if not self.enabled:
+            return self
+        self.started = time.perf_counter()
+        self.start_rss = self.peak_rss = read_rss()
+        self.start_max_rss = read_max_rss()
+        self.traced = random.random() < MEMORY_TRACKING_TRACEMALLOC_RATE
+        with trackers_lock:
+            active_trackers.add(self)
+            if self.traced and not tracing_trackers:
+                # Allocations traced by someone else are left alone.
+                if tracemalloc.is_tracing():
+                    self.traced = False
+                else:
+                    tracemalloc.start(MEMORY_TRACKING_FRAMES)
+            if self.traced:
+                tracing_trackers.add(self)
+        self.token = current_tracker.set(self)
+        self.sampler = threading.Thread(target=self.sample, daemon=True)
+        self.sampler.start()
+        return self
+
+    def sample(self):
+        """
+        Samples the RSS, and snapshots the traced allocations as they grow,
+        until the tracker stops. Runs in its own thread.
+        """
+        while not self.stop_event.wait(MEMORY_TRACKING_INTERVAL_SECONDS):
+            self.update()
+
+    def update(self):
+        """
+        Records the current RSS and, if the invocation is traced, takes a
+        snapshot when the traced memory exceeds the last snapshot.
+        """
+        rss = read_rss()
+        if rss is not None and (self.peak_rss is None or rss > self.peak_rss):
+            self.peak_rss = rss
+        if self.traced and tracemalloc.is_tracing():
+            traced_bytes, _ = tracemalloc.get_traced_memory()
+            if self.snapshot is None or traced_bytes > self.snapshot_traced_bytes * SNAPSHOT_GROWTH:
+                self.snapshot = tracemalloc.take_snapshot()
+                self.snapshot_traced_bytes = traced_bytes
+
+    def stop(self):
+        """
+        Stops tracking, then logs and observes the memory used.
+
+        Returns:
+            dict: The report, as returned by report, or None if tracking is disabled.
+        """
+        if not self.enabled or self.started is None:
+            return None
+        self.stop_event.set()
+        self.sampler.join()
+        self.update()
+        traced_peak = tracemalloc.get_traced_memory()[1] if self.traced else None
+        with trackers_lock:
+            concurrent = len(active_trackers) - 1
+            active_trackers.discard(self)
+            if self.traced:
+                tracing_trackers.discard(self)
+                if not tracing_trackers:
+                    tracemalloc.stop()
+        current_tracker.reset(self.token)
+
+        result = self.report(traced_peak, concurrent)
+        self.log(result)
+        labels = (self.function_name,)
+        if result["peak_rss_bytes"] is not None:
+            PEAK_RSS_BYTES.observe(result["peak_rss_bytes"], labels=labels)
+            RSS_INCREASE_BYTES.observe(result["rss_increase_bytes"], labels=labels)
+        if traced_peak is not None:
+            TRACED_PEAK_BYTES.observe(traced_peak, labels=labels)
+        return result
+
+    def report(self, traced_peak, concurrent):
+        """
+        Builds the report of the invocation.
+
+        Args:
+            traced_peak (int): The peak of the traced allocations, None if not traced.
+            concurrent (int): The number of other invocations tracked at the end.
+
+        Returns:
+            dict: The function, file name and size, duration, RSS at the start,
+                peak RSS and increase, process peak RSS, traced peak, and the top
+                allocation sites near the peak.
+        """
+        increase = None
+        if self.peak_rss is not None and self.start_rss is not None:
+            increase = self.peak_rss - self.start_rss
+        top_sites = []
+        if self.snapshot is not None:
+            snapshot = self.snapshot.filter_traces(
+                (
+                    tracemalloc.Filter(False, tracemalloc.__file__),
+                    tracemalloc.Filter(False, __file__, all_frames=True),
+                    tracemalloc.Filter(False, threading.__file__),
+                    tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+                )
+            )
+            for stat in snapshot.statistics("traceback")[:MEMORY_TRACKING_TOP_SITES]:
+                top_sites.append(
+                    {
+                        "site": " <- ".join(
+                            f"{os.path.basename(frame.filename)}:{frame.lineno}"
+                            for frame in reversed(stat.traceback)
+                        ),
+                        "bytes": stat.size,
+                        "blocks": stat.count,
+                    }
+                )
+        max_rss = read_max_rss()
+        return {
+            "function": self.function_name,
+            "file_name": self.file_name,
+            "size_bytes": self.size_bytes,
+            "seconds": time.perf_counter() - self.started,
+            "start_rss_bytes": self.start_rss,
+            "peak_rss_bytes": self.peak_rss,
+            "rss_increase_bytes": increase,
+            "process_peak_rss_bytes": max_rss,
+            "new_process_peak": max_rss > self.start_max_rss,
+            "traced_peak_bytes": traced_peak,
+            "snapshot_traced_bytes": self.snapshot_traced_bytes if self.snapshot else None,
+            "top_sites": top_sites,
+            "concurrent": concurrent,
+        }
+
+    def log(self, result):
+        """
+        Logs the report of the invocation.
+
+        Args:
+            result (dict): The report, as returned by report.
+        """
+        logging.info(
+            "Memory of %s for %s (%s bytes): RSS %s MB at start, peak %s MB (+%s MB), "
+            "process peak %s MB%s, traced peak %s MB, %d concurrent invocations",
+            result["function"],
+            result["file_name"],
+            result["size_bytes"],
+            format_megabytes(result["start_rss_bytes"]),
+            format_megabytes(result["peak_rss_bytes"]),
+            format_megabytes(result["rss_increase_bytes"]),
+            format_megabytes(result["process_peak_rss_bytes"]),
+            " (new)" if result["new_process_peak"] else "",
+            format_megabytes(result["traced_peak_bytes"]),
+            result["concurrent"],
+        )
+        for site in result["top_sites"]:
+            logging.info(
+                "Allocation site of %s for %s: %s MB in %d blocks at %s",
+                result["function"],
+                result["file_name"],
+                format_megabytes(site["bytes"]),
+                site["blocks"],
+                site["site"],
+            )
+
+
+def format_megabytes(value):
+    """
+    Formats a number of bytes in megabytes for the logs.
+
+    Args:
+        value (int): The number of bytes, or None.
+
+    Returns:
+        str: The megabytes with one decimal, or "-" for None.
+    """
+    return "-" if value is None else f"{value / 1024 / 1024:.1f}"
+
+
+@contextmanager
+def track_memory(function_name, file_name=None, size_bytes=None):
+    """
+    Tracks the memory used by the block. Does nothing unless MEMORY_TRACKING_ENABLED is set.
+
+    Args:
+        function_name (str): The name of the function.
+        file_name (str): The name of the file processed.
+        size_bytes (int): The size of the file, if known; see set_document_size.
+
+    Yields:
+        MemoryTracker: The tracker.
+    """
+    tracker = MemoryTracker(function_name, file_name, size_bytes).start()
+    try:
+        yield tracker
+    finally:
+        tracker.stop()
+
+
+def set_document_size(size_bytes):
+    """
+    Sets the file size of the current tracker. Does nothing outside a tracker.
+
+    Args:
+        size_bytes (int): The size of the file in bytes.
+    """
+    tracker = current_tracker.get()
+    if tracker is not None:
+        tracker.size_bytes = size_bytes
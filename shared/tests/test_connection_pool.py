@@ -0,0 +1,124 @@
+"""
+Tests for connection_pool.py.
+"""
+
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS
+from connection_pool import ConnectionPool
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, query):
+        self.conn.queries.append(query)
+        if not self.conn.alive:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+
+class FakeConnection:
+    def __init__(self, alive=True, status=TRANSACTION_STATUS_IDLE):
+        self.alive = alive
+        self.status = status
+        self.closed = 0
+        self.autocommit = False
+        self.queries = []
+        self.rolled_back = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.rolled_back = True
+        self.status = TRANSACTION_STATUS_IDLE
+
+    def disconnect(self):
+        self.closed = 1
+
+
+def test_acquire_returns_none_when_empty():
+    assert ConnectionPool(size=2).acquire() is None
+
+
+def test_release_then_acquire_reuses_the_connection():
+    pool = ConnectionPool(size=2)
+    conn = FakeConnection()
+    assert pool.release(conn)
+    assert pool.acquire() is conn
+    assert conn.queries == ["SELECT 1"]
+    assert conn.autocommit is False
+
+
+def test_acquire_returns_the_most_recent_connection():
+    pool = ConnectionPool(size=2)
+    first, second = FakeConnection(), FakeConnection()
+    pool.release(first)
+    pool.release(second)
+    assert pool.acquire() is second
+    assert pool.acquire() is first
+
+
+def test_acquire_skips_dead_connections():
+    pool = ConnectionPool(size=3)
+    alive, dead = FakeConnection(), FakeConnection(alive=False)
+    pool.release(alive)
+    pool.release(dead)
+    assert pool.acquire() is alive
+    assert dead.closed
+    assert pool.acquire() is None
+
+
+def test_acquire_returns_none_when_all_connections_are_dead():
+    pool = ConnectionPool(size=2)
+    dead = FakeConnection(alive=False)
+    pool.release(dead)
+    assert pool.acquire() is None
+    assert dead.closed
+
+
+def test_acquire_closes_expired_connections():
+    pool = ConnectionPool(size=2, max_idle_seconds=0)
+    conn = FakeConnection()
+    pool.release(conn)
+    pool.idle[0] = (conn, pool.idle[0][1] - 1)
+    assert pool.acquire() is None
+    assert conn.closed
+    assert conn.queries == []
+
+
+def test_release_rolls_back_open_transaction():
+    pool = ConnectionPool(size=2)
+    conn = FakeConnection(status=TRANSACTION_STATUS_INTRANS)
+    assert pool.release(conn)
+    assert conn.rolled_back
+
+
+def test_release_refuses_when_full_or_disabled():
+    pool = ConnectionPool(size=1)
+    assert pool.release(FakeConnection())
+    assert not pool.release(FakeConnection())
+    assert not ConnectionPool(size=0).release(FakeConnection())
+
+
+def test_release_refuses_closed_connection():
+    conn = FakeConnection()
+    conn.closed = 1
+    assert not ConnectionPool(size=2).release(conn)
+
+
+def test_idle_connections_are_not_shared_with_a_forked_process():
+    pool = ConnectionPool(size=2)
+    pool.release(FakeConnection())
+    pool.pid = -1
+    assert pool.acquire() is None
+    assert pool.collect_idle() == {(): 0}
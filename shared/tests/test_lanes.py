@@ -0,0 +1,28 @@
+"""
+Tests for lanes.py.
+"""
+
+import pytest
+import lanes
+from lanes import BATCH_LANE, INTERACTIVE_LANE, classify_lane
+
+
+@pytest.fixture(autouse=True)
+def thresholds(monkeypatch):
+    monkeypatch.setattr(lanes, "LANE_INTERACTIVE_MAX_BYTES", 1000)
+    monkeypatch.setattr(lanes, "LANE_INTERACTIVE_MAX_PAGES", 10)
+
+
+@pytest.mark.parametrize(
+    "size_bytes, page_count, lane",
+    [
+        (1000, None, INTERACTIVE_LANE),
+        (1001, None, BATCH_LANE),
+        (1000, 10, INTERACTIVE_LANE),
+        (1000, 11, BATCH_LANE),
+        (0, 0, INTERACTIVE_LANE),
+        (None, 1, BATCH_LANE),
+    ],
+)
+def test_classify_lane_boundaries(size_bytes, page_count, lane):
+    assert classify_lane(size_bytes, page_count) == lane
@@ -0,0 +1,69 @@
+"""
+Tests for metrics.py.
+"""
+
+import pytest
+import metrics
+from metrics import counter, gauge, histogram, render
+
+
+@pytest.fixture(autouse=True)
+def registry():
+    saved = dict(metrics.registry)
+    metrics.registry.clear()
+    yield metrics.registry
+    metrics.registry.clear()
+    metrics.registry.update(saved)
+
+
+def test_render_counter_with_labels():
+    documents = counter("documents_total", "Processed documents.", ("status",))
+    documents.inc(labels=("done",))
+    documents.inc(2, labels=("failed",))
+    documents.inc(labels=("done",))
+    assert render() == (
+        "# HELP documents_total Processed documents.\n"
+        "# TYPE documents_total counter\n"
+        'documents_total{status="done"} 2\n'
+        'documents_total{status="failed"} 2\n'
+    )
+
+
+def test_render_histogram_with_cumulative_buckets():
+    durations = histogram("duration_seconds", "Durations.", buckets=(1, 5))
+    durations.observe(0.5)
+    durations.observe(3)
+    durations.observe(7.5)
+    assert render().splitlines()[2:] == [
+        'duration_seconds_bucket{le="1"} 1',
+        'duration_seconds_bucket{le="5"} 2',
+        'duration_seconds_bucket{le="+Inf"} 3',
+        "duration_seconds_sum 11",
+        "duration_seconds_count 3",
+    ]
+
+
+def test_render_sorts_metrics_by_name_and_escapes_labels():
+    gauge("b_gauge", "B.", ("path",)).set(1.5, labels=('a "quoted"\\path\n',))
+    counter("a_total", "A.").inc()
+    lines = render().splitlines()
+    assert lines[0] == "# HELP a_total A."
+    assert lines[2] == "a_total 1"
+    assert lines[5] == 'b_gauge{path="a \\"quoted\\"\\\\path\\n"} 1.5'
+
+
+def test_gauge_function_failure_renders_no_series():
+    def fail():
+        raise ConnectionError("database unavailable")
+
+    gauge("queued", "Queued jobs.").set_function(fail)
+    assert render() == "# HELP queued Queued jobs.\n# TYPE queued gauge\n"
+
+
+def test_register_rejects_other_type_or_labels():
+    counter("jobs_total", "Jobs.", ("lane",))
+    assert counter("jobs_total", "Jobs.", ("lane",)) is metrics.registry["jobs_total"]
+    with pytest.raises(ValueError):
+        gauge("jobs_total", "Jobs.", ("lane",))
+    with pytest.raises(ValueError):
+        counter("jobs_total", "Jobs.", ("user",))
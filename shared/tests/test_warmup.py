@@ -0,0 +1,111 @@
+"""
+Tests for warmup.py.
+"""
+
+import threading
+import pytest
+import warmup
+
+
+@pytest.fixture(autouse=True)
+def steps():
+    warmup.WARMUP_STEPS.clear()
+    warmup.step_results.clear()
+    warmup.last_started["at"] = None
+    yield warmup.WARMUP_STEPS
+    warmup.WARMUP_STEPS.clear()
+    warmup.step_results.clear()
+
+
+def test_warm_up_runs_steps_in_order_and_reports_ready():
+    calls = []
+    warmup.register_warmup_step("first")(lambda: calls.append("first"))
+    warmup.register_warmup_step("second")(lambda: calls.append("second"))
+    readiness = warmup.warm_up()
+    assert calls == ["first", "second"]
+    assert readiness["ready"]
+    assert readiness["steps"]["first"]["status"] == "ok"
+    assert warmup.collect_ready() == {(): 1}
+
+
+def test_failed_step_runs_again_and_successful_step_does_not():
+    calls = []
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError("secret connection string")
+
+    warmup.register_warmup_step("stable")(lambda: calls.append(1))
+    warmup.register_warmup_step("flaky")(flaky)
+    readiness = warmup.warm_up()
+    assert not readiness["ready"]
+    assert readiness["steps"]["flaky"]["status"] == "failed"
+    assert "secret" not in str(readiness)
+    assert warmup.warm_up()["ready"]
+    assert calls == [1]
+    assert len(attempts) == 2
+
+
+def test_get_readiness_reports_pending_steps():
+    warmup.register_warmup_step("pending")(lambda: None)
+    readiness = warmup.get_readiness()
+    assert readiness == {"ready": False, "steps": {"pending": {"status": "pending"}}}
+    assert warmup.collect_ready() == {(): 0}
+
+
+def test_request_warm_up_does_not_wait_for_the_steps():
+    release = threading.Event()
+    done = threading.Event()
+
+    def slow():
+        release.wait(5)
+        done.set()
+
+    warmup.register_warmup_step("slow")(slow)
+    readiness = warmup.request_warm_up()
+    assert readiness["steps"]["slow"]["status"] == "pending"
+    release.set()
+    assert done.wait(5)
+
+
+def test_request_warm_up_retries_failed_steps_at_most_once_per_period(monkeypatch):
+    attempts = []
+
+    def failing():
+        attempts.append(1)
+        raise ConnectionError("database unreachable")
+
+    monkeypatch.setattr(warmup, "WARMUP_RETRY_SECONDS", 3600)
+    warmup.register_warmup_step("failing")(failing)
+    warmup.warm_up()
+    for _ in range(5):
+        assert not warmup.request_warm_up()["ready"]
+    assert not any(thread.name == "warm-up" for thread in threading.enumerate())
+    assert len(attempts) == 1
+
+
+def test_request_warm_up_retries_after_the_period(monkeypatch):
+    retried = threading.Event()
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError("database unreachable")
+        retried.set()
+
+    monkeypatch.setattr(warmup, "WARMUP_RETRY_SECONDS", 0)
+    warmup.register_warmup_step("flaky")(flaky)
+    warmup.warm_up()
+    warmup.request_warm_up()
+    assert retried.wait(5)
+
+
+def test_request_warm_up_does_nothing_when_ready():
+    calls = []
+    warmup.register_warmup_step("step")(lambda: calls.append(1))
+    warmup.warm_up()
+    assert warmup.request_warm_up()["ready"]
+    assert calls == [1]
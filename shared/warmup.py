@@ -0,0 +1,149 @@
+"""
+Module for warming up an instance of the function app before it serves requests.
+
+The app registers warm-up steps, such as opening a database connection or the
+TLS connection to Blob Storage, which the first requests of a new instance
+would otherwise pay for:
+
+    @register_warmup_step("database")
+    def warm_up_database():
+        DatabaseHandler().ping()
+
+The steps run from the warmup trigger, which the platform calls when it adds an
+instance on a Premium or Dedicated plan. A step that raises is logged with its
+error, reported as failed, and runs again on the next warm-up; a step that
+succeeded does not run again. The instance is ready once every step has
+succeeded. Steps run one after the other, and a warm-up started while another
+one runs waits for it.
+
+The health route only reports the readiness and never waits for the steps:
+it calls request_warm_up, which starts a warm-up in a background thread when
+the instance is not ready, no warm-up is running and the last one started at
+least WARMUP_RETRY_SECONDS ago. Frequent or concurrent probes therefore run
+the failed steps at most once per period.
+
+Readiness reflects the warm-up, not the current health of the dependencies.
+The duration of each step and the readiness are served by the metrics route
+(see metrics.py).
+
+The source of this module is shared/warmup.py. The function apps each have a
+copy, updated with deployment-scripts/sync_shared_modules.py.
+"""
+
+import logging
+import os
+import threading
+import time
+from metrics import gauge, histogram
+
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "30"))
+
+logging.info("WARMUP_RETRY_SECONDS: %s", WARMUP_RETRY_SECONDS)
+
+WARMUP_STEPS = {}
+step_results = {}
+warmup_lock = threading.Lock()
+retry_lock = threading.Lock()
+last_started = {"at": None}
+
+WARMUP_STEP_SECONDS = histogram(
+    "warmup_step_seconds", "Duration of the warm-up steps of the instance.", ("step", "status")
+)
+INSTANCE_READY = gauge("instance_ready", "1 once every warm-up step of the instance succeeded.")
+
+
+def register_warmup_step(name):
+    """
+    Registers a warm-up step. Steps run in the order they are registered.
+
+    The function is called without arguments and raises if the step failed.
+
+    Args:
+        name (str): The name of the step, used in the readiness report and the metrics.
+
+    Returns:
+        function: The decorator registering the function.
+    """
+
+    def decorator(func):
+        WARMUP_STEPS[name] = func
+        return func
+
+    return decorator
+
+
+def warm_up():
+    """
+    Runs the warm-up steps that have not succeeded yet.
+
+    Returns:
+        dict: The readiness report, as returned by get_readiness.
+    """
+    with warmup_lock:
+        last_started["at"] = time.monotonic()
+        for name, step in WARMUP_STEPS.items():
+            if step_results.get(name, {}).get("status") == "ok":
+                continue
+            started = time.perf_counter()
+            try:
+                step()
+                status = "ok"
+                logging.info("Warm-up step %s done", name)
+            except Exception as e:
+                status = "failed"
+                logging.warning("Warm-up step %s failed: %s", name, str(e))
+            seconds = time.perf_counter() - started
+            step_results[name] = {"status": status, "seconds": round(seconds, 3)}
+            WARMUP_STEP_SECONDS.observe(seconds, labels=(name, status))
+    return get_readiness()
+
+
+def request_warm_up():
+    """
+    Starts a warm-up in the background if the instance is not ready, no
+    warm-up is running and the last one started WARMUP_RETRY_SECONDS ago or
+    more. Does not wait for it.
+
+    Returns:
+        dict: The current readiness report, as returned by get_readiness.
+    """
+    readiness = get_readiness()
+    if readiness["ready"]:
+        return readiness
+    with retry_lock:
+        started = last_started["at"]
+        if warmup_lock.locked() or (
+            started is not None and time.monotonic() - started < WARMUP_RETRY_SECONDS
+        ):
+            return readiness
+        last_started["at"] = time.monotonic()
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    return readiness
+
+
+def get_readiness():
+    """
+    Returns whether the instance is ready, with the result of each warm-up step.
+
+    Returns:
+        dict: ready (bool), and the status (pending, ok or failed) and seconds
+            of each step, keyed by step name. Errors are only logged, as the
+            health route may be public.
+    """
+    steps = {
+        name: dict(step_results.get(name, {"status": "pending"})) for name in WARMUP_STEPS
+    }
+    return {"ready": all(step["status"] == "ok" for step in steps.values()), "steps": steps}
+
+
+def collect_ready():
+    """
+    Returns the readiness of the instance, for the instance_ready gauge.
+
+    Returns:
+        dict: 1 if the instance is ready, 0 otherwise, keyed by the empty label values.
+    """
+    return {(): 1 if get_readiness()["ready"] else 0}
+
+
+INSTANCE_READY.set_function(collect_ready)